@@ -0,0 +1,31 @@
+# demand_stats_worker.py
+# -*- coding: utf-8 -*-
+import logging
+from PyQt5.QtCore import QThread, pyqtSignal
+
+class DemandStatsWorker(QThread):
+    """عامل خلفي لإعادة بناء إحصائيات الطلب دون تجميد الواجهة"""
+    
+    rebuild_finished = pyqtSignal(dict)   # نتيجة البناء
+    error_occurred = pyqtSignal(str)
+    
+    def __init__(self, db_manager, window_days=None, parent=None):
+        super().__init__(parent)
+        self.db_manager = db_manager
+        self.window_days = window_days
+    
+    def run(self):
+        worker_db = None
+        try:
+            # اتصال مستقل لهذا الخيط
+            worker_db = self.db_manager.create_thread_instance()
+            result = worker_db.rebuild_demand_stats(self.window_days)
+            self.rebuild_finished.emit(result)
+            
+        except Exception as e:
+            logging.error(f"❌ خطأ في عامل بناء الإحصائيات: {e}")
+            self.error_occurred.emit(str(e))
+            
+        finally:
+            if worker_db:
+                worker_db.close()
@@ -0,0 +1,46 @@
+# schedule_renewal_worker.py
+# -*- coding: utf-8 -*-
+import logging
+from PyQt5.QtCore import QThread, pyqtSignal
+
+class ScheduleRenewalWorker(QThread):
+    """عامل خلفي لتجديد الجداول الدورية دون تجميد الواجهة"""
+    
+    progress = pyqtSignal(int, int, str)  # المنجز، الإجمالي، اسم الطبيب
+    renewal_finished = pyqtSignal(dict)   # مقاييس التجديد
+    error_occurred = pyqtSignal(str)
+    
+    def __init__(self, db_manager, chunk_size=5, pause_seconds=0.05, parent=None):
+        super().__init__(parent)
+        self.db_manager = db_manager
+        self.chunk_size = chunk_size
+        self.pause_seconds = pause_seconds
+        self._cancelled = False
+    
+    def cancel(self):
+        """طلب إيقاف التجديد بعد الطبيب الحالي"""
+        self._cancelled = True
+    
+    def is_cancelled(self):
+        return self._cancelled
+    
+    def run(self):
+        worker_db = None
+        try:
+            # اتصال مستقل لهذا الخيط
+            worker_db = self.db_manager.create_thread_instance()
+            metrics = worker_db.renew_schedules_in_chunks(
+                chunk_size=self.chunk_size,
+                should_cancel=self.is_cancelled,
+                progress_callback=self.progress.emit,
+                pause_seconds=self.pause_seconds
+            )
+            self.renewal_finished.emit(metrics)
+            
+        except Exception as e:
+            logging.error(f"❌ خطأ في عامل تجديد الجداول: {e}")
+            self.error_occurred.emit(str(e))
+            
+        finally:
+            if worker_db:
+                worker_db.close()
@@ -4,6 +4,9 @@ import logging
 from datetime import datetime, timedelta
 from PyQt5.QtCore import QTimer, pyqtSignal, QObject
 
+from core.schedule_renewal_worker import ScheduleRenewalWorker
+from core.demand_stats_worker import DemandStatsWorker
+
 class SystemIntegrator(QObject):
     """مكامل النظام - يدير التكامل بين جميع المكونات"""
     
@@ -17,6 +20,10 @@ class SystemIntegrator(QObject):
         self.db_manager = db_manager
         self.auto_renew_timer = None
         self.health_check_timer = None
+        self.renewal_worker = None
+        self.analytics_timer = None
+        self.analytics_worker = None
+        self.waitlist_timer = None
         
     def initialize_system(self):
         """تهيئة النظام بالكامل"""
@@ -58,23 +65,91 @@ class SystemIntegrator(QObject):
             self.health_check_timer.timeout.connect(self.health_check)
             self.health_check_timer.start(60 * 60 * 1000)  # ساعة
             
+            # مؤقت إحصائيات الطلب (يومياً) - وبناؤها الآن إن كانت قديمة
+            self.analytics_timer = QTimer()
+            self.analytics_timer.timeout.connect(self.rebuild_demand_stats)
+            self.analytics_timer.start(24 * 60 * 60 * 1000)  # يوم
+            if self.db_manager.is_demand_stats_stale():
+                QTimer.singleShot(60 * 1000, self.rebuild_demand_stats)
+            
+            # مؤقت عروض قائمة الانتظار (كل دقيقة) - إرسال العروض وإنهاء المنتهية
+            self.waitlist_timer = QTimer()
+            self.waitlist_timer.timeout.connect(self.process_waitlist)
+            self.waitlist_timer.start(60 * 1000)  # دقيقة
+            
             logging.info("✅ بدء المراقبة التلقائية للنظام")
             
         except Exception as e:
             logging.error(f"❌ خطأ في بدء المراقبة التلقائية: {e}")
     
     def auto_renew_schedules(self):
-        """التجديد التلقائي للجداول"""
+        """التجديد التلقائي للجداول في خيط خلفي"""
         try:
-            renewed_count = self.db_manager.check_and_renew_schedules()
-            if renewed_count > 0:
-                logging.info(f"✅ تم التجديد التلقائي لـ {renewed_count} جدول")
-                self.schedules_renewed.emit(renewed_count)
+            if self.renewal_worker and self.renewal_worker.isRunning():
+                logging.info("⏳ التجديد التلقائي قيد التنفيذ بالفعل")
+                return
+            
+            self.renewal_worker = ScheduleRenewalWorker(self.db_manager)
+            self.renewal_worker.renewal_finished.connect(self.on_renewal_finished)
+            self.renewal_worker.error_occurred.connect(
+                lambda message: self.error_occurred.emit(f"خطأ في التجديد التلقائي: {message}")
+            )
+            self.renewal_worker.start()
                 
         except Exception as e:
             logging.error(f"❌ خطأ في التجديد التلقائي: {e}")
             self.error_occurred.emit(f"خطأ في التجديد التلقائي: {str(e)}")
     
+    def on_renewal_finished(self, metrics):
+        """معالجة انتهاء التجديد الخلفي"""
+        renewed_count = metrics.get('renewed', 0)
+        logging.info(f"📊 التجديد التلقائي: {renewed_count}/{metrics.get('total', 0)} "
+                     f"(فشل {metrics.get('failed', 0)}) خلال {metrics.get('elapsed_ms', 0)} ms")
+        if renewed_count > 0:
+            self.schedules_renewed.emit(renewed_count)
+    
+    def stop_auto_renewal(self):
+        """إيقاف التجديد الخلفي الجاري وانتظار بناء الإحصائيات (عند إغلاق التطبيق)"""
+        if self.renewal_worker and self.renewal_worker.isRunning():
+            self.renewal_worker.cancel()
+            self.renewal_worker.wait()
+        if self.analytics_worker and self.analytics_worker.isRunning():
+            self.analytics_worker.wait()
+    
+    def rebuild_demand_stats(self):
+        """إعادة بناء إحصائيات الطلب لاقتراحات الجدولة الذكية في خيط خلفي"""
+        try:
+            if self.analytics_worker and self.analytics_worker.isRunning():
+                logging.info("⏳ بناء إحصائيات الطلب قيد التنفيذ بالفعل")
+                return
+            
+            self.analytics_worker = DemandStatsWorker(self.db_manager)
+            self.analytics_worker.rebuild_finished.connect(self.on_demand_stats_rebuilt)
+            self.analytics_worker.error_occurred.connect(
+                lambda message: self.error_occurred.emit(f"خطأ في بناء الإحصائيات: {message}")
+            )
+            self.analytics_worker.start()
+            
+        except Exception as e:
+            logging.error(f"❌ خطأ في بناء إحصائيات الطلب: {e}")
+    
+    def on_demand_stats_rebuilt(self, result):
+        """معالجة انتهاء بناء الإحصائيات الخلفي"""
+        if result.get('success'):
+            # البناء تم باتصال العامل: ذاكرة الاتصال الرئيسي أصبحت قديمة
+            self.db_manager.clear_demand_stats_cache()
+        else:
+            self.error_occurred.emit(f"خطأ في بناء الإحصائيات: {result.get('message', '')}")
+    
+    def process_waitlist(self):
+        """إرسال عروض قائمة الانتظار الجديدة وتحرير أوقات العروض المنتهية"""
+        try:
+            result = self.db_manager.process_waitlist_offers()
+            if result['expired'] or result['queued']:
+                logging.info(f"⏳ قائمة الانتظار: {result['queued']} عرض مرسل، {result['expired']} عرض منتهي")
+        except Exception as e:
+            logging.error(f"❌ خطأ في معالجة عروض قائمة الانتظار: {e}")
+    
     def health_check(self):
         """فحص صحة النظام"""
         try:
@@ -193,6 +268,11 @@ class SystemIntegrator(QObject):
                 self.auto_renew_timer.stop()
             if self.health_check_timer:
                 self.health_check_timer.stop()
+            if self.analytics_timer:
+                self.analytics_timer.stop()
+            if self.waitlist_timer:
+                self.waitlist_timer.stop()
+            self.stop_auto_renewal()
                 
             logging.info("✅ تم إيقاف نظام المراقبة التلقائية")
             
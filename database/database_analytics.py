@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+import logging
+import time as time_module
+from datetime import date, datetime, timedelta
+from typing import List, Dict, Optional
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from scheduling_time import to_ordinal, to_minutes
+
+HOURS_PER_WEEK = 168
+
+class AnalyticsMixin:
+    """ميكسین إحصائيات الطلب والإشغال لكل طبيب حسب ساعة الأسبوع
+
+    تُبنى الإحصائيات بمهمة ليلية وتُحفظ في جدول صغير (168 صف لكل طبيب)،
+    ثم تُقرأ من الذاكرة عند ترتيب الاقتراحات بدل التحليل مع كل نقرة.
+    """
+
+    ANALYTICS_WINDOW_DAYS = 180
+
+    # حالات الموعد المنتهي فعلياً - غيرها في الماضي يُعد عدم حضور
+    ATTENDED_STATUSES = ('منتهي', 'حاضر')
+
+    def create_analytics_tables(self):
+        """إنشاء جدول إحصائيات الطلب"""
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS doctor_demand_stats (
+                    doctor_id INTEGER NOT NULL,
+                    hour_of_week INTEGER NOT NULL, -- يوم الأسبوع (الإثنين = 0) × 24 + الساعة
+                    booked_count INTEGER DEFAULT 0,
+                    cancelled_count INTEGER DEFAULT 0,
+                    no_show_count INTEGER DEFAULT 0,
+                    slot_count INTEGER DEFAULT 0,
+                    fill_rate REAL DEFAULT 0,
+                    no_show_rate REAL DEFAULT 0,
+                    weekly_demand REAL DEFAULT 0, -- متوسط الحجوزات في هذه الساعة أسبوعياً
+                    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (doctor_id, hour_of_week),
+                    FOREIGN KEY (doctor_id) REFERENCES doctors (id) ON DELETE CASCADE
+                )
+            ''')
+            self.conn.commit()
+
+        except Exception as e:
+            logging.error(f"❌ خطأ في إنشاء جدول الإحصائيات: {e}")
+            self.conn.rollback()
+
+    def rebuild_demand_stats(self, window_days: int = None) -> Dict:
+        """إعادة بناء إحصائيات الطلب من سجل المواعيد (مهمة ليلية)"""
+        started = time_module.perf_counter()
+        window_days = window_days or self.ANALYTICS_WINDOW_DAYS
+
+        try:
+            today = date.today()
+            start = today - timedelta(days=window_days)
+            start_str = start.strftime('%Y-%m-%d')
+            today_str = today.strftime('%Y-%m-%d')
+            now_key = (today.toordinal(), to_minutes(datetime.now().time()))
+
+            cursor = self.conn.cursor()
+            cursor.execute('SELECT id FROM doctors ORDER BY id')
+            doctor_ids = [row['id'] for row in cursor.fetchall()]
+            if not doctor_ids:
+                return {'success': True, 'doctors': 0, 'appointments': 0, 'elapsed_ms': 0}
+            doctor_index = {doctor_id: index for index, doctor_id in enumerate(doctor_ids)}
+
+            # المواعيد: مؤشر الخلية (طبيب × ساعة أسبوع) وأعلام الحالة
+            cursor.execute('''
+                SELECT doctor_id, appointment_date, appointment_time, status
+                FROM appointments
+                WHERE appointment_date BETWEEN ? AND ?
+            ''', (start_str, today_str))
+
+            cells, booked, cancelled, no_show = [], [], [], []
+            for row in cursor.fetchall():
+                if row['doctor_id'] not in doctor_index:
+                    continue
+                try:
+                    day_ordinal = to_ordinal(row['appointment_date'])
+                    minute = to_minutes(row['appointment_time'])
+                except (TypeError, ValueError):
+                    continue
+                status = row['status'] or ''
+                is_cancelled = self.is_cancelled_status(status)
+                attended = any(word in status for word in self.ATTENDED_STATUSES)
+
+                cells.append(doctor_index[row['doctor_id']] * HOURS_PER_WEEK
+                             + ((day_ordinal - 1) % 7) * 24 + minute // 60)
+                booked.append(0 if is_cancelled else 1)
+                cancelled.append(1 if is_cancelled else 0)
+                no_show.append(1 if not is_cancelled and not attended and (day_ordinal, minute) < now_key else 0)
+
+            # العرض: أوقات الجدول الدوري في نفس الفترة
+            cursor.execute('''
+                SELECT doctor_id, day_ordinal, start_minute
+                FROM doctor_periodic_schedules
+                WHERE day_ordinal BETWEEN ? AND ? AND status != 'blocked'
+            ''', (start.toordinal(), today.toordinal()))
+            slot_cells = [doctor_index[row['doctor_id']] * HOURS_PER_WEEK
+                          + ((row['day_ordinal'] - 1) % 7) * 24 + row['start_minute'] // 60
+                          for row in cursor.fetchall()
+                          if row['doctor_id'] in doctor_index and row['start_minute'] is not None]
+
+            size = len(doctor_ids) * HOURS_PER_WEEK
+            weeks = max(window_days / 7.0, 1.0)
+            rows = self._aggregate_demand(cells, booked, cancelled, no_show, slot_cells, size, weeks)
+
+            records = []
+            for cell, (booked_count, cancelled_count, no_show_count, slot_count,
+                       fill_rate, no_show_rate, weekly_demand) in enumerate(rows):
+                if not (booked_count or cancelled_count or slot_count):
+                    continue
+                records.append((doctor_ids[cell // HOURS_PER_WEEK], cell % HOURS_PER_WEEK,
+                                booked_count, cancelled_count, no_show_count, slot_count,
+                                fill_rate, no_show_rate, weekly_demand))
+
+            cursor.execute('DELETE FROM doctor_demand_stats')
+            cursor.executemany('''
+                INSERT INTO doctor_demand_stats
+                (doctor_id, hour_of_week, booked_count, cancelled_count, no_show_count, slot_count,
+                 fill_rate, no_show_rate, weekly_demand)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', records)
+            self.conn.commit()
+
+            self.clear_demand_stats_cache()
+            elapsed_ms = int((time_module.perf_counter() - started) * 1000)
+            logging.info(f"📊 تم بناء إحصائيات الطلب: {len(cells)} موعد، {len(records)} خلية "
+                         f"({'numpy' if np is not None else 'python'}) خلال {elapsed_ms} ms")
+
+            return {'success': True, 'doctors': len(doctor_ids), 'appointments': len(cells),
+                    'cells': len(records), 'elapsed_ms': elapsed_ms}
+
+        except Exception as e:
+            logging.error(f"❌ خطأ في بناء إحصائيات الطلب: {e}")
+            self.conn.rollback()
+            return {'success': False, 'message': str(e)}
+
+    def _aggregate_demand(self, cells, booked, cancelled, no_show, slot_cells, size, weeks) -> List[tuple]:
+        """تجميع الأعداد والنسب لكل خلية (متجه بـ NumPy إن توفرت)"""
+        if np is not None:
+            cell_array = np.asarray(cells, dtype=np.int64)
+            booked_counts = np.bincount(cell_array, weights=np.asarray(booked, dtype=np.float64), minlength=size)
+            cancelled_counts = np.bincount(cell_array, weights=np.asarray(cancelled, dtype=np.float64), minlength=size)
+            no_show_counts = np.bincount(cell_array, weights=np.asarray(no_show, dtype=np.float64), minlength=size)
+            slot_counts = np.bincount(np.asarray(slot_cells, dtype=np.int64), minlength=size).astype(np.float64)
+
+            supply = np.maximum(slot_counts, booked_counts)
+            fill_rate = np.divide(booked_counts, supply, out=np.zeros(size), where=supply > 0)
+            no_show_rate = np.divide(no_show_counts, booked_counts, out=np.zeros(size), where=booked_counts > 0)
+            weekly_demand = booked_counts / weeks
+
+            return list(zip(booked_counts.astype(int).tolist(), cancelled_counts.astype(int).tolist(),
+                            no_show_counts.astype(int).tolist(), slot_counts.astype(int).tolist(),
+                            np.round(fill_rate, 4).tolist(), np.round(no_show_rate, 4).tolist(),
+                            np.round(weekly_demand, 4).tolist()))
+
+        booked_counts = [0] * size
+        cancelled_counts = [0] * size
+        no_show_counts = [0] * size
+        slot_counts = [0] * size
+        for cell, is_booked, is_cancelled, is_no_show in zip(cells, booked, cancelled, no_show):
+            booked_counts[cell] += is_booked
+            cancelled_counts[cell] += is_cancelled
+            no_show_counts[cell] += is_no_show
+        for cell in slot_cells:
+            slot_counts[cell] += 1
+
+        rows = []
+        for cell in range(size):
+            supply = max(slot_counts[cell], booked_counts[cell])
+            rows.append((
+                booked_counts[cell], cancelled_counts[cell], no_show_counts[cell], slot_counts[cell],
+                round(booked_counts[cell] / supply, 4) if supply else 0.0,
+                round(no_show_counts[cell] / booked_counts[cell], 4) if booked_counts[cell] else 0.0,
+                round(booked_counts[cell] / weeks, 4)
+            ))
+        return rows
+
+    def clear_demand_stats_cache(self):
+        """مسح إحصائيات الأطباء المحفوظة في الذاكرة (بعد إعادة البناء من اتصال آخر)"""
+        self._demand_stats_cache = {}
+
+    def get_demand_stats(self, doctor_id: int) -> List[Optional[Dict]]:
+        """إحصائيات الطبيب كمصفوفة بطول 168 (فهرسة مباشرة بساعة الأسبوع)"""
+        cache = getattr(self, '_demand_stats_cache', None)
+        if cache is None:
+            cache = self._demand_stats_cache = {}
+
+        stats = cache.get(doctor_id)
+        if stats is None:
+            stats = [None] * HOURS_PER_WEEK
+            try:
+                cursor = self.conn.cursor()
+                cursor.execute('''
+                    SELECT hour_of_week, booked_count, no_show_count, slot_count,
+                           fill_rate, no_show_rate, weekly_demand
+                    FROM doctor_demand_stats WHERE doctor_id = ?
+                ''', (doctor_id,))
+                for row in cursor.fetchall():
+                    stats[row['hour_of_week']] = dict(row)
+            except Exception as e:
+                logging.error(f"❌ خطأ في جلب إحصائيات الطلب: {e}")
+            cache[doctor_id] = stats
+        return stats
+
+    def get_hour_stats(self, doctor_id: int, target_date, hour: int) -> Optional[Dict]:
+        """إحصائية ساعة محددة في يوم محدد"""
+        weekday = (to_ordinal(target_date) - 1) % 7
+        return self.get_demand_stats(doctor_id)[weekday * 24 + hour]
+
+    def rank_times_by_demand(self, doctor_id: int, target_date, times: List[str]) -> List[str]:
+        """ترتيب الأوقات من الأهدأ للأكثر ازدحاماً حسب الإحصائيات المحسوبة مسبقاً"""
+        stats = self.get_demand_stats(doctor_id)
+        base = ((to_ordinal(target_date) - 1) % 7) * 24
+
+        def score(time_str):
+            cell = stats[base + to_minutes(time_str) // 60]
+            return (cell['fill_rate'], cell['no_show_rate']) if cell else (0.0, 0.0)
+
+        return sorted(times, key=lambda time_str: (score(time_str), to_minutes(time_str)))
+
+    def get_busy_hours(self, doctor_id: int, target_date, limit: int = 2) -> List[int]:
+        """أكثر ساعات اليوم إشغالاً تاريخياً"""
+        stats = self.get_demand_stats(doctor_id)
+        base = ((to_ordinal(target_date) - 1) % 7) * 24
+        hours = [(stats[base + hour]['fill_rate'], hour) for hour in range(24)
+                 if stats[base + hour] and stats[base + hour]['booked_count']]
+        return [hour for _, hour in sorted(hours, reverse=True)[:limit]]
+
+    def is_demand_stats_stale(self, max_age_hours: int = 24) -> bool:
+        """هل تحتاج الإحصائيات لإعادة البناء"""
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute('SELECT MAX(updated_at) FROM doctor_demand_stats')
+            last_update = cursor.fetchone()[0]
+            if not last_update:
+                return True
+            return datetime.strptime(last_update, '%Y-%m-%d %H:%M:%S') < datetime.utcnow() - timedelta(hours=max_age_hours)
+
+        except Exception as e:
+            logging.error(f"❌ خطأ في فحص عمر الإحصائيات: {e}")
+            return True
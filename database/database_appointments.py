@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
 import logging
-from datetime import date
+from datetime import date, datetime, timedelta
+
+from scheduling_time import to_minutes, minutes_to_label
 
 class AppointmentsMixin:
     """ميكسین إدارة المواعيد والتذكيرات - الإصدار المصحح"""
@@ -83,6 +85,327 @@ class AppointmentsMixin:
             logging.error(f"❌ خطأ في جلب المواعيد: {e}")
             return []
     
+    # بداية الموعد ونهايته بالدقائق من 'HH:MM' ومدة نوع الخدمة (30 دقيقة افتراضياً)
+    APPOINTMENT_START_SQL = "CAST(substr(NEW.appointment_time, 1, 2) AS INTEGER) * 60 + CAST(substr(NEW.appointment_time, 4, 2) AS INTEGER)"
+    APPOINTMENT_DURATION_SQL = "COALESCE((SELECT default_duration FROM service_types WHERE name = NEW.type), 30)"
+
+    def create_appointment_interval_index(self):
+        """أعمدة فترة الموعد (start_minute, end_minute) وفهرس تعارض مواعيد المريض
+
+        تُحدَّث الأعمدة بمشغلات SQLite عند الإدراج أو تغيير الوقت/النوع، فتبقى صحيحة
+        لكل مسارات الحجز (الإضافة، التعديل، قائمة الانتظار، النقل الجماعي).
+        """
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute("PRAGMA table_info(appointments)")
+            existing_columns = [column[1] for column in cursor.fetchall()]
+            
+            for column_name in ('start_minute', 'end_minute'):
+                if column_name not in existing_columns:
+                    cursor.execute(f'ALTER TABLE appointments ADD COLUMN {column_name} INTEGER')
+                    logging.info(f"✅ تم إضافة عمود {column_name} لجدول المواعيد")
+            
+            start_sql = self.APPOINTMENT_START_SQL
+            duration_sql = self.APPOINTMENT_DURATION_SQL
+            for trigger_name, event in (('trg_appointments_interval_insert', 'INSERT'),
+                                        ('trg_appointments_interval_update', 'UPDATE OF appointment_time, type')):
+                cursor.execute(f'''
+                    CREATE TRIGGER IF NOT EXISTS {trigger_name}
+                    AFTER {event} ON appointments
+                    BEGIN
+                        UPDATE appointments
+                        SET start_minute = {start_sql},
+                            end_minute = {start_sql} + {duration_sql}
+                        WHERE id = NEW.id;
+                    END
+                ''')
+            
+            # تعبئة المواعيد القديمة
+            cursor.execute(f'''
+                UPDATE appointments
+                SET start_minute = {start_sql.replace('NEW.', '')},
+                    end_minute = {start_sql.replace('NEW.', '')} + {duration_sql.replace('NEW.type', 'appointments.type')}
+                WHERE start_minute IS NULL AND appointment_time IS NOT NULL
+            ''')
+            
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_appointments_patient_interval
+                ON appointments (patient_id, appointment_date, start_minute, end_minute)
+            ''')
+            
+            self.conn.commit()
+            
+        except Exception as e:
+            logging.error(f"❌ خطأ في إنشاء فهرس فترات المواعيد: {e}")
+            self.conn.rollback()
+    
+    # مهلة كل تذكير قبل الموعد (معدِّل datetime في SQLite)
+    REMINDER_LEADS = {'24h': '-24 hours', '2h': '-2 hours'}
+
+    def create_reminder_due_index(self):
+        """أوقات استحقاق التذكيرات (reminder_24h_due_at, reminder_2h_due_at) وفهرسها
+
+        تُحسب بمشغلات عند الإدراج أو تغيير التاريخ/الوقت، ويُعاد ضبط علم الإرسال عند
+        تغيير الموعد ليُرسل تذكير بالوقت الجديد. الفحص يجلب كل ما استحق منذ آخر
+        علامة مائية (watermark) بمسح نطاق واحد على الفهرس.
+        """
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute("PRAGMA table_info(appointments)")
+            existing_columns = [column[1] for column in cursor.fetchall()]
+
+            for reminder_type in self.REMINDER_LEADS:
+                column_name = f'reminder_{reminder_type}_due_at'
+                if column_name not in existing_columns:
+                    cursor.execute(f'ALTER TABLE appointments ADD COLUMN {column_name} TEXT')
+                    logging.info(f"✅ تم إضافة عمود {column_name} لجدول المواعيد")
+
+            due_sql = ", ".join(
+                f"reminder_{reminder_type}_due_at = datetime(NEW.appointment_date, "
+                f"({self.APPOINTMENT_START_SQL}) || ' minutes', '{lead}')"
+                for reminder_type, lead in self.REMINDER_LEADS.items())
+
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_appointments_reminder_due_insert
+                AFTER INSERT ON appointments
+                BEGIN
+                    UPDATE appointments SET {due_sql} WHERE id = NEW.id;
+                END
+            ''')
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_appointments_reminder_due_update
+                AFTER UPDATE OF appointment_date, appointment_time ON appointments
+                WHEN NEW.appointment_date IS NOT OLD.appointment_date
+                  OR NEW.appointment_time IS NOT OLD.appointment_time
+                BEGIN
+                    UPDATE appointments
+                    SET {due_sql}, reminder_24h_sent = 0, reminder_2h_sent = 0
+                    WHERE id = NEW.id;
+                END
+            ''')
+
+            # تعبئة المواعيد القديمة
+            cursor.execute(f'''
+                UPDATE appointments SET {due_sql.replace('NEW.', '')}
+                WHERE reminder_24h_due_at IS NULL AND appointment_time IS NOT NULL
+            ''')
+
+            for reminder_type in self.REMINDER_LEADS:
+                cursor.execute(f'''
+                    CREATE INDEX IF NOT EXISTS idx_appointments_reminder_{reminder_type}_due
+                    ON appointments (reminder_{reminder_type}_sent, reminder_{reminder_type}_due_at)
+                ''')
+
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS reminder_watermarks (
+                    reminder_type TEXT PRIMARY KEY,
+                    watermark TEXT NOT NULL,
+                    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+
+            self.conn.commit()
+
+        except Exception as e:
+            logging.error(f"❌ خطأ في إنشاء فهرس استحقاق التذكيرات: {e}")
+            self.conn.rollback()
+
+    def get_due_reminders(self, reminder_type, now=None):
+        """المواعيد التي استحق تذكيرها منذ آخر فحص ولم يُرسل بعد
+
+        النطاق (max(العلامة المائية، الآن - المهلة)، الآن]: يلحق بما فات أثناء توقف
+        البرنامج دون إرسال تذكيرات لمواعيد انقضت.
+        """
+        try:
+            now = now or datetime.now()
+            lead_hours = int(self.REMINDER_LEADS[reminder_type].split()[0].lstrip('-'))
+            until = now.strftime('%Y-%m-%d %H:%M:%S')
+            since = (now - timedelta(hours=lead_hours)).strftime('%Y-%m-%d %H:%M:%S')
+
+            cursor = self.conn.cursor()
+            cursor.execute('SELECT watermark FROM reminder_watermarks WHERE reminder_type = ?', (reminder_type,))
+            row = cursor.fetchone()
+            if row and row['watermark'] > since:
+                since = row['watermark']
+
+            # عند اللحاق لا يُرسل تذكير أقدم إذا استحق تذكير أقرب للموعد
+            superseded_sql = "".join(
+                f" AND a.reminder_{other}_due_at > :until"
+                for other, lead in self.REMINDER_LEADS.items()
+                if int(lead.split()[0].lstrip('-')) < lead_hours)
+
+            cursor.execute(f'''
+                SELECT a.*, a.reminder_{reminder_type}_due_at AS reminder_due_at,
+                       p.name as patient_name, p.phone as patient_phone,
+                       d.name as doctor_name, dep.name as department_name
+                FROM appointments a
+                JOIN patients p ON a.patient_id = p.id
+                JOIN doctors d ON a.doctor_id = d.id
+                JOIN departments dep ON a.department_id = dep.id
+                WHERE a.reminder_{reminder_type}_sent = 0
+                AND a.reminder_{reminder_type}_due_at > :since AND a.reminder_{reminder_type}_due_at <= :until
+                AND a.status = 'مجدول'{superseded_sql}
+                ORDER BY a.reminder_{reminder_type}_due_at
+            ''', {'since': since, 'until': until})
+
+            return [dict(row) for row in cursor.fetchall()]
+
+        except Exception as e:
+            logging.error(f"❌ خطأ في جلب التذكيرات المستحقة: {e}")
+            return []
+
+    def advance_reminder_watermark(self, reminder_type, scanned_until, failed_due_times=None):
+        """تقديم العلامة المائية بعد الفحص - تبقى قبل أول تذكير فشل ليُعاد في الفحص التالي"""
+        try:
+            watermark = scanned_until.strftime('%Y-%m-%d %H:%M:%S')
+            if failed_due_times:
+                earliest = datetime.strptime(min(failed_due_times), '%Y-%m-%d %H:%M:%S')
+                watermark = min(watermark, (earliest - timedelta(seconds=1)).strftime('%Y-%m-%d %H:%M:%S'))
+
+            self.conn.cursor().execute('''
+                INSERT OR REPLACE INTO reminder_watermarks (reminder_type, watermark, updated_at)
+                VALUES (?, ?, CURRENT_TIMESTAMP)
+            ''', (reminder_type, watermark))
+            self.conn.commit()
+            return True
+
+        except Exception as e:
+            logging.error(f"❌ خطأ في تحديث علامة التذكيرات: {e}")
+            self.conn.rollback()
+            return False
+
+    def get_upcoming_reminder_times(self, since, until):
+        """أوقات استحقاق التذكيرات غير المرسلة في النطاق (since، until] - لجدولة المُنبّه
+        
+        تُرجع [(وقت الاستحقاق، نوع التذكير، رقم الموعد)] مرتبة، بمسح نطاق على فهرس كل نوع.
+        """
+        try:
+            cursor = self.conn.cursor()
+            params = {'since': since.strftime('%Y-%m-%d %H:%M:%S'), 'until': until.strftime('%Y-%m-%d %H:%M:%S')}
+            events = []
+            for reminder_type in self.REMINDER_LEADS:
+                cursor.execute(f'''
+                    SELECT id, reminder_{reminder_type}_due_at AS due_at FROM appointments
+                    WHERE reminder_{reminder_type}_sent = 0
+                    AND reminder_{reminder_type}_due_at > :since AND reminder_{reminder_type}_due_at <= :until
+                    AND status = 'مجدول'
+                ''', params)
+                events.extend((datetime.strptime(row['due_at'], '%Y-%m-%d %H:%M:%S'), reminder_type, row['id'])
+                              for row in cursor.fetchall())
+            return sorted(events)
+        
+        except Exception as e:
+            logging.error(f"❌ خطأ في جلب أوقات التذكيرات القادمة: {e}")
+            return []
+    
+    def get_appointment_reminder_times(self, appointment_id):
+        """أوقات استحقاق تذكيرات موعد واحد التي لم تُرسل بعد [(وقت الاستحقاق، النوع، رقم الموعد)]"""
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute('SELECT * FROM appointments WHERE id = ?', (appointment_id,))
+            row = cursor.fetchone()
+            if not row or row['status'] != 'مجدول':
+                return []
+            
+            return sorted(
+                (datetime.strptime(row[f'reminder_{reminder_type}_due_at'], '%Y-%m-%d %H:%M:%S'),
+                 reminder_type, appointment_id)
+                for reminder_type in self.REMINDER_LEADS
+                if not row[f'reminder_{reminder_type}_sent'] and row[f'reminder_{reminder_type}_due_at'])
+        
+        except Exception as e:
+            logging.error(f"❌ خطأ في جلب أوقات تذكيرات الموعد {appointment_id}: {e}")
+            return []
+    
+    def add_appointment_listener(self, callback):
+        """تسجيل دالة تُستدعى برقم الموعد بعد حفظ أي تغيير عليه (None = تغيير جماعي)"""
+        listeners = getattr(self, '_appointment_listeners', None)
+        if listeners is None:
+            listeners = self._appointment_listeners = []
+        if callback not in listeners:
+            listeners.append(callback)
+    
+    def remove_appointment_listener(self, callback):
+        """إلغاء تسجيل دالة تغيير المواعيد"""
+        listeners = getattr(self, '_appointment_listeners', None) or []
+        if callback in listeners:
+            listeners.remove(callback)
+    
+    def notify_appointment_changed(self, appointment_id=None):
+        """إبلاغ المستمعين بتغيير موعد بعد الحفظ - خطأ مستمع لا يُفشل عملية الحفظ"""
+        for callback in list(getattr(self, '_appointment_listeners', None) or []):
+            try:
+                callback(appointment_id)
+            except Exception as e:
+                logging.error(f"❌ خطأ في مستمع تغيير المواعيد: {e}")
+    
+    def find_patient_conflicts(self, patient_id, appointment_date, appointment_time,
+                               appointment_type=None, exclude_appointment_id=None):
+        """مواعيد المريض المتداخلة مع وقت محدد (مع أي طبيب) - تعمل داخل معاملة الحجز"""
+        cursor = self.conn.cursor()
+        
+        start_minute = to_minutes(appointment_time)
+        cursor.execute('SELECT default_duration FROM service_types WHERE name = ?', (appointment_type,))
+        row = cursor.fetchone()
+        end_minute = start_minute + (row['default_duration'] if row and row['default_duration'] else 30)
+        
+        cursor.execute('''
+            SELECT a.id, a.doctor_id, d.name AS doctor_name, a.appointment_time,
+                   a.start_minute, a.end_minute, a.status
+            FROM appointments a
+            LEFT JOIN doctors d ON d.id = a.doctor_id
+            WHERE a.patient_id = ? AND a.appointment_date = ?
+            AND a.start_minute < ? AND a.end_minute > ? AND a.id != ?
+        ''', (patient_id, appointment_date, end_minute, start_minute, exclude_appointment_id or 0))
+        
+        return [dict(row) for row in cursor.fetchall() if not self.is_cancelled_status(row['status'])]
+    
+    def audit_patient_overlaps(self):
+        """تدقيق كل قاعدة البيانات: أزواج مواعيد المريض المتداخلة بمرور ترتيب ومسح واحد"""
+        try:
+            cursor = self.conn.cursor()
+            cursor.row_factory = None
+            cursor.execute('''
+                SELECT patient_id, appointment_date, start_minute, end_minute, id, doctor_id, status
+                FROM appointments
+                WHERE start_minute IS NOT NULL
+                ORDER BY patient_id, appointment_date, start_minute
+            ''')
+            
+            overlaps = []
+            current_key = None
+            active = []  # المواعيد التي لم تنتهِ بعد عند نقطة المسح
+            for patient_id, appointment_date, start_minute, end_minute, appointment_id, doctor_id, status in cursor:
+                if self.is_cancelled_status(status):
+                    continue
+                key = (patient_id, appointment_date)
+                if key != current_key:
+                    current_key = key
+                    active = []
+                
+                active = [item for item in active if item[1] > start_minute]
+                for other_id, other_end, other_doctor, other_start in active:
+                    overlaps.append({
+                        'patient_id': patient_id,
+                        'appointment_date': appointment_date,
+                        'first_appointment_id': other_id,
+                        'first_doctor_id': other_doctor,
+                        'first_time': minutes_to_label(other_start),
+                        'second_appointment_id': appointment_id,
+                        'second_doctor_id': doctor_id,
+                        'second_time': minutes_to_label(start_minute),
+                        'overlap_minutes': min(other_end, end_minute) - start_minute
+                    })
+                active.append((appointment_id, end_minute, doctor_id, start_minute))
+            
+            if overlaps:
+                logging.warning(f"⚠️ تم العثور على {len(overlaps)} تعارض في مواعيد المرضى")
+            return overlaps
+            
+        except Exception as e:
+            logging.error(f"❌ خطأ في تدقيق تعارض مواعيد المرضى: {e}")
+            return []
+    
     def get_today_appointments(self):
         """الحصول على مواعيد اليوم"""
         try:
@@ -96,29 +419,14 @@ class AppointmentsMixin:
     def add_appointment(self, appointment_data):
         """إضافة موعد جديد"""
         try:
-            query = '''
-                INSERT INTO appointments (
-                    patient_id, doctor_id, department_id, clinic_id, 
-                    appointment_date, appointment_time, type, status, notes
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            '''
-            params = (
-                appointment_data['patient_id'],
-                appointment_data['doctor_id'],
-                appointment_data['department_id'],
-                appointment_data['clinic_id'],
-                appointment_data['appointment_date'],
-                appointment_data['appointment_time'],
-                appointment_data.get('type', 'كشف'),
-                appointment_data.get('status', 'مجدول'),
-                appointment_data.get('notes', '')
-            )
+            appointment_id = self._insert_appointment(appointment_data)
+            if not appointment_id:
+                self.conn.rollback()
+                return None
             
-            cursor = self.conn.cursor()
-            cursor.execute(query, params)
             self.conn.commit()
+            self.notify_appointment_changed(appointment_id)
             
-            appointment_id = cursor.lastrowid
             logging.info(f"✅ تم إضافة الموعد الجديد برقم: {appointment_id}")
             return appointment_id
             
@@ -127,13 +435,93 @@ class AppointmentsMixin:
             self.conn.rollback()
             return None
 
+    def _insert_appointment(self, appointment_data, allow_held_slot=False):
+        """إدراج الموعد مع حجز سعة اليوم ووقت الطبيب والموارد - بدون حفظ
+
+        تُرجع رقم الموعد، أو None عند أي تعارض ويتولى المستدعي التراجع.
+        """
+        query = '''
+            INSERT INTO appointments (
+                patient_id, doctor_id, department_id, clinic_id, 
+                appointment_date, appointment_time, type, status, notes
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        '''
+        params = (
+            appointment_data['patient_id'],
+            appointment_data['doctor_id'],
+            appointment_data['department_id'],
+            appointment_data['clinic_id'],
+            appointment_data['appointment_date'],
+            appointment_data['appointment_time'],
+            appointment_data.get('type', 'كشف'),
+            appointment_data.get('status', 'مجدول'),
+            appointment_data.get('notes', '')
+        )
+        counted = self.is_capacity_status(appointment_data.get('status', 'مجدول'))
+        
+        # حجز مكان في سعة اليوم ضمن نفس المعاملة
+        if counted:
+            if not self.reserve_daily_capacity(appointment_data['doctor_id'], appointment_data['appointment_date']):
+                return None
+            
+            # منع حجز المريض في وقتين متداخلين (ضمن نفس المعاملة بعد قفل الكتابة)
+            conflicts = self.find_patient_conflicts(
+                appointment_data['patient_id'], appointment_data['appointment_date'],
+                appointment_data['appointment_time'], appointment_data.get('type', 'كشف'))
+            if conflicts:
+                logging.warning(f"⚠️ المريض لديه موعد متداخل: {conflicts[0]['appointment_time']} "
+                                f"مع {conflicts[0]['doctor_name']}")
+                return None
+        
+        cursor = self.conn.cursor()
+        cursor.execute(query, params)
+        appointment_id = cursor.lastrowid
+        
+        # حجز وقت الطبيب الدوري والغرف/الأجهزة المطلوبة ضمن نفس المعاملة
+        if counted:
+            if not self.claim_doctor_slot(appointment_id, appointment_data, allow_held=allow_held_slot):
+                return None
+            if self.needs_resources(appointment_data) and not self.claim_appointment_resources(appointment_id, appointment_data):
+                return None
+        
+        # موعد لليوم يغير طابور الطبيب
+        self.touch_doctor_queue(appointment_data['doctor_id'], appointment_data['appointment_date'])
+        return appointment_id
+
     def update_appointment_status(self, appointment_id, new_status):
         """تحديث حالة الموعد"""
         try:
-            query = 'UPDATE appointments SET status = ? WHERE id = ?'
             cursor = self.conn.cursor()
+            cursor.execute('''
+                SELECT doctor_id, appointment_date, appointment_time, status FROM appointments WHERE id = ?
+            ''', (appointment_id,))
+            old = cursor.fetchone()
+            
+            if old and not self.apply_capacity_change(
+                    (old['doctor_id'], old['appointment_date'], old['status']),
+                    (old['doctor_id'], old['appointment_date'], new_status)):
+                self.conn.rollback()
+                return False
+            
+            # إعادة موعد ملغى: يستعيد وقت الطبيب إن كان ما زال متاحاً
+            if old and not self.is_capacity_status(old['status']) and self.is_capacity_status(new_status):
+                if not self.claim_doctor_slot(appointment_id, dict(old)):
+                    self.conn.rollback()
+                    return False
+            
+            query = 'UPDATE appointments SET status = ? WHERE id = ?'
             cursor.execute(query, (new_status, appointment_id))
+            
+            # الحضور والانتهاء يحدثان تقدير الانتظار في طابور اليوم
+            if old and old['status'] != new_status:
+                self.on_appointment_status_changed(appointment_id, old['doctor_id'], old['appointment_date'], new_status)
+            
             self.conn.commit()
+            self.notify_appointment_changed(appointment_id)
+            
+            # حدث الإلغاء: تحرير الوقت وعرضه على قائمة الانتظار
+            if old and self.is_cancelled_status(new_status) and not self.is_cancelled_status(old['status']):
+                self.handle_appointments_cancelled([appointment_id])
             
             logging.info(f"✅ تم تحديث حالة الموعد {appointment_id} إلى: {new_status}")
             return True
@@ -166,8 +554,59 @@ class AppointmentsMixin:
             )
             
             cursor = self.conn.cursor()
+            cursor.execute('''
+                SELECT doctor_id, appointment_date, appointment_time, status FROM appointments WHERE id = ?
+            ''', (appointment_id,))
+            old = cursor.fetchone()
+            
+            if old and not self.apply_capacity_change(
+                    (old['doctor_id'], old['appointment_date'], old['status']),
+                    (appointment_data['doctor_id'], appointment_data['appointment_date'],
+                     appointment_data.get('status', 'مجدول'))):
+                self.conn.rollback()
+                return False
+            
+            if self.is_capacity_status(appointment_data.get('status', 'مجدول')) and self.find_patient_conflicts(
+                    appointment_data['patient_id'], appointment_data['appointment_date'],
+                    appointment_data['appointment_time'], appointment_data.get('type', 'كشف'),
+                    exclude_appointment_id=appointment_id):
+                logging.warning(f"⚠️ المريض لديه موعد متداخل في {appointment_data['appointment_date']} "
+                                f"{appointment_data['appointment_time']}")
+                self.conn.rollback()
+                return False
+            
             cursor.execute(query, params)
+            
+            # نقل وقت الطبيب الدوري مع الموعد (الإلغاء يحرره معالج الإلغاء بعد الحفظ)
+            if old and self.is_capacity_status(appointment_data.get('status', 'مجدول')):
+                old_slot = (old['doctor_id'], old['appointment_date'], to_minutes(old['appointment_time']))
+                new_slot = (appointment_data['doctor_id'], appointment_data['appointment_date'],
+                            to_minutes(appointment_data['appointment_time']))
+                if old_slot != new_slot:
+                    self.release_doctor_slot(appointment_id)
+                if not self.claim_doctor_slot(appointment_id, appointment_data):
+                    self.conn.rollback()
+                    return False
+            
+            # نقل حجوزات الموارد مع الموعد
+            if old and not self.move_appointment_resources(appointment_id, appointment_data['appointment_date'],
+                                                           appointment_data['appointment_time']):
+                self.conn.rollback()
+                return False
+            
+            if old:
+                self.touch_doctor_queue(old['doctor_id'], old['appointment_date'])
+                self.touch_doctor_queue(appointment_data['doctor_id'], appointment_data['appointment_date'])
+            if old and old['status'] != appointment_data.get('status', 'مجدول'):
+                self.on_appointment_status_changed(appointment_id, appointment_data['doctor_id'],
+                                                   appointment_data['appointment_date'],
+                                                   appointment_data.get('status', 'مجدول'))
+            
             self.conn.commit()
+            self.notify_appointment_changed(appointment_id)
+            
+            if old and self.is_cancelled_status(appointment_data.get('status')) and not self.is_cancelled_status(old['status']):
+                self.handle_appointments_cancelled([appointment_id])
             
             return True
             
@@ -176,6 +615,29 @@ class AppointmentsMixin:
             self.conn.rollback()
             return False
 
+    def apply_capacity_change(self, old, new):
+        """تحديث عدادات السعة عند تغيير (الطبيب، التاريخ، الحالة) للموعد - بدون حفظ
+
+        تُرجع False إذا كان اليوم الجديد مكتملاً
+        """
+        old_doctor, old_date, old_status = old
+        new_doctor, new_date, new_status = new
+        
+        old_counted = self.is_capacity_status(old_status)
+        new_counted = self.is_capacity_status(new_status)
+        same_day = (old_doctor, old_date) == (new_doctor, new_date)
+        
+        if same_day and old_counted == new_counted:
+            return True
+        
+        if new_counted and not (same_day and old_counted):
+            if not self.reserve_daily_capacity(new_doctor, new_date):
+                return False
+        if old_counted and not (same_day and new_counted):
+            self.release_daily_capacity(old_doctor, old_date)
+        
+        return True
+
     def get_appointment_by_id(self, appointment_id):
         """الحصول على بيانات موعد بواسطة ID"""
         try:
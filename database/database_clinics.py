@@ -85,6 +85,9 @@ class ClinicsMixin:
             cursor.execute(query, params)
             self.conn.commit()
             
+            # اسم العيادة وهاتفها متغيرات في قوالب الرسائل
+            self.invalidate_template_cache(clinic_id)
+            
             logging.info(f"✅ تم تحديث العيادة: {clinic_data['name']} - ID: {clinic_id}")
             return True
             
@@ -69,6 +69,7 @@ class DatabaseInitMixin:
                 template_type TEXT NOT NULL,
                 template_content TEXT NOT NULL,
                 variables TEXT,
+                template_level TEXT DEFAULT 'clinic', -- clinic / department / doctor
                 is_active BOOLEAN DEFAULT 1,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 FOREIGN KEY (clinic_id) REFERENCES clinics (id)
@@ -291,7 +292,8 @@ class DatabaseInitMixin:
             missing_columns = {
                 'template_content': 'TEXT',
                 'variables': 'TEXT',
-                'is_active': 'BOOLEAN'
+                'is_active': 'BOOLEAN',
+                'template_level': "TEXT DEFAULT 'clinic'"
             }
             
             for column, definition in missing_columns.items():
@@ -323,6 +325,7 @@ class DatabaseInitMixin:
                         template_type TEXT NOT NULL,
                         template_content TEXT NOT NULL,
                         variables TEXT,
+                        template_level TEXT DEFAULT 'clinic',
                         is_active BOOLEAN DEFAULT 1,
                         created_at TIMESTAMP,
                         FOREIGN KEY (clinic_id) REFERENCES clinics (id)
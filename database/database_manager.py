@@ -14,6 +14,15 @@ from database_patients import PatientsMixin
 from database_appointments import AppointmentsMixin
 from database_utils import DatabaseUtilsMixin
 from database_scheduling import SchedulingMixin  # نظام الجدولة الذكية
+from database_waitlist import WaitlistMixin  # قائمة الانتظار
+from database_rescheduling import ReschedulingMixin  # إعادة الجدولة الجماعية
+from database_analytics import AnalyticsMixin  # إحصائيات الطلب
+from database_resources import ResourcesMixin  # الغرف والأجهزة
+from database_recurring import RecurringAppointmentsMixin  # المواعيد المتكررة
+from database_queue import WalkInQueueMixin  # طابور المراجعين
+from database_outbox import OutboxMixin  # صندوق الرسائل الصادرة
+from database_send_ledger import SendLedgerMixin  # سجل الإرسال (مرة واحدة لكل رسالة)
+from database_receipts import DeliveryReceiptsMixin  # إيصالات التسليم وردود المرضى
 
 class DatabaseManager(
     DatabaseInitMixin,
@@ -24,7 +33,16 @@ class DatabaseManager(
     PatientsMixin,
     AppointmentsMixin,
     DatabaseUtilsMixin,
-    SchedulingMixin  # إضافة نظام الجدولة
+    SchedulingMixin,  # إضافة نظام الجدولة
+    WaitlistMixin,
+    ReschedulingMixin,
+    AnalyticsMixin,
+    ResourcesMixin,
+    RecurringAppointmentsMixin,
+    WalkInQueueMixin,
+    OutboxMixin,
+    SendLedgerMixin,
+    DeliveryReceiptsMixin
 ):
     """مدير قاعدة البيانات - الجسر الخفيف المتكامل"""
     
@@ -176,6 +194,42 @@ class DatabaseManager(
             # إنشاء جداول الجدولة الذكية (من scheduling.py)
             self.create_scheduling_tables()
             
+            # فهرس فترات المواعيد لكشف تعارض مواعيد المريض
+            self.create_appointment_interval_index()
+            
+            # أوقات استحقاق التذكيرات وفهرسها
+            self.create_reminder_due_index()
+            
+            # سلاسل المواعيد المتكررة
+            self.create_series_tables()
+            
+            # جداول قائمة الانتظار
+            self.create_waitlist_tables()
+            
+            # جدول إحصائيات الطلب
+            self.create_analytics_tables()
+            
+            # جداول الموارد (الغرف والأجهزة)
+            self.create_resources_tables()
+            
+            # طابور المراجعين بدون موعد
+            self.create_queue_tables()
+            
+            # صندوق الرسائل الصادرة
+            self.create_outbox_tables()
+            
+            # سجل الإرسال لمنع تكرار التذكيرات
+            self.create_send_ledger_table()
+            
+            # قوالب الرسائل (محرك القوالب المجمّعة)
+            self.create_message_templates_table()
+            
+            # تجميعات إحصائيات الرسائل (ساعة / يوم)
+            self.create_message_stats_rollups()
+            
+            # إيصالات التسليم (مُسلَّمة / مقروءة) وردود المرضى
+            self.create_delivery_receipt_tables()
+            
             self.conn.commit()
             logging.info("✅ تم إنشاء جميع الجداول بنجاح")
             
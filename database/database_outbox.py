@@ -0,0 +1,308 @@
+# -*- coding: utf-8 -*-
+import logging
+import random
+import uuid
+from datetime import datetime, timedelta
+from typing import List, Dict, Optional
+
+# إعادة المحاولة: تأخير أسي مع تشويش عشوائي حتى حد أعلى
+OUTBOX_BASE_DELAY_SECONDS = 30
+OUTBOX_MAX_DELAY_SECONDS = 60 * 60
+OUTBOX_MAX_ATTEMPTS = 5
+
+# رسالة بقيت "قيد الإرسال" أكثر من هذا تُعتبر عالقة (توقف البرنامج أثناء الإرسال)
+OUTBOX_STALE_MINUTES = 10
+
+def _timestamp(moment: datetime) -> str:
+    return moment.strftime('%Y-%m-%d %H:%M:%S')
+
+def outbox_retry_delay(attempts: int) -> float:
+    """مدة الانتظار قبل المحاولة التالية بالثواني (نصفها ثابت ونصفها عشوائي)"""
+    delay = min(OUTBOX_BASE_DELAY_SECONDS * (2 ** max(attempts - 1, 0)), OUTBOX_MAX_DELAY_SECONDS)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+class OutboxMixin:
+    """ميكسين صندوق الرسائل الصادرة (outbox)
+
+    كل رسالة تُكتب أولاً في جدول outbox ثم يرسلها موزع الرسائل في الخلفية، فتنجو
+    من إغلاق البرنامج وتُعاد عند الفشل. مفتاح التكرار (idempotency_key) يمنع
+    إدراج نفس الرسالة مرتين (مثل تذكير نفس الموعد).
+    """
+
+    def create_outbox_tables(self):
+        """إنشاء جدول الرسائل الصادرة"""
+        try:
+            cursor = self.conn.cursor()
+
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS outbox (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    idempotency_key TEXT UNIQUE,
+                    channel TEXT NOT NULL DEFAULT 'whatsapp', -- whatsapp / email
+                    recipient TEXT NOT NULL,
+                    subject TEXT,
+                    message TEXT NOT NULL,
+                    message_type TEXT DEFAULT 'custom',
+                    clinic_id INTEGER DEFAULT 1,
+                    appointment_id INTEGER,
+                    patient_id INTEGER,
+                    priority INTEGER DEFAULT 0,
+                    status TEXT DEFAULT 'pending', -- pending / sending / sent / dead
+                    attempts INTEGER DEFAULT 0,
+                    max_attempts INTEGER DEFAULT 5,
+                    next_attempt_at TEXT NOT NULL,
+                    claim_token TEXT,
+                    locked_at TEXT,
+                    last_error TEXT,
+                    provider_message_id TEXT,
+                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    sent_at TEXT,
+                    FOREIGN KEY (appointment_id) REFERENCES appointments (id) ON DELETE SET NULL,
+                    FOREIGN KEY (patient_id) REFERENCES patients (id) ON DELETE SET NULL
+                )
+            ''')
+
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_outbox_due
+                ON outbox (status, next_attempt_at)
+            ''')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_outbox_claim
+                ON outbox (claim_token)
+            ''')
+
+            self.conn.commit()
+
+        except Exception as e:
+            logging.error(f"❌ خطأ في إنشاء جدول الرسائل الصادرة: {e}")
+            self.conn.rollback()
+
+    def enqueue_message(self, recipient: str, message: str, message_type: str = 'custom',
+                        channel: str = 'whatsapp', idempotency_key: str = None,
+                        appointment_id: int = None, patient_id: int = None, clinic_id: int = 1,
+                        subject: str = None, priority: int = 0, max_attempts: int = OUTBOX_MAX_ATTEMPTS,
+                        send_after: datetime = None) -> Optional[int]:
+        """إضافة رسالة لصندوق الصادر - تُرجع رقمها (أو رقم الرسالة الموجودة بنفس المفتاح)"""
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute('''
+                INSERT OR IGNORE INTO outbox (
+                    idempotency_key, channel, recipient, subject, message, message_type,
+                    clinic_id, appointment_id, patient_id, priority, max_attempts, next_attempt_at
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (idempotency_key, channel, recipient, subject, message, message_type,
+                  clinic_id, appointment_id, patient_id, priority, max_attempts,
+                  _timestamp(send_after or datetime.now())))
+
+            if cursor.rowcount:
+                message_id = cursor.lastrowid
+            else:
+                cursor.execute('SELECT id FROM outbox WHERE idempotency_key = ?', (idempotency_key,))
+                message_id = cursor.fetchone()['id']
+                logging.info(f"ℹ️ الرسالة {idempotency_key} موجودة مسبقاً في الصادر")
+
+            self.conn.commit()
+            return message_id
+
+        except Exception as e:
+            logging.error(f"❌ خطأ في إضافة رسالة للصادر: {e}")
+            self.conn.rollback()
+            return None
+
+    def claim_outbox_batch(self, limit: int) -> List[Dict]:
+        """حجز دفعة من الرسائل المستحقة للإرسال (تتحول إلى 'sending')"""
+        try:
+            token = uuid.uuid4().hex
+            now = _timestamp(datetime.now())
+            cursor = self.conn.cursor()
+            cursor.execute('''
+                UPDATE outbox SET status = 'sending', claim_token = ?, locked_at = ?
+                WHERE id IN (
+                    SELECT id FROM outbox
+                    WHERE status = 'pending' AND next_attempt_at <= ?
+                    ORDER BY priority DESC, next_attempt_at
+                    LIMIT ?
+                )
+            ''', (token, now, now, limit))
+            self.conn.commit()
+
+            if not cursor.rowcount:
+                return []
+            cursor.execute('SELECT * FROM outbox WHERE claim_token = ?', (token,))
+            return [dict(row) for row in cursor.fetchall()]
+
+        except Exception as e:
+            logging.error(f"❌ خطأ في حجز رسائل الصادر: {e}")
+            self.conn.rollback()
+            return []
+
+    def mark_outbox_sent(self, message_id: int, provider_message_id: str = None, provider: str = None) -> bool:
+        """تسجيل نجاح الإرسال (وتحديث علم التذكير للموعد ضمن نفس المعاملة)
+
+        رقم رسالة المزود يُسجل أيضاً في message_stats حتى تطابقه إيصالات التسليم.
+        """
+        try:
+            sent_at = _timestamp(datetime.now())
+            cursor = self.conn.cursor()
+            cursor.execute('''
+                UPDATE outbox
+                SET status = 'sent', attempts = attempts + 1, sent_at = ?,
+                    provider_message_id = ?, claim_token = NULL, last_error = NULL
+                WHERE id = ?
+            ''', (sent_at, provider_message_id, message_id))
+
+            cursor.execute('''
+                SELECT message_type, appointment_id, patient_id, clinic_id, channel, recipient
+                FROM outbox WHERE id = ?
+            ''', (message_id,))
+            row = cursor.fetchone()
+            if row and provider_message_id:
+                self._record_outbox_stat(cursor, row, provider or row['channel'], provider_message_id, sent_at)
+            if row and row['appointment_id'] and row['message_type'] in ('reminder_24h', 'reminder_2h'):
+                reminder_type = row['message_type'].split('_', 1)[1]
+                cursor.execute(f'''
+                    UPDATE appointments
+                    SET reminder_{reminder_type}_sent = 1, reminder_{reminder_type}_sent_at = datetime('now')
+                    WHERE id = ?
+                ''', (row['appointment_id'],))
+                self._sync_ledger_from_outbox(cursor, message_id, 'sent', provider_message_id)
+
+            self.conn.commit()
+            return True
+
+        except Exception as e:
+            logging.error(f"❌ خطأ في تحديث رسالة الصادر: {e}")
+            self.conn.rollback()
+            return False
+
+    def _record_outbox_stat(self, cursor, row, provider: str, provider_message_id: str, sent_at: str):
+        """صف إحصائية للرسالة المرسلة (ما لم يسجلها المزود) مع تجميعاتها - بدون حفظ"""
+        cursor.execute('''
+            INSERT INTO message_stats
+            (clinic_id, patient_id, appointment_id, message_type, phone_number, status, provider,
+             error_message, provider_message_id, sent_at, created_at)
+            SELECT ?, ?, ?, ?, ?, 'sent', ?, '', ?, ?, ?
+            WHERE NOT EXISTS (SELECT 1 FROM message_stats WHERE provider_message_id = ?)
+        ''', (row['clinic_id'] or 1, row['patient_id'], row['appointment_id'], row['message_type'],
+              row['recipient'], provider, provider_message_id, sent_at, sent_at, provider_message_id))
+        if cursor.rowcount:
+            self._rollup_message_stat(cursor, row['clinic_id'] or 1, datetime.fromisoformat(sent_at),
+                                      provider, row['message_type'], 'sent')
+
+    def mark_outbox_failed(self, message_id: int, error: str, retryable: bool = True) -> str:
+        """تسجيل فشل الإرسال - تُجدول إعادة المحاولة أو تُنقل للرسائل الميتة
+
+        تُرجع الحالة الجديدة: 'pending' أو 'dead'.
+        """
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute('SELECT attempts, max_attempts FROM outbox WHERE id = ?', (message_id,))
+            row = cursor.fetchone()
+            if not row:
+                return 'dead'
+
+            attempts = row['attempts'] + 1
+            if not retryable or attempts >= row['max_attempts']:
+                status, next_attempt = 'dead', datetime.now()
+                logging.warning(f"⚠️ الرسالة {message_id} نُقلت للرسائل الميتة بعد {attempts} محاولة: {error}")
+            else:
+                status = 'pending'
+                next_attempt = datetime.now() + timedelta(seconds=outbox_retry_delay(attempts))
+
+            cursor.execute('''
+                UPDATE outbox
+                SET status = ?, attempts = ?, next_attempt_at = ?, last_error = ?, claim_token = NULL
+                WHERE id = ?
+            ''', (status, attempts, _timestamp(next_attempt), str(error)[:500], message_id))
+            if status == 'dead':
+                # فشل نهائي: يسمح سجل الإرسال بحجز التذكير من جديد في الفحص التالي
+                self._sync_ledger_from_outbox(cursor, message_id, 'failed', error=error)
+            self.conn.commit()
+            return status
+
+        except Exception as e:
+            logging.error(f"❌ خطأ في تسجيل فشل رسالة الصادر: {e}")
+            self.conn.rollback()
+            return 'pending'
+
+    def defer_outbox_messages(self, message_ids: List[int], seconds: float) -> bool:
+        """إعادة رسائل محجوزة للانتظار دون احتساب محاولة (تجاوز حد معدل الإرسال)"""
+        try:
+            next_attempt = _timestamp(datetime.now() + timedelta(seconds=seconds))
+            self.conn.cursor().executemany('''
+                UPDATE outbox SET status = 'pending', next_attempt_at = ?, claim_token = NULL
+                WHERE id = ? AND status = 'sending'
+            ''', [(next_attempt, message_id) for message_id in message_ids])
+            self.conn.commit()
+            return True
+
+        except Exception as e:
+            logging.error(f"❌ خطأ في تأجيل رسائل الصادر: {e}")
+            self.conn.rollback()
+            return False
+
+    def recover_stale_outbox(self, stale_minutes: int = OUTBOX_STALE_MINUTES) -> int:
+        """إعادة الرسائل العالقة في 'sending' للانتظار (بعد إغلاق مفاجئ)"""
+        try:
+            cutoff = _timestamp(datetime.now() - timedelta(minutes=stale_minutes))
+            cursor = self.conn.cursor()
+            cursor.execute('''
+                UPDATE outbox SET status = 'pending', claim_token = NULL
+                WHERE status = 'sending' AND (locked_at IS NULL OR locked_at <= ?)
+            ''', (cutoff,))
+            self.conn.commit()
+
+            if cursor.rowcount:
+                logging.info(f"🔄 تمت استعادة {cursor.rowcount} رسالة عالقة في الصادر")
+            return cursor.rowcount
+
+        except Exception as e:
+            logging.error(f"❌ خطأ في استعادة رسائل الصادر: {e}")
+            self.conn.rollback()
+            return 0
+
+    def get_outbox_stats(self) -> Dict:
+        """عدد رسائل الصادر حسب الحالة"""
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute('SELECT status, COUNT(*) AS count FROM outbox GROUP BY status')
+            stats = {'pending': 0, 'sending': 0, 'sent': 0, 'dead': 0}
+            stats.update({row['status']: row['count'] for row in cursor.fetchall()})
+            return stats
+
+        except Exception as e:
+            logging.error(f"❌ خطأ في جلب إحصائيات الصادر: {e}")
+            return {}
+
+    def get_dead_letters(self, limit: int = 100) -> List[Dict]:
+        """الرسائل التي فشلت نهائياً"""
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute('''
+                SELECT * FROM outbox WHERE status = 'dead'
+                ORDER BY next_attempt_at DESC LIMIT ?
+            ''', (limit,))
+            return [dict(row) for row in cursor.fetchall()]
+
+        except Exception as e:
+            logging.error(f"❌ خطأ في جلب الرسائل الميتة: {e}")
+            return []
+
+    def requeue_dead_letter(self, message_id: int) -> bool:
+        """إعادة رسالة ميتة للإرسال بعدد محاولات جديد"""
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute('''
+                UPDATE outbox SET status = 'pending', attempts = 0, next_attempt_at = ?
+                WHERE id = ? AND status = 'dead'
+            ''', (_timestamp(datetime.now()), message_id))
+            requeued = cursor.rowcount
+            if requeued:
+                self._sync_ledger_from_outbox(cursor, message_id, 'queued')
+            self.conn.commit()
+            return requeued > 0
+
+        except Exception as e:
+            logging.error(f"❌ خطأ في إعادة الرسالة للإرسال: {e}")
+            self.conn.rollback()
+            return False
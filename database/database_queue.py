@@ -0,0 +1,402 @@
+# -*- coding: utf-8 -*-
+import logging
+from datetime import date, datetime
+from typing import List, Dict, Optional, Union
+
+from scheduling_time import to_minutes, to_ordinal, ordinal_to_str, minutes_to_label
+from queue_estimator import estimate_queue, update_average
+
+class WalkInQueueMixin:
+    """ميكسين طابور المراجعين اليومي لكل طبيب (مواعيد + بدون موعد)
+
+    كل حدث (إضافة مراجع، حضور، نداء، انتهاء) يرفع رقم إصدار الطابور في
+    queue_state. اللقطات تُحفظ في الذاكرة حسب الإصدار، فالاستعلام الدوري من عدة
+    مكاتب وشاشة الانتظار يكلف قراءة صف واحد ما لم يتغير شيء.
+    """
+
+    ATTENDED_STATUS = 'حاضر'
+    FINISHED_STATUS = 'منتهي'
+
+    def create_queue_tables(self):
+        """إنشاء جداول طابور المراجعين"""
+        try:
+            cursor = self.conn.cursor()
+
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS walk_ins (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    doctor_id INTEGER NOT NULL,
+                    day_ordinal INTEGER NOT NULL,
+                    ticket_number INTEGER NOT NULL,
+                    patient_id INTEGER,
+                    patient_name TEXT NOT NULL,
+                    phone TEXT,
+                    priority INTEGER DEFAULT 0,
+                    status TEXT DEFAULT 'waiting', -- waiting / in_service / done / left
+                    arrived_minute INTEGER NOT NULL,
+                    started_minute INTEGER,
+                    finished_minute INTEGER,
+                    notes TEXT,
+                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (doctor_id) REFERENCES doctors (id),
+                    FOREIGN KEY (patient_id) REFERENCES patients (id),
+                    UNIQUE (doctor_id, day_ordinal, ticket_number)
+                )
+            ''')
+
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS queue_state (
+                    doctor_id INTEGER NOT NULL,
+                    day_ordinal INTEGER NOT NULL,
+                    version INTEGER DEFAULT 0,
+                    in_service_kind TEXT, -- appointment / walk_in
+                    in_service_id INTEGER,
+                    in_service_started_minute INTEGER,
+                    last_finished_minute INTEGER,
+                    avg_service_minutes REAL,
+                    served_count INTEGER DEFAULT 0,
+                    PRIMARY KEY (doctor_id, day_ordinal)
+                )
+            ''')
+
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_walk_ins_queue
+                ON walk_ins (doctor_id, day_ordinal, status, priority DESC, ticket_number)
+            ''')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_appointments_doctor_date
+                ON appointments (doctor_id, appointment_date)
+            ''')
+
+            self.conn.commit()
+
+        except Exception as e:
+            logging.error(f"❌ خطأ في إنشاء جداول الطابور: {e}")
+            self.conn.rollback()
+
+    # ⭐⭐ حالة الطابور ⭐⭐
+
+    def _now_minute(self) -> int:
+        return to_minutes(datetime.now().time())
+
+    def _queue_state(self, doctor_id: int, day_ordinal: int):
+        """صف حالة الطابور (يُنشأ عند أول حدث)"""
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            INSERT OR IGNORE INTO queue_state (doctor_id, day_ordinal, avg_service_minutes)
+            VALUES (?, ?, ?)
+        ''', (doctor_id, day_ordinal, self._default_service_minutes(doctor_id)))
+        cursor.execute('SELECT * FROM queue_state WHERE doctor_id = ? AND day_ordinal = ?',
+                       (doctor_id, day_ordinal))
+        return cursor.fetchone()
+
+    def _default_service_minutes(self, doctor_id: int) -> int:
+        settings = self.get_doctor_schedule_settings(doctor_id)
+        return (settings or {}).get('appointment_duration') or 30
+
+    def touch_doctor_queue(self, doctor_id: int, target_date: Union[str, date] = None):
+        """رفع إصدار طابور الطبيب عند تغيير مواعيد اليوم - بدون حفظ"""
+        day_ordinal = to_ordinal(target_date or date.today())
+        if day_ordinal != date.today().toordinal():
+            return
+        self._queue_state(doctor_id, day_ordinal)
+        self.conn.cursor().execute('''
+            UPDATE queue_state SET version = version + 1 WHERE doctor_id = ? AND day_ordinal = ?
+        ''', (doctor_id, day_ordinal))
+
+    def _finish_in_service(self, state, now_minute: int):
+        """إنهاء المراجع الحالي وتحديث متوسط مدة الخدمة - بدون حفظ"""
+        if not state['in_service_id']:
+            return
+
+        cursor = self.conn.cursor()
+        if state['in_service_kind'] == 'walk_in':
+            cursor.execute('''
+                UPDATE walk_ins SET status = 'done', finished_minute = ? WHERE id = ?
+            ''', (now_minute, state['in_service_id']))
+        else:
+            cursor.execute('SELECT status FROM appointments WHERE id = ?', (state['in_service_id'],))
+            row = cursor.fetchone()
+            if row and self.FINISHED_STATUS not in (row['status'] or ''):
+                cursor.execute('''
+                    UPDATE appointments SET status = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?
+                ''', (self.FINISHED_STATUS, state['in_service_id']))
+
+        self._record_service_end(state, now_minute, state['in_service_started_minute'])
+
+    def _record_service_end(self, state, now_minute: int, started_minute: Optional[int]):
+        """تحديث المتوسط المتحرك لمدة الخدمة ومسح المراجع الحالي - بدون حفظ"""
+        average = state['avg_service_minutes']
+        if started_minute is not None and now_minute > started_minute:
+            average = update_average(average, now_minute - started_minute)
+
+        self.conn.cursor().execute('''
+            UPDATE queue_state
+            SET in_service_kind = NULL, in_service_id = NULL, in_service_started_minute = NULL,
+                last_finished_minute = ?, avg_service_minutes = ?, served_count = served_count + 1,
+                version = version + 1
+            WHERE doctor_id = ? AND day_ordinal = ?
+        ''', (now_minute, average, state['doctor_id'], state['day_ordinal']))
+
+    def on_appointment_status_changed(self, appointment_id: int, doctor_id: int,
+                                      appointment_date: str, new_status: str):
+        """حدث تغيير حالة موعد اليوم (حضور / انتهاء / إلغاء) - بدون حفظ"""
+        day_ordinal = to_ordinal(appointment_date)
+        if day_ordinal != date.today().toordinal():
+            return
+
+        state = self._queue_state(doctor_id, day_ordinal)
+        in_service = state['in_service_kind'] == 'appointment' and state['in_service_id'] == appointment_id
+        if self.FINISHED_STATUS in (new_status or '') and in_service:
+            self._record_service_end(state, self._now_minute(), state['in_service_started_minute'])
+        else:
+            # انتهاء موعد غير المراجع الحالي لا يمس حالة الخدمة: يكفي رفع الإصدار
+            self.touch_doctor_queue(doctor_id, appointment_date)
+
+    # ⭐⭐ المراجعون بدون موعد ⭐⭐
+
+    def add_walk_in(self, doctor_id: int, patient_name: str, phone: str = '',
+                    patient_id: int = None, priority: int = 0, notes: str = '') -> Dict:
+        """تسجيل مراجع بدون موعد وإعطاؤه رقم دور"""
+        try:
+            day_ordinal = date.today().toordinal()
+            cursor = self.conn.cursor()
+            self._queue_state(doctor_id, day_ordinal)
+            cursor.execute('''
+                SELECT COALESCE(MAX(ticket_number), 0) + 1 FROM walk_ins
+                WHERE doctor_id = ? AND day_ordinal = ?
+            ''', (doctor_id, day_ordinal))
+            ticket_number = cursor.fetchone()[0]
+
+            cursor.execute('''
+                INSERT INTO walk_ins (doctor_id, day_ordinal, ticket_number, patient_id, patient_name,
+                                      phone, priority, arrived_minute, notes)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (doctor_id, day_ordinal, ticket_number, patient_id, patient_name,
+                  phone, priority, self._now_minute(), notes))
+            walk_in_id = cursor.lastrowid
+            self.touch_doctor_queue(doctor_id)
+            self.conn.commit()
+
+            snapshot = self.get_queue_snapshot(doctor_id)
+            entry = next((item for item in snapshot['queue']
+                          if item['kind'] == 'walk_in' and item['id'] == walk_in_id), None)
+
+            logging.info(f"🚶 مراجع بدون موعد رقم {ticket_number} للطبيب {doctor_id}")
+            return {
+                'success': True,
+                'walk_in_id': walk_in_id,
+                'ticket_number': ticket_number,
+                'estimated_start': entry['estimated_start'] if entry else None,
+                'wait_minutes': entry['wait_minutes'] if entry else None
+            }
+
+        except Exception as e:
+            logging.error(f"❌ خطأ في تسجيل المراجع: {e}")
+            self.conn.rollback()
+            return {'success': False, 'message': str(e)}
+
+    def mark_walk_in_left(self, walk_in_id: int) -> bool:
+        """خروج المراجع قبل دوره"""
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute('''
+                UPDATE walk_ins SET status = 'left' WHERE id = ? AND status = 'waiting'
+            ''', (walk_in_id,))
+            if cursor.rowcount == 0:
+                return False
+            cursor.execute('SELECT doctor_id FROM walk_ins WHERE id = ?', (walk_in_id,))
+            self.touch_doctor_queue(cursor.fetchone()['doctor_id'])
+            self.conn.commit()
+            return True
+
+        except Exception as e:
+            logging.error(f"❌ خطأ في تحديث المراجع: {e}")
+            self.conn.rollback()
+            return False
+
+    # ⭐⭐ النداء والإنهاء ⭐⭐
+
+    def call_next_patient(self, doctor_id: int) -> Optional[Dict]:
+        """إنهاء المراجع الحالي ونداء التالي الحاضر حسب الترتيب المتوقع"""
+        try:
+            day_ordinal = date.today().toordinal()
+            now_minute = self._now_minute()
+            state = self._queue_state(doctor_id, day_ordinal)
+            self._finish_in_service(state, now_minute)
+
+            snapshot = self._build_queue_snapshot(doctor_id, day_ordinal, now_minute, use_cache=False)
+            next_entry = next((entry for entry in snapshot['queue']
+                               if entry['kind'] == 'walk_in' or entry['checked_in']), None)
+
+            cursor = self.conn.cursor()
+            if next_entry:
+                if next_entry['kind'] == 'walk_in':
+                    cursor.execute('''
+                        UPDATE walk_ins SET status = 'in_service', started_minute = ? WHERE id = ?
+                    ''', (now_minute, next_entry['id']))
+                cursor.execute('''
+                    UPDATE queue_state
+                    SET in_service_kind = ?, in_service_id = ?, in_service_started_minute = ?,
+                        version = version + 1
+                    WHERE doctor_id = ? AND day_ordinal = ?
+                ''', (next_entry['kind'], next_entry['id'], now_minute, doctor_id, day_ordinal))
+
+            self.conn.commit()
+            if next_entry:
+                logging.info(f"📢 نداء {next_entry['label']} - {next_entry['patient_name']}")
+            return next_entry
+
+        except Exception as e:
+            logging.error(f"❌ خطأ في نداء المراجع التالي: {e}")
+            self.conn.rollback()
+            return None
+
+    def finish_current_patient(self, doctor_id: int) -> bool:
+        """إنهاء المراجع الحالي دون نداء التالي"""
+        try:
+            state = self._queue_state(doctor_id, date.today().toordinal())
+            if not state['in_service_id']:
+                return False
+            self._finish_in_service(state, self._now_minute())
+            self.conn.commit()
+            return True
+
+        except Exception as e:
+            logging.error(f"❌ خطأ في إنهاء المراجع الحالي: {e}")
+            self.conn.rollback()
+            return False
+
+    # ⭐⭐ لقطات الطابور ⭐⭐
+
+    def get_queue_snapshot(self, doctor_id: int) -> Dict:
+        """لقطة طابور الطبيب اليوم (مناسبة للاستعلام كل بضع ثوانٍ)
+
+        قراءة صف الإصدار فقط؛ تُعاد اللقطة المحفوظة إن لم يتغير الإصدار ولا الدقيقة،
+        وتُعاد حسابات الانتظار من البيانات المحفوظة إن تغيرت الدقيقة فقط.
+        """
+        try:
+            return self._build_queue_snapshot(doctor_id, date.today().toordinal(), self._now_minute())
+
+        except Exception as e:
+            logging.error(f"❌ خطأ في جلب لقطة الطابور: {e}")
+            return {'doctor_id': doctor_id, 'queue': [], 'in_service': None, 'waiting_count': 0}
+
+    def get_waiting_room_snapshot(self) -> List[Dict]:
+        """لقطات طوابير كل الأطباء النشطين اليوم (لشاشة الانتظار)"""
+        try:
+            today = date.today()
+            cursor = self.conn.cursor()
+            cursor.execute('''
+                SELECT doctor_id FROM appointments WHERE appointment_date = ?
+                UNION
+                SELECT doctor_id FROM walk_ins WHERE day_ordinal = ?
+            ''', (today.strftime('%Y-%m-%d'), today.toordinal()))
+            return [self.get_queue_snapshot(row['doctor_id']) for row in cursor.fetchall()]
+
+        except Exception as e:
+            logging.error(f"❌ خطأ في جلب شاشة الانتظار: {e}")
+            return []
+
+    def _build_queue_snapshot(self, doctor_id: int, day_ordinal: int, now_minute: int,
+                              use_cache: bool = True) -> Dict:
+        cache = getattr(self, '_queue_snapshot_cache', None)
+        if cache is None:
+            cache = self._queue_snapshot_cache = {}
+
+        cursor = self.conn.cursor()
+        cursor.execute('SELECT * FROM queue_state WHERE doctor_id = ? AND day_ordinal = ?',
+                       (doctor_id, day_ordinal))
+        state = cursor.fetchone()
+        version = state['version'] if state else -1
+
+        key = (doctor_id, day_ordinal)
+        cached = cache.get(key)
+        if use_cache and cached and cached['version'] == version:
+            if cached['minute'] == now_minute:
+                return cached['snapshot']
+            entries = cached['entries']
+        else:
+            entries = self._load_queue_entries(doctor_id, day_ordinal)
+
+        snapshot = self._estimate_snapshot(doctor_id, day_ordinal, now_minute, state, entries)
+        cache[key] = {'version': version, 'minute': now_minute, 'entries': entries, 'snapshot': snapshot}
+        return snapshot
+
+    def _load_queue_entries(self, doctor_id: int, day_ordinal: int) -> Dict:
+        """مواعيد اليوم المتبقية والمنتظرون بدون موعد (استعلامان)"""
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            SELECT a.id, a.start_minute, a.appointment_time, a.status, p.name AS patient_name
+            FROM appointments a
+            JOIN patients p ON p.id = a.patient_id
+            WHERE a.doctor_id = ? AND a.appointment_date = ?
+            ORDER BY a.start_minute
+        ''', (doctor_id, ordinal_to_str(day_ordinal)))
+        scheduled = []
+        for row in cursor.fetchall():
+            status = row['status'] or ''
+            if self.is_cancelled_status(status) or self.FINISHED_STATUS in status:
+                continue
+            start_minute = row['start_minute'] if row['start_minute'] is not None else to_minutes(row['appointment_time'])
+            scheduled.append({
+                'kind': 'appointment',
+                'id': row['id'],
+                'label': minutes_to_label(start_minute),
+                'patient_name': row['patient_name'],
+                'start_minute': start_minute,
+                'checked_in': self.ATTENDED_STATUS in status
+            })
+
+        cursor.execute('''
+            SELECT id, ticket_number, patient_name, status, arrived_minute FROM walk_ins
+            WHERE doctor_id = ? AND day_ordinal = ? AND status IN ('waiting', 'in_service')
+            ORDER BY priority DESC, ticket_number
+        ''', (doctor_id, day_ordinal))
+        walk_ins = []
+        for row in cursor.fetchall():
+            walk_ins.append({
+                'kind': 'walk_in',
+                'id': row['id'],
+                'label': f"#{row['ticket_number']}",
+                'patient_name': row['patient_name'],
+                'arrived_minute': row['arrived_minute'],
+                'checked_in': True,
+                'in_service': row['status'] == 'in_service'
+            })
+
+        return {'scheduled': scheduled, 'walk_ins': walk_ins}
+
+    def _estimate_snapshot(self, doctor_id: int, day_ordinal: int, now_minute: int,
+                           state, entries: Dict) -> Dict:
+        service_minutes = (state['avg_service_minutes'] if state and state['avg_service_minutes']
+                           else self._default_service_minutes(doctor_id))
+
+        in_service = None
+        busy_until = now_minute
+        if state and state['in_service_id']:
+            kind, entry_id = state['in_service_kind'], state['in_service_id']
+            pool = entries['walk_ins'] if kind == 'walk_in' else entries['scheduled']
+            in_service = next((dict(entry) for entry in pool if entry['id'] == entry_id), None)
+            if in_service:
+                in_service['started'] = minutes_to_label(state['in_service_started_minute'])
+                busy_until = max(now_minute, state['in_service_started_minute'] + int(round(service_minutes)))
+
+        scheduled = [entry for entry in entries['scheduled'] if not in_service or entry['id'] != in_service['id']
+                     or in_service['kind'] != 'appointment']
+        walk_ins = [entry for entry in entries['walk_ins'] if not entry['in_service']]
+
+        queue = estimate_queue(now_minute, busy_until, scheduled, walk_ins, service_minutes)
+        for entry in queue:
+            entry['estimated_time'] = minutes_to_label(entry['estimated_start'])
+
+        return {
+            'doctor_id': doctor_id,
+            'date': ordinal_to_str(day_ordinal),
+            'now': minutes_to_label(now_minute),
+            'avg_service_minutes': service_minutes,
+            'in_service': in_service,
+            'queue': queue,
+            'waiting_count': sum(1 for entry in queue if entry['checked_in']),
+            'served_count': state['served_count'] if state else 0
+        }
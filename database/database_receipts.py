@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+import logging
+import re
+from datetime import date, datetime
+from typing import Dict, List, Optional
+
+# ترتيب حالات التسليم: لا تعود الرسالة من "مقروءة" إلى "مُسلَّمة" إن وصل الإيصال متأخراً
+DELIVERY_STATUS_RANK = {'sent': 1, 'delivered': 2, 'read': 3}
+
+# ردود المريض على رسالة التذكير
+CONFIRM_REPLIES = ('1', 'نعم', 'اكيد', 'أكيد', 'تأكيد', 'تاكيد', 'موافق', 'تمام', 'yes', 'ok', 'confirm')
+DECLINE_REPLIES = ('2', 'لا', 'الغاء', 'إلغاء', 'اعتذر', 'أعتذر', 'no', 'cancel')
+
+def classify_reply(body: str) -> Optional[str]:
+    """نية رد المريض من أول كلمة: 'confirmed' أو 'declined' أو None"""
+    words = re.findall(r'\w+', (body or '').strip().lower())
+    if not words:
+        return None
+    if words[0] in CONFIRM_REPLIES:
+        return 'confirmed'
+    if words[0] in DECLINE_REPLIES:
+        return 'declined'
+    return None
+
+def _phone_suffix(phone: str) -> str:
+    """آخر 9 أرقام من الهاتف لمطابقة الصيغ المحلية والدولية (05xx / 9665xx / ...@c.us)"""
+    return re.sub(r'\D', '', (phone or '').split('@')[0])[-9:]
+
+class DeliveryReceiptsMixin:
+    """ميكسين إيصالات التسليم وردود المرضى الواردة من المزودين (webhooks)
+
+    الإيصالات تصل بالآلاف وتُطبَّق دفعات: كل دفعة معاملة واحدة قصيرة بدل معاملة
+    لكل إيصال، فلا تزاحم كتابات الحجز على قفل قاعدة البيانات.
+    """
+
+    def create_delivery_receipt_tables(self):
+        """أعمدة حالة التسليم في message_stats وتأكيد المريض في المواعيد وجدول الردود"""
+        try:
+            cursor = self.conn.cursor()
+
+            cursor.execute("PRAGMA table_info(message_stats)")
+            stats_columns = [column[1] for column in cursor.fetchall()]
+            for column_name in ('provider_message_id', 'delivery_status', 'delivered_at', 'read_at'):
+                if column_name not in stats_columns:
+                    cursor.execute(f'ALTER TABLE message_stats ADD COLUMN {column_name} TEXT')
+                    logging.info(f"✅ تم إضافة عمود {column_name} لجدول message_stats")
+
+            cursor.execute("PRAGMA table_info(appointments)")
+            appointment_columns = [column[1] for column in cursor.fetchall()]
+            for column_name in ('patient_confirmation', 'patient_confirmation_at'):
+                if column_name not in appointment_columns:
+                    cursor.execute(f'ALTER TABLE appointments ADD COLUMN {column_name} TEXT')
+                    logging.info(f"✅ تم إضافة عمود {column_name} لجدول المواعيد")
+
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_message_stats_provider_message
+                ON message_stats (provider_message_id)
+            ''')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_outbox_provider_message
+                ON outbox (provider_message_id)
+            ''')
+
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS message_replies (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    phone_number TEXT,
+                    body TEXT,
+                    intent TEXT, -- confirmed / declined / NULL
+                    appointment_id INTEGER,
+                    provider_message_id TEXT,
+                    received_at TEXT NOT NULL,
+                    FOREIGN KEY (appointment_id) REFERENCES appointments (id) ON DELETE SET NULL
+                )
+            ''')
+
+            self.conn.commit()
+
+        except Exception as e:
+            logging.error(f"❌ خطأ في إنشاء جداول إيصالات التسليم: {e}")
+            self.conn.rollback()
+
+    def apply_delivery_receipts(self, events: List[Dict]) -> Optional[Dict]:
+        """تطبيق دفعة إيصالات وردود في معاملة واحدة
+
+        الحدث: {'kind': 'status', 'provider_message_id', 'status': sent/delivered/read/failed,
+        'timestamp', 'error'} أو {'kind': 'reply', 'phone', 'body', 'reply_to', 'timestamp'}.
+        تُرجع ملخص الدفعة، أو None إن فشلت (تبقى الأحداث لإعادة المحاولة).
+        """
+        try:
+            now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+            # دمج إيصالات نفس الرسالة: تكفي الحالة الأعلى وأول فشل
+            statuses, failures = {}, {}
+            replies = []
+            for event in events:
+                if event.get('kind') == 'reply':
+                    replies.append(event)
+                    continue
+                message_id, status = event.get('provider_message_id'), event.get('status')
+                if not message_id:
+                    continue
+                if status == 'failed':
+                    failures.setdefault(message_id, event)
+                elif status in DELIVERY_STATUS_RANK:
+                    current = statuses.get(message_id)
+                    if not current or DELIVERY_STATUS_RANK[status] > DELIVERY_STATUS_RANK[current['status']]:
+                        statuses[message_id] = event
+
+            cursor = self.conn.cursor()
+            summary = {'events': len(events), 'updated': 0, 'failed': 0, 'replies': len(replies), 'confirmations': 0}
+
+            rank_sql = ' '.join(f"WHEN '{status}' THEN {rank}" for status, rank in DELIVERY_STATUS_RANK.items())
+            for message_id, event in statuses.items():
+                status, timestamp = event['status'], event.get('timestamp') or now
+                cursor.execute(f'''
+                    UPDATE message_stats
+                    SET delivery_status = :status,
+                        delivered_at = CASE WHEN :status IN ('delivered', 'read')
+                                            THEN COALESCE(delivered_at, :at) ELSE delivered_at END,
+                        read_at = CASE WHEN :status = 'read' THEN COALESCE(read_at, :at) ELSE read_at END
+                    WHERE provider_message_id = :id
+                      AND COALESCE(status, '') != 'failed'
+                      AND (CASE COALESCE(delivery_status, '') {rank_sql} ELSE 0 END) < :rank
+                ''', {'status': status, 'at': timestamp, 'id': message_id, 'rank': DELIVERY_STATUS_RANK[status]})
+                summary['updated'] += cursor.rowcount
+
+            # فشل بعد قبول المزود: نقل الرسالة من المرسل إلى الفاشل في التجميعات
+            for message_id, event in failures.items():
+                cursor.execute('''
+                    SELECT id, clinic_id, created_at, provider, message_type, status FROM message_stats
+                    WHERE provider_message_id = ? AND COALESCE(status, '') != 'failed'
+                ''', (message_id,))
+                for row in cursor.fetchall():
+                    cursor.execute('''
+                        UPDATE message_stats SET status = 'failed', delivery_status = 'failed', error_message = ?
+                        WHERE id = ?
+                    ''', (str(event.get('error') or 'فشل التسليم')[:500], row['id']))
+                    created_at = datetime.fromisoformat(str(row['created_at']))
+                    self._rollup_message_stat(cursor, row['clinic_id'], created_at, row['provider'],
+                                              row['message_type'], row['status'], count=-1)
+                    self._rollup_message_stat(cursor, row['clinic_id'], created_at, row['provider'],
+                                              row['message_type'], 'failed')
+                    summary['failed'] += 1
+
+            for event in replies:
+                intent = classify_reply(event.get('body'))
+                appointment_id = self._appointment_for_reply(cursor, event)
+                if intent and appointment_id:
+                    cursor.execute('''
+                        UPDATE appointments SET patient_confirmation = ?, patient_confirmation_at = ?
+                        WHERE id = ?
+                    ''', (intent, event.get('timestamp') or now, appointment_id))
+                    summary['confirmations'] += 1
+
+                cursor.execute('''
+                    INSERT INTO message_replies (phone_number, body, intent, appointment_id, provider_message_id, received_at)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', (event.get('phone'), (event.get('body') or '')[:1000], intent, appointment_id,
+                      event.get('provider_message_id'), event.get('timestamp') or now))
+
+            self.conn.commit()
+            return summary
+
+        except Exception as e:
+            logging.error(f"❌ خطأ في تطبيق إيصالات التسليم: {e}")
+            self.conn.rollback()
+            return None
+
+    def _appointment_for_reply(self, cursor, event: Dict) -> Optional[int]:
+        """الموعد الذي يرد عليه المريض: من الرسالة المقتبسة، وإلا أقرب موعد قادم لنفس الهاتف"""
+        reply_to = event.get('reply_to')
+        if reply_to:
+            cursor.execute('''
+                SELECT appointment_id FROM outbox WHERE provider_message_id = ? AND appointment_id IS NOT NULL
+                UNION ALL
+                SELECT appointment_id FROM message_stats WHERE provider_message_id = ? AND appointment_id IS NOT NULL
+                LIMIT 1
+            ''', (reply_to, reply_to))
+            row = cursor.fetchone()
+            if row:
+                return row['appointment_id']
+
+        suffix = _phone_suffix(event.get('phone'))
+        if len(suffix) < 9:
+            return None
+        cursor.execute('''
+            SELECT a.id FROM appointments a
+            JOIN patients p ON a.patient_id = p.id
+            WHERE a.status = 'مجدول' AND a.appointment_date >= ?
+              AND substr(replace(replace(p.phone, ' ', ''), '-', ''), -9) = ?
+            ORDER BY a.appointment_date, a.appointment_time
+            LIMIT 1
+        ''', (date.today().isoformat(), suffix))
+        row = cursor.fetchone()
+        return row['id'] if row else None
+
+    def get_message_replies(self, limit: int = 100) -> List[Dict]:
+        """آخر ردود المرضى الواردة"""
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute('SELECT * FROM message_replies ORDER BY id DESC LIMIT ?', (limit,))
+            return [dict(row) for row in cursor.fetchall()]
+
+        except Exception as e:
+            logging.error(f"❌ خطأ في جلب ردود المرضى: {e}")
+            return []
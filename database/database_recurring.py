@@ -0,0 +1,302 @@
+# -*- coding: utf-8 -*-
+import json
+import logging
+import time as time_module
+from typing import List, Dict, Optional, Union
+
+from scheduling_time import to_minutes, ordinal_to_str, minutes_to_label, ranges_overlap
+from recurrence import parse_rule, generate_occurrences, describe_rule
+
+class RecurringAppointmentsMixin:
+    """ميكسین سلاسل المواعيد المتكررة (علاج طبيعي، غيارات، متابعة)
+
+    تُفحص كل تواريخ السلسلة دفعة واحدة بعدد ثابت من الاستعلامات (أوقات الطبيب،
+    الأيام المكتملة، مواعيد المريض) ثم تُحجز في معاملة واحدة.
+    """
+
+    def create_series_tables(self):
+        """إنشاء جدول السلاسل وربط المواعيد بها"""
+        try:
+            cursor = self.conn.cursor()
+
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS appointment_series (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    patient_id INTEGER NOT NULL,
+                    doctor_id INTEGER NOT NULL,
+                    department_id INTEGER NOT NULL,
+                    clinic_id INTEGER NOT NULL,
+                    start_date DATE NOT NULL,
+                    appointment_time TIME NOT NULL,
+                    type TEXT DEFAULT 'متابعة',
+                    rule TEXT NOT NULL, -- القاعدة الموحدة JSON
+                    description TEXT,
+                    occurrences_count INTEGER DEFAULT 0,
+                    status TEXT DEFAULT 'active', -- active / cancelled
+                    notes TEXT,
+                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (patient_id) REFERENCES patients (id),
+                    FOREIGN KEY (doctor_id) REFERENCES doctors (id)
+                )
+            ''')
+
+            cursor.execute("PRAGMA table_info(appointments)")
+            existing_columns = [column[1] for column in cursor.fetchall()]
+            if 'series_id' not in existing_columns:
+                cursor.execute('ALTER TABLE appointments ADD COLUMN series_id INTEGER')
+                logging.info("✅ تم إضافة عمود series_id لجدول المواعيد")
+
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_appointments_series
+                ON appointments (series_id, appointment_date)
+            ''')
+
+            self.conn.commit()
+
+        except Exception as e:
+            logging.error(f"❌ خطأ في إنشاء جدول السلاسل: {e}")
+            self.conn.rollback()
+
+    def check_series_occurrences(self, series_data: Dict, occurrences: List[int]) -> List[Dict]:
+        """فحص كل تواريخ السلسلة مقابل توفر الطبيب وسعة اليوم ومواعيد المريض
+
+        تُرجع لكل تاريخ: {'date', 'time', 'ok', 'reason', 'alternative'}
+        حيث alternative أقرب وقت متاح في نفس اليوم لا يتعارض مع المريض.
+        يُفترض أن جدول الطبيب مولد حتى آخر تاريخ (extend_doctor_schedule).
+        """
+        if not occurrences:
+            return []
+
+        doctor_id = series_data['doctor_id']
+        start_minute = to_minutes(series_data['appointment_time'])
+        duration = self.get_service_duration(series_data.get('type'))
+        placeholders = ', '.join('?' for _ in occurrences)
+        cursor = self.conn.cursor()
+
+        # أوقات الطبيب لكل تواريخ السلسلة في استعلام واحد
+        cursor.execute(f'''
+            SELECT day_ordinal, start_minute, status FROM doctor_periodic_schedules
+            WHERE doctor_id = ? AND day_ordinal IN ({placeholders})
+            ORDER BY day_ordinal, start_minute
+        ''', [doctor_id] + occurrences)
+        day_slots = {}
+        for row in cursor.fetchall():
+            day_slots.setdefault(row['day_ordinal'], []).append((row['start_minute'], row['status']))
+
+        full_days = self.get_full_days(doctor_id, occurrences[0], occurrences[-1])
+
+        # مواعيد المريض والطبيب في نفس التواريخ (تشمل المواعيد المحجوزة خارج الجدول الدوري)
+        dates = [ordinal_to_str(ordinal) for ordinal in occurrences]
+        cursor.execute(f'''
+            SELECT patient_id, appointment_date, start_minute, end_minute, status FROM appointments
+            WHERE (patient_id = ? OR doctor_id = ?) AND appointment_date IN ({placeholders})
+            AND start_minute IS NOT NULL
+        ''', [series_data['patient_id'], doctor_id] + dates)
+        patient_busy = {}
+        doctor_busy = {}
+        for row in cursor.fetchall():
+            if self.is_cancelled_status(row['status']):
+                continue
+            busy = patient_busy if row['patient_id'] == series_data['patient_id'] else doctor_busy
+            busy.setdefault(row['appointment_date'], []).append((row['start_minute'], row['end_minute']))
+
+        calendar = self.get_holiday_calendar()
+        results = []
+        for ordinal, date_str in zip(occurrences, dates):
+            result = {'date': date_str, 'time': minutes_to_label(start_minute),
+                      'ok': False, 'reason': '', 'alternative': None}
+            results.append(result)
+
+            if calendar.is_holiday(ordinal):
+                result['reason'] = f"عطلة: {calendar.holiday_name(ordinal)}"
+                continue
+            if ordinal in full_days:
+                result['reason'] = "اكتملت سعة اليوم"
+                continue
+
+            slots = day_slots.get(ordinal, [])
+            busy = patient_busy.get(date_str, [])
+            taken = {start for start, _ in doctor_busy.get(date_str, [])}
+            slots = [(start, 'booked' if start in taken else status) for start, status in slots]
+            free_starts = [start for start, status in slots if status == 'available'
+                           and not any(ranges_overlap(start, start + duration, busy_start, busy_end)
+                                       for busy_start, busy_end in busy)]
+
+            if start_minute in free_starts:
+                result['ok'] = True
+                continue
+
+            slot_status = dict(slots).get(start_minute)
+            if slot_status == 'available':
+                result['reason'] = "المريض لديه موعد آخر"
+            elif slot_status:
+                result['reason'] = "الوقت محجوز" if slot_status in ('booked', 'held') else "الطبيب غير متاح"
+            else:
+                result['reason'] = "خارج أوقات عمل الطبيب"
+
+            if free_starts:
+                result['alternative'] = minutes_to_label(min(free_starts, key=lambda start: abs(start - start_minute)))
+
+        return results
+
+    def preview_recurring_series(self, series_data: Dict, rule: Union[str, Dict]) -> Dict:
+        """معاينة السلسلة قبل الحجز"""
+        try:
+            occurrences = generate_occurrences(series_data['start_date'], rule)
+            if occurrences:
+                self.extend_doctor_schedule(series_data['doctor_id'], occurrences[-1])
+            checks = self.check_series_occurrences(series_data, occurrences)
+            return {
+                'success': True,
+                'description': describe_rule(rule),
+                'occurrences': checks,
+                'ok_count': sum(1 for check in checks if check['ok']),
+                'conflict_count': sum(1 for check in checks if not check['ok'])
+            }
+
+        except Exception as e:
+            logging.error(f"❌ خطأ في معاينة السلسلة: {e}")
+            return {'success': False, 'message': str(e), 'occurrences': [], 'ok_count': 0, 'conflict_count': 0}
+
+    def create_recurring_series(self, series_data: Dict, rule: Union[str, Dict],
+                                use_alternatives: bool = False) -> Dict:
+        """حجز سلسلة كاملة في معاملة واحدة
+
+        التواريخ المتعارضة لا تُحجز (أو تُحجز في أقرب وقت بديل عند use_alternatives)
+        وتُعاد في needs_alternative ليختار لها المستخدم وقتاً آخر.
+        """
+        started = time_module.perf_counter()
+        try:
+            normalized = parse_rule(rule)
+            occurrences = generate_occurrences(series_data['start_date'], normalized)
+            if not occurrences:
+                return {'success': False, 'message': 'لا توجد تواريخ في السلسلة'}
+
+            service_type = series_data.get('type', 'متابعة')
+            status = series_data.get('status', 'مجدول')
+
+            # إدراج السلسلة أولاً يحجز قفل الكتابة، فلا يتغير ما فحصناه قبل الحجز
+            cursor = self.conn.cursor()
+            cursor.execute('''
+                INSERT INTO appointment_series
+                (patient_id, doctor_id, department_id, clinic_id, start_date, appointment_time,
+                 type, rule, description, notes)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (
+                series_data['patient_id'], series_data['doctor_id'], series_data['department_id'],
+                series_data['clinic_id'], ordinal_to_str(occurrences[0]), series_data['appointment_time'],
+                service_type, json.dumps(normalized), describe_rule(normalized), series_data.get('notes', '')
+            ))
+            series_id = cursor.lastrowid
+
+            # توليد أيام الطبيب حتى آخر تاريخ حتى يحجز كل موعد وقتاً فعلياً
+            if not self.extend_doctor_schedule(series_data['doctor_id'], occurrences[-1], commit=False):
+                raise RuntimeError("تعذر توليد جدول الطبيب حتى نهاية السلسلة")
+
+            checks = self.check_series_occurrences(series_data, occurrences)
+            booked = []
+            needs_alternative = []
+            for check in checks:
+                appointment_time = check['time'] if check['ok'] else (check['alternative'] if use_alternatives else None)
+                if not appointment_time:
+                    needs_alternative.append(check)
+                    continue
+
+                appointment_data = dict(series_data, appointment_date=check['date'],
+                                        appointment_time=appointment_time, type=service_type, status=status)
+
+                # كل تاريخ في نقطة حفظ: فشل أحدها لا يلغي بقية السلسلة
+                cursor.execute('SAVEPOINT series_occurrence')
+                appointment_id = self._book_series_occurrence(series_id, appointment_data)
+                if appointment_id:
+                    cursor.execute('RELEASE SAVEPOINT series_occurrence')
+                    booked.append({'appointment_id': appointment_id, 'date': check['date'],
+                                   'time': appointment_time, 'is_alternative': not check['ok']})
+                else:
+                    cursor.execute('ROLLBACK TO SAVEPOINT series_occurrence')
+                    cursor.execute('RELEASE SAVEPOINT series_occurrence')
+                    needs_alternative.append(dict(check, ok=False, reason=check['reason'] or "تعذر الحجز"))
+
+            cursor.execute('UPDATE appointment_series SET occurrences_count = ? WHERE id = ?',
+                           (len(booked), series_id))
+            self.conn.commit()
+            self.notify_appointment_changed()
+
+            elapsed_ms = int((time_module.perf_counter() - started) * 1000)
+            logging.info(f"🔁 سلسلة {series_id}: تم حجز {len(booked)} من {len(checks)} موعد "
+                         f"({len(needs_alternative)} تحتاج وقتاً بديلاً) خلال {elapsed_ms} ms")
+
+            return {
+                'success': True,
+                'series_id': series_id,
+                'booked': booked,
+                'needs_alternative': needs_alternative,
+                'elapsed_ms': elapsed_ms,
+                'message': f"تم حجز {len(booked)} من {len(checks)} موعد"
+            }
+
+        except Exception as e:
+            logging.error(f"❌ خطأ في حجز السلسلة: {e}")
+            self.conn.rollback()
+            return {'success': False, 'message': str(e), 'booked': [], 'needs_alternative': []}
+
+    def _book_series_occurrence(self, series_id: int, appointment_data: Dict) -> Optional[int]:
+        """حجز تاريخ واحد من السلسلة بمسار الحجز العادي ثم ربطه بالسلسلة - بدون حفظ"""
+        appointment_id = self._insert_appointment(appointment_data)
+        if not appointment_id:
+            return None
+
+        self.conn.cursor().execute('UPDATE appointments SET series_id = ? WHERE id = ?', (series_id, appointment_id))
+        return appointment_id
+
+    def get_series_appointments(self, series_id: int) -> List[Dict]:
+        """مواعيد السلسلة مرتبة بالتاريخ"""
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute('''
+                SELECT id, appointment_date, appointment_time, status
+                FROM appointments WHERE series_id = ?
+                ORDER BY appointment_date, appointment_time
+            ''', (series_id,))
+            return [dict(row) for row in cursor.fetchall()]
+
+        except Exception as e:
+            logging.error(f"❌ خطأ في جلب مواعيد السلسلة: {e}")
+            return []
+
+    def cancel_series(self, series_id: int, from_date: str = None) -> int:
+        """إلغاء مواعيد السلسلة القادمة (من تاريخ محدد) وتحرير أوقاتها"""
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute('''
+                SELECT id, doctor_id, appointment_date, status FROM appointments
+                WHERE series_id = ? AND appointment_date >= COALESCE(?, date('now', 'localtime'))
+            ''', (series_id, from_date))
+            upcoming = [row for row in cursor.fetchall() if not self.is_cancelled_status(row['status'])]
+            if not upcoming:
+                return 0
+
+            cancelled_ids = [row['id'] for row in upcoming]
+            placeholders = ', '.join('?' for _ in cancelled_ids)
+            cursor.execute(f'''
+                UPDATE appointments SET status = 'ملغى', updated_at = CURRENT_TIMESTAMP
+                WHERE id IN ({placeholders})
+            ''', cancelled_ids)
+            for row in upcoming:
+                self.release_daily_capacity(row['doctor_id'], row['appointment_date'])
+                self.touch_doctor_queue(row['doctor_id'], row['appointment_date'])
+
+            if from_date is None:
+                cursor.execute("UPDATE appointment_series SET status = 'cancelled' WHERE id = ?", (series_id,))
+            self.conn.commit()
+
+            # تحرير الأوقات والموارد وعرضها على قائمة الانتظار
+            self.handle_appointments_cancelled(cancelled_ids)
+
+            logging.info(f"✅ تم إلغاء {len(cancelled_ids)} موعد من السلسلة {series_id}")
+            return len(cancelled_ids)
+
+        except Exception as e:
+            logging.error(f"❌ خطأ في إلغاء السلسلة: {e}")
+            self.conn.rollback()
+            return 0
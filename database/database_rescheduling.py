@@ -0,0 +1,382 @@
+# -*- coding: utf-8 -*-
+import logging
+import time as time_module
+from datetime import date
+from typing import List, Dict, Optional, Union
+
+from scheduling_time import MINUTE_LABELS, to_ordinal, ordinal_to_str, to_minutes, ranges_overlap
+
+class ReschedulingMixin:
+    """ميكسین إعادة الجدولة الجماعية عند غياب الطبيب"""
+
+    # أوزان تكلفة النقل: تأخير يوم، فرق ساعة عن الوقت الأصلي، النقل لطبيب آخر
+    RESCHEDULE_DAY_COST = 10
+    RESCHEDULE_HOUR_COST = 1
+    RESCHEDULE_OTHER_DOCTOR_COST = 15
+
+    # حالات لا تُنقل (انتهى الموعد أو حضر المريض)
+    FINISHED_STATUSES = ('منتهي', 'حاضر')
+
+    def plan_absence_reschedule(self, doctor_id: int, start_date: Union[str, date], end_date: Union[str, date],
+                                horizon_days: int = 14, allow_other_doctors: bool = True,
+                                preferences: Dict[int, Dict] = None) -> Dict:
+        """إعداد خطة نقل مواعيد الطبيب الغائب (معاينة بدون أي كتابة)
+
+        - الأوقات المرشحة: أوقات الطبيب نفسه بعد فترة الغياب، وأوقات أطباء القسم نفسه
+        - تُراعى مدة الخدمة (أوقات متتالية عند الحاجة)، والسعة اليومية، والعطل،
+          وعدم تعارض المريض مع مواعيده الأخرى
+        - تخصيص جشع بأقل تكلفة بترتيب المواعيد الأصلي
+
+        preferences: {appointment_id: {'same_doctor_only': bool, 'preferred_start_minute': int,
+                                       'earliest_date': 'YYYY-MM-DD'}}
+        """
+        started = time_module.perf_counter()
+        preferences = preferences or {}
+
+        try:
+            start_ordinal = to_ordinal(start_date)
+            end_ordinal = to_ordinal(end_date)
+            horizon_end = end_ordinal + horizon_days
+            today = date.today().toordinal()
+
+            cursor = self.conn.cursor()
+            cursor.execute('''
+                SELECT a.id, a.patient_id, a.doctor_id, a.appointment_date, a.appointment_time,
+                       a.type, a.status, p.name as patient_name
+                FROM appointments a
+                JOIN patients p ON a.patient_id = p.id
+                WHERE a.doctor_id = ? AND a.appointment_date BETWEEN ? AND ?
+                ORDER BY a.appointment_date, a.appointment_time
+            ''', (doctor_id, ordinal_to_str(start_ordinal), ordinal_to_str(end_ordinal)))
+            affected = [dict(row) for row in cursor.fetchall()
+                        if not self.is_cancelled_status(row['status'])
+                        and not any(word in (row['status'] or '') for word in self.FINISHED_STATUSES)]
+
+            if not affected:
+                return {'success': True, 'moves': [], 'unassigned': [], 'elapsed_ms': 0,
+                        'message': 'لا توجد مواعيد متأثرة'}
+
+            # الأطباء المرشحون: الطبيب نفسه ثم أطباء القسم النشطون
+            doctor_info = {}
+            cursor.execute('''
+                SELECT d2.id, d2.name, d2.department_id, d2.clinic_id
+                FROM doctors d1
+                JOIN doctors d2 ON d2.department_id = d1.department_id
+                WHERE d1.id = ? AND (d2.id = d1.id OR (? AND d2.is_active = 1))
+            ''', (doctor_id, 1 if allow_other_doctors else 0))
+            for row in cursor.fetchall():
+                doctor_info[row['id']] = dict(row)
+
+            day_slots = self._load_reschedule_candidates(doctor_id, doctor_info, start_ordinal,
+                                                         end_ordinal, horizon_end, today)
+            remaining = self._load_remaining_capacity(doctor_info, max(start_ordinal, today), horizon_end)
+            patient_busy = self._load_patient_busy(affected, max(start_ordinal, today), horizon_end)
+            durations = self._load_service_durations()
+
+            moves = []
+            unassigned = []
+
+            for appointment in affected:
+                original_day = to_ordinal(appointment['appointment_date'])
+                original_minute = to_minutes(appointment['appointment_time'])
+                preference = preferences.get(appointment['id'], {})
+                reference_minute = preference.get('preferred_start_minute', original_minute)
+                earliest = to_ordinal(preference['earliest_date']) if preference.get('earliest_date') else 0
+                duration = durations.get(appointment['type']) or 0
+
+                best = None
+                for (candidate_doctor, day), slots in day_slots.items():
+                    if day < earliest:
+                        continue
+                    if candidate_doctor != doctor_id and preference.get('same_doctor_only'):
+                        continue
+                    if (candidate_doctor, day) in remaining and remaining[(candidate_doctor, day)] <= 0:
+                        continue
+
+                    base_cost = (abs(day - original_day) * self.RESCHEDULE_DAY_COST
+                                 + (self.RESCHEDULE_OTHER_DOCTOR_COST if candidate_doctor != doctor_id else 0))
+                    if best and base_cost >= best['cost']:
+                        continue
+
+                    busy = patient_busy.get((appointment['patient_id'], day), [])
+                    for index, slot in enumerate(slots):
+                        if slot['taken']:
+                            continue
+                        run = self._slot_run(slots, index, duration)
+                        if run is None:
+                            continue
+                        run_start = slots[run[0]]['start_minute']
+                        run_end = slots[run[-1]]['end_minute']
+                        if any(ranges_overlap(run_start, run_end, busy_start, busy_end)
+                               for busy_start, busy_end in busy):
+                            continue
+
+                        cost = base_cost + abs(run_start - reference_minute) / 60 * self.RESCHEDULE_HOUR_COST
+                        if best is None or cost < best['cost']:
+                            best = {'cost': cost, 'doctor_id': candidate_doctor, 'day': day, 'run': run}
+
+                if best is None:
+                    unassigned.append({
+                        'appointment_id': appointment['id'],
+                        'patient_name': appointment['patient_name'],
+                        'appointment_date': appointment['appointment_date'],
+                        'appointment_time': appointment['appointment_time']
+                    })
+                    continue
+
+                slots = day_slots[(best['doctor_id'], best['day'])]
+                for index in best['run']:
+                    slots[index]['taken'] = True
+                start_minute = slots[best['run'][0]]['start_minute']
+                end_minute = slots[best['run'][-1]]['end_minute']
+                if (best['doctor_id'], best['day']) in remaining:
+                    remaining[(best['doctor_id'], best['day'])] -= 1
+                patient_busy.setdefault((appointment['patient_id'], best['day']), []).append((start_minute, end_minute))
+
+                target_doctor = doctor_info[best['doctor_id']]
+                moves.append({
+                    'appointment_id': appointment['id'],
+                    'patient_id': appointment['patient_id'],
+                    'patient_name': appointment['patient_name'],
+                    'status': appointment['status'],
+                    'from_doctor_id': doctor_id,
+                    'from_date': appointment['appointment_date'],
+                    'from_time': appointment['appointment_time'],
+                    'to_doctor_id': target_doctor['id'],
+                    'to_doctor_name': target_doctor['name'],
+                    'to_department_id': target_doctor['department_id'],
+                    'to_clinic_id': target_doctor['clinic_id'],
+                    'to_date': ordinal_to_str(best['day']),
+                    'to_time': MINUTE_LABELS[start_minute],
+                    'slot_ids': [slots[index]['id'] for index in best['run']],
+                    'cost': round(best['cost'], 2)
+                })
+
+            elapsed_ms = int((time_module.perf_counter() - started) * 1000)
+            logging.info(f"📋 خطة إعادة جدولة الطبيب {doctor_id}: {len(moves)} نقل، "
+                         f"{len(unassigned)} بدون وقت ({elapsed_ms} ms)")
+
+            return {
+                'success': True,
+                'doctor_id': doctor_id,
+                'start_date': ordinal_to_str(start_ordinal),
+                'end_date': ordinal_to_str(end_ordinal),
+                'moves': moves,
+                'unassigned': unassigned,
+                'elapsed_ms': elapsed_ms
+            }
+
+        except Exception as e:
+            logging.error(f"❌ خطأ في إعداد خطة إعادة الجدولة: {e}")
+            return {'success': False, 'moves': [], 'unassigned': [], 'message': str(e)}
+
+    def apply_reschedule_plan(self, plan: Dict) -> Dict:
+        """تطبيق خطة إعادة الجدولة في معاملة واحدة (كل شيء أو لا شيء)"""
+        moves = plan.get('moves', [])
+        if not moves:
+            return {'success': True, 'moved': 0, 'message': 'لا توجد مواعيد للنقل'}
+
+        try:
+            cursor = self.conn.cursor()
+            old_days = set()
+
+            for move in moves:
+                # حجز الأوقات الجديدة - يفشل إذا حُجز أحدها بعد المعاينة
+                placeholders = ', '.join('?' for _ in move['slot_ids'])
+                cursor.execute(f'''
+                    UPDATE doctor_periodic_schedules
+                    SET status = 'booked', appointment_id = ?, updated_at = CURRENT_TIMESTAMP
+                    WHERE id IN ({placeholders}) AND status = 'available'
+                ''', [move['appointment_id']] + move['slot_ids'])
+                if cursor.rowcount != len(move['slot_ids']):
+                    raise RuntimeError(f"الوقت {move['to_date']} {move['to_time']} لم يعد متاحاً")
+
+                if not self.apply_capacity_change(
+                        (move['from_doctor_id'], move['from_date'], move['status']),
+                        (move['to_doctor_id'], move['to_date'], move['status'])):
+                    raise RuntimeError(f"اكتملت سعة يوم {move['to_date']}")
+
+                # تحرير الوقت القديم
+                cursor.execute('''
+                    UPDATE doctor_periodic_schedules
+                    SET status = 'available', appointment_id = NULL, updated_at = CURRENT_TIMESTAMP
+                    WHERE status = 'booked' AND id NOT IN ({}) AND (appointment_id = ?
+                          OR (doctor_id = ? AND day_ordinal = ? AND start_minute = ?))
+                '''.format(placeholders), move['slot_ids'] + [
+                    move['appointment_id'], move['from_doctor_id'],
+                    to_ordinal(move['from_date']), to_minutes(move['from_time'])])
+                old_days.add((move['from_doctor_id'], move['from_date']))
+                
+                if not self.move_appointment_resources(move['appointment_id'], move['to_date'], move['to_time']):
+                    raise RuntimeError(f"الموارد غير متاحة في {move['to_date']} {move['to_time']}")
+
+                cursor.execute('''
+                    UPDATE appointments
+                    SET doctor_id = ?, department_id = ?, clinic_id = ?,
+                        appointment_date = ?, appointment_time = ?,
+                        reminder_24h_sent = 0, reminder_2h_sent = 0,
+                        notes = TRIM(COALESCE(notes, '') || ' ' || ?),
+                        updated_at = CURRENT_TIMESTAMP
+                    WHERE id = ?
+                ''', (move['to_doctor_id'], move['to_department_id'], move['to_clinic_id'],
+                      move['to_date'], move['to_time'],
+                      f"(نُقل من {move['from_date']} {move['from_time']})", move['appointment_id']))
+
+                cursor.execute('SELECT patient_id, type FROM appointments WHERE id = ?', (move['appointment_id'],))
+                moved = cursor.fetchone()
+                if self.find_patient_conflicts(moved['patient_id'], move['to_date'], move['to_time'],
+                                               moved['type'], exclude_appointment_id=move['appointment_id']):
+                    raise RuntimeError(f"المريض لديه موعد آخر في {move['to_date']} {move['to_time']}")
+                if self._find_doctor_overlaps(move['appointment_id']):
+                    raise RuntimeError(f"الطبيب {move['to_doctor_name']} لديه موعد آخر في {move['to_date']} {move['to_time']}")
+
+                self.touch_doctor_queue(move['from_doctor_id'], move['from_date'])
+                self.touch_doctor_queue(move['to_doctor_id'], move['to_date'])
+
+            # إعادة حجب الأوقات المحررة إن كانت مشمولة باستثناء الغياب
+            for old_doctor, old_date in old_days:
+                result = self.refresh_doctor_day_availability(old_doctor, old_date, commit=False)
+                if not result['success']:
+                    raise RuntimeError(f"تعذر تحديث أوقات يوم {old_date}")
+
+            self.conn.commit()
+            self.notify_appointment_changed()
+            logging.info(f"✅ تم نقل {len(moves)} موعد")
+            return {'success': True, 'moved': len(moves), 'message': f'تم نقل {len(moves)} موعد'}
+
+        except Exception as e:
+            logging.error(f"❌ خطأ في تطبيق خطة إعادة الجدولة: {e}")
+            self.conn.rollback()
+            return {'success': False, 'moved': 0, 'message': str(e)}
+
+    # ⭐⭐ دوال مساعدة للخطة ⭐⭐
+
+    def _load_reschedule_candidates(self, doctor_id: int, doctor_info: Dict, start_ordinal: int,
+                                    end_ordinal: int, horizon_end: int, today: int) -> Dict:
+        """الأوقات المتاحة المرشحة مجمعة حسب (الطبيب، اليوم) ومرتبة بالوقت
+
+        تُستبعد الأوقات المتداخلة مع مواعيد الطبيب القائمة (تشمل المواعيد
+        المحجوزة خارج الجدول الدوري) حتى لا يُحجز الطبيب مرتين.
+        """
+        cursor = self.conn.cursor()
+        placeholders = ', '.join('?' for _ in doctor_info)
+        first_ordinal = max(start_ordinal, today)
+
+        cursor.execute(f'''
+            SELECT doctor_id, appointment_date, start_minute, end_minute, status FROM appointments
+            WHERE doctor_id IN ({placeholders}) AND appointment_date BETWEEN ? AND ?
+            AND start_minute IS NOT NULL
+        ''', list(doctor_info) + [ordinal_to_str(first_ordinal), ordinal_to_str(horizon_end)])
+        doctor_busy = {}
+        for row in cursor.fetchall():
+            if self.is_cancelled_status(row['status']):
+                continue
+            doctor_busy.setdefault((row['doctor_id'], to_ordinal(row['appointment_date'])), []).append(
+                (row['start_minute'], row['end_minute']))
+
+        cursor.execute(f'''
+            SELECT id, doctor_id, day_ordinal, start_minute, end_minute
+            FROM doctor_periodic_schedules
+            WHERE doctor_id IN ({placeholders}) AND status = 'available'
+            AND day_ordinal BETWEEN ? AND ?
+            ORDER BY doctor_id, day_ordinal, start_minute
+        ''', list(doctor_info) + [first_ordinal, horizon_end])
+
+        calendar = self.get_holiday_calendar()
+        day_slots = {}
+        for row in cursor.fetchall():
+            # الطبيب الغائب لا يُنقل إليه إلا بعد فترة الغياب
+            if row['doctor_id'] == doctor_id and row['day_ordinal'] <= end_ordinal:
+                continue
+            if calendar.is_holiday(row['day_ordinal']):
+                continue
+            if any(ranges_overlap(row['start_minute'], row['end_minute'], busy_start, busy_end)
+                   for busy_start, busy_end in doctor_busy.get((row['doctor_id'], row['day_ordinal']), [])):
+                continue
+            day_slots.setdefault((row['doctor_id'], row['day_ordinal']), []).append({
+                'id': row['id'],
+                'start_minute': row['start_minute'],
+                'end_minute': row['end_minute'],
+                'taken': False
+            })
+        return day_slots
+
+    def _find_doctor_overlaps(self, appointment_id: int) -> List[int]:
+        """مواعيد الطبيب الأخرى المتداخلة مع موعد محدد - تعمل داخل معاملة النقل"""
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            SELECT other.id, other.status
+            FROM appointments a
+            JOIN appointments other ON other.doctor_id = a.doctor_id
+                AND other.appointment_date = a.appointment_date AND other.id != a.id
+                AND other.start_minute < a.end_minute AND other.end_minute > a.start_minute
+            WHERE a.id = ?
+        ''', (appointment_id,))
+        return [row['id'] for row in cursor.fetchall() if not self.is_cancelled_status(row['status'])]
+
+    def _load_remaining_capacity(self, doctor_info: Dict, start_ordinal: int, end_ordinal: int) -> Dict:
+        """المتبقي من السعة لكل (طبيب، يوم) - المفقود يعني بدون حد أو يوم فارغ"""
+        remaining = {}
+        cursor = self.conn.cursor()
+        for candidate_doctor in doctor_info:
+            limit = self.get_doctor_daily_limit(candidate_doctor)
+            if limit is None:
+                continue
+            cursor.execute('''
+                SELECT day_ordinal, booked_count FROM doctor_daily_capacity
+                WHERE doctor_id = ? AND day_ordinal BETWEEN ? AND ?
+            ''', (candidate_doctor, start_ordinal, end_ordinal))
+            booked = {row['day_ordinal']: row['booked_count'] for row in cursor.fetchall()}
+            for day in range(start_ordinal, end_ordinal + 1):
+                remaining[(candidate_doctor, day)] = limit - booked.get(day, 0)
+        return remaining
+
+    def _load_patient_busy(self, affected: List[Dict], start_ordinal: int, end_ordinal: int) -> Dict:
+        """فترات انشغال المرضى المتأثرين بمواعيدهم الأخرى {(المريض، اليوم): [(بداية، نهاية)]}"""
+        patient_ids = sorted({appointment['patient_id'] for appointment in affected})
+        affected_ids = {appointment['id'] for appointment in affected}
+        durations = self._load_service_durations()
+
+        cursor = self.conn.cursor()
+        placeholders = ', '.join('?' for _ in patient_ids)
+        cursor.execute(f'''
+            SELECT id, patient_id, appointment_date, appointment_time, type, status
+            FROM appointments
+            WHERE patient_id IN ({placeholders}) AND appointment_date BETWEEN ? AND ?
+        ''', patient_ids + [ordinal_to_str(start_ordinal), ordinal_to_str(end_ordinal)])
+
+        busy = {}
+        for row in cursor.fetchall():
+            if row['id'] in affected_ids or self.is_cancelled_status(row['status']):
+                continue
+            try:
+                start_minute = to_minutes(row['appointment_time'])
+            except (TypeError, ValueError):
+                continue
+            end_minute = start_minute + (durations.get(row['type']) or 30)
+            busy.setdefault((row['patient_id'], to_ordinal(row['appointment_date'])), []).append(
+                (start_minute, end_minute))
+        return busy
+
+    def _load_service_durations(self) -> Dict[str, int]:
+        """مدة كل نوع خدمة من service_types"""
+        cursor = self.conn.cursor()
+        cursor.execute('SELECT name, default_duration FROM service_types WHERE is_active = 1')
+        return {row['name']: row['default_duration'] for row in cursor.fetchall()}
+
+    def _slot_run(self, slots: List[Dict], index: int, duration: int) -> Optional[List[int]]:
+        """أوقات متتالية غير محجوزة تبدأ من index وتغطي مدة الخدمة"""
+        start_minute = slots[index]['start_minute']
+        run = [index]
+        current = slots[index]
+        while current['end_minute'] - start_minute < duration:
+            next_index = run[-1] + 1
+            if next_index >= len(slots) or slots[next_index]['taken']:
+                return None
+            following = slots[next_index]
+            # فاصل قصير فقط بين الوقتين (وقت التنظيف بين المواعيد)
+            if following['start_minute'] - current['end_minute'] > 15:
+                return None
+            run.append(next_index)
+            current = following
+        return run
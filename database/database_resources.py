@@ -0,0 +1,548 @@
+# -*- coding: utf-8 -*-
+import json
+import logging
+from datetime import date
+from typing import List, Dict, Optional, Union
+
+from scheduling_time import (to_minutes, to_ordinal, ordinal_to_str, minutes_to_label,
+                             merge_intervals, intersect_intervals, subtract_intervals,
+                             interval_contains)
+
+class ResourcesMixin:
+    """ميكسین الموارد (الغرف والأجهزة) وحجزها مع الطبيب
+
+    لكل مورد ساعات عمل وأيام عمل وفترات توقف خاصة به. الخدمات مثل الأشعة والتحاليل
+    تتطلب مورداً من فئة محددة، ويُحجز المورد مع الموعد في نفس المعاملة.
+    """
+
+    RESOURCE_TYPES = ('room', 'device')
+
+    WEEKDAY_NAMES = ("monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday")
+
+    def create_resources_tables(self):
+        """إنشاء جداول الموارد ومتطلبات الخدمات وحجوزات الموارد"""
+        try:
+            cursor = self.conn.cursor()
+
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS resources (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    name TEXT NOT NULL UNIQUE,
+                    resource_type TEXT NOT NULL DEFAULT 'room', -- room / device
+                    category TEXT NOT NULL, -- الفئة التي تطلبها الخدمات (مثل: جهاز أشعة)
+                    clinic_id INTEGER,
+                    open_minute INTEGER NOT NULL DEFAULT 480,
+                    close_minute INTEGER NOT NULL DEFAULT 1020,
+                    work_days TEXT NOT NULL DEFAULT '["sunday", "monday", "tuesday", "wednesday", "thursday"]',
+                    is_active BOOLEAN DEFAULT 1,
+                    notes TEXT,
+                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (clinic_id) REFERENCES clinics (id)
+                )
+            ''')
+
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS service_resource_requirements (
+                    service_name TEXT NOT NULL,
+                    category TEXT NOT NULL,
+                    PRIMARY KEY (service_name, category)
+                )
+            ''')
+
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS resource_downtime (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    resource_id INTEGER NOT NULL,
+                    start_ordinal INTEGER NOT NULL,
+                    end_ordinal INTEGER NOT NULL,
+                    start_minute INTEGER, -- NULL = اليوم كاملاً
+                    end_minute INTEGER,
+                    reason TEXT,
+                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (resource_id) REFERENCES resources (id) ON DELETE CASCADE
+                )
+            ''')
+
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS resource_bookings (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    resource_id INTEGER NOT NULL,
+                    appointment_id INTEGER NOT NULL,
+                    day_ordinal INTEGER NOT NULL,
+                    start_minute INTEGER NOT NULL,
+                    end_minute INTEGER NOT NULL,
+                    status TEXT DEFAULT 'active', -- active / released
+                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (resource_id) REFERENCES resources (id) ON DELETE CASCADE,
+                    FOREIGN KEY (appointment_id) REFERENCES appointments (id) ON DELETE CASCADE
+                )
+            ''')
+
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_resource_bookings_day
+                ON resource_bookings (resource_id, day_ordinal, status, start_minute)
+            ''')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_resource_bookings_appointment
+                ON resource_bookings (appointment_id, status)
+            ''')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_resource_downtime_range
+                ON resource_downtime (resource_id, start_ordinal, end_ordinal)
+            ''')
+
+            self.conn.commit()
+            self.create_default_resources()
+
+        except Exception as e:
+            logging.error(f"❌ خطأ في إنشاء جداول الموارد: {e}")
+            self.conn.rollback()
+
+    def create_default_resources(self):
+        """الموارد الافتراضية لخدمات الأشعة والتحاليل (عند أول تشغيل فقط)"""
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute('SELECT COUNT(*) FROM resources')
+            if cursor.fetchone()[0]:
+                return
+
+            default_resources = [
+                ('غرفة الأشعة', 'room', 'غرفة أشعة'),
+                ('جهاز الأشعة السينية', 'device', 'جهاز أشعة'),
+                ('معمل التحاليل', 'room', 'معمل'),
+            ]
+            cursor.executemany('''
+                INSERT OR IGNORE INTO resources (name, resource_type, category) VALUES (?, ?, ?)
+            ''', default_resources)
+
+            default_requirements = [
+                ('أشعة', 'غرفة أشعة'),
+                ('أشعة', 'جهاز أشعة'),
+                ('تحاليل', 'معمل'),
+            ]
+            cursor.executemany('''
+                INSERT OR IGNORE INTO service_resource_requirements (service_name, category) VALUES (?, ?)
+            ''', default_requirements)
+
+            self.conn.commit()
+            logging.info("✅ تم إنشاء الموارد الافتراضية")
+
+        except Exception as e:
+            logging.error(f"❌ خطأ في إنشاء الموارد الافتراضية: {e}")
+            self.conn.rollback()
+
+    # ⭐⭐ إدارة الموارد ⭐⭐
+
+    def add_resource(self, resource_data: Dict) -> Optional[int]:
+        """إضافة مورد (غرفة أو جهاز)"""
+        try:
+            resource_type = resource_data.get('resource_type', 'room')
+            if resource_type not in self.RESOURCE_TYPES:
+                logging.warning(f"⚠️ نوع مورد غير معروف: {resource_type}")
+                return None
+
+            work_days = resource_data.get('work_days') or ["sunday", "monday", "tuesday", "wednesday", "thursday"]
+            cursor = self.conn.cursor()
+            cursor.execute('''
+                INSERT INTO resources (name, resource_type, category, clinic_id,
+                                       open_minute, close_minute, work_days, notes)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (
+                resource_data['name'],
+                resource_type,
+                resource_data.get('category') or resource_data['name'],
+                resource_data.get('clinic_id'),
+                to_minutes(resource_data.get('open_time', '08:00')),
+                to_minutes(resource_data.get('close_time', '17:00')),
+                json.dumps(work_days, ensure_ascii=False),
+                resource_data.get('notes', '')
+            ))
+            self.conn.commit()
+
+            logging.info(f"✅ تم إضافة المورد: {resource_data['name']}")
+            return cursor.lastrowid
+
+        except Exception as e:
+            logging.error(f"❌ خطأ في إضافة المورد: {e}")
+            self.conn.rollback()
+            return None
+
+    def deactivate_resource(self, resource_id: int) -> bool:
+        """إيقاف مورد (تبقى حجوزاته السابقة كما هي)"""
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute('UPDATE resources SET is_active = 0 WHERE id = ?', (resource_id,))
+            self.conn.commit()
+            return cursor.rowcount > 0
+
+        except Exception as e:
+            logging.error(f"❌ خطأ في إيقاف المورد: {e}")
+            self.conn.rollback()
+            return False
+
+    def get_resources(self, category: str = None, resource_type: str = None,
+                      clinic_id: int = None) -> List[Dict]:
+        """الموارد النشطة (مع تصفية اختيارية)"""
+        try:
+            query = 'SELECT * FROM resources WHERE is_active = 1'
+            params = []
+            if category:
+                query += ' AND category = ?'
+                params.append(category)
+            if resource_type:
+                query += ' AND resource_type = ?'
+                params.append(resource_type)
+            if clinic_id:
+                query += ' AND (clinic_id IS NULL OR clinic_id = ?)'
+                params.append(clinic_id)
+            query += ' ORDER BY category, id'
+
+            cursor = self.conn.cursor()
+            cursor.execute(query, params)
+
+            resources = []
+            for row in cursor.fetchall():
+                resource = dict(row)
+                work_days = self.safe_json_loads(resource.get('work_days'))
+                resource['work_days'] = work_days if isinstance(work_days, list) else []
+                resources.append(resource)
+            return resources
+
+        except Exception as e:
+            logging.error(f"❌ خطأ في جلب الموارد: {e}")
+            return []
+
+    def set_service_resource_requirements(self, service_name: str, categories: List[str]) -> bool:
+        """تحديد فئات الموارد المطلوبة لخدمة"""
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute('DELETE FROM service_resource_requirements WHERE service_name = ?', (service_name,))
+            cursor.executemany('''
+                INSERT OR IGNORE INTO service_resource_requirements (service_name, category) VALUES (?, ?)
+            ''', [(service_name, category) for category in categories])
+            self.conn.commit()
+            return True
+
+        except Exception as e:
+            logging.error(f"❌ خطأ في تحديد موارد الخدمة: {e}")
+            self.conn.rollback()
+            return False
+
+    def get_service_resource_requirements(self, service_name: str) -> List[str]:
+        """فئات الموارد المطلوبة لخدمة (قائمة فارغة إن لم تتطلب موارد)"""
+        if not service_name:
+            return []
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute('''
+                SELECT category FROM service_resource_requirements
+                WHERE service_name = ? ORDER BY category
+            ''', (service_name,))
+            return [row['category'] for row in cursor.fetchall()]
+
+        except Exception as e:
+            logging.error(f"❌ خطأ في جلب موارد الخدمة: {e}")
+            return []
+
+    def get_service_duration(self, service_name: str, default: int = 30) -> int:
+        """مدة الخدمة بالدقائق من service_types"""
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute('SELECT default_duration FROM service_types WHERE name = ?', (service_name,))
+            row = cursor.fetchone()
+            return row['default_duration'] if row and row['default_duration'] else default
+
+        except Exception as e:
+            logging.error(f"❌ خطأ في جلب مدة الخدمة: {e}")
+            return default
+
+    def add_resource_downtime(self, downtime_data: Dict) -> Optional[int]:
+        """إضافة فترة توقف لمورد (صيانة مثلاً) - بدون وقت = اليوم كاملاً"""
+        try:
+            start_time = downtime_data.get('start_time')
+            end_time = downtime_data.get('end_time')
+            cursor = self.conn.cursor()
+            cursor.execute('''
+                INSERT INTO resource_downtime (resource_id, start_ordinal, end_ordinal,
+                                               start_minute, end_minute, reason)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (
+                downtime_data['resource_id'],
+                to_ordinal(downtime_data['start_date']),
+                to_ordinal(downtime_data.get('end_date') or downtime_data['start_date']),
+                to_minutes(start_time) if start_time else None,
+                to_minutes(end_time) if end_time else None,
+                downtime_data.get('reason', '')
+            ))
+            self.conn.commit()
+            return cursor.lastrowid
+
+        except Exception as e:
+            logging.error(f"❌ خطأ في إضافة توقف المورد: {e}")
+            self.conn.rollback()
+            return None
+
+    # ⭐⭐ حساب الفترات الحرة ⭐⭐
+
+    def get_resources_free_intervals(self, resources: List[Dict], start_ordinal: int,
+                                     end_ordinal: int, exclude_appointment_id: int = None) -> Dict:
+        """الفترات الحرة لكل مورد ولكل يوم {resource_id: {ordinal: [(بداية، نهاية)]}}
+
+        استعلامان فقط لكل الموارد والفترة: الحجوزات النشطة وفترات التوقف.
+        """
+        if not resources:
+            return {}
+
+        resource_ids = [resource['id'] for resource in resources]
+        placeholders = ', '.join('?' for _ in resource_ids)
+        cursor = self.conn.cursor()
+
+        busy = {}
+        cursor.execute(f'''
+            SELECT resource_id, day_ordinal, start_minute, end_minute
+            FROM resource_bookings
+            WHERE resource_id IN ({placeholders}) AND status = 'active'
+            AND day_ordinal BETWEEN ? AND ? AND appointment_id != ?
+        ''', resource_ids + [start_ordinal, end_ordinal, exclude_appointment_id or 0])
+        for row in cursor.fetchall():
+            busy.setdefault((row['resource_id'], row['day_ordinal']), []).append(
+                (row['start_minute'], row['end_minute']))
+
+        cursor.execute(f'''
+            SELECT resource_id, start_ordinal, end_ordinal, start_minute, end_minute
+            FROM resource_downtime
+            WHERE resource_id IN ({placeholders}) AND end_ordinal >= ? AND start_ordinal <= ?
+        ''', resource_ids + [start_ordinal, end_ordinal])
+        for row in cursor.fetchall():
+            interval = ((row['start_minute'], row['end_minute'])
+                        if row['start_minute'] is not None else (0, 24 * 60))
+            for ordinal in range(max(row['start_ordinal'], start_ordinal), min(row['end_ordinal'], end_ordinal) + 1):
+                busy.setdefault((row['resource_id'], ordinal), []).append(interval)
+
+        calendar = self.get_holiday_calendar()
+        free = {}
+        for resource in resources:
+            work_weekdays = {self.WEEKDAY_NAMES.index(day) for day in resource['work_days']
+                             if day in self.WEEKDAY_NAMES}
+            opening = [(resource['open_minute'], resource['close_minute'])]
+            days = {}
+            for ordinal in range(start_ordinal, end_ordinal + 1):
+                if (ordinal - 1) % 7 not in work_weekdays or calendar.is_holiday(ordinal):
+                    continue
+                day_busy = busy.get((resource['id'], ordinal))
+                days[ordinal] = subtract_intervals(opening, merge_intervals(day_busy)) if day_busy else opening
+            free[resource['id']] = days
+
+        return free
+
+    def find_combined_availability(self, doctor_id: int, service_type: str,
+                                   start_date: Union[str, date] = None, days: int = 7) -> Dict:
+        """الأوقات المتاحة للطبيب والموارد المطلوبة معاً
+
+        لكل يوم: تقاطع فترات الطبيب الحرة مع اتحاد فترات كل فئة موارد (قوائم مرتبة)،
+        ثم اختيار مورد محدد لكل فئة بالبحث الثنائي في فتراته الحرة.
+        تُرجع {'YYYY-MM-DD': [{'time', 'start_minute', 'end_minute', 'resources': {فئة: رقم المورد}}]}
+        """
+        try:
+            start_ordinal = to_ordinal(start_date or date.today())
+            end_ordinal = start_ordinal + max(days, 1) - 1
+            duration = self.get_service_duration(service_type)
+            categories = self.get_service_resource_requirements(service_type)
+
+            cursor = self.conn.cursor()
+            cursor.execute('''
+                SELECT day_ordinal, start_minute, end_minute
+                FROM doctor_periodic_schedules
+                WHERE doctor_id = ? AND status = 'available' AND day_ordinal BETWEEN ? AND ?
+                ORDER BY day_ordinal, start_minute
+            ''', (doctor_id, start_ordinal, end_ordinal))
+            doctor_slots = {}
+            for row in cursor.fetchall():
+                doctor_slots.setdefault(row['day_ordinal'], []).append((row['start_minute'], row['end_minute']))
+
+            full_days = self.get_full_days(doctor_id, start_ordinal, end_ordinal)
+            buffer = (self.get_doctor_schedule_settings(doctor_id) or {}).get('buffer_time') or 0
+
+            resources_by_category = {category: self.get_resources(category=category) for category in categories}
+            all_resources = [resource for resources in resources_by_category.values() for resource in resources]
+            resource_free = self.get_resources_free_intervals(all_resources, start_ordinal, end_ordinal)
+
+            availability = {}
+            for ordinal, slots in doctor_slots.items():
+                if ordinal in full_days:
+                    continue
+
+                # فترات الطبيب الحرة: الأوقات المتتالية المتاحة تُدمج عبر فاصل الراحة بينها
+                doctor_free = [(start, end - buffer) for start, end in
+                               merge_intervals([(start, end + buffer) for start, end in slots])]
+
+                # الفترات المشتركة بين الطبيب وكل فئة موارد
+                combined = doctor_free
+                category_free = {}
+                for category, resources in resources_by_category.items():
+                    per_resource = [(resource['id'], resource_free[resource['id']].get(ordinal, []))
+                                    for resource in resources]
+                    category_free[category] = per_resource
+                    union = merge_intervals([interval for _, intervals in per_resource for interval in intervals])
+                    combined = intersect_intervals(combined, union)
+                    if not combined:
+                        break
+                if not combined:
+                    continue
+
+                day_slots = []
+                for start, end in slots:
+                    # الخدمة الأطول من الوقت تحتاج الأوقات التالية للطبيب حرة أيضاً
+                    service_end = start + max(duration, end - start)
+                    if not interval_contains(combined, start, service_end):
+                        continue
+
+                    chosen = {}
+                    for category, per_resource in category_free.items():
+                        for resource_id, intervals in per_resource:
+                            if interval_contains(intervals, start, service_end):
+                                chosen[category] = resource_id
+                                break
+                        else:
+                            break
+                    if len(chosen) != len(categories):
+                        continue
+
+                    day_slots.append({
+                        'time': minutes_to_label(start),
+                        'start_minute': start,
+                        'end_minute': service_end,
+                        'resources': chosen
+                    })
+
+                if day_slots:
+                    availability[ordinal_to_str(ordinal)] = day_slots
+
+            return availability
+
+        except Exception as e:
+            logging.error(f"❌ خطأ في حساب التوفر المشترك: {e}")
+            return {}
+
+    # ⭐⭐ الحجز والتحرير ⭐⭐
+
+    def needs_resources(self, appointment_data: Dict) -> bool:
+        """هل يحتاج الموعد إلى حجز موارد"""
+        return bool(appointment_data.get('resource_ids')
+                    or self.get_service_resource_requirements(appointment_data.get('type')))
+
+    def claim_appointment_resources(self, appointment_id: int, appointment_data: Dict) -> bool:
+        """حجز الموارد المطلوبة للموعد - بدون حفظ
+
+        تُستدعى بعد إدراج الموعد وحجز وقت الطبيب (claim_doctor_slot) في نفس المعاملة،
+        فيكون قفل الكتابة في SQLite محجوزاً مسبقاً ولا يستطيع اتصال آخر حجز نفس
+        المورد بين الفحص والإدراج. تُرجع False عند أي تعارض ويتولى المستدعي التراجع.
+        """
+        ordinal = to_ordinal(appointment_data['appointment_date'])
+        start = to_minutes(appointment_data['appointment_time'])
+        service_type = appointment_data.get('type')
+        end = start + self.get_service_duration(service_type)
+        cursor = self.conn.cursor()
+
+        # الموارد: المحددة من المستخدم أو أول مورد متاح من كل فئة مطلوبة
+        requested = appointment_data.get('resource_ids') or []
+        categories = self.get_service_resource_requirements(service_type)
+        candidates = self.get_resources(clinic_id=appointment_data.get('clinic_id'))
+        if requested:
+            candidates = [resource for resource in candidates if resource['id'] in requested]
+            if len(candidates) != len(set(requested)):
+                logging.warning(f"⚠️ مورد غير موجود أو موقوف: {requested}")
+                return False
+
+        free = self.get_resources_free_intervals(candidates, ordinal, ordinal)
+        chosen = {}
+        for resource in candidates:
+            if not interval_contains(free[resource['id']].get(ordinal, []), start, end):
+                continue
+            if requested:
+                chosen[resource['id']] = resource
+            elif resource['category'] in categories and resource['category'] not in chosen:
+                chosen[resource['category']] = resource
+
+        missing = (set(requested) - set(chosen)) if requested else (set(categories) - set(chosen))
+        if missing:
+            logging.warning(f"⚠️ الموارد غير متاحة في {appointment_data['appointment_date']} "
+                            f"{appointment_data['appointment_time']}: {sorted(map(str, missing))}")
+            return False
+
+        cursor.executemany('''
+            INSERT INTO resource_bookings (resource_id, appointment_id, day_ordinal, start_minute, end_minute)
+            VALUES (?, ?, ?, ?, ?)
+        ''', [(resource['id'], appointment_id, ordinal, start, end) for resource in chosen.values()])
+
+        logging.info(f"🏥 تم حجز {len(chosen)} مورد للموعد {appointment_id}")
+        return True
+
+    def move_appointment_resources(self, appointment_id: int, new_date: Union[str, date],
+                                   new_time: str) -> bool:
+        """نقل حجوزات موارد الموعد لوقت جديد إن كانت الموارد متاحة - بدون حفظ"""
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            SELECT id, resource_id, start_minute, end_minute FROM resource_bookings
+            WHERE appointment_id = ? AND status = 'active'
+        ''', (appointment_id,))
+        bookings = cursor.fetchall()
+        if not bookings:
+            return True
+
+        ordinal = to_ordinal(new_date)
+        start = to_minutes(new_time)
+        resources = {resource['id']: resource for resource in self.get_resources()}
+        moving = [resources[booking['resource_id']] for booking in bookings if booking['resource_id'] in resources]
+        free = self.get_resources_free_intervals(moving, ordinal, ordinal, exclude_appointment_id=appointment_id)
+
+        for booking in bookings:
+            end = start + booking['end_minute'] - booking['start_minute']
+            if not interval_contains(free.get(booking['resource_id'], {}).get(ordinal, []), start, end):
+                logging.warning(f"⚠️ المورد {booking['resource_id']} غير متاح في {new_date} {new_time}")
+                return False
+            cursor.execute('''
+                UPDATE resource_bookings SET day_ordinal = ?, start_minute = ?, end_minute = ?
+                WHERE id = ?
+            ''', (ordinal, start, end, booking['id']))
+
+        return True
+
+    def release_appointment_resources(self, appointment_ids: List[int]) -> int:
+        """تحرير موارد المواعيد الملغاة - بدون حفظ"""
+        if not appointment_ids:
+            return 0
+        cursor = self.conn.cursor()
+        placeholders = ', '.join('?' for _ in appointment_ids)
+        cursor.execute(f'''
+            UPDATE resource_bookings SET status = 'released'
+            WHERE appointment_id IN ({placeholders}) AND status = 'active'
+        ''', list(appointment_ids))
+        return cursor.rowcount
+
+    def get_resource_schedule(self, resource_id: int, target_date: Union[str, date]) -> List[Dict]:
+        """حجوزات مورد في يوم محدد"""
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute('''
+                SELECT rb.appointment_id, rb.start_minute, rb.end_minute,
+                       p.name AS patient_name, d.name AS doctor_name
+                FROM resource_bookings rb
+                JOIN appointments a ON a.id = rb.appointment_id
+                JOIN patients p ON p.id = a.patient_id
+                JOIN doctors d ON d.id = a.doctor_id
+                WHERE rb.resource_id = ? AND rb.day_ordinal = ? AND rb.status = 'active'
+                ORDER BY rb.start_minute
+            ''', (resource_id, to_ordinal(target_date)))
+
+            return [{
+                'appointment_id': row['appointment_id'],
+                'start': minutes_to_label(row['start_minute']),
+                'end': minutes_to_label(row['end_minute']),
+                'patient_name': row['patient_name'],
+                'doctor_name': row['doctor_name']
+            } for row in cursor.fetchall()]
+
+        except Exception as e:
+            logging.error(f"❌ خطأ في جلب جدول المورد: {e}")
+            return []
@@ -1,9 +1,16 @@
 # -*- coding: utf-8 -*-
 import logging
 import json
+import hashlib
+import time as time_module
+from array import array
 from datetime import datetime, timedelta, time, date
 from typing import List, Dict, Optional, Union
 
+from scheduling_time import (MINUTE_LABELS, SQLITE_JULIANDAY_OFFSET, to_minutes, to_ordinal,
+                             ordinal_to_str, minutes_to_time, ranges_overlap)
+from holiday_calendar import HolidayCalendar
+
 class SchedulingMixin:
     """ميكسین إدارة الجدولة الذكية المتكاملة - الإصدار النهائي المتكامل والمصحح"""
 
@@ -61,6 +68,10 @@ class SchedulingMixin:
                     appointment_id INTEGER NULL,
                     slot_type TEXT DEFAULT 'regular', -- regular, emergency, followup
                     period_type TEXT DEFAULT 'main', -- نوع الفترة
+                    needs_reschedule BOOLEAN DEFAULT 0, -- موعد محجوز خرج عن ساعات العمل الجديدة
+                    day_ordinal INTEGER, -- date.toordinal للتاريخ
+                    start_minute INTEGER, -- دقائق من بداية اليوم
+                    end_minute INTEGER,
                     created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
                     updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
                     UNIQUE(doctor_id, schedule_date, time_slot),
@@ -81,6 +92,9 @@ class SchedulingMixin:
                     next_renewal_date DATE,
                     max_daily_appointments INTEGER DEFAULT 15,
                     slot_interval INTEGER DEFAULT 30,
+                    renewal_status TEXT, -- done, failed (آخر تجديد خلفي)
+                    renewal_duration_ms INTEGER,
+                    renewal_updated_at DATETIME,
                     created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
                     FOREIGN KEY (doctor_id) REFERENCES doctors (id) ON DELETE CASCADE
                 )
@@ -114,12 +128,46 @@ class SchedulingMixin:
                 )
             ''')
             
+            # جدول إغلاقات العيادة (تُضاف إلى العطلات الرسمية)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS clinic_closures (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    start_date DATE NOT NULL,
+                    end_date DATE NOT NULL,
+                    reason TEXT,
+                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            
+            # عدادات السعة اليومية لكل طبيب (تُحدَّث مع الحجز والإلغاء)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS doctor_daily_capacity (
+                    doctor_id INTEGER NOT NULL,
+                    day_ordinal INTEGER NOT NULL,
+                    appointment_date DATE NOT NULL,
+                    booked_count INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (doctor_id, day_ordinal),
+                    FOREIGN KEY (doctor_id) REFERENCES doctors (id) ON DELETE CASCADE
+                )
+            ''')
+            
+            # فهرس الاستثناءات حسب الطبيب واليوم (يُستخدم عند توليد الأوقات والاستعلام عنها)
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_schedule_exceptions_doctor_date
+                ON schedule_exceptions (doctor_id, exception_date)
+            ''')
+            
             self.conn.commit()
             logging.info("✅ تم إنشاء جداول الجدولة الذكية المحسنة بنجاح")
             
             # ⭐⭐ إضافة الأعمدة المفقودة للتكامل ⭐⭐
             self.add_missing_columns()
             
+            # مطابقة عدادات السعة أول مرة لقواعد البيانات القائمة
+            cursor.execute('SELECT COUNT(*) FROM doctor_daily_capacity')
+            if cursor.fetchone()[0] == 0:
+                self.rebuild_daily_capacity()
+            
             # إنشاء البيانات الافتراضية
             self.create_default_service_types()
             self.initialize_default_periodic_settings()
@@ -158,7 +206,11 @@ class SchedulingMixin:
             existing_columns = [column[1] for column in cursor.fetchall()]
             
             periodic_columns_to_add = [
-                ('period_type', 'TEXT DEFAULT "main"')
+                ('period_type', 'TEXT DEFAULT "main"'),
+                ('needs_reschedule', 'BOOLEAN DEFAULT 0'),
+                ('day_ordinal', 'INTEGER'),
+                ('start_minute', 'INTEGER'),
+                ('end_minute', 'INTEGER')
             ]
             
             for column_name, column_def in periodic_columns_to_add:
@@ -169,6 +221,38 @@ class SchedulingMixin:
                     except Exception as e:
                         logging.warning(f"⚠️ تعذر إضافة العمود {column_name}: {e}")
             
+            # تعبئة الأعمدة الرقمية للصفوف القديمة ثم فهرستها
+            cursor.execute(f'''
+                UPDATE doctor_periodic_schedules
+                SET day_ordinal = CAST(julianday(schedule_date) - {SQLITE_JULIANDAY_OFFSET} AS INTEGER),
+                    start_minute = CAST(substr(time_slot, 1, 2) AS INTEGER) * 60 + CAST(substr(time_slot, 4, 2) AS INTEGER),
+                    end_minute = CAST(substr(time_slot, 1, 2) AS INTEGER) * 60 + CAST(substr(time_slot, 4, 2) AS INTEGER)
+                                 + COALESCE(slot_duration, 30)
+                WHERE day_ordinal IS NULL OR start_minute IS NULL
+            ''')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_periodic_doctor_day_minute
+                ON doctor_periodic_schedules (doctor_id, day_ordinal, start_minute)
+            ''')
+            
+            # التحقق من وجود أعمدة متابعة التجديد في periodic_schedule_settings
+            cursor.execute("PRAGMA table_info(periodic_schedule_settings)")
+            existing_columns = [column[1] for column in cursor.fetchall()]
+            
+            renewal_columns_to_add = [
+                ('renewal_status', 'TEXT'),
+                ('renewal_duration_ms', 'INTEGER'),
+                ('renewal_updated_at', 'DATETIME')
+            ]
+            
+            for column_name, column_def in renewal_columns_to_add:
+                if column_name not in existing_columns:
+                    try:
+                        cursor.execute(f'ALTER TABLE periodic_schedule_settings ADD COLUMN {column_name} {column_def}')
+                        logging.info(f"✅ تم إضافة عمود {column_name} لإعدادات الجدولة الدورية")
+                    except Exception as e:
+                        logging.warning(f"⚠️ تعذر إضافة العمود {column_name}: {e}")
+            
             self.conn.commit()
             
         except Exception as e:
@@ -296,7 +380,7 @@ class SchedulingMixin:
             self.conn.rollback()
             return False
 
-    def setup_doctor_periodic_schedule(self, doctor_id: int, period_days: int = 30) -> bool:
+    def setup_doctor_periodic_schedule(self, doctor_id: int, period_days: int = 30, commit: bool = True) -> bool:
         """إنشاء جدول دوري للطبيب لمدة محددة - الإصدار المتكامل والمصحح"""
         try:
             cursor = self.conn.cursor()
@@ -319,30 +403,11 @@ class SchedulingMixin:
             start_date = datetime.now().date()
             end_date = start_date + timedelta(days=period_days)
             
-            slots_created = 0
-            current_date = start_date
-            
-            while current_date <= end_date:
-                if self.is_work_day(settings, current_date):
-                    daily_slots = self.generate_daily_slots(settings, current_date)
-                    
-                    for slot in daily_slots:
-                        cursor.execute('''
-                            INSERT OR REPLACE INTO doctor_periodic_schedules 
-                            (doctor_id, schedule_date, time_slot, slot_duration, status, slot_type, period_type)
-                            VALUES (?, ?, ?, ?, ?, ?, ?)
-                        ''', (
-                            doctor_id,
-                            current_date.strftime('%Y-%m-%d'),
-                            slot['time'],
-                            settings.get('appointment_duration', 30),
-                            'available',
-                            'regular',
-                            slot.get('period_type', 'main')
-                        ))
-                        slots_created += 1
-                
-                current_date += timedelta(days=1)
+            # توليد تفاضلي: لا تُمس الأوقات المحجوزة ولا تُعاد كتابة الأوقات غير المتغيرة
+            diff_result = self.regenerate_doctor_schedule(doctor_id, start_date, end_date, settings, commit=False)
+            if not diff_result['success']:
+                raise RuntimeError(diff_result.get('message', 'فشل التوليد التفاضلي'))
+            slots_created = diff_result['inserted']
             
             # تحديث إعدادات الجدولة الدورية
             next_renewal = end_date - timedelta(days=7)  # التجديد قبل 7 أيام من النهاية
@@ -353,15 +418,209 @@ class SchedulingMixin:
                 VALUES (?, ?, 1, 7, DATE('now'), ?)
             ''', (doctor_id, period_days, next_renewal.strftime('%Y-%m-%d')))
             
-            self.conn.commit()
+            if commit:
+                self.conn.commit()
             logging.info(f"✅ تم إنشاء جدول دوري للطبيب {doctor_id}: {slots_created} موعد خلال {period_days} يوم")
             return True
             
         except Exception as e:
             logging.error(f"❌ خطأ في إنشاء الجدول الدوري: {e}")
-            self.conn.rollback()
+            if commit:
+                self.conn.rollback()
             return False
 
+    # الأوقات المحجوزة أو المعروضة على قائمة الانتظار لا تُحذف ولا تُعدَّل عند إعادة التوليد
+    PROTECTED_SLOT_STATUSES = ('booked', 'held')
+
+    def regenerate_doctor_schedule(self, doctor_id: int, start_date: date, end_date: date,
+                                   settings: Dict = None, commit: bool = True) -> Dict:
+        """إعادة توليد الجدول الدوري بمقارنة الأوقات القديمة والجديدة لكل يوم
+
+        - تُضاف الأوقات الجديدة فقط
+        - تُحذف الأوقات الفارغة التي خرجت عن ساعات العمل
+        - الأوقات المحجوزة خارج الساعات الجديدة لا تُحذف بل تُعلَّم needs_reschedule
+        - الوقت الجديد الذي يشغله موعد قائم (سلسلة حُجزت قبل توليد أيامها مثلاً)
+          يُدرج محجوزاً له، ويُعلَّم needs_reschedule إن لم يكن متاحاً في القالب
+        - تُكتب الصفوف المتغيرة فقط ضمن معاملة واحدة
+        """
+        try:
+            if settings is None:
+                settings = self.get_doctor_schedule_settings(doctor_id)
+            if not settings:
+                return {'success': False, 'message': 'لا توجد إعدادات للطبيب'}
+
+            start_str = start_date.strftime('%Y-%m-%d')
+            end_str = end_date.strftime('%Y-%m-%d')
+            duration = settings.get('appointment_duration', 30)
+
+            cursor = self.conn.cursor()
+
+            # الأوقات الحالية في الفترة مجمعة حسب اليوم
+            cursor.execute('''
+                SELECT id, schedule_date, time_slot, slot_duration, status, period_type, needs_reschedule
+                FROM doctor_periodic_schedules
+                WHERE doctor_id = ? AND schedule_date BETWEEN ? AND ?
+            ''', (doctor_id, start_str, end_str))
+
+            existing_by_date = {}
+            for row in cursor.fetchall():
+                existing_by_date.setdefault(row['schedule_date'], {})[row['time_slot']] = row
+
+            # مواعيد الطبيب القائمة في الفترة {(التاريخ، دقيقة البداية): رقم الموعد}
+            cursor.execute('''
+                SELECT id, appointment_date, start_minute, status FROM appointments
+                WHERE doctor_id = ? AND appointment_date BETWEEN ? AND ? AND start_minute IS NOT NULL
+            ''', (doctor_id, start_str, end_str))
+            occupied = {(row['appointment_date'], row['start_minute']): row['id']
+                        for row in cursor.fetchall() if not self.is_cancelled_status(row['status'])}
+
+            exceptions_by_date = self.get_schedule_exceptions_by_date(doctor_id, start_date, end_date)
+            holiday_calendar = self.get_holiday_calendar()
+
+            to_insert = []
+            to_delete = []
+            to_update = []
+            to_flag = []
+            to_unflag = []
+
+            current_date = start_date
+            while current_date <= end_date:
+                date_str = current_date.strftime('%Y-%m-%d')
+                existing = existing_by_date.get(date_str, {})
+
+                # أيام الإجازة الأسبوعية قالبها فارغ، والعطلات الرسمية وإغلاقات العيادة بلا أوقات
+                new_slots = {}
+                if not holiday_calendar.is_holiday(current_date):
+                    for slot in self.generate_daily_slots(settings, current_date, exceptions_by_date.get(date_str)):
+                        new_slots[slot['time']] = slot
+
+                day_ordinal = current_date.toordinal()
+                for time_slot, slot in new_slots.items():
+                    new_status = slot.get('status', 'available')
+                    new_period = slot.get('period_type', 'main')
+                    row = existing.get(time_slot)
+
+                    if row is None:
+                        appointment_id = occupied.get((date_str, slot['start_minute']))
+                        to_insert.append((doctor_id, date_str, time_slot, duration,
+                                          'booked' if appointment_id else new_status, 'regular', new_period,
+                                          day_ordinal, slot['start_minute'], slot['end_minute'], appointment_id,
+                                          1 if appointment_id and new_status != 'available' else 0))
+                    elif row['status'] in self.PROTECTED_SLOT_STATUSES:
+                        if row['needs_reschedule']:
+                            to_unflag.append((row['id'],))
+                    elif (row['status'] != new_status or row['slot_duration'] != duration
+                          or (row['period_type'] or 'main') != new_period):
+                        to_update.append((new_status, duration, new_period, slot['end_minute'], row['id']))
+
+                for time_slot, row in existing.items():
+                    if time_slot in new_slots:
+                        continue
+                    if row['status'] in self.PROTECTED_SLOT_STATUSES:
+                        if not row['needs_reschedule']:
+                            to_flag.append((row['id'],))
+                    else:
+                        to_delete.append((row['id'],))
+
+                current_date += timedelta(days=1)
+
+            if to_insert:
+                cursor.executemany('''
+                    INSERT INTO doctor_periodic_schedules
+                    (doctor_id, schedule_date, time_slot, slot_duration, status, slot_type, period_type,
+                     day_ordinal, start_minute, end_minute, appointment_id, needs_reschedule)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', to_insert)
+            if to_delete:
+                cursor.executemany('''
+                    DELETE FROM doctor_periodic_schedules WHERE id = ? AND status NOT IN ('booked', 'held')
+                ''', to_delete)
+            if to_update:
+                cursor.executemany('''
+                    UPDATE doctor_periodic_schedules
+                    SET status = ?, slot_duration = ?, period_type = ?, end_minute = ?,
+                        updated_at = CURRENT_TIMESTAMP
+                    WHERE id = ? AND status NOT IN ('booked', 'held')
+                ''', to_update)
+            if to_flag:
+                cursor.executemany('''
+                    UPDATE doctor_periodic_schedules
+                    SET needs_reschedule = 1, updated_at = CURRENT_TIMESTAMP
+                    WHERE id = ?
+                ''', to_flag)
+            if to_unflag:
+                cursor.executemany('''
+                    UPDATE doctor_periodic_schedules
+                    SET needs_reschedule = 0, updated_at = CURRENT_TIMESTAMP
+                    WHERE id = ?
+                ''', to_unflag)
+
+            if commit:
+                self.conn.commit()
+
+            flagged = self.get_slots_needing_reschedule(doctor_id, start_str, end_str) if to_flag else []
+
+            logging.info(f"✅ توليد تفاضلي لجدول الطبيب {doctor_id}: +{len(to_insert)} -{len(to_delete)} "
+                         f"~{len(to_update)} ⚠️{len(to_flag)}")
+
+            return {
+                'success': True,
+                'inserted': len(to_insert),
+                'deleted': len(to_delete),
+                'updated': len(to_update),
+                'flagged': flagged,
+                'unflagged': len(to_unflag)
+            }
+
+        except Exception as e:
+            logging.error(f"❌ خطأ في التوليد التفاضلي للجدول: {e}")
+            if commit:
+                self.conn.rollback()
+            return {'success': False, 'message': str(e), 'inserted': 0, 'deleted': 0, 'updated': 0, 'flagged': []}
+
+    def extend_doctor_schedule(self, doctor_id: int, end_date: Union[str, date], commit: bool = True) -> bool:
+        """توليد أوقات الطبيب حتى تاريخ محدد إن كان بعد آخر يوم مولد (الطبيب بلا إعدادات لا يُولد له شيء)
+
+        حتى يمر كل تاريخ بالتوليد العادي (الاستثناءات والعطل) ويحجز الموعد وقتاً فعلياً.
+        """
+        cursor = self.conn.cursor()
+        cursor.execute('SELECT MAX(day_ordinal) FROM doctor_periodic_schedules WHERE doctor_id = ?', (doctor_id,))
+        start_ordinal = max((cursor.fetchone()[0] or 0) + 1, date.today().toordinal())
+        end_ordinal = to_ordinal(end_date)
+        settings = self.get_doctor_schedule_settings(doctor_id)
+        if start_ordinal > end_ordinal or not settings:
+            return True
+
+        result = self.regenerate_doctor_schedule(doctor_id, date.fromordinal(start_ordinal),
+                                                 date.fromordinal(end_ordinal), settings, commit=commit)
+        return result['success']
+
+    def get_slots_needing_reschedule(self, doctor_id: int, start_date: str = None, end_date: str = None) -> List[Dict]:
+        """المواعيد المحجوزة التي أصبحت خارج ساعات عمل الطبيب"""
+        try:
+            if not start_date:
+                start_date = datetime.now().strftime('%Y-%m-%d')
+            if not end_date:
+                end_date = '9999-12-31'
+
+            cursor = self.conn.cursor()
+            cursor.execute('''
+                SELECT s.id as slot_id, s.schedule_date, s.time_slot, s.appointment_id,
+                       a.patient_id, p.name as patient_name, p.phone as patient_phone
+                FROM doctor_periodic_schedules s
+                LEFT JOIN appointments a ON s.appointment_id = a.id
+                LEFT JOIN patients p ON a.patient_id = p.id
+                WHERE s.doctor_id = ? AND s.needs_reschedule = 1
+                AND s.schedule_date BETWEEN ? AND ?
+                ORDER BY s.schedule_date, s.time_slot
+            ''', (doctor_id, start_date, end_date))
+
+            return [dict(row) for row in cursor.fetchall()]
+
+        except Exception as e:
+            logging.error(f"❌ خطأ في جلب المواعيد التي تحتاج إعادة جدولة: {e}")
+            return []
+
     def get_doctor_schedule_settings(self, doctor_id: int) -> Optional[Dict]:
         """الحصول على إعدادات جدول الطبيب - الإصدار المتكامل"""
         try:
@@ -385,70 +644,35 @@ class SchedulingMixin:
             logging.error(f"❌ خطأ في جلب إعدادات الطبيب: {e}")
             return None
 
-    def generate_daily_slots(self, settings: Dict, target_date: date) -> List[Dict]:
-        """توليد المواعيد اليومية بناءً على فترات العمل المتعددة - الإصدار المتكامل"""
+    def generate_daily_slots(self, settings: Dict, target_date: date,
+                             exceptions: List[Dict] = None) -> List[Dict]:
+        """توليد المواعيد اليومية بناءً على فترات العمل المتعددة - الإصدار المتكامل
+        
+        تُنسخ الأوقات من القالب المجمّع ليوم الأسبوع بدل إعادة حسابها لكل تاريخ.
+        إذا مُررت استثناءات اليوم (إجازة/حجب جزئي) تُعلَّم الأوقات المتأثرة بالحالة blocked
+        """
         try:
+            template = self.get_slot_template(settings)
+            duration = template['duration']
+            buffer_time = template['buffer_time']
+            labels = MINUTE_LABELS
+            
             slots = []
+            for start_minute, end_minute, period_type in template['weekdays'][target_date.weekday()]:
+                slot = {
+                    'time': labels[start_minute],
+                    'end': labels[end_minute % 1440],
+                    'start_minute': start_minute,
+                    'end_minute': end_minute,
+                    'duration': duration,
+                    'period_type': period_type
+                }
+                if template['uses_periods']:
+                    slot['with_buffer'] = buffer_time
+                slots.append(slot)
             
-            # استخدام فترات العمل المتعددة إذا كانت متاحة
-            work_periods = settings.get('work_periods', [])
-            if work_periods:
-                # استخدام فترات العمل المتعددة
-                duration = settings.get('appointment_duration', 30)
-                buffer_time = settings.get('buffer_time', 5)
-                
-                for period in work_periods:
-                    if not period.get('is_active', True):
-                        continue
-                        
-                    work_start = datetime.strptime(period['start'], '%H:%M').time()
-                    work_end = datetime.strptime(period['end'], '%H:%M').time()
-                    
-                    current_time = work_start
-                    while current_time < work_end:
-                        slot_end = self.add_minutes_to_time(current_time, duration)
-                        
-                        # إضافة وقت缓冲 بين المواعيد
-                        slot_end_with_buffer = self.add_minutes_to_time(slot_end, buffer_time)
-                        
-                        if slot_end_with_buffer > work_end:
-                            break
-                        
-                        # التحقق من فترات الراحة
-                        if not self.is_break_time(settings, current_time, slot_end):
-                            slots.append({
-                                'time': current_time.strftime('%H:%M'),
-                                'end': slot_end.strftime('%H:%M'),
-                                'duration': duration,
-                                'period_type': period.get('type', 'main'),
-                                'with_buffer': buffer_time
-                            })
-                        
-                        current_time = self.add_minutes_to_time(current_time, duration + buffer_time)
-            else:
-                # استخدام الطريقة التقليدية
-                work_start = datetime.strptime(settings['work_hours_start'], '%H:%M').time()
-                work_end = datetime.strptime(settings['work_hours_end'], '%H:%M').time()
-                duration = settings.get('appointment_duration', 30)
-                buffer_time = settings.get('buffer_time', 5)
-                
-                current_time = work_start
-                while current_time < work_end:
-                    slot_end = self.add_minutes_to_time(current_time, duration)
-                    
-                    if slot_end > work_end:
-                        break
-                    
-                    # التحقق من فترات الراحة
-                    if not self.is_break_time(settings, current_time, slot_end):
-                        slots.append({
-                            'time': current_time.strftime('%H:%M'),
-                            'end': slot_end.strftime('%H:%M'),
-                            'duration': duration,
-                            'period_type': 'main'
-                        })
-                    
-                    current_time = self.add_minutes_to_time(current_time, duration + buffer_time)
+            if exceptions:
+                self.apply_schedule_exceptions(slots, exceptions)
             
             return slots
             
@@ -456,6 +680,110 @@ class SchedulingMixin:
             logging.error(f"❌ خطأ في توليد المواعيد اليومية: {e}")
             return []
 
+    # ⭐⭐ قوالب الأوقات المجمعة ⭐⭐
+
+    _slot_template_cache: Dict[str, Dict] = {}
+    _SLOT_TEMPLATE_CACHE_LIMIT = 256
+
+    def get_slot_template_fingerprint(self, settings: Dict) -> str:
+        """بصمة الإعدادات المؤثرة على توليد الأوقات"""
+        relevant = {
+            'work_days': self.safe_json_loads(settings.get('work_days', [])),
+            'work_periods': self.safe_json_loads(settings.get('work_periods', [])),
+            'break_times': self.safe_json_loads(settings.get('break_times', [])),
+            'work_hours_start': settings.get('work_hours_start'),
+            'work_hours_end': settings.get('work_hours_end'),
+            'appointment_duration': settings.get('appointment_duration', 30),
+            'buffer_time': settings.get('buffer_time', 5)
+        }
+        payload = json.dumps(relevant, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+    def get_slot_template(self, settings: Dict) -> Dict:
+        """القالب المجمّع لإعدادات الطبيب (من الذاكرة المؤقتة إن وُجد)"""
+        fingerprint = self.get_slot_template_fingerprint(settings)
+        template = self._slot_template_cache.get(fingerprint)
+        if template is None:
+            template = self.compile_slot_template(settings)
+            template['fingerprint'] = fingerprint
+            if len(self._slot_template_cache) >= self._SLOT_TEMPLATE_CACHE_LIMIT:
+                self._slot_template_cache.clear()
+            self._slot_template_cache[fingerprint] = template
+        return template
+
+    def compile_slot_template(self, settings: Dict) -> Dict:
+        """تجميع إعدادات الطبيب إلى أوقات لكل يوم أسبوع (دقيقة البداية، دقيقة النهاية، نوع الفترة)
+
+        تُحلل فترات العمل والراحة مرة واحدة فقط، ثم يُعاد استخدام الناتج لكل التواريخ.
+        """
+        duration = settings.get('appointment_duration', 30) or 30
+        buffer_time = settings.get('buffer_time', 5) or 0
+        step = duration + buffer_time
+        
+        work_days = self.safe_json_loads(settings.get('work_days', []))
+        if not isinstance(work_days, list):
+            work_days = []
+        
+        # فترات الراحة كدقائق
+        breaks = []
+        break_times = self.safe_json_loads(settings.get('break_times', []))
+        for break_period in break_times if isinstance(break_times, list) else []:
+            if not isinstance(break_period, dict):
+                continue
+            try:
+                breaks.append((to_minutes(break_period['start']),
+                               to_minutes(break_period['end'])))
+            except (KeyError, ValueError):
+                logging.warning(f"⚠️ تنسيق وقت راحة غير صالح: {break_period}")
+        
+        def in_break(start_minute, end_minute):
+            return any(ranges_overlap(start_minute, end_minute, b_start, b_end) for b_start, b_end in breaks)
+        
+        day_slots = []
+        work_periods = self.safe_json_loads(settings.get('work_periods', []))
+        uses_periods = bool(work_periods) and isinstance(work_periods, list)
+        
+        if uses_periods:
+            for period in work_periods:
+                if not period.get('is_active', True):
+                    continue
+                work_start = to_minutes(period['start'])
+                work_end = to_minutes(period['end'])
+                period_type = period.get('type', 'main')
+                
+                current = work_start
+                while current < work_end:
+                    slot_end = current + duration
+                    # يجب أن يتسع الموعد مع وقت الفاصل داخل الفترة
+                    if slot_end + buffer_time > work_end:
+                        break
+                    if not in_break(current, slot_end):
+                        day_slots.append((current, slot_end, period_type))
+                    current += step
+        else:
+            work_start = to_minutes(settings['work_hours_start'])
+            work_end = to_minutes(settings['work_hours_end'])
+            
+            current = work_start
+            while current < work_end:
+                slot_end = current + duration
+                if slot_end > work_end:
+                    break
+                if not in_break(current, slot_end):
+                    day_slots.append((current, slot_end, 'main'))
+                current += step
+        
+        day_slots = tuple(day_slots)
+        day_names = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+        
+        return {
+            'duration': duration,
+            'buffer_time': buffer_time,
+            'uses_periods': uses_periods,
+            'weekdays': [day_slots if day_names[weekday] in work_days else ()
+                         for weekday in range(7)]
+        }
+
     def is_break_time(self, settings: Dict, start_time: time, end_time: time) -> bool:
         """التحقق إذا كانت الفترة تقع في وقت راحة - الإصدار المحسن"""
         try:
@@ -478,10 +806,8 @@ class SchedulingMixin:
                     continue
 
                 try:
-                    break_start = datetime.strptime(break_start_str, '%H:%M').time()
-                    break_end = datetime.strptime(break_end_str, '%H:%M').time()
-                    
-                    if self.is_time_overlap(start_time, end_time, break_start, break_end):
+                    if ranges_overlap(to_minutes(start_time), to_minutes(end_time),
+                                      to_minutes(break_start_str), to_minutes(break_end_str)):
                         return True
                 except ValueError as e:
                     logging.warning(f"⚠️ تنسيق وقت راحة غير صالح: {break_start_str}-{break_end_str}")
@@ -572,6 +898,536 @@ class SchedulingMixin:
             self.conn.rollback()
             return False
 
+    # ⭐⭐ وظائف استثناءات الجدول (إجازات وحجب جزئي) ⭐⭐
+
+    def get_schedule_exceptions(self, doctor_id: int, start_date: Union[str, date],
+                                end_date: Union[str, date] = None) -> List[Dict]:
+        """الحصول على استثناءات الطبيب ليوم أو لفترة"""
+        try:
+            if isinstance(start_date, date):
+                start_date = start_date.strftime('%Y-%m-%d')
+            if end_date is None:
+                end_date = start_date
+            elif isinstance(end_date, date):
+                end_date = end_date.strftime('%Y-%m-%d')
+
+            cursor = self.conn.cursor()
+            cursor.execute('''
+                SELECT * FROM schedule_exceptions
+                WHERE doctor_id = ? AND exception_date BETWEEN ? AND ?
+                ORDER BY exception_date, start_time
+            ''', (doctor_id, start_date, end_date))
+
+            return [dict(row) for row in cursor.fetchall()]
+
+        except Exception as e:
+            logging.error(f"❌ خطأ في جلب الاستثناءات: {e}")
+            return []
+
+    def get_schedule_exceptions_by_date(self, doctor_id: int, start_date: Union[str, date],
+                                        end_date: Union[str, date]) -> Dict[str, List[Dict]]:
+        """استثناءات الفترة مجمعة حسب التاريخ - استعلام واحد لكامل الفترة"""
+        exceptions_by_date = {}
+        for exception in self.get_schedule_exceptions(doctor_id, start_date, end_date):
+            exceptions_by_date.setdefault(exception['exception_date'], []).append(exception)
+        return exceptions_by_date
+
+    def is_exception_overlap(self, exception: Dict, start_time: Union[int, str, time],
+                             end_time: Union[int, str, time]) -> bool:
+        """التحقق إذا كان الاستثناء يغطي الفترة (الاستثناء بدون أوقات يعامل كيوم كامل)"""
+        if exception.get('is_all_day') or not exception.get('start_time') or not exception.get('end_time'):
+            return True
+
+        try:
+            return ranges_overlap(to_minutes(start_time), to_minutes(end_time),
+                                  to_minutes(exception['start_time']), to_minutes(exception['end_time']))
+        except ValueError:
+            logging.warning(f"⚠️ تنسيق وقت استثناء غير صالح: {exception.get('start_time')}-{exception.get('end_time')}")
+            return False
+
+    def apply_schedule_exceptions(self, slots: List[Dict], exceptions: List[Dict]) -> List[Dict]:
+        """تعليم الأوقات التي يغطيها استثناء بالحالة blocked"""
+        for slot in slots:
+            slot_start = slot.get('start_minute', slot['time'])
+            slot_end = slot.get('end_minute', slot['end'])
+
+            for exception in exceptions:
+                if self.is_exception_overlap(exception, slot_start, slot_end):
+                    slot['status'] = 'blocked'
+                    slot['exception_id'] = exception.get('id')
+                    break
+
+        return slots
+
+    def add_schedule_exception(self, exception_data: Dict) -> Dict:
+        """إضافة استثناء وتحديث أيام الطبيب المتأثرة فقط
+
+        تُرجع المواعيد المحجوزة التي أصبحت متعارضة مع الاستثناء لإعادة جدولتها
+        """
+        try:
+            doctor_id = exception_data['doctor_id']
+            exception_date = exception_data['exception_date']
+            if isinstance(exception_date, date):
+                exception_date = exception_date.strftime('%Y-%m-%d')
+
+            is_all_day = bool(exception_data.get('is_all_day')) or not (
+                exception_data.get('start_time') and exception_data.get('end_time')
+            )
+
+            cursor = self.conn.cursor()
+            cursor.execute('''
+                INSERT INTO schedule_exceptions
+                (doctor_id, exception_date, exception_type, start_time, end_time, reason, is_all_day)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (
+                doctor_id,
+                exception_date,
+                exception_data.get('exception_type', 'إجازة'),
+                None if is_all_day else exception_data.get('start_time'),
+                None if is_all_day else exception_data.get('end_time'),
+                exception_data.get('reason', ''),
+                1 if is_all_day else 0
+            ))
+            exception_id = cursor.lastrowid
+
+            refresh_result = self.refresh_doctor_day_availability(doctor_id, exception_date, commit=False)
+
+            self.conn.commit()
+
+            conflicts = refresh_result.get('conflicts', [])
+            logging.info(f"✅ تم إضافة استثناء للطبيب {doctor_id} في {exception_date} - "
+                         f"حجب {refresh_result.get('blocked', 0)} وقت، {len(conflicts)} موعد متعارض")
+
+            return {
+                'success': True,
+                'exception_id': exception_id,
+                'blocked_slots': refresh_result.get('blocked', 0),
+                'conflicts': conflicts,
+                'message': f'تم إضافة الاستثناء - {len(conflicts)} موعد يحتاج إعادة جدولة' if conflicts else 'تم إضافة الاستثناء'
+            }
+
+        except Exception as e:
+            logging.error(f"❌ خطأ في إضافة الاستثناء: {e}")
+            self.conn.rollback()
+            return {'success': False, 'conflicts': [], 'message': f'خطأ في إضافة الاستثناء: {e}'}
+
+    def remove_schedule_exception(self, exception_id: int) -> Dict:
+        """حذف استثناء وإعادة فتح الأوقات في يوم الطبيب المتأثر فقط"""
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute('SELECT doctor_id, exception_date FROM schedule_exceptions WHERE id = ?', (exception_id,))
+            row = cursor.fetchone()
+            if not row:
+                return {'success': False, 'released_slots': 0, 'message': 'الاستثناء غير موجود'}
+
+            cursor.execute('DELETE FROM schedule_exceptions WHERE id = ?', (exception_id,))
+            refresh_result = self.refresh_doctor_day_availability(row['doctor_id'], row['exception_date'], commit=False)
+
+            self.conn.commit()
+            logging.info(f"✅ تم حذف الاستثناء {exception_id} وإعادة فتح {refresh_result.get('released', 0)} وقت")
+
+            return {
+                'success': True,
+                'released_slots': refresh_result.get('released', 0),
+                'message': 'تم حذف الاستثناء'
+            }
+
+        except Exception as e:
+            logging.error(f"❌ خطأ في حذف الاستثناء: {e}")
+            self.conn.rollback()
+            return {'success': False, 'released_slots': 0, 'message': f'خطأ في حذف الاستثناء: {e}'}
+
+    def refresh_doctor_day_availability(self, doctor_id: int, target_date: Union[str, date],
+                                        commit: bool = True) -> Dict:
+        """إعادة حساب حالة أوقات يوم واحد للطبيب حسب استثناءاته الحالية
+
+        - الأوقات المتاحة التي يغطيها استثناء تصبح blocked
+        - الأوقات المحجوبة التي لم يعد يغطيها استثناء تعود available
+        - المواعيد المحجوزة لا تُمس وتُرجع كتعارضات
+        """
+        try:
+            if isinstance(target_date, date):
+                target_date = target_date.strftime('%Y-%m-%d')
+
+            exceptions = self.get_schedule_exceptions(doctor_id, target_date)
+
+            cursor = self.conn.cursor()
+            cursor.execute('''
+                SELECT id, time_slot, slot_duration, status, start_minute, end_minute
+                FROM doctor_periodic_schedules
+                WHERE doctor_id = ? AND schedule_date = ?
+            ''', (doctor_id, target_date))
+
+            to_block = []
+            to_release = []
+            for row in cursor.fetchall():
+                slot_start = row['start_minute'] if row['start_minute'] is not None else to_minutes(row['time_slot'])
+                slot_end = row['end_minute'] if row['end_minute'] is not None else slot_start + (row['slot_duration'] or 30)
+                covered = any(self.is_exception_overlap(exception, slot_start, slot_end) for exception in exceptions)
+
+                if covered and row['status'] == 'available':
+                    to_block.append((row['id'],))
+                elif not covered and row['status'] == 'blocked':
+                    to_release.append((row['id'],))
+
+            if to_block:
+                cursor.executemany('''
+                    UPDATE doctor_periodic_schedules
+                    SET status = 'blocked', updated_at = CURRENT_TIMESTAMP
+                    WHERE id = ? AND status = 'available'
+                ''', to_block)
+            if to_release:
+                cursor.executemany('''
+                    UPDATE doctor_periodic_schedules
+                    SET status = 'available', updated_at = CURRENT_TIMESTAMP
+                    WHERE id = ? AND status = 'blocked'
+                ''', to_release)
+
+            conflicts = self.get_exception_conflicts(doctor_id, target_date, exceptions)
+
+            if commit:
+                self.conn.commit()
+
+            return {
+                'success': True,
+                'blocked': len(to_block),
+                'released': len(to_release),
+                'conflicts': conflicts
+            }
+
+        except Exception as e:
+            logging.error(f"❌ خطأ في تحديث أوقات اليوم: {e}")
+            if commit:
+                self.conn.rollback()
+            return {'success': False, 'blocked': 0, 'released': 0, 'conflicts': []}
+
+    def get_exception_conflicts(self, doctor_id: int, target_date: str, exceptions: List[Dict]) -> List[Dict]:
+        """المواعيد القائمة في اليوم التي تتعارض مع الاستثناءات"""
+        if not exceptions:
+            return []
+
+        settings = self.get_doctor_schedule_settings(doctor_id) or {}
+        duration = settings.get('appointment_duration', 30) or 30
+
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            SELECT a.id, a.patient_id, a.doctor_id, a.appointment_date, a.appointment_time,
+                   a.type, a.status, p.name as patient_name, p.phone as patient_phone
+            FROM appointments a
+            LEFT JOIN patients p ON a.patient_id = p.id
+            WHERE a.doctor_id = ? AND a.appointment_date = ?
+            AND a.status NOT IN ('ملغي', 'ملغى', 'منتهي')
+            ORDER BY a.appointment_time
+        ''', (doctor_id, target_date))
+
+        conflicts = []
+        for row in cursor.fetchall():
+            try:
+                appointment_start = to_minutes(row['appointment_time'])
+            except (TypeError, ValueError):
+                continue
+            appointment_end = appointment_start + duration
+
+            for exception in exceptions:
+                if self.is_exception_overlap(exception, appointment_start, appointment_end):
+                    conflict = dict(row)
+                    conflict['exception_id'] = exception.get('id')
+                    conflict['exception_type'] = exception.get('exception_type')
+                    conflicts.append(conflict)
+                    break
+
+        return conflicts
+
+    # ⭐⭐ وظائف العطلات وإغلاقات العيادة ⭐⭐
+
+    def get_holiday_calendar(self, reload: bool = False) -> HolidayCalendar:
+        """تقويم العطلات مع إغلاقات العيادة (يُحمّل مرة واحدة لكل اتصال)"""
+        calendar = getattr(self, '_holiday_calendar', None)
+        if calendar is None or reload:
+            calendar = calendar or HolidayCalendar()
+            calendar.set_closures(self.get_clinic_closures())
+            self._holiday_calendar = calendar
+        return calendar
+
+    def get_clinic_closures(self, start_date: Union[str, date] = None,
+                            end_date: Union[str, date] = None) -> List[Dict]:
+        """إغلاقات العيادة (كلها أو المتقاطعة مع فترة)"""
+        try:
+            cursor = self.conn.cursor()
+            if start_date and end_date:
+                cursor.execute('''
+                    SELECT * FROM clinic_closures
+                    WHERE end_date >= ? AND start_date <= ?
+                    ORDER BY start_date
+                ''', (ordinal_to_str(to_ordinal(start_date)), ordinal_to_str(to_ordinal(end_date))))
+            else:
+                cursor.execute('SELECT * FROM clinic_closures ORDER BY start_date')
+            return [dict(row) for row in cursor.fetchall()]
+
+        except Exception as e:
+            logging.error(f"❌ خطأ في جلب إغلاقات العيادة: {e}")
+            return []
+
+    def add_clinic_closure(self, closure_data: Dict) -> Dict:
+        """إضافة إغلاق للعيادة وإعادة توليد أيام الأطباء المتأثرة
+
+        المواعيد المحجوزة في أيام الإغلاق لا تُحذف بل تُعلَّم needs_reschedule
+        """
+        try:
+            start_date = ordinal_to_str(to_ordinal(closure_data['start_date']))
+            end_date = ordinal_to_str(to_ordinal(closure_data.get('end_date') or closure_data['start_date']))
+            if end_date < start_date:
+                return {'success': False, 'message': 'تاريخ النهاية قبل تاريخ البداية'}
+
+            cursor = self.conn.cursor()
+            cursor.execute('''
+                INSERT INTO clinic_closures (start_date, end_date, reason)
+                VALUES (?, ?, ?)
+            ''', (start_date, end_date, closure_data.get('reason', '')))
+            closure_id = cursor.lastrowid
+
+            self.get_holiday_calendar(reload=True)
+            flagged = self.regenerate_schedules_for_range(start_date, end_date)
+
+            self.conn.commit()
+            logging.info(f"✅ تم إضافة إغلاق العيادة {start_date} - {end_date}")
+            return {
+                'success': True,
+                'closure_id': closure_id,
+                'conflicts': flagged,
+                'message': 'تم إضافة الإغلاق'
+            }
+
+        except Exception as e:
+            logging.error(f"❌ خطأ في إضافة إغلاق العيادة: {e}")
+            self.conn.rollback()
+            self.get_holiday_calendar(reload=True)
+            return {'success': False, 'conflicts': [], 'message': str(e)}
+
+    def remove_clinic_closure(self, closure_id: int) -> bool:
+        """حذف إغلاق وإعادة أوقات أيامه"""
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute('SELECT start_date, end_date FROM clinic_closures WHERE id = ?', (closure_id,))
+            closure = cursor.fetchone()
+            if not closure:
+                return False
+
+            cursor.execute('DELETE FROM clinic_closures WHERE id = ?', (closure_id,))
+            self.get_holiday_calendar(reload=True)
+            self.regenerate_schedules_for_range(closure['start_date'], closure['end_date'])
+
+            self.conn.commit()
+            logging.info(f"✅ تم حذف إغلاق العيادة {closure_id}")
+            return True
+
+        except Exception as e:
+            logging.error(f"❌ خطأ في حذف إغلاق العيادة: {e}")
+            self.conn.rollback()
+            self.get_holiday_calendar(reload=True)
+            return False
+
+    def regenerate_schedules_for_range(self, start_date: Union[str, date], end_date: Union[str, date]) -> List[Dict]:
+        """إعادة توليد أيام الفترة لكل طبيب لديه جدول فيها (بدون حفظ)
+
+        تُرجع المواعيد المحجوزة التي أصبحت تحتاج إعادة جدولة
+        """
+        start = date.fromordinal(to_ordinal(start_date))
+        end = date.fromordinal(to_ordinal(end_date))
+
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            SELECT DISTINCT doctor_id FROM doctor_periodic_schedules
+            WHERE day_ordinal BETWEEN ? AND ?
+        ''', (start.toordinal(), end.toordinal()))
+
+        flagged = []
+        for row in cursor.fetchall():
+            result = self.regenerate_doctor_schedule(row['doctor_id'], start, end, commit=False)
+            if not result['success']:
+                raise RuntimeError(result.get('message', 'فشل التوليد التفاضلي'))
+            flagged.extend(result.get('flagged', []))
+        return flagged
+
+    def find_first_available_slot(self, doctor_id: int, start_date: Union[str, date] = None,
+                                  max_days: int = 60) -> Optional[Dict]:
+        """أول يوم فيه أوقات متاحة للطبيب (تُتخطى العطلات والإغلاقات)"""
+        try:
+            start_ordinal = to_ordinal(start_date or date.today())
+            calendar = self.get_holiday_calendar()
+            full_days = self.get_full_days(doctor_id, start_ordinal, start_ordinal + max_days)
+
+            cursor = self.conn.cursor()
+            cursor.execute('''
+                SELECT day_ordinal, time_slot, start_minute, end_minute, period_type
+                FROM doctor_periodic_schedules
+                WHERE doctor_id = ? AND status = 'available'
+                AND day_ordinal BETWEEN ? AND ?
+                ORDER BY day_ordinal, start_minute
+            ''', (doctor_id, start_ordinal, start_ordinal + max_days))
+
+            found_ordinal = None
+            slots = []
+            for row in cursor.fetchall():
+                if found_ordinal is not None and row['day_ordinal'] != found_ordinal:
+                    break
+                if row['day_ordinal'] in full_days or calendar.is_holiday(row['day_ordinal']):
+                    continue
+                found_ordinal = row['day_ordinal']
+                end_label = MINUTE_LABELS[row['end_minute'] % 1440]
+                slots.append({
+                    'time': row['time_slot'],
+                    'start_minute': row['start_minute'],
+                    'end_minute': row['end_minute'],
+                    'period_type': row['period_type'] or 'main',
+                    'display': f"{row['time_slot']} - {end_label}"
+                })
+
+            if found_ordinal is None:
+                return None
+
+            return {'date': ordinal_to_str(found_ordinal), 'slots': slots}
+
+        except Exception as e:
+            logging.error(f"❌ خطأ في البحث عن أول موعد متاح: {e}")
+            return None
+
+    # ⭐⭐ وظائف السعة اليومية ⭐⭐
+
+    CANCELLED_STATUSES = ('ملغي', 'ملغى')
+
+    def is_cancelled_status(self, status: str) -> bool:
+        """هل الحالة إلغاء (تقبل الحالات المعروضة مع رموز مثل '❌ ملغى')"""
+        return any(word in (status or '') for word in self.CANCELLED_STATUSES)
+
+    def is_capacity_status(self, status: str) -> bool:
+        """هل تُحتسب حالة الموعد ضمن سعة اليوم (كل الحالات ما عدا الإلغاء)"""
+        return not self.is_cancelled_status(status)
+
+    def get_doctor_daily_limit(self, doctor_id: int) -> Optional[int]:
+        """الحد الأقصى لمواعيد الطبيب اليومية (None = بدون حد)
+
+        الأقل من max_patients_per_day و max_daily_appointments، ولا حد عند السماح بالحجز الزائد
+        """
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            SELECT s.max_patients_per_day, s.allow_overbooking, p.max_daily_appointments
+            FROM doctors d
+            LEFT JOIN doctor_schedule_settings s ON s.doctor_id = d.id
+            LEFT JOIN periodic_schedule_settings p ON p.doctor_id = d.id
+            WHERE d.id = ?
+        ''', (doctor_id,))
+        row = cursor.fetchone()
+        if not row or row['allow_overbooking']:
+            return None
+
+        limits = [value for value in (row['max_patients_per_day'], row['max_daily_appointments']) if value]
+        return min(limits) if limits else None
+
+    def reserve_daily_capacity(self, doctor_id: int, appointment_date: Union[str, date]) -> bool:
+        """حجز مكان في سعة اليوم بتحديث ذري (بدون حفظ - ضمن معاملة الحجز)"""
+        day_ordinal = to_ordinal(appointment_date)
+        limit = self.get_doctor_daily_limit(doctor_id)
+
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            INSERT OR IGNORE INTO doctor_daily_capacity (doctor_id, day_ordinal, appointment_date, booked_count)
+            VALUES (?, ?, ?, 0)
+        ''', (doctor_id, day_ordinal, ordinal_to_str(day_ordinal)))
+        cursor.execute('''
+            UPDATE doctor_daily_capacity
+            SET booked_count = booked_count + 1
+            WHERE doctor_id = ? AND day_ordinal = ?
+            AND (? IS NULL OR booked_count < ?)
+        ''', (doctor_id, day_ordinal, limit, limit))
+
+        if cursor.rowcount == 0:
+            logging.warning(f"⚠️ اكتملت سعة الطبيب {doctor_id} ليوم {ordinal_to_str(day_ordinal)} ({limit} موعد)")
+            return False
+        return True
+
+    def release_daily_capacity(self, doctor_id: int, appointment_date: Union[str, date]):
+        """تحرير مكان من سعة اليوم (بدون حفظ)"""
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            UPDATE doctor_daily_capacity
+            SET booked_count = MAX(booked_count - 1, 0)
+            WHERE doctor_id = ? AND day_ordinal = ?
+        ''', (doctor_id, to_ordinal(appointment_date)))
+
+    def get_daily_capacity(self, doctor_id: int, appointment_date: Union[str, date]) -> Dict:
+        """سعة يوم الطبيب: المحجوز، الحد، المتبقي"""
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute('''
+                SELECT booked_count FROM doctor_daily_capacity
+                WHERE doctor_id = ? AND day_ordinal = ?
+            ''', (doctor_id, to_ordinal(appointment_date)))
+            row = cursor.fetchone()
+            booked = row['booked_count'] if row else 0
+            limit = self.get_doctor_daily_limit(doctor_id)
+
+            return {
+                'booked': booked,
+                'limit': limit,
+                'remaining': None if limit is None else max(limit - booked, 0),
+                'is_full': limit is not None and booked >= limit
+            }
+
+        except Exception as e:
+            logging.error(f"❌ خطأ في جلب السعة اليومية: {e}")
+            return {'booked': 0, 'limit': None, 'remaining': None, 'is_full': False}
+
+    def get_full_days(self, doctor_id: int, start_date: Union[str, date], end_date: Union[str, date]) -> set:
+        """الأرقام الترتيبية للأيام المكتملة في الفترة"""
+        try:
+            limit = self.get_doctor_daily_limit(doctor_id)
+            if limit is None:
+                return set()
+
+            cursor = self.conn.cursor()
+            cursor.execute('''
+                SELECT day_ordinal FROM doctor_daily_capacity
+                WHERE doctor_id = ? AND day_ordinal BETWEEN ? AND ? AND booked_count >= ?
+            ''', (doctor_id, to_ordinal(start_date), to_ordinal(end_date), limit))
+            return {row['day_ordinal'] for row in cursor.fetchall()}
+
+        except Exception as e:
+            logging.error(f"❌ خطأ في جلب الأيام المكتملة: {e}")
+            return set()
+
+    def rebuild_daily_capacity(self, doctor_id: int = None) -> int:
+        """إعادة بناء عدادات السعة من جدول المواعيد (للمطابقة بعد تعديلات خارجية)"""
+        try:
+            cursor = self.conn.cursor()
+            cancelled_filter = ' AND '.join("COALESCE(status, '') NOT LIKE ?" for _ in self.CANCELLED_STATUSES)
+            cancelled_params = tuple(f'%{word}%' for word in self.CANCELLED_STATUSES)
+            doctor_filter = 'AND doctor_id = ?' if doctor_id else ''
+            doctor_params = (doctor_id,) if doctor_id else ()
+
+            cursor.execute(f'DELETE FROM doctor_daily_capacity WHERE 1 = 1 {doctor_filter}', doctor_params)
+            cursor.execute(f'''
+                INSERT INTO doctor_daily_capacity (doctor_id, day_ordinal, appointment_date, booked_count)
+                SELECT doctor_id,
+                       CAST(julianday(appointment_date) - {SQLITE_JULIANDAY_OFFSET} AS INTEGER),
+                       appointment_date, COUNT(*)
+                FROM appointments
+                WHERE {cancelled_filter}
+                AND appointment_date IS NOT NULL AND julianday(appointment_date) IS NOT NULL
+                {doctor_filter}
+                GROUP BY doctor_id, appointment_date
+            ''', cancelled_params + doctor_params)
+            rebuilt = cursor.rowcount
+
+            self.conn.commit()
+            logging.info(f"✅ تم إعادة بناء عدادات السعة اليومية ({rebuilt} يوم)")
+            return rebuilt
+
+        except Exception as e:
+            logging.error(f"❌ خطأ في إعادة بناء عدادات السعة: {e}")
+            self.conn.rollback()
+            return 0
+
     # ⭐⭐ وظائف الجدولة الدورية المتقدمة ⭐⭐
 
     def get_periodic_schedule(self, doctor_id: int, start_date: str = None, end_date: str = None) -> Dict:
@@ -584,15 +1440,19 @@ class SchedulingMixin:
             
             cursor = self.conn.cursor()
             cursor.execute('''
-                SELECT schedule_date, time_slot, status, appointment_id, slot_type, period_type
+                SELECT schedule_date, time_slot, status, appointment_id, slot_type, period_type,
+                       day_ordinal, start_minute, end_minute
                 FROM doctor_periodic_schedules 
                 WHERE doctor_id = ? 
-                AND schedule_date BETWEEN ? AND ?
-                ORDER BY schedule_date, time_slot
-            ''', (doctor_id, start_date, end_date))
+                AND day_ordinal BETWEEN ? AND ?
+                ORDER BY day_ordinal, start_minute
+            ''', (doctor_id, to_ordinal(start_date), to_ordinal(end_date)))
+            
+            rows = cursor.fetchall()
+            full_days = self.get_full_days(doctor_id, start_date, end_date)
             
             schedule_data = {}
-            for row in cursor.fetchall():
+            for row in rows:
                 date_str = row['schedule_date']
                 time_str = row['time_slot']
                 
@@ -602,21 +1462,25 @@ class SchedulingMixin:
                         'slots': [],
                         'available_count': 0,
                         'booked_count': 0,
-                        'total_count': 0
+                        'total_count': 0,
+                        'is_full': row['day_ordinal'] in full_days
                     }
                 
                 slot_info = {
                     'time': time_str,
+                    'start_minute': row['start_minute'],
+                    'end_minute': row['end_minute'],
                     'status': row['status'],
                     'appointment_id': row['appointment_id'],
                     'type': row['slot_type'],
-                    'period_type': row.get('period_type', 'main')
+                    'period_type': row['period_type'] or 'main'
                 }
                 
                 schedule_data[date_str]['slots'].append(slot_info)
                 schedule_data[date_str]['total_count'] += 1
                 
-                if row['status'] == 'available':
+                # الأيام المكتملة السعة لا تُعرض فيها أوقات متاحة
+                if row['status'] == 'available' and not schedule_data[date_str]['is_full']:
                     schedule_data[date_str]['available_count'] += 1
                 elif row['status'] == 'booked':
                     schedule_data[date_str]['booked_count'] += 1
@@ -627,6 +1491,98 @@ class SchedulingMixin:
             logging.error(f"❌ خطأ في الحصول على الجدول الدوري: {e}")
             return {}
 
+    # رموز حالات الأوقات في الشبكة العمودية (الفهرس = الرمز)
+    SLOT_STATUS_CODES = ('available', 'booked', 'blocked', 'break', 'held')
+
+    def get_schedule_grid(self, doctor_id: int, start_date: Union[str, date],
+                          end_date: Union[str, date]) -> Dict:
+        """الجدول الدوري بصيغة عمودية مضغوطة لعرض الشبكات الأسبوعية والشهرية والربعية
+
+        استعلام واحد بدون كائن لكل وقت: مصفوفات متوازية للأوقات، ومصفوفات لكل يوم
+        فيها موضع أول وقت (day_offsets) والتجميعات. أوقات اليوم i هي
+        minutes[day_offsets[i]:day_offsets[i + 1]].
+        """
+        start_ordinal = to_ordinal(start_date)
+        end_ordinal = to_ordinal(end_date)
+        codes = {status: code for code, status in enumerate(self.SLOT_STATUS_CODES)}
+        available_code = codes['available']
+        booked_code = codes['booked']
+
+        grid = {
+            'start_ordinal': start_ordinal,
+            'end_ordinal': end_ordinal,
+            'status_codes': self.SLOT_STATUS_CODES,
+            'ordinals': array('l'),
+            'minutes': array('h'),
+            'end_minutes': array('h'),
+            'status': bytearray(),
+            'day_ordinals': array('l'),
+            'day_offsets': array('l'),
+            'day_available': array('h'),
+            'day_booked': array('h'),
+            'day_total': array('h'),
+            'day_full': bytearray()
+        }
+
+        try:
+            limit = self.get_doctor_daily_limit(doctor_id)
+
+            cursor = self.conn.cursor()
+            cursor.row_factory = None  # صفوف tuple بدلاً من sqlite3.Row
+            cursor.execute('''
+                SELECT s.day_ordinal, s.start_minute, s.end_minute, s.status, COALESCE(c.booked_count, 0)
+                FROM doctor_periodic_schedules s
+                LEFT JOIN doctor_daily_capacity c
+                    ON c.doctor_id = s.doctor_id AND c.day_ordinal = s.day_ordinal
+                WHERE s.doctor_id = ? AND s.day_ordinal BETWEEN ? AND ?
+                ORDER BY s.day_ordinal, s.start_minute
+            ''', (doctor_id, start_ordinal, end_ordinal))
+
+            ordinals = grid['ordinals']
+            minutes = grid['minutes']
+            end_minutes = grid['end_minutes']
+            status = grid['status']
+            day_ordinals = grid['day_ordinals']
+            day_offsets = grid['day_offsets']
+            day_available = grid['day_available']
+            day_booked = grid['day_booked']
+            day_total = grid['day_total']
+            day_full = grid['day_full']
+
+            current_day = None
+            is_full = False
+            for day_ordinal, start_minute, end_minute, slot_status, booked_count in cursor:
+                if day_ordinal != current_day:
+                    current_day = day_ordinal
+                    is_full = limit is not None and booked_count >= limit
+                    day_ordinals.append(day_ordinal)
+                    day_offsets.append(len(minutes))
+                    day_available.append(0)
+                    day_booked.append(0)
+                    day_total.append(0)
+                    day_full.append(is_full)
+
+                code = codes.get(slot_status, available_code)
+                ordinals.append(day_ordinal)
+                minutes.append(start_minute)
+                end_minutes.append(end_minute)
+                status.append(code)
+
+                day_total[-1] += 1
+                # الأيام المكتملة السعة لا تُحسب فيها أوقات متاحة
+                if code == available_code and not is_full:
+                    day_available[-1] += 1
+                elif code == booked_code:
+                    day_booked[-1] += 1
+
+            day_offsets.append(len(minutes))
+            return grid
+
+        except Exception as e:
+            logging.error(f"❌ خطأ في بناء شبكة الجدول: {e}")
+            grid['day_offsets'] = array('l', [0])
+            return grid
+
     def book_appointment_slot(self, doctor_id: int, appointment_date: str, 
                             appointment_time: str, appointment_id: int) -> bool:
         """حجز موعد في الجدول الدوري"""
@@ -655,41 +1611,185 @@ class SchedulingMixin:
             self.conn.rollback()
             return False
 
+    def claim_doctor_slot(self, appointment_id: int, appointment_data: Dict,
+                          allow_held: bool = False) -> bool:
+        """ربط وقت الطبيب الدوري بالموعد (booked) - بدون حفظ
+
+        الموعد خارج الجدول الدوري (طبيب بلا جدول أو وقت خارج الشبكة) لا يحجز شيئاً.
+        تُرجع False إن كان الوقت محجوزاً لموعد آخر أو محجوباً ويتولى المستدعي التراجع؛
+        allow_held لقبول عرض قائمة الانتظار على الوقت المحجوز له مؤقتاً.
+        """
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            SELECT id, status, appointment_id FROM doctor_periodic_schedules
+            WHERE doctor_id = ? AND day_ordinal = ? AND start_minute = ?
+        ''', (appointment_data['doctor_id'], to_ordinal(appointment_data['appointment_date']),
+              to_minutes(appointment_data['appointment_time'])))
+        slot = cursor.fetchone()
+        if not slot or (slot['status'] == 'booked' and slot['appointment_id'] == appointment_id):
+            return True
+
+        if slot['status'] not in (('available', 'held') if allow_held else ('available',)):
+            logging.warning(f"⚠️ وقت الطبيب غير متاح: {appointment_data['appointment_date']} "
+                            f"{appointment_data['appointment_time']} ({slot['status']})")
+            return False
+
+        cursor.execute('''
+            UPDATE doctor_periodic_schedules
+            SET status = 'booked', appointment_id = ?, updated_at = CURRENT_TIMESTAMP
+            WHERE id = ? AND status = ?
+        ''', (appointment_id, slot['id'], slot['status']))
+        return cursor.rowcount > 0
+
+    def release_doctor_slot(self, appointment_id: int) -> int:
+        """إعادة الوقت الدوري المرتبط بالموعد إلى متاح - بدون حفظ"""
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            UPDATE doctor_periodic_schedules
+            SET status = 'available', appointment_id = NULL, needs_reschedule = 0,
+                updated_at = CURRENT_TIMESTAMP
+            WHERE appointment_id = ? AND status = 'booked'
+        ''', (appointment_id,))
+        return cursor.rowcount
+
     def check_and_renew_schedules(self):
         """التحقق من الحاجة لتجديد الجداول والتجديد التلقائي"""
+        metrics = self.renew_schedules_in_chunks()
+        return metrics.get('renewed', 0)
+
+    def get_doctors_due_for_renewal(self) -> List[Dict]:
+        """الأطباء الذين حان موعد تجديد جداولهم"""
         try:
             cursor = self.conn.cursor()
-            
-            # الحصول على الأطباء الذين يحتاجون تجديد
             cursor.execute('''
                 SELECT ps.doctor_id, d.name, ps.next_renewal_date
                 FROM periodic_schedule_settings ps
                 JOIN doctors d ON ps.doctor_id = d.id
                 WHERE ps.auto_renew_enabled = 1 
                 AND ps.next_renewal_date <= DATE('now')
+                ORDER BY ps.next_renewal_date, ps.doctor_id
             ''')
-            
-            doctors_to_renew = cursor.fetchall()
-            renewed_count = 0
-            
-            for doctor in doctors_to_renew:
-                doctor_id = doctor['doctor_id']
-                doctor_name = doctor['name']
-                
-                if self.renew_doctor_schedule(doctor_id):
-                    renewed_count += 1
-                    logging.info(f"✅ تم تجديد جدول الطبيب: {doctor_name}")
-                else:
-                    logging.error(f"❌ فشل في تجديد جدول الطبيب: {doctor_name}")
-            
-            logging.info(f"📊 تم تجديد {renewed_count} جدول من أصل {len(doctors_to_renew)}")
-            return renewed_count
-            
+            return [dict(row) for row in cursor.fetchall()]
+
+        except Exception as e:
+            logging.error(f"❌ خطأ في جلب الأطباء المستحقين للتجديد: {e}")
+            return []
+
+    def renew_schedules_in_chunks(self, chunk_size: int = 5, should_cancel=None,
+                                  progress_callback=None, pause_seconds: float = 0.0) -> Dict:
+        """تجديد الجداول المستحقة على دفعات مع حفظ بعد كل دفعة
+
+        - الحفظ بين الدفعات يحرر قفل الكتابة لعمليات الحجز
+        - should_cancel: دالة تُستدعى بين الأطباء لإيقاف العملية
+        - progress_callback(done, total, doctor_name): لإبلاغ الواجهة بالتقدم
+        - يُحفظ تقدم كل طبيب في periodic_schedule_settings لاستكمال العمل بعد الإلغاء
+        """
+        started = time_module.perf_counter()
+        metrics = {
+            'total': 0,
+            'renewed': 0,
+            'failed': 0,
+            'chunks': 0,
+            'cancelled': False,
+            'elapsed_ms': 0,
+            'doctor_timings_ms': {}
+        }
+
+        try:
+            doctors_to_renew = self.get_doctors_due_for_renewal()
+            metrics['total'] = len(doctors_to_renew)
+            cursor = self.conn.cursor()
+            done = 0
+
+            for chunk_start in range(0, len(doctors_to_renew), max(1, chunk_size)):
+                chunk = doctors_to_renew[chunk_start:chunk_start + max(1, chunk_size)]
+
+                for doctor in chunk:
+                    if should_cancel and should_cancel():
+                        metrics['cancelled'] = True
+                        break
+
+                    doctor_id = doctor['doctor_id']
+                    doctor_started = time_module.perf_counter()
+
+                    # نقطة حفظ لكل طبيب حتى لا يُلغي فشل طبيب واحد بقية الدفعة
+                    cursor.execute('SAVEPOINT renew_doctor')
+                    try:
+                        renewed = self.renew_doctor_schedule(doctor_id, commit=False)
+                    except Exception as e:
+                        logging.error(f"❌ خطأ في تجديد جدول الطبيب {doctor['name']}: {e}")
+                        renewed = False
+
+                    duration_ms = int((time_module.perf_counter() - doctor_started) * 1000)
+
+                    if renewed:
+                        cursor.execute('RELEASE SAVEPOINT renew_doctor')
+                        metrics['renewed'] += 1
+                        self.update_renewal_progress(doctor_id, 'done', duration_ms)
+                        logging.info(f"✅ تم تجديد جدول الطبيب: {doctor['name']} ({duration_ms} ms)")
+                    else:
+                        cursor.execute('ROLLBACK TO SAVEPOINT renew_doctor')
+                        cursor.execute('RELEASE SAVEPOINT renew_doctor')
+                        metrics['failed'] += 1
+                        self.update_renewal_progress(doctor_id, 'failed', duration_ms)
+                        logging.error(f"❌ فشل في تجديد جدول الطبيب: {doctor['name']}")
+
+                    metrics['doctor_timings_ms'][doctor_id] = duration_ms
+                    done += 1
+
+                    if progress_callback:
+                        progress_callback(done, metrics['total'], doctor['name'])
+
+                # حفظ الدفعة وتحرير القفل قبل الدفعة التالية
+                self.conn.commit()
+                metrics['chunks'] += 1
+
+                if metrics['cancelled']:
+                    logging.info(f"⏹️ تم إيقاف التجديد بعد {done} من {metrics['total']} طبيب")
+                    break
+
+                if pause_seconds:
+                    time_module.sleep(pause_seconds)
+
         except Exception as e:
             logging.error(f"❌ خطأ في تجديد الجداول: {e}")
-            return 0
+            self.conn.rollback()
 
-    def renew_doctor_schedule(self, doctor_id: int) -> bool:
+        metrics['elapsed_ms'] = int((time_module.perf_counter() - started) * 1000)
+        logging.info(f"📊 تم تجديد {metrics['renewed']} جدول من أصل {metrics['total']} "
+                     f"في {metrics['chunks']} دفعة خلال {metrics['elapsed_ms']} ms")
+        return metrics
+
+    def update_renewal_progress(self, doctor_id: int, status: str, duration_ms: int = None):
+        """حفظ حالة تجديد الطبيب (بدون حفظ المعاملة - تُحفظ مع الدفعة)"""
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute('''
+                UPDATE periodic_schedule_settings
+                SET renewal_status = ?, renewal_duration_ms = ?, renewal_updated_at = CURRENT_TIMESTAMP
+                WHERE doctor_id = ?
+            ''', (status, duration_ms, doctor_id))
+        except Exception as e:
+            logging.warning(f"⚠️ تعذر حفظ حالة تجديد الطبيب {doctor_id}: {e}")
+
+    def get_renewal_progress(self) -> List[Dict]:
+        """حالة آخر تجديد لكل طبيب"""
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute('''
+                SELECT ps.doctor_id, d.name, ps.renewal_status, ps.renewal_duration_ms,
+                       ps.renewal_updated_at, ps.last_renewal_date, ps.next_renewal_date
+                FROM periodic_schedule_settings ps
+                JOIN doctors d ON ps.doctor_id = d.id
+                ORDER BY ps.doctor_id
+            ''')
+            return [dict(row) for row in cursor.fetchall()]
+
+        except Exception as e:
+            logging.error(f"❌ خطأ في جلب حالة التجديد: {e}")
+            return []
+
+    def renew_doctor_schedule(self, doctor_id: int, commit: bool = True) -> bool:
         """تجديد الجدول الدوري للطبيب"""
         try:
             cursor = self.conn.cursor()
@@ -717,7 +1817,7 @@ class SchedulingMixin:
             
             result = cursor.fetchone()
             if not result or not result['last_date']:
-                return self.setup_doctor_periodic_schedule(doctor_id, period_days)
+                return self.setup_doctor_periodic_schedule(doctor_id, period_days, commit=commit)
             
             last_date = datetime.strptime(result['last_date'], '%Y-%m-%d').date()
             today = datetime.now().date()
@@ -729,47 +1829,31 @@ class SchedulingMixin:
                 new_end_date = new_start_date + timedelta(days=period_days - 1)
                 
                 # إنشاء الجدول للفترة الجديدة
-                settings_data = self.get_doctor_schedule_settings(doctor_id)
-                current_date = new_start_date
+                diff_result = self.regenerate_doctor_schedule(doctor_id, new_start_date, new_end_date, commit=False)
+                if not diff_result['success']:
+                    raise RuntimeError(diff_result.get('message', 'فشل التوليد التفاضلي'))
                 
-                while current_date <= new_end_date:
-                    if self.is_work_day(settings_data, current_date):
-                        daily_slots = self.generate_daily_slots(settings_data, current_date)
-                        
-                        for slot in daily_slots:
-                            cursor.execute('''
-                                INSERT OR REPLACE INTO doctor_periodic_schedules 
-                                (doctor_id, schedule_date, time_slot, slot_duration, status, slot_type, period_type)
-                                VALUES (?, ?, ?, ?, ?, ?, ?)
-                            ''', (
-                                doctor_id,
-                                current_date.strftime('%Y-%m-%d'),
-                                slot['time'],
-                                settings_data.get('appointment_duration', 30),
-                                'available',
-                                'regular',
-                                slot.get('period_type', 'main')
-                            ))
-                    
-                    current_date += timedelta(days=1)
-                
-                # تحديث تاريخ التجديد القادم
                 next_renewal = new_end_date - timedelta(days=advance_days)
-                cursor.execute('''
-                    UPDATE periodic_schedule_settings 
-                    SET last_renewal_date = DATE('now'), next_renewal_date = ?
-                    WHERE doctor_id = ?
-                ''', (next_renewal.strftime('%Y-%m-%d'), doctor_id))
-                
-                self.conn.commit()
-                logging.info(f"✅ تم تجديد جدول الطبيب {doctor_id} حتى {new_end_date}")
-                return True
+            else:
+                # الجدول الحالي كافٍ - نؤجل موعد التجديد حتى لا يُعاد اختياره في كل فحص
+                next_renewal = last_date - timedelta(days=advance_days)
             
+            # تحديث تاريخ التجديد القادم
+            cursor.execute('''
+                UPDATE periodic_schedule_settings 
+                SET last_renewal_date = DATE('now'), next_renewal_date = ?
+                WHERE doctor_id = ?
+            ''', (next_renewal.strftime('%Y-%m-%d'), doctor_id))
+            
+            if commit:
+                self.conn.commit()
+            logging.info(f"✅ تم تجديد جدول الطبيب {doctor_id} - التجديد القادم {next_renewal}")
             return True
             
         except Exception as e:
             logging.error(f"❌ خطأ في تجديد جدول الطبيب: {e}")
-            self.conn.rollback()
+            if commit:
+                self.conn.rollback()
             return False
 
     # ⭐⭐ وظائف التحقق والتحليل ⭐⭐
@@ -868,22 +1952,20 @@ class SchedulingMixin:
 
     def add_minutes_to_time(self, time_obj: time, minutes: int) -> time:
         """إضافة دقائق إلى وقت"""
-        full_datetime = datetime.combine(datetime.today(), time_obj)
-        new_datetime = full_datetime + timedelta(minutes=minutes)
-        return new_datetime.time()
+        return minutes_to_time(to_minutes(time_obj) + minutes)
 
     def is_time_overlap(self, start1: time, end1: time, start2: time, end2: time) -> bool:
-        """التحقق من تداخل فترتين زمنيتين"""
-        return not (end1 <= start2 or start1 >= end2)
+        """التحقق من تداخل فترتين زمنيتين (أوقات أو دقائق)"""
+        return ranges_overlap(start1, end1, start2, end2)
 
     # ⭐⭐ وظائف التوافق مع النظام القديم ⭐⭐
 
-    def get_available_slots(self, doctor_id: int, target_date: str) -> List[str]:
+    def get_available_slots(self, doctor_id: int, target_date: str, service_type: str = None) -> List[str]:
         """الحصول على الأوقات المتاحة (للتوافق مع النظام القديم)"""
         try:
             schedule = self.get_periodic_schedule(doctor_id, target_date, target_date)
             
-            if target_date in schedule:
+            if target_date in schedule and not schedule[target_date]['is_full']:
                 available_slots = []
                 for slot in schedule[target_date]['slots']:
                     if slot['status'] == 'available':
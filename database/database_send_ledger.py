@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+import logging
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+# حجز بقي "قيد الإرسال" أكثر من هذا يُعتبر متروكاً (توقف الجهاز أثناء الإرسال)
+SEND_CLAIM_STALE_MINUTES = 10
+
+REMINDER_MESSAGE_TYPES = ('reminder_24h', 'reminder_2h')
+
+def _timestamp(moment: datetime) -> str:
+    return moment.strftime('%Y-%m-%d %H:%M:%S')
+
+class SendLedgerMixin:
+    """ميكسين سجل الإرسال (send ledger) - إرسال كل رسالة موعد مرة واحدة فقط
+
+    صف واحد لكل (موعد، نوع الرسالة، القناة) بمفتاح فريد. قبل الاتصال بالمزود
+    يحجز المرسل الصف بعبارة واحدة (INSERT ... ON CONFLICT DO UPDATE ... WHERE)
+    فلا ينجح الحجز إلا لعامل واحد مهما تعددت الأجهزة أو الفحوص المتزامنة.
+
+    الحالات: claimed (قيد الإرسال) / queued (في صندوق الصادر) / sent / failed.
+    يُعاد الحجز فقط إن فشل الإرسال، أو تغير وقت الموعد (appointment_slot)،
+    أو تُرك الحجز أكثر من SEND_CLAIM_STALE_MINUTES.
+    """
+
+    def create_send_ledger_table(self):
+        """إنشاء جدول سجل الإرسال"""
+        try:
+            cursor = self.conn.cursor()
+
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS send_ledger (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    appointment_id INTEGER NOT NULL,
+                    message_type TEXT NOT NULL,
+                    channel TEXT NOT NULL DEFAULT 'whatsapp',
+                    appointment_slot TEXT,
+                    status TEXT NOT NULL DEFAULT 'claimed', -- claimed / queued / sent / failed
+                    claim_token TEXT,
+                    claimed_at TEXT,
+                    attempts INTEGER DEFAULT 1,
+                    sent_at TEXT,
+                    provider_message_id TEXT,
+                    last_error TEXT,
+                    UNIQUE (appointment_id, message_type, channel),
+                    FOREIGN KEY (appointment_id) REFERENCES appointments (id) ON DELETE CASCADE
+                )
+            ''')
+
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_send_ledger_token
+                ON send_ledger (claim_token)
+            ''')
+
+            self.conn.commit()
+
+        except Exception as e:
+            logging.error(f"❌ خطأ في إنشاء جدول سجل الإرسال: {e}")
+            self.conn.rollback()
+
+    def claim_send(self, appointment_id: int, message_type: str, channel: str = 'whatsapp',
+                   appointment_slot: str = None,
+                   stale_minutes: int = SEND_CLAIM_STALE_MINUTES) -> Optional[str]:
+        """حجز إرسال رسالة الموعد قبل الاتصال بالمزود
+
+        تُرجع رمز الحجز، أو None إن كانت الرسالة أُرسلت أو يحجزها مرسل آخر.
+        """
+        try:
+            token = uuid.uuid4().hex
+            now = datetime.now()
+            cursor = self.conn.cursor()
+            cursor.execute('''
+                INSERT INTO send_ledger (appointment_id, message_type, channel, appointment_slot,
+                                         status, claim_token, claimed_at)
+                VALUES (?, ?, ?, ?, 'claimed', ?, ?)
+                ON CONFLICT (appointment_id, message_type, channel) DO UPDATE SET
+                    status = 'claimed', claim_token = excluded.claim_token,
+                    claimed_at = excluded.claimed_at, appointment_slot = excluded.appointment_slot,
+                    attempts = send_ledger.attempts + 1, last_error = NULL
+                WHERE send_ledger.status = 'failed'
+                   OR send_ledger.appointment_slot IS NOT excluded.appointment_slot
+                   OR (send_ledger.status = 'claimed' AND send_ledger.claimed_at <= ?)
+            ''', (appointment_id, message_type, channel, appointment_slot, token, _timestamp(now),
+                  _timestamp(now - timedelta(minutes=stale_minutes))))
+            self.conn.commit()
+            return token if cursor.rowcount else None
+
+        except Exception as e:
+            logging.error(f"❌ خطأ في حجز الإرسال للموعد {appointment_id}: {e}")
+            self.conn.rollback()
+            return None
+
+    def complete_send(self, token: str, success: bool, provider_message_id: str = None,
+                      error: str = None) -> bool:
+        """تسجيل نتيجة الإرسال المحجوز (ورفع علم التذكير للموعد ضمن نفس المعاملة)"""
+        try:
+            cursor = self.conn.cursor()
+            if success:
+                cursor.execute('''
+                    UPDATE send_ledger
+                    SET status = 'sent', sent_at = ?, provider_message_id = ?, last_error = NULL
+                    WHERE claim_token = ?
+                ''', (_timestamp(datetime.now()), provider_message_id, token))
+                updated = cursor.rowcount
+                self._mark_ledger_reminders_sent(cursor, 'claim_token = ?', (token,))
+            else:
+                cursor.execute('''
+                    UPDATE send_ledger SET status = 'failed', last_error = ?
+                    WHERE claim_token = ? AND status != 'sent'
+                ''', (str(error or '')[:500], token))
+                updated = cursor.rowcount
+
+            self.conn.commit()
+            return updated > 0
+
+        except Exception as e:
+            logging.error(f"❌ خطأ في تسجيل نتيجة الإرسال: {e}")
+            self.conn.rollback()
+            return False
+
+    def mark_send_queued(self, token: str) -> bool:
+        """الرسالة المحجوزة أُضيفت لصندوق الصادر - الموزع يسجل نتيجتها"""
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute('''
+                UPDATE send_ledger SET status = 'queued' WHERE claim_token = ? AND status = 'claimed'
+            ''', (token,))
+            self.conn.commit()
+            return cursor.rowcount > 0
+
+        except Exception as e:
+            logging.error(f"❌ خطأ في تحديث سجل الإرسال: {e}")
+            self.conn.rollback()
+            return False
+
+    def get_send_record(self, appointment_id: int, message_type: str,
+                        channel: str = 'whatsapp') -> Optional[Dict]:
+        """صف سجل الإرسال لرسالة الموعد (أو None)"""
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute('''
+                SELECT * FROM send_ledger WHERE appointment_id = ? AND message_type = ? AND channel = ?
+            ''', (appointment_id, message_type, channel))
+            row = cursor.fetchone()
+            return dict(row) if row else None
+
+        except Exception as e:
+            logging.error(f"❌ خطأ في جلب سجل الإرسال: {e}")
+            return None
+
+    def _sync_ledger_from_outbox(self, cursor, message_id: int, status: str,
+                                 provider_message_id: str = None, error: str = None):
+        """تحديث سجل الإرسال من نتيجة رسالة الصادر - بدون حفظ (ضمن معاملة الصادر)"""
+        where = '''(appointment_id, message_type, channel) IN (
+                       SELECT appointment_id, message_type, channel FROM outbox WHERE id = ?)'''
+        if status == 'sent':
+            cursor.execute(f'''
+                UPDATE send_ledger SET status = 'sent', sent_at = ?, provider_message_id = ?, last_error = NULL
+                WHERE {where}
+            ''', (_timestamp(datetime.now()), provider_message_id, message_id))
+        else:
+            cursor.execute(f'''
+                UPDATE send_ledger SET status = ?, last_error = ?
+                WHERE {where} AND status != 'sent'
+            ''', (status, str(error or '')[:500] or None, message_id))
+
+    def _mark_ledger_reminders_sent(self, cursor, where: str, params: tuple):
+        """رفع علم التذكير للمواعيد التي سُجل إرسال تذكيرها - بدون حفظ"""
+        cursor.execute(f'SELECT appointment_id, message_type FROM send_ledger WHERE {where}', params)
+        for row in cursor.fetchall():
+            if row['message_type'] in REMINDER_MESSAGE_TYPES:
+                reminder_type = row['message_type'].split('_', 1)[1]
+                cursor.execute(f'''
+                    UPDATE appointments
+                    SET reminder_{reminder_type}_sent = 1, reminder_{reminder_type}_sent_at = datetime('now')
+                    WHERE id = ?
+                ''', (row['appointment_id'],))
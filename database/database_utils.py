@@ -57,4 +57,17 @@ class DatabaseUtilsMixin:
         if self.conn is None:
             self.conn = sqlite3.connect(self.db_path)
             self.conn.row_factory = sqlite3.Row
-        return self.conn
\ No newline at end of file
+        return self.conn
+
+    def create_thread_instance(self):
+        """إنشاء نسخة من المدير باتصال مستقل للاستخدام في خيط خلفي
+
+        اتصال sqlite3 لا يُشارك بين الخيوط، لذا يحصل العامل الخلفي على اتصاله الخاص
+        بدون إعادة تهيئة الجداول.
+        """
+        instance = self.__class__.__new__(self.__class__)
+        instance.db_path = self.db_path
+        instance.conn = sqlite3.connect(self.db_path, timeout=30)
+        instance.conn.row_factory = sqlite3.Row
+        instance.conn.execute("PRAGMA foreign_keys = ON")
+        return instance
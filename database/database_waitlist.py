@@ -0,0 +1,510 @@
+# -*- coding: utf-8 -*-
+import logging
+from datetime import datetime, timedelta, date
+from typing import List, Dict, Optional
+
+from scheduling_time import to_ordinal, ordinal_to_str, to_minutes
+
+class WaitlistMixin:
+    """ميكسین قائمة الانتظار - ملء الأوقات الملغاة تلقائياً"""
+
+    OFFER_TTL_MINUTES = 120
+
+    def create_waitlist_tables(self):
+        """إنشاء جداول قائمة الانتظار وعروض المواعيد"""
+        try:
+            cursor = self.conn.cursor()
+
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS waitlist_entries (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    patient_id INTEGER NOT NULL,
+                    doctor_id INTEGER NOT NULL,
+                    service_type TEXT, -- NULL = أي خدمة
+                    earliest_date DATE NOT NULL,
+                    latest_date DATE NOT NULL,
+                    earliest_ordinal INTEGER NOT NULL,
+                    latest_ordinal INTEGER NOT NULL,
+                    priority INTEGER DEFAULT 0, -- الأعلى أولاً
+                    status TEXT NOT NULL DEFAULT 'waiting', -- waiting, offered, booked, cancelled
+                    notes TEXT,
+                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (patient_id) REFERENCES patients (id) ON DELETE CASCADE,
+                    FOREIGN KEY (doctor_id) REFERENCES doctors (id) ON DELETE CASCADE
+                )
+            ''')
+
+            # طابور الأولوية: الطبيب ثم الأولوية ثم الأقدم
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_waitlist_queue
+                ON waitlist_entries (doctor_id, status, priority DESC, id)
+            ''')
+
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS waitlist_offers (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    waitlist_id INTEGER NOT NULL,
+                    patient_id INTEGER NOT NULL,
+                    doctor_id INTEGER NOT NULL,
+                    appointment_date DATE NOT NULL,
+                    appointment_time TIME NOT NULL,
+                    cancelled_appointment_id INTEGER,
+                    message TEXT,
+                    status TEXT NOT NULL DEFAULT 'pending', -- pending, sent, accepted, declined, expired
+                    expires_at DATETIME NOT NULL,
+                    sent_at DATETIME,
+                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (waitlist_id) REFERENCES waitlist_entries (id) ON DELETE CASCADE
+                )
+            ''')
+
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_waitlist_offers_status
+                ON waitlist_offers (status, expires_at)
+            ''')
+
+            self.conn.commit()
+            logging.info("✅ تم إنشاء جداول قائمة الانتظار")
+
+        except Exception as e:
+            logging.error(f"❌ خطأ في إنشاء جداول قائمة الانتظار: {e}")
+            self.conn.rollback()
+
+    # ⭐⭐ إدارة قائمة الانتظار ⭐⭐
+
+    def add_to_waitlist(self, entry_data: Dict) -> Optional[int]:
+        """إضافة مريض لقائمة انتظار طبيب ضمن فترة تواريخ"""
+        try:
+            earliest = to_ordinal(entry_data.get('earliest_date') or date.today())
+            latest = to_ordinal(entry_data.get('latest_date') or earliest + 30)
+            if latest < earliest:
+                logging.warning("⚠️ نهاية فترة الانتظار قبل بدايتها")
+                return None
+
+            cursor = self.conn.cursor()
+            cursor.execute('''
+                INSERT INTO waitlist_entries
+                (patient_id, doctor_id, service_type, earliest_date, latest_date,
+                 earliest_ordinal, latest_ordinal, priority, notes)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (
+                entry_data['patient_id'],
+                entry_data['doctor_id'],
+                entry_data.get('service_type'),
+                ordinal_to_str(earliest),
+                ordinal_to_str(latest),
+                earliest,
+                latest,
+                entry_data.get('priority', 0),
+                entry_data.get('notes', '')
+            ))
+            self.conn.commit()
+
+            logging.info(f"✅ تم إضافة المريض {entry_data['patient_id']} لقائمة الانتظار")
+            return cursor.lastrowid
+
+        except Exception as e:
+            logging.error(f"❌ خطأ في الإضافة لقائمة الانتظار: {e}")
+            self.conn.rollback()
+            return None
+
+    def remove_from_waitlist(self, entry_id: int) -> bool:
+        """إلغاء طلب انتظار"""
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute('''
+                UPDATE waitlist_entries SET status = 'cancelled', updated_at = CURRENT_TIMESTAMP
+                WHERE id = ? AND status IN ('waiting', 'offered')
+            ''', (entry_id,))
+            self.conn.commit()
+            return cursor.rowcount > 0
+
+        except Exception as e:
+            logging.error(f"❌ خطأ في إلغاء طلب الانتظار: {e}")
+            self.conn.rollback()
+            return False
+
+    def get_waitlist(self, doctor_id: int = None, status: str = 'waiting') -> List[Dict]:
+        """قائمة الانتظار بترتيب الأولوية"""
+        try:
+            query = '''
+                SELECT w.*, p.name as patient_name, p.phone as patient_phone, d.name as doctor_name
+                FROM waitlist_entries w
+                JOIN patients p ON w.patient_id = p.id
+                JOIN doctors d ON w.doctor_id = d.id
+                WHERE w.status = ?
+            '''
+            params = [status]
+            if doctor_id:
+                query += ' AND w.doctor_id = ?'
+                params.append(doctor_id)
+            query += ' ORDER BY w.doctor_id, w.priority DESC, w.id'
+
+            cursor = self.conn.cursor()
+            cursor.execute(query, params)
+            return [dict(row) for row in cursor.fetchall()]
+
+        except Exception as e:
+            logging.error(f"❌ خطأ في جلب قائمة الانتظار: {e}")
+            return []
+
+    # ⭐⭐ معالجة الإلغاء ومطابقة الانتظار ⭐⭐
+
+    def handle_appointments_cancelled(self, appointment_ids: List[int]) -> List[Dict]:
+        """حدث الإلغاء: تحرير الأوقات ثم عرضها على أفضل المنتظرين
+
+        تُعالج دفعة الإلغاءات في معاملة واحدة: استعلام واحد لطوابير كل طبيب
+        ومطابقة في الذاكرة، حتى تبقى سريعة عند إلغاء يوم كامل (غياب طبيب مثلاً).
+        """
+        if not appointment_ids:
+            return []
+
+        try:
+            cursor = self.conn.cursor()
+            placeholders = ', '.join('?' for _ in appointment_ids)
+            cursor.execute(f'''
+                SELECT id, doctor_id, appointment_date, appointment_time, type
+                FROM appointments WHERE id IN ({placeholders})
+                ORDER BY appointment_date, appointment_time
+            ''', list(appointment_ids))
+            cancelled = [dict(row) for row in cursor.fetchall()]
+
+            freed_slots = self.free_cancelled_slots(cancelled)
+            self.release_appointment_resources(appointment_ids)
+            offers = self.match_waitlist_for_slots(freed_slots)
+
+            self.conn.commit()
+            if offers:
+                logging.info(f"✅ تم عرض {len(offers)} موعد ملغى على قائمة الانتظار")
+                self.queue_waitlist_offers()
+            return offers
+
+        except Exception as e:
+            logging.error(f"❌ خطأ في معالجة المواعيد الملغاة: {e}")
+            self.conn.rollback()
+            return []
+
+    def free_cancelled_slots(self, cancelled: List[Dict]) -> List[Dict]:
+        """إعادة أوقات المواعيد الملغاة للجدول الدوري (بدون حفظ)"""
+        cursor = self.conn.cursor()
+        today = date.today().toordinal()
+        freed = []
+
+        for appointment in cancelled:
+            try:
+                day_ordinal = to_ordinal(appointment['appointment_date'])
+                start_minute = to_minutes(appointment['appointment_time'])
+            except (TypeError, ValueError):
+                continue
+
+            # الموعد مرتبط بالوقت عبر appointment_id أو مطابق بالطبيب والتاريخ والوقت
+            cursor.execute('''
+                UPDATE doctor_periodic_schedules
+                SET status = 'available', appointment_id = NULL, needs_reschedule = 0,
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE status = 'booked' AND (appointment_id = ?
+                      OR (doctor_id = ? AND day_ordinal = ? AND start_minute = ?))
+            ''', (appointment['id'], appointment['doctor_id'], day_ordinal, start_minute))
+
+            if day_ordinal < today:
+                continue
+
+            freed.append({
+                'doctor_id': appointment['doctor_id'],
+                'day_ordinal': day_ordinal,
+                'appointment_date': ordinal_to_str(day_ordinal),
+                'appointment_time': appointment['appointment_time'],
+                'start_minute': start_minute,
+                'service_type': appointment.get('type'),
+                'cancelled_appointment_id': appointment['id']
+            })
+
+        return freed
+
+    def match_waitlist_for_slots(self, freed_slots: List[Dict], exclude_entries: set = None) -> List[Dict]:
+        """مطابقة الأوقات المحررة مع أعلى المنتظرين أولوية وإنشاء العروض (بدون حفظ)"""
+        if not freed_slots:
+            return []
+
+        cursor = self.conn.cursor()
+        exclude_entries = exclude_entries or set()
+
+        # طابور كل طبيب مرتب مسبقاً بالأولوية (استعلام واحد لكل طبيب عبر الفهرس)
+        queues = {}
+        for doctor_id in {slot['doctor_id'] for slot in freed_slots}:
+            doctor_slots = [slot['day_ordinal'] for slot in freed_slots if slot['doctor_id'] == doctor_id]
+            cursor.execute('''
+                SELECT id, patient_id, service_type, earliest_ordinal, latest_ordinal
+                FROM waitlist_entries
+                WHERE doctor_id = ? AND status = 'waiting'
+                AND earliest_ordinal <= ? AND latest_ordinal >= ?
+                ORDER BY priority DESC, id
+            ''', (doctor_id, max(doctor_slots), min(doctor_slots)))
+            queues[doctor_id] = [dict(row) for row in cursor.fetchall() if row['id'] not in exclude_entries]
+
+        offers = []
+        expires_at = (datetime.now() + timedelta(minutes=self.OFFER_TTL_MINUTES)).strftime('%Y-%m-%d %H:%M:%S')
+
+        for slot in freed_slots:
+            queue = queues.get(slot['doctor_id'], [])
+            match_index = next((index for index, entry in enumerate(queue)
+                                if entry['earliest_ordinal'] <= slot['day_ordinal'] <= entry['latest_ordinal']
+                                and (not entry['service_type'] or entry['service_type'] == slot['service_type'])),
+                               None)
+            if match_index is None:
+                continue
+
+            entry = queue.pop(match_index)
+            message = (f"تتوفر فرصة موعد بتاريخ {slot['appointment_date']} الساعة {slot['appointment_time']}. "
+                       f"يرجى التأكيد خلال {self.OFFER_TTL_MINUTES // 60} ساعة")
+
+            cursor.execute('''
+                INSERT INTO waitlist_offers
+                (waitlist_id, patient_id, doctor_id, appointment_date, appointment_time,
+                 cancelled_appointment_id, message, expires_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (entry['id'], entry['patient_id'], slot['doctor_id'], slot['appointment_date'],
+                  slot['appointment_time'], slot.get('cancelled_appointment_id'), message, expires_at))
+            offer_id = cursor.lastrowid
+
+            cursor.execute('''
+                UPDATE waitlist_entries SET status = 'offered', updated_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+            ''', (entry['id'],))
+
+            # حجز الوقت مؤقتاً حتى يرد المريض
+            cursor.execute('''
+                UPDATE doctor_periodic_schedules
+                SET status = 'held', updated_at = CURRENT_TIMESTAMP
+                WHERE doctor_id = ? AND day_ordinal = ? AND start_minute = ? AND status = 'available'
+            ''', (slot['doctor_id'], slot['day_ordinal'], slot['start_minute']))
+
+            offers.append({
+                'offer_id': offer_id,
+                'waitlist_id': entry['id'],
+                'patient_id': entry['patient_id'],
+                'doctor_id': slot['doctor_id'],
+                'appointment_date': slot['appointment_date'],
+                'appointment_time': slot['appointment_time'],
+                'message': message,
+                'expires_at': expires_at
+            })
+
+        return offers
+
+    # ⭐⭐ الرد على العروض ⭐⭐
+
+    def get_pending_waitlist_offers(self) -> List[Dict]:
+        """العروض الجاهزة للإرسال مع بيانات المريض"""
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute('''
+                SELECT o.*, p.name as patient_name, p.phone as patient_phone, d.name as doctor_name
+                FROM waitlist_offers o
+                JOIN patients p ON o.patient_id = p.id
+                JOIN doctors d ON o.doctor_id = d.id
+                WHERE o.status = 'pending'
+                ORDER BY o.id
+            ''')
+            return [dict(row) for row in cursor.fetchall()]
+
+        except Exception as e:
+            logging.error(f"❌ خطأ في جلب عروض الانتظار: {e}")
+            return []
+
+    def mark_waitlist_offer_sent(self, offer_id: int) -> bool:
+        """تعليم العرض كمرسل"""
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute('''
+                UPDATE waitlist_offers SET status = 'sent', sent_at = CURRENT_TIMESTAMP
+                WHERE id = ? AND status = 'pending'
+            ''', (offer_id,))
+            self.conn.commit()
+            return cursor.rowcount > 0
+
+        except Exception as e:
+            logging.error(f"❌ خطأ في تحديث حالة العرض: {e}")
+            self.conn.rollback()
+            return False
+
+    def queue_waitlist_offers(self) -> int:
+        """إرسال العروض المنتظرة عبر صندوق الصادر وتعليمها كمرسلة"""
+        queued = 0
+        for offer in self.get_pending_waitlist_offers():
+            if not offer.get('patient_phone'):
+                logging.warning(f"⚠️ لا يوجد رقم هاتف لعرض الانتظار {offer['id']}")
+                continue
+
+            message_id = self.enqueue_message(
+                offer['patient_phone'], offer['message'],
+                message_type='waitlist_offer',
+                idempotency_key=f"waitlist_offer:{offer['id']}",
+                patient_id=offer['patient_id'],
+                priority=1
+            )
+            if message_id and self.mark_waitlist_offer_sent(offer['id']):
+                queued += 1
+
+        if queued:
+            logging.info(f"📤 تم إرسال {queued} عرض انتظار لصندوق الصادر")
+        return queued
+
+    def process_waitlist_offers(self) -> Dict:
+        """دورة قائمة الانتظار: إنهاء العروض المنتهية ثم إرسال العروض الجديدة"""
+        expired = self.expire_waitlist_offers()
+        queued = self.queue_waitlist_offers()
+        return {'expired': expired, 'queued': queued}
+
+    def get_sent_waitlist_offers(self, doctor_id: int = None) -> List[Dict]:
+        """العروض المرسلة بانتظار رد المريض"""
+        try:
+            query = '''
+                SELECT o.*, p.name as patient_name, p.phone as patient_phone, d.name as doctor_name
+                FROM waitlist_offers o
+                JOIN patients p ON o.patient_id = p.id
+                JOIN doctors d ON o.doctor_id = d.id
+                WHERE o.status = 'sent'
+            '''
+            params = []
+            if doctor_id:
+                query += ' AND o.doctor_id = ?'
+                params.append(doctor_id)
+            query += ' ORDER BY o.appointment_date, o.appointment_time'
+
+            cursor = self.conn.cursor()
+            cursor.execute(query, params)
+            return [dict(row) for row in cursor.fetchall()]
+
+        except Exception as e:
+            logging.error(f"❌ خطأ في جلب عروض الانتظار المرسلة: {e}")
+            return []
+
+    def accept_waitlist_offer(self, offer_id: int) -> Optional[int]:
+        """قبول العرض: إنشاء الموعد وحجز الوقت المحجوز مؤقتاً في معاملة واحدة"""
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute('''
+                SELECT o.*, w.service_type, d.department_id, d.clinic_id
+                FROM waitlist_offers o
+                JOIN waitlist_entries w ON o.waitlist_id = w.id
+                JOIN doctors d ON o.doctor_id = d.id
+                WHERE o.id = ? AND o.status IN ('pending', 'sent')
+            ''', (offer_id,))
+            offer = cursor.fetchone()
+            if not offer:
+                logging.warning(f"⚠️ العرض {offer_id} غير متاح")
+                return None
+
+            if offer['expires_at'] < datetime.now().strftime('%Y-%m-%d %H:%M:%S'):
+                self.decline_waitlist_offer(offer_id, status='expired')
+                self.queue_waitlist_offers()
+                return None
+
+            # الوقت محجوز مؤقتاً لهذا العرض، لذا يُسمح بحجز الوقت 'held'
+            appointment_id = self._insert_appointment({
+                'patient_id': offer['patient_id'],
+                'doctor_id': offer['doctor_id'],
+                'department_id': offer['department_id'],
+                'clinic_id': offer['clinic_id'],
+                'appointment_date': offer['appointment_date'],
+                'appointment_time': offer['appointment_time'],
+                'type': offer['service_type'] or 'كشف',
+                'notes': 'من قائمة الانتظار'
+            }, allow_held_slot=True)
+            if not appointment_id:
+                self.conn.rollback()
+                return None
+
+            cursor.execute("UPDATE waitlist_offers SET status = 'accepted' WHERE id = ?", (offer_id,))
+            cursor.execute('''
+                UPDATE waitlist_entries SET status = 'booked', updated_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+            ''', (offer['waitlist_id'],))
+            self.conn.commit()
+            self.notify_appointment_changed(appointment_id)
+
+            logging.info(f"✅ تم حجز موعد من قائمة الانتظار برقم: {appointment_id}")
+            return appointment_id
+
+        except Exception as e:
+            logging.error(f"❌ خطأ في قبول عرض الانتظار: {e}")
+            self.conn.rollback()
+            return None
+
+    def decline_waitlist_offer(self, offer_id: int, status: str = 'declined') -> List[Dict]:
+        """رفض العرض أو انتهاؤه: يعود المريض للانتظار ويُعرض الوقت على التالي"""
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute('''
+                SELECT * FROM waitlist_offers WHERE id = ? AND status IN ('pending', 'sent')
+            ''', (offer_id,))
+            offer = cursor.fetchone()
+            if not offer:
+                return []
+
+            cursor.execute('UPDATE waitlist_offers SET status = ? WHERE id = ?', (status, offer_id))
+            cursor.execute('''
+                UPDATE waitlist_entries SET status = 'waiting', updated_at = CURRENT_TIMESTAMP
+                WHERE id = ? AND status = 'offered'
+            ''', (offer['waitlist_id'],))
+
+            day_ordinal = to_ordinal(offer['appointment_date'])
+            start_minute = to_minutes(offer['appointment_time'])
+            cursor.execute('''
+                UPDATE doctor_periodic_schedules
+                SET status = 'available', updated_at = CURRENT_TIMESTAMP
+                WHERE doctor_id = ? AND day_ordinal = ? AND start_minute = ? AND status = 'held'
+            ''', (offer['doctor_id'], day_ordinal, start_minute))
+
+            # المرضى الذين رُفض أو انتهى عرضهم لنفس الوقت لا يُعرض عليهم مجدداً
+            cursor.execute('''
+                SELECT waitlist_id FROM waitlist_offers
+                WHERE doctor_id = ? AND appointment_date = ? AND appointment_time = ?
+                AND status IN ('declined', 'expired')
+            ''', (offer['doctor_id'], offer['appointment_date'], offer['appointment_time']))
+            excluded = {row['waitlist_id'] for row in cursor.fetchall()}
+
+            offers = []
+            if day_ordinal >= date.today().toordinal():
+                cursor.execute('SELECT type FROM appointments WHERE id = ?', (offer['cancelled_appointment_id'],))
+                cancelled = cursor.fetchone()
+                offers = self.match_waitlist_for_slots([{
+                    'doctor_id': offer['doctor_id'],
+                    'day_ordinal': day_ordinal,
+                    'appointment_date': offer['appointment_date'],
+                    'appointment_time': offer['appointment_time'],
+                    'start_minute': start_minute,
+                    'service_type': cancelled['type'] if cancelled else None,
+                    'cancelled_appointment_id': offer['cancelled_appointment_id']
+                }], exclude_entries=excluded)
+
+            self.conn.commit()
+            return offers
+
+        except Exception as e:
+            logging.error(f"❌ خطأ في رفض عرض الانتظار: {e}")
+            self.conn.rollback()
+            return []
+
+    def expire_waitlist_offers(self) -> int:
+        """إنهاء العروض التي تجاوزت مهلتها وتمرير أوقاتها للتالي"""
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute('''
+                SELECT id FROM waitlist_offers
+                WHERE status IN ('pending', 'sent') AND expires_at < ?
+            ''', (datetime.now().strftime('%Y-%m-%d %H:%M:%S'),))
+            expired_ids = [row['id'] for row in cursor.fetchall()]
+
+            for offer_id in expired_ids:
+                self.decline_waitlist_offer(offer_id, status='expired')
+
+            if expired_ids:
+                logging.info(f"⌛ تم إنهاء {len(expired_ids)} عرض انتظار")
+            return len(expired_ids)
+
+        except Exception as e:
+            logging.error(f"❌ خطأ في إنهاء عروض الانتظار: {e}")
+            return 0
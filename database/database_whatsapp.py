@@ -1,7 +1,9 @@
 # -*- coding: utf-8 -*-
 import json
 import logging
-from datetime import datetime
+from datetime import datetime, timedelta
+
+from template_engine import TemplateError, compile_template, default_template
 
 class WhatsAppMixin:
     """ميكسین إدارة إعدادات الواتساب والرسائل"""
@@ -85,15 +87,18 @@ class WhatsAppMixin:
             return []
     
     def save_message_template(self, clinic_id, template_data):
-        """حفظ قالب رسالة"""
+        """حفظ قالب رسالة (بعد التحقق من متغيراته)"""
         try:
+            # القالب بمتغير غير معروف يُرفض قبل الحفظ بدل أن يفشل عند الإرسال
+            compiled = compile_template(template_data['template_content'])
+            
             query = '''
-                INSERT OR REPLACE INTO message_templates 
-                (clinic_id, template_name, template_type, template_content, variables, is_active)
-                VALUES (?, ?, ?, ?, ?, ?)
+                INSERT OR REPLACE INTO message_templates
+                (clinic_id, template_name, template_type, template_content, variables, template_level, is_active)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
             '''
             # تحويل variables إلى JSON
-            variables_json = json.dumps(template_data.get('variables', []))
+            variables_json = json.dumps(template_data.get('variables') or list(compiled.variables))
             
             params = (
                 clinic_id,
@@ -101,26 +106,235 @@ class WhatsAppMixin:
                 template_data['template_type'],
                 template_data['template_content'],
                 variables_json,
+                template_data.get('template_level', 'clinic'),
                 1
             )
             
             cursor = self.conn.cursor()
             cursor.execute(query, params)
             self.conn.commit()
+            self.invalidate_template_cache(clinic_id)
             return cursor.lastrowid
+        except TemplateError as e:
+            logging.error(f"❌ قالب غير صالح: {e}")
+            return None
         except Exception as e:
             logging.error(f"❌ خطأ في حفظ القالب: {e}")
             self.conn.rollback()
             return None
 
+    # ⭐⭐ محرك القوالب المجمّعة ⭐⭐
+    
+    def create_message_templates_table(self):
+        """إنشاء جدول قوالب الرسائل مع عمود المستوى (clinic / department / doctor)"""
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS message_templates (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    clinic_id INTEGER NOT NULL,
+                    template_name TEXT NOT NULL,
+                    template_type TEXT NOT NULL,
+                    template_content TEXT NOT NULL,
+                    variables TEXT,
+                    template_level TEXT DEFAULT 'clinic',
+                    is_active BOOLEAN DEFAULT 1,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (clinic_id) REFERENCES clinics (id)
+                )
+            ''')
+            
+            cursor.execute("PRAGMA table_info(message_templates)")
+            if 'template_level' not in [column[1] for column in cursor.fetchall()]:
+                cursor.execute("ALTER TABLE message_templates ADD COLUMN template_level TEXT DEFAULT 'clinic'")
+            
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_message_templates_lookup
+                ON message_templates (clinic_id, template_type, is_active)
+            ''')
+            self.conn.commit()
+        
+        except Exception as e:
+            logging.error(f"❌ خطأ في إنشاء جدول قوالب الرسائل: {e}")
+            self.conn.rollback()
+    
+    def get_compiled_template(self, clinic_id, template_type, level='clinic'):
+        """القالب المجمّع للعيادة والنوع والمستوى (من الذاكرة المؤقتة إن وُجد)
+        
+        الترتيب: قالب العيادة بنفس المستوى، ثم قالب العيادة العام، ثم القالب الافتراضي.
+        """
+        cache = getattr(self, '_compiled_template_cache', None)
+        if cache is None:
+            cache = self._compiled_template_cache = {}
+        
+        key = (clinic_id, template_type, level)
+        if key in cache:
+            return cache[key]
+        
+        compiled = None
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute('''
+                SELECT template_content, template_level FROM message_templates
+                WHERE clinic_id = ? AND template_type = ? AND is_active = 1
+                  AND COALESCE(template_level, 'clinic') IN (?, 'clinic')
+                ORDER BY COALESCE(template_level, 'clinic') = ? DESC, id DESC
+            ''', (clinic_id, template_type, level, level))
+            
+            for row in cursor.fetchall():
+                try:
+                    compiled = compile_template(row['template_content'])
+                    break
+                except TemplateError as e:
+                    logging.warning(f"⚠️ تجاهل قالب {template_type} للعيادة {clinic_id}: {e}")
+        except Exception as e:
+            logging.error(f"❌ خطأ في تحميل القالب {template_type}: {e}")
+        
+        if compiled is None:
+            source = default_template(template_type, level)
+            compiled = compile_template(source) if source else None
+        
+        cache[key] = compiled
+        return compiled
+    
+    def get_template_clinic_variables(self, clinic_id):
+        """متغيرات العيادة المشتركة بين كل الرسائل (الاسم والهاتف والعنوان)"""
+        cache = getattr(self, '_template_clinic_variables', None)
+        if cache is None:
+            cache = self._template_clinic_variables = {}
+        
+        if clinic_id not in cache:
+            clinic = self.get_clinic_by_id(clinic_id) or {}
+            cache[clinic_id] = {
+                'clinic_name': clinic.get('name'),
+                'clinic_phone': clinic.get('phone'),
+                'clinic_address': clinic.get('address')
+            }
+        return cache[clinic_id]
+    
+    def render_message(self, clinic_id, template_type, values, level='clinic'):
+        """نص الرسالة من القالب المجمّع - '' إن لم يوجد قالب للنوع"""
+        try:
+            compiled = self.get_compiled_template(clinic_id, template_type, level)
+            if compiled is None:
+                logging.warning(f"⚠️ لا يوجد قالب للنوع {template_type}")
+                return ''
+            
+            clinic_values = self.get_template_clinic_variables(clinic_id)
+            return compiled.render(dict(clinic_values, **values) if clinic_values else values)
+        except Exception as e:
+            logging.error(f"❌ خطأ في إنشاء نص الرسالة {template_type}: {e}")
+            return ''
+    
+    def invalidate_template_cache(self, clinic_id=None):
+        """إلغاء القوالب المجمّعة (لعيادة واحدة أو للجميع) بعد تعديل القوالب أو بيانات العيادة"""
+        templates = getattr(self, '_compiled_template_cache', None) or {}
+        clinic_variables = getattr(self, '_template_clinic_variables', None) or {}
+        
+        if clinic_id is None:
+            templates.clear()
+            clinic_variables.clear()
+            return
+        
+        for key in [key for key in templates if key[0] == clinic_id]:
+            del templates[key]
+        clinic_variables.pop(clinic_id, None)
+    
+    # ⭐⭐ تجميعات إحصائيات الرسائل (لكل ساعة ولكل يوم) ⭐⭐
+    
+    # جدول التجميع وصيغة الفترة لكل دقة
+    MESSAGE_STATS_ROLLUPS = {'hour': ('message_stats_hourly', '%Y-%m-%d %H:00'),
+                             'day': ('message_stats_daily', '%Y-%m-%d')}
+    
+    def create_message_stats_rollups(self):
+        """إنشاء جداول تجميع الإحصائيات وتعبئتها من message_stats أول مرة
+        
+        كل صف مجموع (الإجمالي، المرسل، الفاشل) لعيادة ومزود ونوع رسالة في ساعة أو يوم،
+        يُحدَّث مع كل log_message_stat، فقراءة 90 يوماً تمر على بضع مئات من الصفوف.
+        """
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS message_stats (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    clinic_id INTEGER NOT NULL,
+                    patient_id INTEGER,
+                    appointment_id INTEGER,
+                    message_type TEXT,
+                    phone_number TEXT,
+                    country_code TEXT,
+                    status TEXT,
+                    provider TEXT,
+                    error_message TEXT,
+                    sent_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (clinic_id) REFERENCES clinics (id)
+                )
+            ''')
+            
+            for table_name, bucket_format in self.MESSAGE_STATS_ROLLUPS.values():
+                cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = ?", (table_name,))
+                is_new = cursor.fetchone() is None
+                
+                cursor.execute(f'''
+                    CREATE TABLE IF NOT EXISTS {table_name} (
+                        clinic_id INTEGER NOT NULL,
+                        bucket TEXT NOT NULL,
+                        provider TEXT NOT NULL,
+                        message_type TEXT NOT NULL,
+                        total_messages INTEGER DEFAULT 0,
+                        sent_messages INTEGER DEFAULT 0,
+                        failed_messages INTEGER DEFAULT 0,
+                        PRIMARY KEY (clinic_id, bucket, provider, message_type)
+                    ) WITHOUT ROWID
+                ''')
+                
+                if is_new:
+                    cursor.execute(f'''
+                        INSERT INTO {table_name}
+                        SELECT clinic_id, strftime('{bucket_format}', created_at),
+                               COALESCE(provider, 'unknown'), COALESCE(message_type, 'unknown'),
+                               COUNT(*),
+                               SUM(CASE WHEN status = 'sent' THEN 1 ELSE 0 END),
+                               SUM(CASE WHEN status = 'failed' THEN 1 ELSE 0 END)
+                        FROM message_stats
+                        WHERE created_at IS NOT NULL
+                        GROUP BY 1, 2, 3, 4
+                    ''')
+                    if cursor.rowcount > 0:
+                        logging.info(f"✅ تم تعبئة {table_name} بـ {cursor.rowcount} صف من message_stats")
+            
+            self.conn.commit()
+        
+        except Exception as e:
+            logging.error(f"❌ خطأ في إنشاء جداول تجميع الإحصائيات: {e}")
+            self.conn.rollback()
+    
+    def _rollup_message_stat(self, cursor, clinic_id, created_at, provider, message_type, status, count=1):
+        """إضافة رسالة لتجميعات الساعة واليوم - بدون حفظ (count = -1 لإلغاء احتسابها)"""
+        sent = count if status == 'sent' else 0
+        failed = count if status == 'failed' else 0
+        for table_name, bucket_format in self.MESSAGE_STATS_ROLLUPS.values():
+            cursor.execute(f'''
+                INSERT INTO {table_name}
+                (clinic_id, bucket, provider, message_type, total_messages, sent_messages, failed_messages)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (clinic_id, bucket, provider, message_type) DO UPDATE SET
+                    total_messages = total_messages + excluded.total_messages,
+                    sent_messages = sent_messages + excluded.sent_messages,
+                    failed_messages = failed_messages + excluded.failed_messages
+            ''', (clinic_id, created_at.strftime(bucket_format), provider or 'unknown',
+                  message_type or 'unknown', count, sent, failed))
+    
     def log_message_stat(self, clinic_id, stat_data):
-        """تسجيل إحصائية رسالة"""
+        """تسجيل إحصائية رسالة (مع تحديث تجميعات الساعة واليوم في نفس المعاملة)"""
         try:
             query = '''
-                INSERT INTO message_stats 
-                (clinic_id, patient_id, appointment_id, message_type, phone_number, country_code, status, provider, error_message, sent_at, created_at)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                INSERT INTO message_stats
+                (clinic_id, patient_id, appointment_id, message_type, phone_number, country_code, status, provider, error_message, provider_message_id, sent_at, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
             '''
+            created_at = datetime.now()
             params = (
                 clinic_id,
                 stat_data.get('patient_id'),
@@ -131,33 +345,58 @@ class WhatsAppMixin:
                 stat_data.get('status'),
                 stat_data.get('provider'),
                 stat_data.get('error_message', ''),
-                stat_data.get('sent_at', datetime.now()),
-                datetime.now()
+                stat_data.get('provider_message_id'),
+                stat_data.get('sent_at', created_at),
+                created_at
             )
             
             cursor = self.conn.cursor()
             cursor.execute(query, params)
+            self._rollup_message_stat(cursor, clinic_id, created_at, stat_data.get('provider'),
+                                      stat_data.get('message_type'), stat_data.get('status'))
             self.conn.commit()
             return True
         except Exception as e:
             logging.error(f"❌ خطأ في تسجيل الإحصائية: {e}")
+            self.conn.rollback()
             return False
     
+    def get_message_stats_range(self, clinic_id, since, until=None, granularity='day'):
+        """إحصائيات الرسائل لكل فترة (ساعة أو يوم) في النطاق [since، until]
+        
+        تُرجع [{'bucket', 'provider', 'message_type', 'total_messages', 'sent_messages', 'failed_messages'}]
+        """
+        try:
+            table_name, bucket_format = self.MESSAGE_STATS_ROLLUPS[granularity]
+            until = until or datetime.now()
+            
+            cursor = self.conn.cursor()
+            cursor.execute(f'''
+                SELECT bucket, provider, message_type, total_messages, sent_messages, failed_messages
+                FROM {table_name}
+                WHERE clinic_id = ? AND bucket >= ? AND bucket <= ?
+                ORDER BY bucket, provider, message_type
+            ''', (clinic_id, since.strftime(bucket_format), until.strftime(bucket_format)))
+            return [dict(row) for row in cursor.fetchall()]
+        except Exception as e:
+            logging.error(f"❌ خطأ في جلب إحصائيات الفترة: {e}")
+            return []
+    
     def get_message_stats(self, clinic_id, days=30):
-        """الحصول على إحصائيات الرسائل - مصححة"""
+        """الحصول على إحصائيات الرسائل - من التجميع اليومي"""
         try:
             query = '''
-                SELECT 
-                    COUNT(*) as total_messages,
-                    SUM(CASE WHEN status = 'sent' THEN 1 ELSE 0 END) as sent_messages,
-                    SUM(CASE WHEN status = 'failed' THEN 1 ELSE 0 END) as failed_messages,
+                SELECT
+                    SUM(total_messages) as total_messages,
+                    SUM(sent_messages) as sent_messages,
+                    SUM(failed_messages) as failed_messages,
                     provider,
                     message_type
-                FROM message_stats 
-                WHERE clinic_id = ? AND date(created_at) >= date('now', ?)
+                FROM message_stats_daily
+                WHERE clinic_id = ? AND bucket >= ?
                 GROUP BY provider, message_type
             '''
-            params = (clinic_id, f'-{days} days')
+            params = (clinic_id, (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d'))
             
             cursor = self.conn.cursor()
             cursor.execute(query, params)
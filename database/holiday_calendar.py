@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""
+تقويم العطلات الرسمية والإغلاقات
+- تحويل هجري/ميلادي بالتقويم الهجري الجدولي (الحسابي)
+- العطلات الهجرية (عيد الفطر، عيد الأضحى) والميلادية الثابتة (يوم التأسيس، اليوم الوطني)
+- إغلاقات العيادة المخزنة في قاعدة البيانات
+- مجموعة أرقام ترتيبية محسوبة مسبقاً لكل سنة للبحث بزمن ثابت
+"""
+
+import logging
+from datetime import date, datetime
+from typing import Dict, FrozenSet, Iterable, Tuple, Union
+
+from scheduling_time import to_ordinal
+
+# 1 محرم 1 هـ (16 يوليو 622م) كرقم ترتيبي date.toordinal ناقص يوم
+HIJRI_EPOCH_ORDINAL = 227014
+
+# العطلات الهجرية: (الشهر، أول يوم، آخر يوم، الاسم)
+HIJRI_HOLIDAYS = [
+    (10, 1, 3, "عيد الفطر"),
+    (12, 9, 9, "يوم عرفة"),
+    (12, 10, 12, "عيد الأضحى"),
+]
+
+# العطلات الميلادية الثابتة: (الشهر، اليوم، الاسم)
+GREGORIAN_HOLIDAYS = [
+    (2, 22, "يوم التأسيس"),
+    (9, 23, "اليوم الوطني"),
+]
+
+
+def hijri_to_ordinal(year: int, month: int, day: int) -> int:
+    """تحويل تاريخ هجري (جدولي) إلى الرقم الترتيبي الميلادي"""
+    return (day + (59 * (month - 1) + 1) // 2 + (year - 1) * 354
+            + (3 + 11 * year) // 30 + HIJRI_EPOCH_ORDINAL)
+
+
+def ordinal_to_hijri(ordinal: int) -> Tuple[int, int, int]:
+    """تحويل الرقم الترتيبي الميلادي إلى تاريخ هجري (جدولي)"""
+    year = (30 * (ordinal - HIJRI_EPOCH_ORDINAL - 1) + 10646) // 10631
+    if ordinal < hijri_to_ordinal(year, 1, 1):
+        year -= 1
+    elif ordinal >= hijri_to_ordinal(year + 1, 1, 1):
+        year += 1
+
+    month = 1
+    while month < 12 and ordinal >= hijri_to_ordinal(year, month + 1, 1):
+        month += 1
+    day = ordinal - hijri_to_ordinal(year, month, 1) + 1
+    return year, month, day
+
+
+def gregorian_to_hijri(value: Union[date, datetime]) -> Tuple[int, int, int]:
+    """تحويل تاريخ ميلادي إلى هجري (جدولي)"""
+    if isinstance(value, datetime):
+        value = value.date()
+    return ordinal_to_hijri(value.toordinal())
+
+
+class HolidayCalendar:
+    """تقويم العطلات مع ذاكرة مؤقتة لكل سنة ميلادية
+
+    hijri_offset_days: تصحيح بالأيام بين التقويم الجدولي وإعلان رؤية الهلال (عادة -1 إلى +1)
+    """
+
+    def __init__(self, hijri_offset_days: int = 0):
+        self.hijri_offset_days = hijri_offset_days
+        self._closures: Dict[int, str] = {}
+        self._year_cache: Dict[int, Dict[int, str]] = {}
+        self._year_sets: Dict[int, FrozenSet[int]] = {}
+
+    def set_closures(self, closures: Iterable[Dict]):
+        """تحميل إغلاقات العيادة (start_date, end_date, reason) وإبطال الذاكرة المؤقتة"""
+        self._closures = {}
+        for closure in closures:
+            try:
+                start = to_ordinal(closure['start_date'])
+                end = to_ordinal(closure.get('end_date') or closure['start_date'])
+            except (KeyError, ValueError, TypeError):
+                logging.warning(f"⚠️ إغلاق غير صالح: {closure}")
+                continue
+            reason = closure.get('reason') or "إغلاق العيادة"
+            for ordinal in range(start, end + 1):
+                self._closures[ordinal] = reason
+        self.invalidate()
+
+    def invalidate(self):
+        """مسح الذاكرة المؤقتة للسنوات المحسوبة"""
+        self._year_cache.clear()
+        self._year_sets.clear()
+
+    def official_holidays(self, year: int) -> Dict[int, str]:
+        """العطلات الرسمية للسنة الميلادية {رقم ترتيبي: اسم}"""
+        first = date(year, 1, 1).toordinal()
+        last = date(year, 12, 31).toordinal()
+        holidays = {}
+
+        for month, day, name in GREGORIAN_HOLIDAYS:
+            holidays[date(year, month, day).toordinal()] = name
+
+        first_hijri_year = ordinal_to_hijri(first)[0]
+        last_hijri_year = ordinal_to_hijri(last)[0]
+        for hijri_year in range(first_hijri_year, last_hijri_year + 1):
+            for month, start_day, end_day, name in HIJRI_HOLIDAYS:
+                for day in range(start_day, end_day + 1):
+                    ordinal = hijri_to_ordinal(hijri_year, month, day) + self.hijri_offset_days
+                    if first <= ordinal <= last:
+                        holidays[ordinal] = name
+
+        return holidays
+
+    def holidays_for_year(self, year: int) -> Dict[int, str]:
+        """العطلات الرسمية وإغلاقات العيادة للسنة (محسوبة مرة واحدة)"""
+        holidays = self._year_cache.get(year)
+        if holidays is None:
+            holidays = self.official_holidays(year)
+            first = date(year, 1, 1).toordinal()
+            last = date(year, 12, 31).toordinal()
+            for ordinal, reason in self._closures.items():
+                if first <= ordinal <= last:
+                    holidays[ordinal] = reason
+            self._year_cache[year] = holidays
+            self._year_sets[year] = frozenset(holidays)
+        return holidays
+
+    def holiday_ordinals(self, year: int) -> FrozenSet[int]:
+        """مجموعة الأرقام الترتيبية لأيام العطل في السنة"""
+        if year not in self._year_sets:
+            self.holidays_for_year(year)
+        return self._year_sets[year]
+
+    def is_holiday(self, value: Union[str, date, datetime, int]) -> bool:
+        """هل التاريخ عطلة أو إغلاق (بحث بزمن ثابت بعد حساب السنة)"""
+        ordinal = to_ordinal(value)
+        return ordinal in self.holiday_ordinals(date.fromordinal(ordinal).year)
+
+    def holiday_name(self, value: Union[str, date, datetime, int]) -> str:
+        """اسم العطلة أو سبب الإغلاق (نص فارغ إن لم يكن عطلة)"""
+        ordinal = to_ordinal(value)
+        return self.holidays_for_year(date.fromordinal(ordinal).year).get(ordinal, "")
+
+    def holidays_between(self, start: Union[str, date], end: Union[str, date]) -> Dict[str, str]:
+        """العطلات ضمن فترة {'YYYY-MM-DD': اسم}"""
+        start_ordinal = to_ordinal(start)
+        end_ordinal = to_ordinal(end)
+        result = {}
+        for year in range(date.fromordinal(start_ordinal).year, date.fromordinal(end_ordinal).year + 1):
+            for ordinal, name in self.holidays_for_year(year).items():
+                if start_ordinal <= ordinal <= end_ordinal:
+                    result[date.fromordinal(ordinal).strftime('%Y-%m-%d')] = name
+        return dict(sorted(result.items()))
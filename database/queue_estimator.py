@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+"""
+تقدير أوقات الانتظار لطابور الطبيب اليومي
+- المواعيد المجدولة تحجز أماكنها في خط الزمن
+- المراجعون بدون موعد يُدخَلون في الفجوات بين المواعيد إن اتسعت لهم، وإلا بعدها
+- مدة الخدمة الفعلية متوسط متحرك أسي (EWMA) يُحدَّث عند انتهاء كل مراجع
+كل الأوقات بالدقائق من بداية اليوم.
+"""
+
+from typing import Dict, List, Optional
+
+# وزن آخر مدة خدمة في المتوسط المتحرك
+EWMA_ALPHA = 0.3
+
+# بعد هذه المدة من وقت الموعد دون حضور يُعتبر المريض متغيباً ولا يحجز مكاناً
+NO_SHOW_GRACE_MINUTES = 15
+
+
+def update_average(average: Optional[float], duration: float, alpha: float = EWMA_ALPHA) -> float:
+    """تحديث متوسط مدة الخدمة بقيمة جديدة"""
+    if average is None:
+        return float(duration)
+    return round(alpha * duration + (1 - alpha) * average, 2)
+
+
+def estimate_queue(now_minute: int, busy_until: int, scheduled: List[Dict],
+                   walk_ins: List[Dict], service_minutes: float) -> List[Dict]:
+    """ترتيب الخدمة المتوقع مع وقت البدء لكل مراجع
+
+    scheduled: مواعيد اليوم المتبقية مرتبة بالوقت {'start_minute', 'checked_in', ...}
+    walk_ins: المنتظرون بدون موعد بترتيب الطابور
+    تُرجع نسخاً من العناصر مع 'estimated_start' و 'wait_minutes'.
+    """
+    duration = max(int(round(service_minutes)), 1)
+    cursor = max(now_minute, busy_until)
+
+    # المواعيد الفائتة دون حضور لا تحجز مكاناً
+    pending = [entry for entry in scheduled
+               if entry['checked_in'] or entry['start_minute'] + NO_SHOW_GRACE_MINUTES >= now_minute]
+
+    order = []
+    i = j = 0
+    while i < len(pending) or j < len(walk_ins):
+        fits_gap = i >= len(pending) or cursor + duration <= pending[i]['start_minute']
+        if j < len(walk_ins) and fits_gap:
+            entry, start = walk_ins[j], cursor
+            j += 1
+        else:
+            entry = pending[i]
+            start = max(cursor, entry['start_minute'])
+            i += 1
+        cursor = start + duration
+        order.append(dict(entry, estimated_start=start, wait_minutes=max(start - now_minute, 0)))
+
+    return order
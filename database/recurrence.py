@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""
+قواعد تكرار المواعيد (مبسطة على نمط RRULE)
+- FREQ: DAILY / WEEKLY / MONTHLY
+- INTERVAL: كل كم يوم/أسبوع/شهر
+- COUNT أو UNTIL: نهاية السلسلة
+- BYDAY: أيام الأسبوع للتكرار الأسبوعي (SU,MO,TU,...)
+تُقبل القاعدة كنص 'FREQ=WEEKLY;INTERVAL=1;COUNT=12;BYDAY=SU,TU' أو كقاموس.
+المخرجات أرقام ترتيبية للتواريخ (date.toordinal) مثل باقي نظام الجدولة.
+"""
+
+import calendar
+from datetime import date
+from typing import Dict, List, Union
+
+from scheduling_time import to_ordinal
+
+FREQUENCIES = ('daily', 'weekly', 'monthly')
+
+# رموز أيام الأسبوع كما في RRULE (الإثنين = 0)
+WEEKDAY_CODES = {'MO': 0, 'TU': 1, 'WE': 2, 'TH': 3, 'FR': 4, 'SA': 5, 'SU': 6}
+
+# حد أعلى لطول السلسلة (سنة من المواعيد اليومية)
+MAX_OCCURRENCES = 366
+
+
+def parse_rule(rule: Union[str, Dict]) -> Dict:
+    """تحويل القاعدة إلى قاموس موحد {'freq', 'interval', 'count', 'until', 'byweekday'}"""
+    if isinstance(rule, str):
+        parts = {}
+        for part in rule.replace('RRULE:', '').split(';'):
+            if '=' in part:
+                key, _, value = part.partition('=')
+                parts[key.strip().lower()] = value.strip()
+        rule = {
+            'freq': parts.get('freq', 'weekly'),
+            'interval': parts.get('interval', 1),
+            'count': parts.get('count'),
+            'until': parts.get('until'),
+            'byweekday': parts['byday'].split(',') if parts.get('byday') else None
+        }
+
+    freq = str(rule.get('freq', 'weekly')).lower()
+    if freq not in FREQUENCIES:
+        raise ValueError(f"تكرار غير مدعوم: {freq}")
+
+    until = rule.get('until')
+    if isinstance(until, str) and len(until) >= 8 and until[:8].isdigit():
+        until = f"{until[0:4]}-{until[4:6]}-{until[6:8]}"
+
+    byweekday = rule.get('byweekday')
+    if byweekday:
+        byweekday = tuple(sorted({WEEKDAY_CODES[str(day).upper()[:2]] if not isinstance(day, int) else day
+                                  for day in byweekday}))
+
+    count = int(rule['count']) if rule.get('count') else None
+    if count is None and until is None:
+        raise ValueError("يجب تحديد عدد المرات (COUNT) أو تاريخ النهاية (UNTIL)")
+
+    return {
+        'freq': freq,
+        'interval': max(int(rule.get('interval') or 1), 1),
+        'count': min(count, MAX_OCCURRENCES) if count else MAX_OCCURRENCES,
+        'until': to_ordinal(until) if until else None,
+        'byweekday': byweekday or None
+    }
+
+
+def generate_occurrences(start: Union[str, date], rule: Union[str, Dict]) -> List[int]:
+    """توليد تواريخ السلسلة كأرقام ترتيبية مرتبة (يبدأ من تاريخ البداية)"""
+    rule = parse_rule(rule)
+    start_ordinal = to_ordinal(start)
+    count = rule['count']
+    until = rule['until'] if rule['until'] is not None else start_ordinal + 366 * 5
+    interval = rule['interval']
+    occurrences = []
+
+    if rule['freq'] == 'daily':
+        ordinal = start_ordinal
+        while len(occurrences) < count and ordinal <= until:
+            occurrences.append(ordinal)
+            ordinal += interval
+
+    elif rule['freq'] == 'weekly':
+        weekdays = rule['byweekday'] or ((start_ordinal - 1) % 7,)
+        week_start = start_ordinal - (start_ordinal - 1) % 7  # الإثنين
+        while len(occurrences) < count and week_start <= until:
+            for weekday in weekdays:
+                ordinal = week_start + weekday
+                if ordinal < start_ordinal:
+                    continue
+                if ordinal > until or len(occurrences) >= count:
+                    break
+                occurrences.append(ordinal)
+            week_start += 7 * interval
+
+    else:
+        # شهري: نفس اليوم من الشهر، وتُتخطى الأشهر التي لا تحتوي هذا اليوم (مثل 31)
+        first = date.fromordinal(start_ordinal)
+        month_index = first.year * 12 + first.month - 1
+        while len(occurrences) < count:
+            year, month = divmod(month_index, 12)
+            month += 1
+            if first.day <= calendar.monthrange(year, month)[1]:
+                ordinal = date(year, month, first.day).toordinal()
+                if ordinal > until:
+                    break
+                occurrences.append(ordinal)
+            elif date(year, month, 1).toordinal() > until:
+                break
+            month_index += interval
+
+    return occurrences
+
+
+def describe_rule(rule: Union[str, Dict]) -> str:
+    """وصف عربي مختصر للقاعدة"""
+    rule = parse_rule(rule)
+    units = {'daily': 'يوم', 'weekly': 'أسبوع', 'monthly': 'شهر'}
+    every = f"كل {units[rule['freq']]}" if rule['interval'] == 1 else f"كل {rule['interval']} {units[rule['freq']]}"
+    if rule['until'] is not None and rule['count'] == MAX_OCCURRENCES:
+        return f"{every} حتى {date.fromordinal(rule['until']).strftime('%Y-%m-%d')}"
+    return f"{every} - {rule['count']} مرة"
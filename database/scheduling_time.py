@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+نموذج الوقت الداخلي لنظام الجدولة
+- الأوقات: دقائق من بداية اليوم (0 - 1439)
+- التواريخ: الرقم الترتيبي للتاريخ (date.toordinal)
+التحويل إلى النصوص 'HH:MM' و 'YYYY-MM-DD' يتم فقط عند حدود الواجهة وقاعدة البيانات
+"""
+
+from bisect import bisect_right
+from datetime import date, datetime, time
+from typing import List, Tuple, Union
+
+MINUTES_PER_DAY = 1440
+
+# نصوص الأوقات محسوبة مسبقاً لكل دقيقة في اليوم
+MINUTE_LABELS = [f"{m // 60:02d}:{m % 60:02d}" for m in range(MINUTES_PER_DAY)]
+
+# الفرق بين julianday في SQLite و date.toordinal في بايثون
+SQLITE_JULIANDAY_OFFSET = 1721424.5
+
+
+def to_minutes(value: Union[str, time, datetime, int]) -> int:
+    """تحويل 'HH:MM' أو 'HH:MM:SS' أو كائن وقت إلى دقائق من بداية اليوم"""
+    if isinstance(value, int):
+        return value
+    if isinstance(value, (time, datetime)):
+        return value.hour * 60 + value.minute
+    text = str(value).strip()
+    hours, _, rest = text.partition(':')
+    return int(hours) * 60 + int(rest[:2])
+
+
+def minutes_to_label(minutes: int) -> str:
+    """تحويل الدقائق إلى 'HH:MM' (مع الالتفاف بعد منتصف الليل)"""
+    return MINUTE_LABELS[minutes % MINUTES_PER_DAY]
+
+
+def minutes_to_time(minutes: int) -> time:
+    """تحويل الدقائق إلى كائن وقت"""
+    minutes %= MINUTES_PER_DAY
+    return time(minutes // 60, minutes % 60)
+
+
+def to_ordinal(value: Union[str, date, datetime, int]) -> int:
+    """تحويل 'YYYY-MM-DD' أو كائن تاريخ إلى الرقم الترتيبي"""
+    if isinstance(value, int):
+        return value
+    if isinstance(value, datetime):
+        return value.date().toordinal()
+    if isinstance(value, date):
+        return value.toordinal()
+    text = str(value).strip()
+    return date(int(text[0:4]), int(text[5:7]), int(text[8:10])).toordinal()
+
+
+def ordinal_to_str(ordinal: int) -> str:
+    """تحويل الرقم الترتيبي إلى 'YYYY-MM-DD'"""
+    return date.fromordinal(ordinal).strftime('%Y-%m-%d')
+
+
+def ranges_overlap(start1: int, end1: int, start2: int, end2: int) -> bool:
+    """تداخل فترتين (تعمل مع الدقائق أو أي قيم قابلة للمقارنة)"""
+    return not (end1 <= start2 or start1 >= end2)
+
+
+# ⭐⭐ عمليات على قوائم الفترات المرتبة [(بداية، نهاية)] ⭐⭐
+
+def merge_intervals(intervals: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """دمج الفترات المتداخلة أو المتلاصقة في قائمة مرتبة"""
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def intersect_intervals(first: List[Tuple[int, int]], second: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """تقاطع قائمتين مرتبتين بمرور واحد (خطي في مجموع الطولين)"""
+    result = []
+    i = j = 0
+    while i < len(first) and j < len(second):
+        start = max(first[i][0], second[j][0])
+        end = min(first[i][1], second[j][1])
+        if start < end:
+            result.append((start, end))
+        if first[i][1] < second[j][1]:
+            i += 1
+        else:
+            j += 1
+    return result
+
+
+def subtract_intervals(free: List[Tuple[int, int]], busy: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """طرح الفترات المشغولة من الفترات الحرة (كلاهما مرتب ومدمج)"""
+    result = []
+    j = 0
+    for start, end in free:
+        while j < len(busy) and busy[j][1] <= start:
+            j += 1
+        k = j
+        while k < len(busy) and busy[k][0] < end:
+            if busy[k][0] > start:
+                result.append((start, busy[k][0]))
+            start = max(start, busy[k][1])
+            k += 1
+        if start < end:
+            result.append((start, end))
+    return result
+
+
+def interval_contains(intervals: List[Tuple[int, int]], start: int, end: int) -> bool:
+    """هل الفترة [start, end) داخل إحدى فترات القائمة المرتبة (بحث ثنائي)"""
+    index = bisect_right(intervals, (start, MINUTES_PER_DAY * 2)) - 1
+    return index >= 0 and intervals[index][0] <= start and end <= intervals[index][1]
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""
+محرك قوالب الرسائل
+- القالب نص بمتغيرات بين أقواس {patient_name} ويُجمَّع مرة واحدة إلى سلسلة تنسيق
+  بمواضع رقمية وقائمة متغيرات، فيصبح العرض استدعاء str.format واحداً
+- المتغيرات تُتحقق عند التجميع: اسم غير معروف أو وصول لخاصية ({x.y} / {x[0]}) يرفض القالب
+- المتغير الناقص عند العرض يأخذ قيمته الافتراضية بدل إفشال الرسالة
+"""
+
+import string
+from typing import Dict, Optional
+
+# المتغيرات المسموحة مع قيمتها عند غيابها
+TEMPLATE_VARIABLES = {
+    'patient_name': 'عزيزي/عزيزتي',
+    'patient_phone': '',
+    'appointment_date': '',
+    'appointment_time': '',
+    'doctor_name': 'الطبيب',
+    'department_name': 'القسم',
+    'clinic_name': 'العيادة',
+    'clinic_phone': '',
+    'clinic_address': '',
+    'minutes': '',
+}
+
+# أسماء مختصرة مستخدمة في القوالب القديمة
+TEMPLATE_ALIASES = {
+    'date': 'appointment_date',
+    'time': 'appointment_time',
+    'doctor': 'doctor_name',
+    'department': 'department_name',
+    'clinic': 'clinic_name',
+}
+
+TEMPLATE_LEVELS = ('clinic', 'department', 'doctor')
+
+# القوالب الافتراضية عند عدم وجود قالب للعيادة في message_templates
+DEFAULT_TEMPLATES = {
+    ('reminder_24h', 'clinic'): (
+        "تذكير بالموعد 🗓️\n\n"
+        "عزيزي/عزيزتي {patient_name}\n\n"
+        "نذكرك بموعدك غداً:\n"
+        "📅 التاريخ: {appointment_date}\n"
+        "⏰ الوقت: {appointment_time}\n"
+        "👨‍⚕️ الدكتور: {doctor_name}\n"
+        "🏥 القسم: {department_name}\n\n"
+        "نرجو التأكيد على الحضور 🌹"
+    ),
+    ('reminder_24h', 'department'): "تذكير موعد - {department_name}\n{patient_name} موعدك غداً {date} الساعة {time}",
+    ('reminder_24h', 'doctor'): "تذكير موعد - د. {doctor_name}\n{patient_name} موعدك غداً {date} الساعة {time}",
+    ('reminder_2h', 'clinic'): (
+        "تذكير فوري بالموعد ⏰\n\n"
+        "عزيزي/عزيزتي {patient_name}\n\n"
+        "موعدك بعد ساعتين:\n"
+        "🕐 الوقت: {appointment_time}\n"
+        "👨‍⚕️ الدكتور: {doctor_name}\n\n"
+        "نترقب زيارتكم 👨‍⚕️"
+    ),
+    ('reminder_2h', 'department'): "تذكير - {department_name}\n{patient_name} موعدك بعد ساعتين الساعة {time}",
+    ('reminder_2h', 'doctor'): "تذكير - د. {doctor_name}\n{patient_name} موعدك بعد ساعتين الساعة {time}",
+    ('appointment_confirmation', 'clinic'): "تأكيد موعد - {clinic_name}\n{patient_name} موعدك بتاريخ {date} الساعة {time}",
+    ('appointment_confirmation', 'department'): "تأكيد موعد - {department_name}\n{patient_name} موعدك بتاريخ {date} الساعة {time}",
+    ('appointment_confirmation', 'doctor'): "تأكيد موعد - د. {doctor_name}\n{patient_name} موعدك بتاريخ {date} الساعة {time}",
+    ('quick_5min', 'clinic'): (
+        "⏰ تذكير بالموعد - اختبار نظام AutoSender المتكامل\n\n"
+        "عزيزي/عزيزتي {patient_name},\n\n"
+        "هذا اختبار حقيقي لنظام التذكير التلقائي المتكامل.\n"
+        "سيتم إرسال تذكير آخر قبل موعدك بدقيقة واحدة.\n\n"
+        "موعدك: {appointment_time}\n"
+        "الوقت المتبقي: 5 دقائق\n\n"
+        "شكراً لتفهمك 🤝"
+    ),
+    ('quick_1min', 'clinic'): (
+        "🔔 تذكير فوري - اختبار نظام AutoSender المتكامل\n\n"
+        "عزيزي/عزيزتي {patient_name},\n\n"
+        "موعدك بعد دقيقة واحدة!\n"
+        "هذا اختبار حقيقي لنظام التذكير التلقائي المتكامل.\n\n"
+        "الوقت: {appointment_time}\n"
+        "الحالة: جاهز للاستقبال\n\n"
+        "نترقب زيارتكم 👨‍⚕️"
+    ),
+}
+
+
+class TemplateError(ValueError):
+    """قالب غير صالح (متغير غير معروف أو صيغة خاطئة)"""
+
+
+class CompiledTemplate:
+    """قالب مُجمَّع جاهز للعرض السريع"""
+
+    __slots__ = ('source', 'variables', '_format', '_fields')
+
+    def __init__(self, source: str, format_string: str, fields: tuple):
+        self.source = source
+        self._format = format_string
+        self._fields = fields
+        self.variables = tuple(dict.fromkeys(fields))
+
+    def render(self, values: Dict) -> str:
+        """عرض القالب بقيم المتغيرات (الناقص أو الفارغ يأخذ القيمة الافتراضية)"""
+        get = values.get
+        arguments = []
+        for field in self._fields:
+            value = get(field)
+            arguments.append(TEMPLATE_VARIABLES[field] if value is None or value == '' else value)
+        return self._format.format(*arguments)
+
+    __call__ = render
+
+
+def compile_template(source: str) -> CompiledTemplate:
+    """تجميع نص القالب - يرفع TemplateError إن كان فيه متغير غير مسموح"""
+    parts, fields = [], []
+
+    try:
+        parsed = list(string.Formatter().parse(source or ''))
+    except ValueError as e:
+        raise TemplateError(f"صيغة القالب غير صحيحة: {e}")
+
+    for literal, field_name, format_spec, conversion in parsed:
+        parts.append(literal.replace('{', '{{').replace('}', '}}'))
+        if field_name is None:
+            continue
+
+        name = TEMPLATE_ALIASES.get(field_name, field_name)
+        if not name.isidentifier():
+            raise TemplateError(f"متغير غير صالح في القالب: {{{field_name}}}")
+        if name not in TEMPLATE_VARIABLES:
+            raise TemplateError(f"متغير غير معروف في القالب: {{{field_name}}}")
+        if format_spec and '{' in format_spec:
+            raise TemplateError(f"تنسيق متداخل غير مدعوم: {{{field_name}:{format_spec}}}")
+
+        placeholder = str(len(fields))
+        if conversion:
+            placeholder += '!' + conversion
+        if format_spec:
+            placeholder += ':' + format_spec
+        parts.append('{' + placeholder + '}')
+        fields.append(name)
+
+    return CompiledTemplate(source, ''.join(parts), tuple(fields))
+
+
+def default_template(template_type: str, level: str = 'clinic') -> Optional[str]:
+    """نص القالب الافتراضي للنوع والمستوى (أو مستوى العيادة إن لم يوجد)"""
+    return DEFAULT_TEMPLATES.get((template_type, level)) or DEFAULT_TEMPLATES.get((template_type, 'clinic'))
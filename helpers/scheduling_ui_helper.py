@@ -1,6 +1,6 @@
 # -*- coding: utf-8 -*-
 import logging
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 
 class SchedulingUIHelper:
     """مساعد واجهات المستخدم لنظام الجدولة الذكية"""
@@ -220,28 +220,31 @@ class SchedulingUIHelper:
         print(f"\n📅 جدول الطبيب {doctor_name} لـ 30 يوم:")
         print("-" * 50)
         
-        schedule = self.db.generate_schedule_for_period(doctor_id, 30)
+        grid = self.get_schedule_grid(doctor_id, 30)
+        days = list(zip(grid['day_ordinals'], grid['day_available'], grid['day_full']))
         
-        available_days = sum(1 for day in schedule.values() if day['status'] == 'available')
-        total_slots = sum(day['slots_count'] for day in schedule.values())
+        available_days = sum(1 for _, available, full in days if available and not full)
+        total_slots = sum(available for _, available, _ in days)
         
         print(f"📊 الملخص: {available_days} يوم متاح - {total_slots} وقت")
         
         # عرض أول 10 أيام
-        for i, (date, data) in enumerate(list(schedule.items())[:10]):
-            day_name = self.get_arabic_day_name(datetime.strptime(date, '%Y-%m-%d').weekday())
-            status_icon = "🟢" if data['status'] == 'available' else "🔴"
-            print(f"   {date} ({day_name}): {status_icon} {data['slots_count']} وقت")
+        for ordinal, available, full in days[:10]:
+            day = date.fromordinal(ordinal)
+            day_name = self.get_arabic_day_name(day.weekday())
+            status_icon = "🟢" if available and not full else "🔴"
+            print(f"   {day.strftime('%Y-%m-%d')} ({day_name}): {status_icon} {available} وقت")
     
     def show_quarterly_schedule(self, doctor_id, doctor_name):
         """عرض جدول ربع سنوي"""
         print(f"\n📅 جدول الطبيب {doctor_name} لـ 90 يوم:")
         print("-" * 50)
         
-        schedule = self.db.generate_schedule_for_period(doctor_id, 90)
+        grid = self.get_schedule_grid(doctor_id, 90)
         
-        available_days = sum(1 for day in schedule.values() if day['status'] == 'available')
-        total_slots = sum(day['slots_count'] for day in schedule.values())
+        available_days = sum(1 for available, full in zip(grid['day_available'], grid['day_full'])
+                             if available and not full)
+        total_slots = sum(grid['day_available'])
         
         print(f"📊 الملخص: {available_days} يوم متاح - {total_slots} وقت")
         
@@ -249,14 +252,19 @@ class SchedulingUIHelper:
         from collections import defaultdict
         weekly_stats = defaultdict(int)
         
-        for date, data in schedule.items():
-            week_num = datetime.strptime(date, '%Y-%m-%d').isocalendar()[1]
-            weekly_stats[week_num] += data['slots_count']
+        for ordinal, available in zip(grid['day_ordinals'], grid['day_available']):
+            week_num = date.fromordinal(ordinal).isocalendar()[1]
+            weekly_stats[week_num] += available
         
         print("\n📈 إحصائية بالأسبوع:")
         for week, slots in list(weekly_stats.items())[:8]:
             print(f"   الأسبوع {week}: {slots} وقت متاح")
     
+    def get_schedule_grid(self, doctor_id, days):
+        """شبكة الجدول العمودية للأيام القادمة"""
+        today = date.today()
+        return self.db.get_schedule_grid(doctor_id, today, today + timedelta(days=days - 1))
+    
     def find_first_available_ui(self, doctor_id, doctor_name):
         """واجهة البحث عن أول موعد متاح"""
         print(f"\n🔍 جاري البحث عن أول موعد متاح للطبيب {doctor_name}...")
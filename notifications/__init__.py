@@ -1,5 +1,6 @@
 # notifications/__init__.py
 from .reminder_system import ClinicReminderSystem
 from .reminder_manager import ReminderManager
+from .outbox_dispatcher import OutboxDispatcher
 
-__all__ = ['ClinicReminderSystem', 'ReminderManager']
\ No newline at end of file
+__all__ = ['ClinicReminderSystem', 'ReminderManager', 'OutboxDispatcher']
\ No newline at end of file
@@ -5,6 +5,10 @@ from datetime import datetime, timedelta
 from PyQt5.QtCore import QObject, QTimer, pyqtSignal
 from PyQt5.QtWidgets import QMessageBox
 
+from notifications.outbox_dispatcher import OutboxDispatcher
+from notifications.reminder_scheduler import ReminderScheduler
+from notifications.reminder_system import enqueue_reminder, send_reminder_once
+
 class AutoSender(QObject):
     """نظام الإرسال التلقائي الموحد - الإصدار النهائي المصحح والمتكامل"""
 
@@ -62,16 +66,26 @@ class AutoSender(QObject):
 
     def setup_timers(self):
         """إعداد المؤقتات المتقدمة"""
+        # الفحص الدوري للاختبار السريع فقط، أو بديلاً إن لم يعمل مُنبّه التذكيرات
         self.reminder_timer = QTimer()
         self.reminder_timer.timeout.connect(self.check_all_reminders)
-        self.reminder_timer.start(60000)  # كل دقيقة
         
         # مؤقت مراقبة الاتصال
         self.connection_monitor = QTimer()
         self.connection_monitor.timeout.connect(self.monitor_connection)
         self.connection_monitor.start(30000)  # كل 30 ثانية
         
-        self.add_log("⏰ تم تفعيل المؤقتات - فحص كل دقيقة، مراقبة اتصال كل 30 ثانية")
+        self.add_log("⏰ تم تفعيل المؤقتات - مراقبة اتصال كل 30 ثانية")
+    
+    def start_polling_if_needed(self):
+        """تشغيل الفحص كل دقيقة إن لم يكن مُنبّه التذكيرات الموحد يعمل"""
+        scheduler = ReminderScheduler.get_global_instance()
+        if self.quick_test_mode or not (scheduler and scheduler.is_running):
+            if not self.reminder_timer.isActive():
+                self.reminder_timer.start(60000)  # كل دقيقة
+                self.add_log("⏰ فحص التذكيرات كل دقيقة")
+        elif self.reminder_timer.isActive():
+            self.reminder_timer.stop()
 
     def connect_signals(self):
         """ربط إشارات النظام بشكل متقدم"""
@@ -147,6 +161,7 @@ class AutoSender(QObject):
             self.quick_test_mode = False
             self.add_log("🚀 بدء نظام الإرسال التلقائي المتكامل")
             self.status_changed.emit("نشط")
+            self.start_polling_if_needed()
             
             # فحص فوري شامل عند البدء
             self.check_all_reminders()
@@ -165,6 +180,7 @@ class AutoSender(QObject):
 
             self.is_running = False
             self.quick_test_mode = False
+            self.reminder_timer.stop()
             self.add_log("⏹️ إيقاف نظام الإرسال التلقائي")
             self.status_changed.emit("متوقف")
             return True
@@ -194,6 +210,7 @@ class AutoSender(QObject):
             
             self.add_log("🔧 تفعيل وضع الاختبار السريع المتقدم (دقائق بدلاً من ساعات)")
             self.status_changed.emit("اختبار")
+            self.start_polling_if_needed()
             
             # إنشاء موعد اختبار بعد 6 دقائق
             test_appointment_id = self.create_test_appointment()
@@ -390,14 +407,19 @@ class AutoSender(QObject):
                         reminder_type
                     )
                     
-                    # إرسال الرسالة الحقيقية عبر WhatsAppManager
-                    result = self.whatsapp_sender.send_message(
-                        patient_phone, 
-                        message, 
-                        f"reminder_{reminder_type}",
-                        appointment_id=appointment['id'],
-                        patient_id=appointment.get('patient_id')
-                    )
+                    # إرسال الرسالة الحقيقية عبر WhatsAppManager (مرة واحدة لكل موعد)
+                    result = send_reminder_once(
+                        self.db_manager, appointment, reminder_type,
+                        lambda: self.whatsapp_sender.send_message(
+                            patient_phone, 
+                            message, 
+                            f"reminder_{reminder_type}",
+                            appointment_id=appointment['id'],
+                            patient_id=appointment.get('patient_id')
+                        ))
+                    if isinstance(result, bool):
+                        self.add_log(f"ℹ️ تخطي الموعد {appointment['id']} - التذكير {reminder_type} محجوز أو مرسل")
+                        continue
                     
                     if result.get('success'):
                         sent_count += 1
@@ -456,35 +478,13 @@ class AutoSender(QObject):
             return []
 
     def create_quick_reminder_message(self, patient_name, appointment_time, minutes, reminder_type):
-        """إنشاء رسالة تذكير سريعة - النسخة المحسنة"""
-        if reminder_type == "quick_5min":
-            return f"""
-⏰ تذكير بالموعد - اختبار نظام AutoSender المتكامل
-
-عزيزي/عزيزتي {patient_name},
-
-هذا اختبار حقيقي لنظام التذكير التلقائي المتكامل.
-سيتم إرسال تذكير آخر قبل موعدك بدقيقة واحدة.
-
-موعدك: {appointment_time}
-الوقت المتبقي: 5 دقائق
-
-شكراً لتفهمك 🤝
-            """.strip()
-        else:  # quick_1min
-            return f"""
-🔔 تذكير فوري - اختبار نظام AutoSender المتكامل
-
-عزيزي/عزيزتي {patient_name},
-
-موعدك بعد دقيقة واحدة!
-هذا اختبار حقيقي لنظام التذكير التلقائي المتكامل.
-
-الوقت: {appointment_time}
-الحالة: جاهز للاستقبال
-
-نترقب زيارتكم 👨‍⚕️
-            """.strip()
+        """إنشاء رسالة تذكير سريعة - من قوالب الرسائل"""
+        template_type = "quick_5min" if reminder_type == "quick_5min" else "quick_1min"
+        return self.db_manager.render_message(1, template_type, {
+            'patient_name': patient_name,
+            'appointment_time': appointment_time,
+            'minutes': minutes
+        })
 
     def check_24h_reminders(self):
         """فحص تذكيرات 24 ساعة - الإصدار المتكامل"""
@@ -493,19 +493,18 @@ class AutoSender(QObject):
                 self.add_log("⚠️ نظام الواتساب غير متوفر لتذكيرات 24 ساعة")
                 return False
 
-            # حساب الوقت بعد 24 ساعة
-            target_date = (datetime.now() + timedelta(hours=24)).strftime('%Y-%m-%d')
-            
-            self.add_log(f"🔍 البحث عن مواعيد بعد 24 ساعة لتاريخ {target_date}")
-            
-            # الحصول على المواعيد بعد 24 ساعة
-            if hasattr(self.db_manager, 'get_appointments'):
-                appointments = self.db_manager.get_appointments(date=target_date)
+            # المواعيد التي استحق تذكيرها منذ آخر فحص
+            scan_time = datetime.now()
+            if hasattr(self.db_manager, 'get_due_reminders'):
+                appointments = self.db_manager.get_due_reminders('24h', scan_time)
             else:
-                self.add_log("❌ db_manager لا يدعم get_appointments")
+                self.add_log("❌ db_manager لا يدعم get_due_reminders")
                 return False
             
+            self.add_log(f"🔍 {len(appointments)} تذكير 24 ساعة مستحق")
+            
             sent_count = 0
+            failed_due_times = []
             total_appointments = len(appointments)
             
             for appointment in appointments:
@@ -514,10 +513,7 @@ class AutoSender(QObject):
                         patient_name = appointment.get('patient_name', 'مريض')
                         self.add_log(f"🔄 معالجة تذكير 24 ساعة للموعد {appointment['id']} - {patient_name}")
                         
-                        result = self.whatsapp_sender.send_appointment_reminder(
-                            appointment['id'], 
-                            "24h"
-                        )
+                        result = self.send_reminder(appointment, "24h")
                         
                         if result:
                             sent_count += 1
@@ -530,6 +526,7 @@ class AutoSender(QObject):
                             })
                         else:
                             self.add_log(f"❌ فشل إرسال تذكير 24 ساعة للموعد {appointment['id']}")
+                            failed_due_times.append(appointment['reminder_due_at'])
                             self.reminder_failed.emit({
                                 'patient_name': patient_name,
                                 'reminder_type': '24h',
@@ -540,6 +537,7 @@ class AutoSender(QObject):
                         self.add_log(f"ℹ️ تخطي الموعد {appointment['id']} - تم إرسال التذكير مسبقاً")
                 except Exception as e:
                     self.add_log(f"❌ خطأ في إرسال تذكير 24 ساعة: {e}")
+                    failed_due_times.append(appointment['reminder_due_at'])
                     self.reminder_failed.emit({
                         'patient_name': appointment.get('patient_name', 'مريض'),
                         'reminder_type': '24h',
@@ -547,6 +545,8 @@ class AutoSender(QObject):
                         'appointment_id': appointment.get('id')
                     })
             
+            self.db_manager.advance_reminder_watermark('24h', scan_time, failed_due_times)
+            
             if sent_count > 0:
                 self.add_log(f"📤 تم إرسال {sent_count} من أصل {total_appointments} تذكير 24 ساعة")
             else:
@@ -558,6 +558,19 @@ class AutoSender(QObject):
             self.add_log(f"❌ فشل في فحص تذكيرات 24 ساعة: {e}")
             return False
 
+    def send_reminder(self, appointment, reminder_type):
+        """إرسال تذكير: عبر صندوق الصادر إن كان الموزع يعمل، وإلا مباشرة"""
+        dispatcher = OutboxDispatcher.get_global_instance()
+        if dispatcher and dispatcher.is_running:
+            if not appointment.get('patient_phone'):
+                return False
+            return enqueue_reminder(self.db_manager, appointment, reminder_type)
+        
+        # حجز في سجل الإرسال أولاً: لا يُرسل التذكير مرتين من فحصين أو جهازين
+        return send_reminder_once(
+            self.db_manager, appointment, reminder_type,
+            lambda: self.whatsapp_sender.send_appointment_reminder(appointment['id'], reminder_type))
+
     def check_2h_reminders(self):
         """فحص تذكيرات ساعتين - الإصدار المتكامل"""
         try:
@@ -565,36 +578,28 @@ class AutoSender(QObject):
                 self.add_log("⚠️ نظام الواتساب غير متوفر لتذكيرات ساعتين")
                 return False
 
-            # حساب الوقت بعد ساعتين
-            target_time = datetime.now() + timedelta(hours=2)
-            target_date = target_time.strftime('%Y-%m-%d')
-            target_hour = target_time.strftime('%H:%M')
-            
-            self.add_log(f"🔍 البحث عن مواعيد بعد ساعتين للوقت {target_hour}")
-            
-            # الحصول على المواعيد بعد ساعتين
-            if hasattr(self.db_manager, 'get_appointments'):
-                appointments = self.db_manager.get_appointments(date=target_date)
+            # المواعيد التي استحق تذكيرها منذ آخر فحص
+            scan_time = datetime.now()
+            if hasattr(self.db_manager, 'get_due_reminders'):
+                appointments = self.db_manager.get_due_reminders('2h', scan_time)
             else:
-                self.add_log("❌ db_manager لا يدعم get_appointments")
+                self.add_log("❌ db_manager لا يدعم get_due_reminders")
                 return False
             
+            self.add_log(f"🔍 {len(appointments)} تذكير ساعتين مستحق")
+            
             sent_count = 0
+            failed_due_times = []
             matching_appointments = 0
             
             for appointment in appointments:
                 try:
-                    if (appointment.get('appointment_time') == target_hour and 
-                        not appointment.get('reminder_2h_sent')):
-                        
+                    if not appointment.get('reminder_2h_sent'):
                         matching_appointments += 1
                         patient_name = appointment.get('patient_name', 'مريض')
                         self.add_log(f"🔄 معالجة تذكير ساعتين للموعد {appointment['id']} - {patient_name}")
                         
-                        result = self.whatsapp_sender.send_appointment_reminder(
-                            appointment['id'], 
-                            "2h"
-                        )
+                        result = self.send_reminder(appointment, "2h")
                         
                         if result:
                             sent_count += 1
@@ -607,6 +612,7 @@ class AutoSender(QObject):
                             })
                         else:
                             self.add_log(f"❌ فشل إرسال تذكير ساعتين للموعد {appointment['id']}")
+                            failed_due_times.append(appointment['reminder_due_at'])
                             self.reminder_failed.emit({
                                 'patient_name': patient_name,
                                 'reminder_type': '2h',
@@ -614,10 +620,10 @@ class AutoSender(QObject):
                                 'appointment_id': appointment['id']
                             })
                     else:
-                        if appointment.get('appointment_time') == target_hour:
-                            self.add_log(f"ℹ️ تخطي الموعد {appointment['id']} - تم إرسال التذكير مسبقاً")
+                        self.add_log(f"ℹ️ تخطي الموعد {appointment['id']} - تم إرسال التذكير مسبقاً")
                 except Exception as e:
                     self.add_log(f"❌ خطأ في إرسال تذكير ساعتين: {e}")
+                    failed_due_times.append(appointment['reminder_due_at'])
                     self.reminder_failed.emit({
                         'patient_name': appointment.get('patient_name', 'مريض'),
                         'reminder_type': '2h',
@@ -625,6 +631,8 @@ class AutoSender(QObject):
                         'appointment_id': appointment.get('id')
                     })
             
+            self.db_manager.advance_reminder_watermark('2h', scan_time, failed_due_times)
+            
             if sent_count > 0:
                 self.add_log(f"📤 تم إرسال {sent_count} من أصل {matching_appointments} تذكير ساعتين")
             else:
@@ -8,6 +8,9 @@ from PyQt5.QtWidgets import QSystemTrayIcon, QMenu, QAction, QApplication, QMess
 from PyQt5.QtGui import QIcon, QPixmap
 from PyQt5.QtCore import QTimer, QObject, pyqtSignal, Qt
 
+from notifications.reminder_scheduler import ReminderScheduler
+from notifications.notification_aggregator import NotificationAggregator
+
 class UnifiedNotificationSystem(QObject):
     """نظام الإشعارات الموحد - يدمج الإشعارات الداخلية والخارجية - الإصدار المصحح بالكامل"""
     
@@ -26,13 +29,18 @@ class UnifiedNotificationSystem(QObject):
         self.email_sender = None
         self.whatsapp_manager = None
         
+        # مجمّع الإشعارات: ملخص واحد بدل فقاعة لكل حدث
+        self.notification_aggregator = NotificationAggregator(parent=self)
+        NotificationAggregator.set_global_instance(self.notification_aggregator)
+        
         # إعداد النظام
         self.setup_auto_sender()  # ⭐⭐ تهيئة AutoSender أولاً ⭐⭐
         self.setup_tray_icon()
         self.setup_timers()
         
         # ربط الإشارات
-        self.internal_notification.connect(self.show_desktop_notification)
+        self.internal_notification.connect(self.post_general_notification)
+        self.notification_aggregator.digest_ready.connect(self.show_desktop_notification)
         
         logging.info("✅ تم تهيئة نظام الإشعارات الموحد بنجاح")
     
@@ -55,6 +63,8 @@ class UnifiedNotificationSystem(QObject):
             
             # تهيئة AutoSender
             self.auto_sender = AutoSender(self.db_manager, self.settings_manager)
+            self.auto_sender.reminder_sent.connect(self.on_reminder_sent)
+            self.auto_sender.reminder_failed.connect(self.on_reminder_failed)
             
             # ⭐⭐ ربط WhatsApp Manager إذا كان متوفراً ⭐⭐
             if hasattr(self, 'whatsapp_manager') and self.whatsapp_manager:
@@ -111,6 +121,10 @@ class UnifiedNotificationSystem(QObject):
                 test_notif_action.triggered.connect(self.test_notification)
                 notification_menu.addAction(test_notif_action)
                 
+                history_action = QAction("آخر الإشعارات", self)
+                history_action.triggered.connect(self.show_notification_history)
+                notification_menu.addAction(history_action)
+                
                 # ⭐⭐ إضافة اختبار الإرسال التلقائي ⭐⭐
                 test_auto_send_action = QAction("اختبار الإرسال التلقائي", self)
                 test_auto_send_action.triggered.connect(self.test_auto_send_system)
@@ -137,10 +151,12 @@ class UnifiedNotificationSystem(QObject):
     
     def setup_timers(self):
         """إعداد المؤقتات للفحص الدوري"""
-        # فحص التذكيرات كل دقيقة
-        self.reminder_timer = QTimer()
-        self.reminder_timer.timeout.connect(self.check_reminders)
-        self.reminder_timer.start(60000)  # كل دقيقة
+        # مُنبّه التذكيرات الموحد: يستيقظ عند استحقاق التذكير التالي بدل الفحص كل دقيقة
+        self.reminder_scheduler = ReminderScheduler(
+            self.db_manager, dispatch=self.dispatch_reminders,
+            is_enabled=self.is_reminder_enabled, parent=self)
+        ReminderScheduler.set_global_instance(self.reminder_scheduler)
+        self.reminder_scheduler.start()
         
         # فحص الإشعارات المجدولة كل 5 دقائق
         self.scheduled_timer = QTimer()
@@ -175,31 +191,33 @@ class UnifiedNotificationSystem(QObject):
         except Exception as e:
             logging.error(f"❌ خطأ في فحص اتصال النظام: {e}")
     
+    def is_reminder_enabled(self, reminder_type):
+        """هل نوع التذكير مفعل في إعدادات النظام"""
+        settings = self.settings_manager.get_system_settings()
+        return bool(self.auto_sender) and settings.get(f'reminder_{reminder_type}_enabled') == '1'
+    
+    def dispatch_reminders(self, reminder_type):
+        """إرسال تذكيرات النوع المستحقة - يستدعيها مُنبّه التذكيرات"""
+        try:
+            if reminder_type == '24h':
+                self.auto_sender.send_24h_reminders()
+            else:
+                self.auto_sender.send_2h_reminders()
+            logging.info(f"✅ تم فحص تذكيرات {reminder_type}")
+        except Exception as e:
+            logging.error(f"❌ خطأ في إرسال تذكيرات {reminder_type}: {e}")
+    
     def check_reminders(self):
-        """فحص التذكيرات الدورية - الإصدار المصحح"""
+        """فحص التذكيرات يدوياً - الإصدار المصحح"""
         try:
             if not self.auto_sender:
                 logging.warning("⚠️ AutoSender غير متوفر لفحص التذكيرات")
                 return
             
-            # الحصول على الإعدادات
-            settings = self.settings_manager.get_system_settings()
-            
-            # فحص تذكيرات 24 ساعة إذا كانت مفعلة
-            if settings.get('reminder_24h_enabled') == '1':
-                try:
-                    self.auto_sender.send_24h_reminders()
-                    logging.info("✅ تم فحص تذكيرات 24 ساعة")
-                except Exception as e:
-                    logging.error(f"❌ خطأ في إرسال تذكيرات 24 ساعة: {e}")
-            
-            # فحص تذكيرات ساعتين إذا كانت مفعلة
-            if settings.get('reminder_2h_enabled') == '1':
-                try:
-                    self.auto_sender.send_2h_reminders()
-                    logging.info("✅ تم فحص تذكيرات ساعتين")
-                except Exception as e:
-                    logging.error(f"❌ خطأ في إرسال تذكيرات ساعتين: {e}")
+            # فحص كل نوع تذكير مفعل
+            for reminder_type in self.db_manager.REMINDER_LEADS:
+                if self.is_reminder_enabled(reminder_type):
+                    self.dispatch_reminders(reminder_type)
             
             # ⭐⭐ فحص التذكيرات الفورية للاختبار ⭐⭐
             if hasattr(self.auto_sender, 'test_mode') and self.auto_sender.test_mode:
@@ -226,6 +244,22 @@ class UnifiedNotificationSystem(QObject):
         except Exception as e:
             logging.error(f"❌ خطأ في فحص الإشعارات المجدولة: {e}")
     
+    def post_notification(self, category, title, message):
+        """إضافة إشعار داخلي لمجمّع الإشعارات (يُعرض ضمن ملخص)"""
+        self.notification_aggregator.add(category, title, message)
+    
+    def post_general_notification(self, title, message):
+        self.post_notification('general', title, message)
+    
+    def show_notification_history(self):
+        """عرض آخر الإشعارات المحفوظة في الذاكرة"""
+        try:
+            events = self.notification_aggregator.get_recent(20)
+            lines = [f"{event['time'].strftime('%H:%M:%S')} {event['title']} - {event['message']}" for event in events]
+            QMessageBox.information(None, "آخر الإشعارات", '\n'.join(lines) or "لا توجد إشعارات")
+        except Exception as e:
+            logging.error(f"❌ فشل في عرض سجل الإشعارات: {e}")
+    
     def show_desktop_notification(self, title, message):
         """عرض إشعار سطح المكتب (داخلي)"""
         try:
@@ -265,29 +299,44 @@ class UnifiedNotificationSystem(QObject):
         """إشعار بموعد جديد (داخلي)"""
         title = "📅 موعد جديد"
         message = f"تم حجز موعد للمريض {patient_name} الساعة {appointment_time}"
-        self.internal_notification.emit(title, message)
+        self.post_notification('new_appointment', title, message)
     
     def notify_reminder_sent(self, patient_name, channel, reminder_type="تذكير"):
         """إشعار بإرسال تذكير (داخلي) - محدث"""
         title = "🔔 تم إرسال التذكير"
         message = f"تم إرسال {reminder_type} للمريض {patient_name} عبر {channel}"
-        self.internal_notification.emit(title, message)
+        self.post_notification('reminder_sent', title, message)
         
         # ⭐⭐ تسجيل في سجل النظام ⭐⭐
         logging.info(f"✅ {reminder_type} مرسل: {patient_name} عبر {channel}")
     
+    def notify_reminder_failed(self, patient_name, reminder_type="تذكير", error=""):
+        """إشعار بفشل إرسال تذكير (داخلي)"""
+        title = "❌ فشل إرسال التذكير"
+        message = f"فشل إرسال {reminder_type} للمريض {patient_name}: {error}"
+        self.post_notification('reminder_failed', title, message)
+    
+    def on_reminder_sent(self, data):
+        """تذكير مرسل من AutoSender"""
+        self.notify_reminder_sent(data.get('patient_name', 'مريض'), "واتساب", data.get('reminder_type', "تذكير"))
+    
+    def on_reminder_failed(self, data):
+        """تذكير فاشل من AutoSender"""
+        self.notify_reminder_failed(data.get('patient_name', 'مريض'), data.get('reminder_type', "تذكير"),
+                                    data.get('error', ''))
+    
     def notify_auto_send_status(self, status, details):
         """إشعار بحالة الإرسال التلقائي - جديد"""
         title = "🔄 حالة الإرسال التلقائي"
         message = f"{status}: {details}"
-        self.internal_notification.emit(title, message)
+        self.post_notification('auto_send', title, message)
         logging.info(f"🔄 الإرسال التلقائي - {status}: {details}")
     
     def notify_new_patient(self, patient_name):
         """إشعار بمريض جديد (داخلي)"""
         title = "👤 مريض جديد"
         message = f"تم إضافة المريض {patient_name} إلى النظام"
-        self.internal_notification.emit(title, message)
+        self.post_notification('new_patient', title, message)
     
     def notify_settings_saved(self):
         """إشعار بحفظ الإعدادات (داخلي)"""
@@ -299,7 +348,7 @@ class UnifiedNotificationSystem(QObject):
         """إشعار بخطأ (داخلي)"""
         title = "❌ خطأ في النظام"
         message = error_message
-        self.internal_notification.emit(title, message)
+        self.post_notification('error', title, message)
     
     def notify_backup_created(self, backup_path):
         """إشعار بنسخة احتياطية (داخلي)"""
@@ -386,8 +435,17 @@ class UnifiedNotificationSystem(QObject):
     def quit_application(self):
         """إغلاق التطبيق"""
         try:
-            # إيقاف جميع المؤقتات
-            timers = ['reminder_timer', 'scheduled_timer', 'connection_timer']
+            # إيقاف مُنبّه التذكيرات وجميع المؤقتات
+            if getattr(self, 'reminder_scheduler', None):
+                self.reminder_scheduler.stop()
+                ReminderScheduler.set_global_instance(None)
+            
+            # عرض ما تبقى من إشعارات قبل الإغلاق
+            self.notification_aggregator.timer.stop()
+            self.notification_aggregator.flush()
+            NotificationAggregator.set_global_instance(None)
+            
+            timers = ['scheduled_timer', 'connection_timer']
             for timer_name in timers:
                 timer = getattr(self, timer_name, None)
                 if timer and timer.isActive():
@@ -0,0 +1,362 @@
+# notifications/mock_provider.py
+"""
+مزود رسائل وهمي محلي لاختبار معدل الإرسال والدفعات دون شبكة
+
+    python -m notifications.mock_provider --provider smartwats --messages 300
+
+الخادم يطبق حد معدل خاص به لكل رقم مرسل ويرد 429 عند تجاوزه، فيظهر إن كان
+محدد المعدل في البرنامج يحمي من الحظر.
+
+    python -m notifications.mock_provider --email --messages 2000
+
+يشغل خادم SMTP وهمياً ويقيس الإرسال عبر مجموعة جلسات SMTP.
+    
+    python -m notifications.mock_provider --receipts http://127.0.0.1:8787 --messages 5000
+
+يرسل إيصالات تسليم وقراءة وهمية لمستقبل الإيصالات ويقيس معدل قبولها.
+"""
+import argparse
+import json
+import logging
+import random
+import socketserver
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from email.mime.text import MIMEText
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib import request, error
+
+from .rate_limiter import TokenBucket, ProviderRateLimiter
+from .smtp_pool import SMTPConnectionPool
+
+class MockProviderServer(ThreadingHTTPServer):
+    """خادم HTTP محلي: POST /send و POST /send_batch و GET /stats"""
+
+    daemon_threads = True
+
+    def __init__(self, address, burst=20, per_minute=300, latency=0.02, failure_rate=0.0,
+                 receipt_url=None, receipt_interval=0.5):
+        super().__init__(address, MockProviderHandler)
+        self.burst = burst
+        self.per_minute = per_minute
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.buckets = {}
+        self.lock = threading.Lock()
+        self.stats = {'accepted': 0, 'throttled': 0, 'failed': 0, 'batches': 0, 'receipts': 0}
+        self.accepted_times = []
+
+        # إيصالات التسليم والقراءة لكل رسالة مقبولة تُرسل دفعات لعنوان المستقبل
+        self.receipt_url = receipt_url
+        self.receipt_interval = receipt_interval
+        self.pending_receipts = []
+        if receipt_url:
+            threading.Thread(target=self._send_receipts, name='mock-receipts', daemon=True).start()
+    
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def accept(self, sender):
+        """قبول رسالة واحدة أو رفضها بسبب المعدل/خطأ عشوائي - (الحالة، التفاصيل)"""
+        with self.lock:
+            bucket = self.buckets.get(sender)
+            if bucket is None:
+                bucket = self.buckets[sender] = TokenBucket(self.burst, self.per_minute / 60.0)
+
+        if not bucket.try_acquire():
+            with self.lock:
+                self.stats['throttled'] += 1
+            return 429, {'error': 'rate_limited', 'retry_after': round(1 / bucket.refill_per_second, 2)}
+
+        if self.failure_rate and random.random() < self.failure_rate:
+            with self.lock:
+                self.stats['failed'] += 1
+            return 503, {'error': 'temporarily_unavailable'}
+
+        message_id = uuid.uuid4().hex
+        with self.lock:
+            self.stats['accepted'] += 1
+            self.accepted_times.append(time.monotonic())
+            if self.receipt_url:
+                self.pending_receipts.append(message_id)
+        return 200, {'id': message_id}
+    
+    def _send_receipts(self):
+        """إرسال إيصالات "مُسلَّمة" ثم "مقروءة" للرسائل المقبولة كل receipt_interval"""
+        while True:
+            time.sleep(self.receipt_interval)
+            with self.lock:
+                message_ids, self.pending_receipts = self.pending_receipts, []
+            if not message_ids:
+                continue
+            receipts = ([{'id': message_id, 'status': 'delivered'} for message_id in message_ids] +
+                        [{'id': message_id, 'status': 'read'} for message_id in message_ids])
+            try:
+                _post(self.receipt_url, {'receipts': receipts}, 10)
+                with self.lock:
+                    self.stats['receipts'] += len(receipts)
+            except Exception as e:
+                logging.warning(f"⚠️ تعذر إرسال الإيصالات الوهمية: {e}")
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.stats)
+            times = list(self.accepted_times)
+        if len(times) > 1 and times[-1] > times[0]:
+            stats['accepted_per_minute'] = round((len(times) - 1) / (times[-1] - times[0]) * 60, 1)
+        return stats
+
+class MockProviderHandler(BaseHTTPRequestHandler):
+
+    def _reply(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/stats':
+            self._reply(200, self.server.get_stats())
+        else:
+            self._reply(404, {'error': 'not_found'})
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        data = json.loads(self.rfile.read(length) or b'{}')
+        time.sleep(self.server.latency)
+
+        if self.path == '/send':
+            status, payload = self.server.accept(data.get('sender', ''))
+            self._reply(status, payload)
+        elif self.path == '/send_batch':
+            with self.server.lock:
+                self.server.stats['batches'] += 1
+            results = []
+            for _ in data.get('messages', []):
+                status, payload = self.server.accept(data.get('sender', ''))
+                results.append(dict(payload, status=status))
+            self._reply(200, {'results': results})
+        else:
+            self._reply(404, {'error': 'not_found'})
+
+    def log_message(self, format, *args):
+        pass
+
+def start_mock_provider(host='127.0.0.1', port=0, **options):
+    """تشغيل الخادم الوهمي في خيط خلفي - يُرجع الخادم (server.url و server.shutdown())"""
+    server = MockProviderServer((host, port), **options)
+    threading.Thread(target=server.serve_forever, name='mock-provider', daemon=True).start()
+    logging.info(f"🧪 المزود الوهمي يعمل على {server.url}")
+    return server
+
+def _post(url, payload, timeout):
+    data = json.dumps(payload).encode('utf-8')
+    req = request.Request(url, data=data, headers={'Content-Type': 'application/json'})
+    try:
+        with request.urlopen(req, timeout=timeout) as response:
+            return response.status, json.loads(response.read())
+    except error.HTTPError as e:
+        return e.code, json.loads(e.read() or b'{}')
+
+def _to_result(status, payload):
+    if status == 200:
+        return {'success': True, 'provider_message_id': payload.get('id')}
+    if status == 429:
+        return {'success': False, 'throttled': True, 'retry_after': payload.get('retry_after'),
+                'message': 'تجاوز حد المعدل لدى المزود'}
+    return {'success': False, 'retryable': status >= 500, 'message': payload.get('error', f'HTTP {status}')}
+
+def http_provider_sender(base_url, sender_number='', timeout=10):
+    """مزود إرسال لموزع الصادر فوق واجهة HTTP بنمط المزود الوهمي (مع دعم الدفعات)"""
+    def send(message):
+        try:
+            status, payload = _post(f"{base_url}/send", {
+                'sender': sender_number, 'to': message['recipient'], 'message': message['message']
+            }, timeout)
+            return _to_result(status, payload)
+        except Exception as e:
+            return {'success': False, 'message': str(e)}
+
+    def send_batch(messages):
+        try:
+            status, payload = _post(f"{base_url}/send_batch", {
+                'sender': sender_number,
+                'messages': [{'to': message['recipient'], 'message': message['message']} for message in messages]
+            }, timeout)
+            if status != 200:
+                return [_to_result(status, payload)] * len(messages)
+            return [_to_result(item.get('status', 200), item) for item in payload['results']]
+        except Exception as e:
+            return [{'success': False, 'message': str(e)}] * len(messages)
+
+    send.send_batch = send_batch
+    return send
+
+def run_receipt_benchmark(receipt_url, receipts=5000, workers=8, batch_size=50):
+    """قياس قبول الإيصالات: نداءات متزامنة بدفعات إلى مستقبل الإيصالات"""
+    message_ids = [uuid.uuid4().hex for _ in range(receipts)]
+    chunks = [message_ids[start:start + batch_size] for start in range(0, receipts, batch_size)]
+    
+    def deliver(chunk):
+        status, payload = _post(receipt_url, {'receipts': [
+            {'id': message_id, 'status': random.choice(('delivered', 'read'))} for message_id in chunk]}, 10)
+        return payload.get('accepted', 0) if status == 200 else 0
+    
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        accepted = sum(pool.map(deliver, chunks))
+    elapsed = time.monotonic() - started
+    return {'receipts': receipts, 'accepted': accepted, 'elapsed_seconds': round(elapsed, 2),
+            'per_minute': round(accepted / elapsed * 60) if elapsed else None}
+
+def run_benchmark(provider='smartwats', messages=300, workers=4, use_limiter=True):
+    """قياس الإنتاجية: إرسال رسائل وهمية عبر محدد المعدل إلى مزود بنفس الحدود"""
+    limiter = ProviderRateLimiter()
+    limits = limiter.limits_for(provider)
+    server = start_mock_provider(burst=limits['burst'], per_minute=limits['per_minute'])
+    sender = http_provider_sender(server.url, sender_number='966500000000')
+    batch_size = limiter.batch_size(provider)
+
+    outgoing = [{'recipient': f'9665{index:08d}', 'message': 'test'} for index in range(messages)]
+    chunks = [outgoing[start:start + batch_size] for start in range(0, messages, batch_size)]
+
+    def deliver(chunk):
+        if use_limiter:
+            time.sleep(limiter.reserve(provider, '966500000000', len(chunk)))
+        results = sender.send_batch(chunk) if len(chunk) > 1 else [sender(chunk[0])]
+        return sum(1 for result in results if result.get('success'))
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        delivered = sum(pool.map(deliver, chunks))
+    elapsed = time.monotonic() - started
+
+    stats = server.get_stats()
+    server.shutdown()
+    return dict(stats, provider=provider, delivered=delivered, elapsed_seconds=round(elapsed, 2))
+
+class MockSMTPServer(socketserver.ThreadingTCPServer):
+    """خادم SMTP محلي بسيط (بديل aiosmtpd) يقبل أي دخول ويحسب الجلسات والرسائل
+
+    drop_after يغلق الجلسة بعد عدد من الرسائل لاختبار إعادة الاتصال.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, latency=0.005, drop_after=0):
+        super().__init__(address, MockSMTPHandler)
+        self.latency = latency
+        self.drop_after = drop_after
+        self.lock = threading.Lock()
+        self.stats = {'sessions': 0, 'messages': 0, 'noops': 0, 'dropped': 0}
+
+    def count(self, key):
+        with self.lock:
+            self.stats[key] += 1
+
+    def get_stats(self):
+        with self.lock:
+            return dict(self.stats)
+
+class MockSMTPHandler(socketserver.StreamRequestHandler):
+
+    def _reply(self, *lines):
+        self.wfile.write(''.join(f"{line}\r\n" for line in lines).encode('ascii'))
+
+    def handle(self):
+        server = self.server
+        server.count('sessions')
+        self._reply('220 mock-smtp ready')
+        in_data, session_messages = False, 0
+
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+
+            if in_data:
+                if line.rstrip(b'\r\n') == b'.':
+                    in_data = False
+                    time.sleep(server.latency)
+                    server.count('messages')
+                    session_messages += 1
+                    self._reply('250 OK queued')
+                    if server.drop_after and session_messages >= server.drop_after:
+                        server.count('dropped')
+                        return
+                continue
+
+            verb = line.decode('utf-8', 'replace').strip().split(' ', 1)[0].upper()
+            if verb == 'EHLO':
+                self._reply('250-mock-smtp', '250-PIPELINING', '250-8BITMIME', '250 AUTH PLAIN LOGIN')
+            elif verb == 'AUTH':
+                self._reply('235 Authentication successful')
+            elif verb == 'NOOP':
+                server.count('noops')
+                self._reply('250 OK')
+            elif verb in ('HELO', 'MAIL', 'RCPT', 'RSET'):
+                self._reply('250 OK')
+            elif verb == 'DATA':
+                in_data = True
+                self._reply('354 End data with <CR><LF>.<CR><LF>')
+            elif verb == 'QUIT':
+                self._reply('221 Bye')
+                return
+            else:
+                self._reply('502 Command not implemented')
+
+def start_mock_smtp(host='127.0.0.1', port=0, **options):
+    """تشغيل خادم SMTP الوهمي في خيط خلفي - يُرجع الخادم"""
+    server = MockSMTPServer((host, port), **options)
+    threading.Thread(target=server.serve_forever, name='mock-smtp', daemon=True).start()
+    logging.info(f"🧪 خادم SMTP الوهمي يعمل على {server.server_address[0]}:{server.server_address[1]}")
+    return server
+
+def run_email_benchmark(messages=2000, pool_size=4, latency=0.005, drop_after=0):
+    """قياس إرسال الإيميلات عبر مجموعة جلسات SMTP إلى الخادم الوهمي"""
+    server = start_mock_smtp(latency=latency, drop_after=drop_after)
+    host, port = server.server_address[:2]
+    pool = SMTPConnectionPool({'smtp_server': host, 'smtp_port': port, 'username': 'clinic',
+                               'password': 'secret', 'use_tls': False}, size=pool_size)
+
+    outgoing = []
+    for index in range(messages):
+        message = MIMEText(f"<p>تذكير بموعدك رقم {index}</p>", 'html', 'utf-8')
+        message['From'] = 'clinic@example.com'
+        message['To'] = f"patient{index}@example.com"
+        message['Subject'] = 'تذكير بموعدك'
+        outgoing.append(message)
+
+    started = time.monotonic()
+    results = pool.send_many(outgoing)
+    elapsed = time.monotonic() - started
+
+    pool.close()
+    server.shutdown()
+    server.server_close()
+    return dict(server.get_stats(), pool=pool.stats, delivered=sum(1 for result in results if result['success']),
+                elapsed_seconds=round(elapsed, 2))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="قياس معدل الإرسال عبر المزود الوهمي")
+    parser.add_argument('--provider', default='smartwats')
+    parser.add_argument('--messages', type=int, default=300)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--no-limiter', action='store_true')
+    parser.add_argument('--email', action='store_true', help="قياس الإيميل عبر خادم SMTP الوهمي")
+    parser.add_argument('--receipts', metavar='URL', help="قياس قبول الإيصالات عبر مستقبل يعمل على URL")
+    args = parser.parse_args()
+    if args.receipts:
+        result = run_receipt_benchmark(args.receipts, args.messages, args.workers)
+    elif args.email:
+        result = run_email_benchmark(args.messages, args.workers)
+    else:
+        result = run_benchmark(args.provider, args.messages, args.workers, not args.no_limiter)
+    print(json.dumps(result, ensure_ascii=False, indent=2))
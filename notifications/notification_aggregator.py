@@ -0,0 +1,135 @@
+# notifications/notification_aggregator.py
+import logging
+from collections import deque
+from datetime import datetime
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal
+
+# مجموعات الملخص: الفئة -> (المجموعة، وصف العدد في الملخص)
+DIGEST_CATEGORIES = {
+    'reminder_sent': ('reminders', 'تذكير مرسل'),
+    'reminder_failed': ('reminders', 'تذكير فاشل'),
+    'new_appointment': ('appointments', 'موعد جديد'),
+    'new_patient': ('patients', 'مريض جديد'),
+    'auto_send': ('auto_send', 'تحديث للإرسال التلقائي'),
+    'error': ('errors', 'خطأ'),
+}
+
+DIGEST_TITLES = {
+    'reminders': '🔔 التذكيرات',
+    'appointments': '📅 المواعيد',
+    'patients': '👤 المرضى',
+    'auto_send': '🔄 الإرسال التلقائي',
+    'errors': '❌ أخطاء النظام',
+    'general': '📢 إشعارات',
+}
+
+class NotificationAggregator(QObject):
+    """مجمّع إشعارات سطح المكتب - ملخص واحد بدل فقاعة لكل حدث
+
+    الأحداث تُجمع خلال نافذة قصيرة (window_seconds) ثم تُعرض فقاعة واحدة
+    تلخصها حسب المجموعة ("120 تذكير مرسل، 3 تذكير فاشل")، ولا تُعرض فقاعتان
+    بفاصل أقل من min_interval_seconds. الحدث المنفرد يُعرض بنصه كما هو.
+    تفاصيل كل الأحداث تبقى في ذاكرة دائرية (history_size) تتصفحها الواجهة
+    عبر get_recent.
+    """
+
+    digest_ready = pyqtSignal(str, str)
+
+    # إشارة داخلية لنقل الأحداث من أي خيط إلى خيط المجمّع
+    _incoming = pyqtSignal(str, str, str)
+
+    _global_instance = None
+
+    def __init__(self, window_seconds=3, min_interval_seconds=10, history_size=500, parent=None):
+        super().__init__(parent)
+        self.window_ms = int(window_seconds * 1000)
+        self.min_interval_ms = int(min_interval_seconds * 1000)
+        self.history = deque(maxlen=history_size)
+
+        self._pending = []
+        self._last_shown = None
+        self.stats = {'received': 0, 'shown': 0}
+
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self.flush)
+        self._incoming.connect(self._on_incoming)
+
+    @classmethod
+    def get_global_instance(cls):
+        return cls._global_instance
+
+    @classmethod
+    def set_global_instance(cls, instance):
+        cls._global_instance = instance
+
+    def add(self, category, title, message):
+        """إضافة حدث - آمنة من أي خيط"""
+        self._incoming.emit(category, title, message)
+
+    def _on_incoming(self, category, title, message):
+        event = {'time': datetime.now(), 'category': category, 'title': title, 'message': message}
+        self.history.append(event)
+        self._pending.append(event)
+        self.stats['received'] += 1
+        if not self.timer.isActive():
+            self.timer.start(self._delay_ms())
+
+    def _delay_ms(self):
+        """نهاية النافذة الحالية، أو ما تبقى من الحد الأدنى بين فقاعتين إن كان أبعد"""
+        if self._last_shown is None:
+            return self.window_ms
+        elapsed = int((datetime.now() - self._last_shown).total_seconds() * 1000)
+        return max(self.window_ms, self.min_interval_ms - elapsed)
+
+    def flush(self):
+        """عرض ملخص الأحداث المنتظرة في فقاعة واحدة"""
+        try:
+            if not self._pending:
+                return
+            events, self._pending = self._pending, []
+            title, message = self.build_digest(events)
+            self._last_shown = datetime.now()
+            self.stats['shown'] += 1
+            self.digest_ready.emit(title, message)
+
+        except Exception as e:
+            logging.error(f"❌ خطأ في عرض ملخص الإشعارات: {e}")
+
+    def build_digest(self, events):
+        """عنوان ونص الفقاعة لمجموعة أحداث"""
+        if len(events) == 1:
+            return events[0]['title'], events[0]['message']
+
+        # عدد الأحداث لكل (مجموعة، وصف) مع الحفاظ على ترتيب الظهور؛
+        # الفئات غير المعرّفة تُعد بعنوان الحدث
+        groups = {}
+        for event in events:
+            group, label = DIGEST_CATEGORIES.get(event['category'], ('general', None))
+            counts = groups.setdefault(group, {})
+            key = (label, True) if label else (event['title'], False)
+            counts[key] = counts.get(key, 0) + 1
+
+        lines = [
+            '، '.join(f"{count} {text}" if counted else (f"{text} ({count})" if count > 1 else text)
+                     for (text, counted), count in counts.items())
+            for counts in groups.values()
+        ]
+        if len(groups) == 1:
+            return DIGEST_TITLES[next(iter(groups))], lines[0]
+        return DIGEST_TITLES['general'], '\n'.join(
+            f"{DIGEST_TITLES[group]}: {line}" for group, line in zip(groups, lines))
+
+    def get_recent(self, limit=None, category=None):
+        """آخر الأحداث (الأحدث أولاً) من الذاكرة الدائرية"""
+        events = [event for event in reversed(self.history)
+                  if category is None or event['category'] == category]
+        return events[:limit] if limit else events
+
+    def clear_history(self):
+        self.history.clear()
+
+    def get_status(self):
+        """حالة المجمّع وعدد الأحداث المنتظرة"""
+        return dict(self.stats, pending=len(self._pending), history=len(self.history),
+                    last_shown=self._last_shown)
@@ -0,0 +1,259 @@
+# notifications/outbox_dispatcher.py
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal
+
+from .rate_limiter import ProviderRateLimiter
+
+class OutboxDispatcher(QObject):
+    """موزع الرسائل الصادرة - يفرغ جدول outbox بمجموعة عمال في الخلفية
+
+    الخيط الرئيسي يحجز دفعات الرسائل المستحقة ويوزعها على العمال؛ كل عامل يرسل
+    عبر المزود المسجل للقناة ويسجل النتيجة باتصال قاعدة بيانات خاص به.
+    المزود دالة تستقبل صف الرسالة وتُرجع {'success': bool, 'message': str,
+    'retryable': bool, 'provider_message_id': str} أو قيمة منطقية. إن كانت له
+    دالة send_batch(messages) -> [result, ...] تُرسل الرسائل دفعات حسب حد المزود.
+
+    معدل الإرسال محدود بدلو رموز لكل (مزود، رقم مرسل)؛ الرسالة التي يطول انتظارها
+    عن max_throttle_wait تعود للصادر دون احتساب محاولة.
+    """
+
+    message_sent = pyqtSignal(dict)
+    message_failed = pyqtSignal(dict)   # فشل مع إعادة محاولة لاحقاً
+    message_dead = pyqtSignal(dict)     # فشل نهائي
+
+    # إشارة داخلية لإعادة نتيجة العامل إلى الخيط الرئيسي
+    _job_finished = pyqtSignal(dict, str)
+
+    _global_instance = None
+
+    def __init__(self, db_manager, workers=4, poll_seconds=5, rate_limiter=None,
+                 max_throttle_wait=10, parent=None):
+        super().__init__(parent)
+        self.db_manager = db_manager
+        self.workers = workers
+        self.poll_seconds = poll_seconds
+        self.rate_limiter = rate_limiter or ProviderRateLimiter()
+        self.max_throttle_wait = max_throttle_wait
+        self.senders = {}
+        self._provider_cache = {}
+        self.executor = None
+        self.in_flight = 0
+        self.is_running = False
+
+        self._local = threading.local()
+        self._worker_dbs = []
+        self._worker_dbs_lock = threading.Lock()
+
+        self.poll_timer = QTimer(self)
+        self.poll_timer.timeout.connect(self.drain)
+        self._job_finished.connect(self.on_job_finished)
+
+    @classmethod
+    def get_global_instance(cls):
+        return cls._global_instance
+
+    @classmethod
+    def set_global_instance(cls, instance):
+        cls._global_instance = instance
+
+    def register_sender(self, channel, sender):
+        """تسجيل مزود إرسال لقناة (whatsapp / email)"""
+        self.senders[channel] = sender
+        logging.info(f"✅ تم تسجيل مزود الإرسال للقناة {channel}")
+
+    def start(self):
+        """بدء الموزع واستعادة الرسائل العالقة من الجلسة السابقة"""
+        try:
+            if self.is_running:
+                return True
+
+            self.db_manager.recover_stale_outbox(stale_minutes=0)
+            self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='outbox')
+            self.poll_timer.start(self.poll_seconds * 1000)
+            self.is_running = True
+
+            logging.info(f"✅ بدء موزع الرسائل الصادرة ({self.workers} عمال)")
+            self.drain()
+            return True
+
+        except Exception as e:
+            logging.error(f"❌ فشل بدء موزع الرسائل: {e}")
+            return False
+
+    def stop(self):
+        """إيقاف الموزع - الرسائل غير المرسلة تبقى في الصادر للجلسة القادمة"""
+        self.poll_timer.stop()
+        self.is_running = False
+        if self.executor:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+
+        with self._worker_dbs_lock:
+            for worker_db in self._worker_dbs:
+                worker_db.close()
+            self._worker_dbs = []
+
+        logging.info("⏹️ إيقاف موزع الرسائل الصادرة")
+
+    def drain(self):
+        """حجز الرسائل المستحقة بقدر المقاعد الشاغرة لدى العمال"""
+        try:
+            if not self.is_running:
+                return
+
+            # دفعتان لكل عامل حتى لا يتوقف العمال بين الدفعات
+            free_slots = self.workers * 2 * self._max_batch_size() - self.in_flight
+            if free_slots <= 0:
+                return
+
+            groups = {}
+            for message in self.db_manager.claim_outbox_batch(free_slots):
+                provider, sender_key = self._provider_for(message)
+                message['provider'], message['sender_key'] = provider, sender_key
+                groups.setdefault((message['channel'], provider, sender_key), []).append(message)
+
+            for (channel, provider, sender_key), messages in groups.items():
+                sender = self.senders.get(channel)
+                batch_size = self.rate_limiter.batch_size(provider) if hasattr(sender, 'send_batch') else 1
+                for start in range(0, len(messages), batch_size):
+                    chunk = messages[start:start + batch_size]
+                    self.in_flight += len(chunk)
+                    self.executor.submit(self._process, chunk)
+
+        except Exception as e:
+            logging.error(f"❌ خطأ في توزيع الرسائل الصادرة: {e}")
+
+    def _provider_for(self, message):
+        """مفتاح تحديد المعدل للرسالة: (نوع المزود، رقم المرسل) من إعدادات العيادة"""
+        if message['channel'] != 'whatsapp':
+            return message['channel'], str(message.get('clinic_id') or '')
+
+        clinic_id = message.get('clinic_id') or 1
+        if clinic_id not in self._provider_cache:
+            settings = self.db_manager.get_whatsapp_settings(clinic_id) or {}
+            self._provider_cache[clinic_id] = (settings.get('provider_type') or 'whatsapp_web',
+                                               settings.get('phone_number') or '')
+        return self._provider_cache[clinic_id]
+
+    def _max_batch_size(self):
+        """أكبر حجم دفعة بين المزودين المعروفين الذين يدعم مرسلهم الدفعات"""
+        if not hasattr(self.senders.get('whatsapp'), 'send_batch'):
+            return 1
+        return max([self.rate_limiter.batch_size(provider) for provider, _ in self._provider_cache.values()] + [1])
+
+    def reload_provider_settings(self):
+        """إعادة قراءة إعدادات المزود بعد تعديلها"""
+        self._provider_cache = {}
+
+    def _worker_db(self):
+        """اتصال قاعدة بيانات خاص بخيط العامل"""
+        worker_db = getattr(self._local, 'db', None)
+        if worker_db is None:
+            worker_db = self.db_manager.create_thread_instance()
+            self._local.db = worker_db
+            with self._worker_dbs_lock:
+                self._worker_dbs.append(worker_db)
+        return worker_db
+
+    def _process(self, messages):
+        """إرسال رسالة أو دفعة لنفس المزود والمرسل (يعمل في خيط العامل)"""
+        worker_db = self._worker_db()
+        provider, sender_key = messages[0]['provider'], messages[0]['sender_key']
+
+        # انتظار دور الإرسال حسب حد المزود، أو إعادة الرسائل للصادر إن طال الانتظار
+        wait = self.rate_limiter.reserve(provider, sender_key, len(messages), self.max_throttle_wait)
+        if wait is None:
+            delay = self.rate_limiter.reserve(provider, sender_key, 0) or self.max_throttle_wait
+            worker_db.defer_outbox_messages([message['id'] for message in messages], delay)
+            for message in messages:
+                self._job_finished.emit(message, 'deferred')
+            return
+        if wait > 0:
+            time.sleep(wait)
+
+        try:
+            sender = self.senders.get(messages[0]['channel'])
+            if sender is None:
+                results = [{'success': False, 'message': f"لا يوجد مزود للقناة {messages[0]['channel']}"}] * len(messages)
+            elif len(messages) > 1:
+                results = sender.send_batch(messages)
+            else:
+                results = [sender(messages[0])]
+        except Exception as e:
+            results = [{'success': False, 'message': str(e)}] * len(messages)
+
+        for message, result in zip(messages, results):
+            if not isinstance(result, dict):
+                result = {'success': bool(result)}
+            try:
+                if result.get('success'):
+                    worker_db.mark_outbox_sent(message['id'], result.get('provider_message_id'), provider)
+                    status = 'sent'
+                elif result.get('throttled'):
+                    # المزود رفض بسبب المعدل: إيقاف الدلو وتأجيل الرسالة دون احتساب محاولة
+                    retry_after = float(result.get('retry_after') or self.max_throttle_wait)
+                    self.rate_limiter.pause(provider, sender_key, retry_after)
+                    worker_db.defer_outbox_messages([message['id']], retry_after)
+                    status = 'deferred'
+                else:
+                    status = worker_db.mark_outbox_failed(
+                        message['id'], result.get('message', 'فشل غير معروف'), result.get('retryable', True))
+            except Exception as e:
+                logging.error(f"❌ خطأ في تسجيل نتيجة الرسالة {message['id']}: {e}")
+                status = 'pending'
+
+            self._job_finished.emit(dict(message, error=result.get('message')), status)
+
+    def on_job_finished(self, message, status):
+        """نتيجة عامل (في الخيط الرئيسي)"""
+        self.in_flight -= 1
+
+        if status == 'sent':
+            self.message_sent.emit(message)
+        elif status == 'dead':
+            self.message_dead.emit(message)
+        elif status != 'deferred':
+            self.message_failed.emit(message)
+
+        # متابعة التفريغ فوراً ما دام هناك رسائل مستحقة
+        self.drain()
+
+    def get_status(self):
+        """حالة الموزع وعدد الرسائل حسب الحالة"""
+        return {
+            'is_running': self.is_running,
+            'workers': self.workers,
+            'in_flight': self.in_flight,
+            'rate_limits': self.rate_limiter.get_status(),
+            'outbox': self.db_manager.get_outbox_stats()
+        }
+
+def whatsapp_outbox_sender(whatsapp_manager):
+    """مزود قناة الواتساب فوق WhatsAppManager.send_message"""
+    def send(message):
+        result = whatsapp_manager.send_message(
+            message['recipient'],
+            message['message'],
+            message['message_type'],
+            appointment_id=message.get('appointment_id'),
+            patient_id=message.get('patient_id')
+        )
+        return result if isinstance(result, dict) else {'success': bool(result)}
+
+    # المزودون عبر API يقبلون دفعات
+    if hasattr(whatsapp_manager, 'send_batch'):
+        send.send_batch = lambda messages: whatsapp_manager.send_batch(
+            [{'phone': message['recipient'], 'message': message['message'],
+              'message_type': message['message_type']} for message in messages])
+    return send
+
+def email_outbox_sender(email_sender):
+    """مزود قناة الإيميل فوق EmailSender - الدفعة تُرسل متتالية على جلسة SMTP واحدة"""
+    def send(message):
+        return email_sender.send_emails([message], workers=1)[0]
+
+    send.send_batch = lambda messages: email_sender.send_emails(messages, workers=1)
+    return send
@@ -0,0 +1,106 @@
+# notifications/rate_limiter.py
+import threading
+import time
+
+# حدود الإرسال لكل مزود: السعة الفورية (burst)، المعدل المستمر بالدقيقة، وحجم الدفعة المجمعة
+PROVIDER_RATE_LIMITS = {
+    'whatsapp_web': {'burst': 3, 'per_minute': 12, 'batch_size': 1},
+    'smartwats': {'burst': 25, 'per_minute': 300, 'batch_size': 25},
+    'email': {'burst': 20, 'per_minute': 600, 'batch_size': 20},
+}
+DEFAULT_RATE_LIMIT = {'burst': 5, 'per_minute': 30, 'batch_size': 1}
+
+class TokenBucket:
+    """دلو رموز آمن للخيوط: يمتلئ بمعدل ثابت حتى السعة القصوى
+
+    الحجز (reserve) يسمح للرصيد بأن يصبح سالباً ويُرجع مدة الانتظار، فيحصل
+    المتسابقون على أدوار عادلة دون حلقات انتظار نشطة.
+    """
+
+    def __init__(self, capacity, refill_per_second, clock=time.monotonic):
+        self.capacity = float(capacity)
+        self.refill_per_second = float(refill_per_second)
+        self.clock = clock
+        self.tokens = float(capacity)
+        self.updated_at = clock()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        elapsed = now - self.updated_at
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.refill_per_second)
+            self.updated_at = now
+
+    def reserve(self, tokens=1, max_wait=None):
+        """حجز رموز - تُرجع مدة الانتظار بالثواني قبل الإرسال، أو None إن تجاوزت max_wait"""
+        with self.lock:
+            now = self.clock()
+            self._refill(now)
+            wait = max(self.paused_until - now, 0.0)
+            deficit = tokens - self.tokens
+            if deficit > 0:
+                wait = max(wait, deficit / self.refill_per_second)
+            if max_wait is not None and wait > max_wait:
+                return None
+            self.tokens -= tokens
+            return wait
+
+    def try_acquire(self, tokens=1):
+        """حجز فوري فقط إن توفرت الرموز"""
+        return self.reserve(tokens, max_wait=0) is not None
+
+    def pause(self, seconds):
+        """إيقاف السحب مؤقتاً (عند رد المزود بتجاوز الحد)"""
+        with self.lock:
+            self.paused_until = max(self.paused_until, self.clock() + seconds)
+            self.tokens = min(self.tokens, 0.0)
+
+    def available(self):
+        with self.lock:
+            self._refill(self.clock())
+            return self.tokens
+
+class ProviderRateLimiter:
+    """محدد معدل الإرسال لكل مزود ولكل رقم مرسل (دلو مستقل لكل زوج)"""
+
+    def __init__(self, limits=None, headroom=0.9, clock=time.monotonic):
+        self.limits = dict(PROVIDER_RATE_LIMITS)
+        self.limits.update(limits or {})
+        # نعمل أبطأ قليلاً من حد المزود حتى لا يتسبب فرق التوقيت في رفض الرسائل
+        self.headroom = headroom
+        self.clock = clock
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def limits_for(self, provider):
+        return self.limits.get(provider, DEFAULT_RATE_LIMIT)
+
+    def batch_size(self, provider):
+        # الدفعة لا تتجاوز السعة الفورية وإلا رفضها المزود جزئياً
+        limits = self.limits_for(provider)
+        return max(min(int(limits.get('batch_size', 1)), int(limits['burst'])), 1)
+
+    def bucket(self, provider, sender_key=''):
+        key = (provider, sender_key or '')
+        with self.lock:
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                limits = self.limits_for(provider)
+                bucket = TokenBucket(limits['burst'], limits['per_minute'] * self.headroom / 60.0, self.clock)
+                self.buckets[key] = bucket
+            return bucket
+
+    def reserve(self, provider, sender_key='', tokens=1, max_wait=None):
+        """حجز رموز للإرسال - مدة الانتظار أو None"""
+        return self.bucket(provider, sender_key).reserve(tokens, max_wait)
+
+    def pause(self, provider, sender_key, seconds):
+        self.bucket(provider, sender_key).pause(seconds)
+
+    def get_status(self):
+        """الرصيد الحالي لكل دلو"""
+        with self.lock:
+            buckets = list(self.buckets.items())
+        return {f"{provider}:{sender_key}": round(bucket.available(), 2)
+                for (provider, sender_key), bucket in buckets}
@@ -0,0 +1,283 @@
+# notifications/receipt_receiver.py
+"""
+مستقبل إيصالات التسليم المحلي (webhook)
+- خادم HTTP محلي يستقبل نداءات المزودين (تسليم / قراءة / فشل / رد المريض)
+  ويرد فوراً بعد وضعها في ذاكرة مؤقتة
+- خيط خلفي باتصال قاعدة بيانات خاص يطبقها دفعات كل flush_seconds أو عند
+  امتلاء batch_size، كل دفعة معاملة واحدة
+"""
+import json
+import logging
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+RECEIPT_DEFAULT_PORT = 8787
+RECEIPT_MAX_BODY_BYTES = 1024 * 1024
+
+# أقصى عدد أحداث في الذاكرة قبل رفض النداءات (503 فيعيد المزود الإرسال لاحقاً)
+RECEIPT_MAX_BUFFERED = 100000
+
+# توحيد أسماء الحالات بين المزودين
+RECEIPT_STATUS_ALIASES = {
+    'sent': 'sent', 'server': 'sent', 'queued': 'sent', 'accepted': 'sent',
+    'delivered': 'delivered', 'device': 'delivered', 'received': 'delivered',
+    'read': 'read', 'seen': 'read', 'played': 'read',
+    'failed': 'failed', 'undelivered': 'failed', 'error': 'failed', 'rejected': 'failed',
+}
+
+def _event_time(value):
+    """وقت الحدث بصيغة قاعدة البيانات (يقبل ثواني يونكس أو نصاً ISO)"""
+    try:
+        if isinstance(value, (int, float)) or (isinstance(value, str) and value.isdigit()):
+            return datetime.fromtimestamp(int(value)).strftime('%Y-%m-%d %H:%M:%S')
+        if value:
+            return datetime.fromisoformat(str(value).replace('Z', '')).strftime('%Y-%m-%d %H:%M:%S')
+    except (ValueError, OverflowError, OSError):
+        pass
+    return None
+
+def _parse_item(item):
+    """حدث واحد من نداء المزود - أو None إن لم يكن إيصالاً أو رداً"""
+    if not isinstance(item, dict):
+        return None
+
+    # UltraMsg وما يشبهه: {"event_type": "...", "data": {...}}
+    event_type = str(item.get('event_type') or item.get('type') or item.get('event') or '').lower()
+    data = item.get('data') if isinstance(item.get('data'), dict) else item
+
+    if event_type in ('message_received', 'message', 'reply', 'incoming') or (
+            data.get('Body') is not None and not data.get('MessageStatus')):
+        quoted = data.get('quotedMsg') or data.get('context') or {}
+        return {
+            'kind': 'reply',
+            'phone': data.get('from') or data.get('phone') or data.get('From'),
+            'body': data.get('body') or data.get('text') or data.get('Body') or '',
+            'reply_to': (quoted.get('id') if isinstance(quoted, dict) else None) or data.get('reply_to'),
+            'provider_message_id': data.get('id') or data.get('MessageSid'),
+            'timestamp': _event_time(data.get('time') or data.get('timestamp')),
+        }
+
+    message_id = (data.get('provider_message_id') or data.get('message_id') or data.get('messageId')
+                  or data.get('MessageSid') or data.get('id'))
+    status = RECEIPT_STATUS_ALIASES.get(
+        str(data.get('status') or data.get('ack') or data.get('MessageStatus') or '').lower())
+    if not message_id or not status:
+        return None
+
+    return {
+        'kind': 'status',
+        'provider_message_id': str(message_id),
+        'status': status,
+        'error': data.get('error') or data.get('ErrorMessage'),
+        'timestamp': _event_time(data.get('time') or data.get('timestamp')),
+    }
+
+def parse_provider_callback(payload):
+    """أحداث نداء المزود (عنصر واحد، أو قائمة، أو {"receipts": [...]})"""
+    if isinstance(payload, dict):
+        items = payload.get('receipts') or payload.get('statuses') or payload.get('events') or [payload]
+    elif isinstance(payload, list):
+        items = payload
+    else:
+        items = []
+    return [event for event in map(_parse_item, items) if event]
+
+class ReceiptServer(ThreadingHTTPServer):
+    """خادم HTTP محلي يمرر النداءات للمستقبل"""
+
+    daemon_threads = True
+
+    def __init__(self, address, receiver):
+        super().__init__(address, ReceiptHandler)
+        self.receiver = receiver
+
+class ReceiptHandler(BaseHTTPRequestHandler):
+
+    def _reply(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _authorized(self):
+        token = self.server.receiver.token
+        if not token:
+            return True
+        query = parse_qs(urlparse(self.path).query)
+        return token in (self.headers.get('X-Webhook-Token'), (query.get('token') or [None])[0])
+
+    def do_GET(self):
+        if urlparse(self.path).path == '/health':
+            self._reply(200, self.server.receiver.get_status())
+        else:
+            self._reply(404, {'error': 'not_found'})
+
+    def do_POST(self):
+        if not self._authorized():
+            self._reply(403, {'error': 'forbidden'})
+            return
+
+        length = int(self.headers.get('Content-Length') or 0)
+        if length > RECEIPT_MAX_BODY_BYTES:
+            self._reply(413, {'error': 'too_large'})
+            return
+
+        raw = self.rfile.read(length)
+        try:
+            if 'application/x-www-form-urlencoded' in (self.headers.get('Content-Type') or ''):
+                payload = {key: values[0] for key, values in parse_qs(raw.decode('utf-8')).items()}
+            else:
+                payload = json.loads(raw or b'{}')
+        except (ValueError, UnicodeDecodeError):
+            self._reply(400, {'error': 'invalid_body'})
+            return
+
+        events = parse_provider_callback(payload)
+        if not self.server.receiver.submit(events):
+            self._reply(503, {'error': 'busy'})
+            return
+        self._reply(200, {'accepted': len(events)})
+
+    def log_message(self, format, *args):
+        pass
+
+class DeliveryReceiptReceiver:
+    """مستقبل إيصالات التسليم: خادم HTTP + ذاكرة مؤقتة + تطبيق دفعات في خيط خلفي
+
+    on_applied(summary) تُستدعى من الخيط الخلفي بعد كل دفعة.
+    """
+
+    _global_instance = None
+
+    def __init__(self, db_manager, host='127.0.0.1', port=RECEIPT_DEFAULT_PORT, token=None,
+                 flush_seconds=2, batch_size=1000, on_applied=None):
+        self.db_manager = db_manager
+        self.host = host
+        self.port = port
+        self.token = token
+        self.flush_seconds = flush_seconds
+        self.batch_size = batch_size
+        self.on_applied = on_applied
+
+        self.server = None
+        self.is_running = False
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._threads = []
+        self.stats = {'received': 0, 'applied': 0, 'batches': 0, 'rejected': 0, 'failed_batches': 0}
+
+    @classmethod
+    def get_global_instance(cls):
+        return cls._global_instance
+
+    @classmethod
+    def set_global_instance(cls, instance):
+        cls._global_instance = instance
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2] if self.server else (self.host, self.port)
+        return f"http://{host}:{port}"
+
+    def start(self):
+        """تشغيل الخادم وخيط التطبيق"""
+        try:
+            if self.is_running:
+                return True
+
+            self.server = ReceiptServer((self.host, self.port), self)
+            self.is_running = True
+            self._threads = [
+                threading.Thread(target=self.server.serve_forever, name='receipt-server', daemon=True),
+                threading.Thread(target=self._flush_loop, name='receipt-flush', daemon=True),
+            ]
+            for thread in self._threads:
+                thread.start()
+
+            logging.info(f"✅ مستقبل إيصالات التسليم يعمل على {self.url}")
+            return True
+
+        except Exception as e:
+            self.is_running = False
+            logging.error(f"❌ فشل تشغيل مستقبل إيصالات التسليم: {e}")
+            return False
+
+    def stop(self):
+        """إيقاف الخادم وتطبيق ما تبقى في الذاكرة"""
+        if not self.is_running:
+            return
+        self.server.shutdown()
+        self.server.server_close()
+        self.is_running = False
+        self._wake.set()
+        for thread in self._threads:
+            thread.join(timeout=10)
+        self._threads = []
+        logging.info("⏹️ إيقاف مستقبل إيصالات التسليم")
+
+    def submit(self, events):
+        """إضافة أحداث للذاكرة المؤقتة - False إن امتلأت"""
+        with self._lock:
+            if len(self._buffer) + len(events) > RECEIPT_MAX_BUFFERED:
+                self.stats['rejected'] += len(events)
+                return False
+            self._buffer.extend(events)
+            self.stats['received'] += len(events)
+            full = len(self._buffer) >= self.batch_size
+        if full:
+            self._wake.set()
+        return True
+
+    def _flush_loop(self):
+        """تطبيق الدفعات باتصال قاعدة بيانات خاص بهذا الخيط"""
+        worker_db = self.db_manager.create_thread_instance()
+        try:
+            while True:
+                self._wake.wait(self.flush_seconds)
+                self._wake.clear()
+                running = self.is_running
+                # كل دفعة معاملة مستقلة: الحجوزات تأخذ القفل بين الدفعات
+                while self._flush(worker_db):
+                    pass
+                if not running:
+                    break
+        finally:
+            worker_db.close()
+
+    def _flush(self, worker_db):
+        """تطبيق دفعة واحدة - True إن بقيت أحداث في الذاكرة"""
+        with self._lock:
+            batch, self._buffer = self._buffer[:self.batch_size], self._buffer[self.batch_size:]
+        if not batch:
+            return False
+
+        started = time.monotonic()
+        summary = worker_db.apply_delivery_receipts(batch)
+        with self._lock:
+            if summary is None:
+                # تعاد للذاكرة لتُطبق في الدورة التالية
+                self._buffer[:0] = batch
+                self.stats['failed_batches'] += 1
+                return False
+            self.stats['applied'] += len(batch)
+            self.stats['batches'] += 1
+            remaining = bool(self._buffer)
+
+        summary['elapsed_ms'] = int((time.monotonic() - started) * 1000)
+        if self.on_applied:
+            try:
+                self.on_applied(summary)
+            except Exception as e:
+                logging.error(f"❌ خطأ في معالج دفعة الإيصالات: {e}")
+        return remaining
+
+    def get_status(self):
+        """حالة المستقبل وعدد الأحداث المنتظرة"""
+        with self._lock:
+            return dict(self.stats, is_running=self.is_running, buffered=len(self._buffer))
@@ -0,0 +1,191 @@
+# notifications/reminder_scheduler.py
+import heapq
+import logging
+from datetime import datetime, timedelta
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal
+
+# أقصى مهلة يقبلها QTimer (بالمللي ثانية)
+MAX_TIMER_MS = 2 ** 31 - 1
+
+class ReminderScheduler(QObject):
+    """مُنبّه التذكيرات الموحد - مالك وحيد لإرسال التذكيرات بدل مؤقتات الفحص الدوري
+
+    يحمّل أوقات استحقاق التذكيرات القادمة (خلال horizon_minutes) من فهرس
+    reminder_*_due_at إلى كومة صغرى (min-heap) ويضبط مؤقتاً واحداً على أقرب
+    استحقاق، فلا يستيقظ إلا عند موعد تذكير أو عند إعادة التحميل الدورية.
+    تغييرات المواعيد تصله من db_manager.add_appointment_listener فيضيف أوقات
+    الموعد للكومة مباشرة؛ الإدخالات القديمة (موعد أُلغي أو نُقل) لا تُحذف بل
+    تُهمل عند الاستيقاظ لأن الإرسال يعيد الاستعلام.
+
+    dispatch(reminder_type) يرسل كل ما استحق من هذا النوع منذ العلامة المائية
+    (check_24h_reminders / process_due_reminders)، وis_enabled(reminder_type)
+    يحدد إن كان النوع مفعلاً في الإعدادات.
+    """
+
+    reminders_due = pyqtSignal(str)
+
+    # إشارة داخلية لنقل تغييرات المواعيد إلى خيط المُنبّه
+    _appointment_changed = pyqtSignal(object)
+
+    _global_instance = None
+
+    def __init__(self, db_manager, dispatch=None, is_enabled=None, horizon_minutes=60,
+                 reload_minutes=30, retry_seconds=60, parent=None):
+        super().__init__(parent)
+        self.db_manager = db_manager
+        self.dispatch = dispatch
+        self.is_enabled = is_enabled or (lambda reminder_type: True)
+        self.horizon = timedelta(minutes=horizon_minutes)
+        self.reload_interval = timedelta(minutes=reload_minutes)
+        self.retry_delay = timedelta(seconds=retry_seconds)
+        self.is_running = False
+
+        self._heap = []
+        self._loaded_until = None
+        self._next_reload = None
+        self.wakeups = 0
+
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self.on_wake)
+        self._appointment_changed.connect(self.on_appointment_changed)
+
+    @classmethod
+    def get_global_instance(cls):
+        return cls._global_instance
+
+    @classmethod
+    def set_global_instance(cls, instance):
+        cls._global_instance = instance
+
+    def start(self):
+        """بدء المُنبّه: لحاق بما فات ثم تحميل الاستحقاقات القادمة"""
+        try:
+            if self.is_running:
+                return True
+
+            self.is_running = True
+            if hasattr(self.db_manager, 'add_appointment_listener'):
+                self.db_manager.add_appointment_listener(self._on_appointments_saved)
+
+            self.catch_up()
+            self.reload()
+            logging.info(f"✅ بدء مُنبّه التذكيرات ({len(self._heap)} تذكير خلال {self.horizon})")
+            return True
+
+        except Exception as e:
+            logging.error(f"❌ فشل بدء مُنبّه التذكيرات: {e}")
+            return False
+
+    def stop(self):
+        """إيقاف المُنبّه - ما لم يُرسل يُلحق به عند البدء التالي"""
+        self.timer.stop()
+        self.is_running = False
+        self._heap = []
+        if hasattr(self.db_manager, 'remove_appointment_listener'):
+            self.db_manager.remove_appointment_listener(self._on_appointments_saved)
+        logging.info("⏹️ إيقاف مُنبّه التذكيرات")
+
+    def catch_up(self):
+        """إرسال كل ما استحق لكل نوع مفعل (منذ العلامة المائية)"""
+        for reminder_type in self.db_manager.REMINDER_LEADS:
+            self._dispatch(reminder_type)
+
+    def reload(self):
+        """إعادة تحميل الكومة من الفهرس للنافذة (الآن، الآن + الأفق]"""
+        now = datetime.now()
+        self._loaded_until = now + self.horizon
+        self._next_reload = now + self.reload_interval
+        self._heap = self.db_manager.get_upcoming_reminder_times(now, self._loaded_until)
+        heapq.heapify(self._heap)
+        self._arm()
+
+    def _on_appointments_saved(self, appointment_id):
+        """مستمع قاعدة البيانات - قد يُستدعى من خيط آخر فيُنقل عبر إشارة"""
+        self._appointment_changed.emit(appointment_id)
+
+    def on_appointment_changed(self, appointment_id):
+        """تحديث الكومة عند تغيير موعد (None = تغيير جماعي يعيد التحميل)"""
+        if not self.is_running:
+            return
+        try:
+            if appointment_id is None:
+                self.reload()
+                return
+
+            for event in self.db_manager.get_appointment_reminder_times(appointment_id):
+                if event[0] <= self._loaded_until:
+                    heapq.heappush(self._heap, event)
+            self._arm()
+
+        except Exception as e:
+            logging.error(f"❌ خطأ في تحديث مُنبّه التذكيرات للموعد {appointment_id}: {e}")
+
+    def on_wake(self):
+        """إرسال أنواع التذكيرات التي حان وقتها ثم ضبط المؤقت على الاستحقاق التالي"""
+        try:
+            self.wakeups += 1
+            now = datetime.now()
+
+            due = {}
+            while self._heap and self._heap[0][0] <= now:
+                due_at, reminder_type, appointment_id = heapq.heappop(self._heap)
+                due.setdefault(reminder_type, set()).add(appointment_id)
+
+            for reminder_type, appointment_ids in due.items():
+                if self._dispatch(reminder_type):
+                    self._schedule_retries(reminder_type, appointment_ids, now)
+
+            if now >= self._next_reload:
+                self.catch_up()
+                self.reload()
+            else:
+                self._arm()
+
+        except Exception as e:
+            logging.error(f"❌ خطأ في مُنبّه التذكيرات: {e}")
+            self._arm()
+
+    def _dispatch(self, reminder_type):
+        """إرسال تذكيرات النوع إن كان مفعلاً - True إن أُرسل"""
+        if not self.is_enabled(reminder_type):
+            return False
+        try:
+            self.reminders_due.emit(reminder_type)
+            if self.dispatch:
+                self.dispatch(reminder_type)
+            return True
+        except Exception as e:
+            logging.error(f"❌ خطأ في إرسال تذكيرات {reminder_type}: {e}")
+            return False
+
+    def _schedule_retries(self, reminder_type, appointment_ids, now):
+        """إعادة جدولة التذكيرات التي بقيت غير مرسلة بعد retry_delay (حتى بداية الموعد)"""
+        lead = timedelta(hours=int(self.db_manager.REMINDER_LEADS[reminder_type].split()[0].lstrip('-')))
+        for appointment_id in appointment_ids:
+            due_events = [event for event in self.db_manager.get_appointment_reminder_times(appointment_id)
+                          if event[0] <= now]
+            # التذكير الأقدم الذي تلاه تذكير أقرب للموعد لا يُرسل، فلا يُعاد
+            if not due_events:
+                continue
+            due_at, event_type, _ = max(due_events)
+            if event_type == reminder_type and now < due_at + lead:
+                heapq.heappush(self._heap, (now + self.retry_delay, reminder_type, appointment_id))
+
+    def _arm(self):
+        """ضبط المؤقت الوحيد على أقرب استحقاق أو موعد إعادة التحميل"""
+        if not self.is_running:
+            return
+        wake_at = min(self._heap[0][0], self._next_reload) if self._heap else self._next_reload
+        delay_ms = int((wake_at - datetime.now()).total_seconds() * 1000)
+        self.timer.start(min(max(delay_ms, 0), MAX_TIMER_MS))
+
+    def get_status(self):
+        """حالة المُنبّه والاستحقاق التالي"""
+        return {
+            'is_running': self.is_running,
+            'pending': len(self._heap),
+            'next_due': self._heap[0][0] if self._heap else None,
+            'loaded_until': self._loaded_until,
+            'wakeups': self.wakeups
+        }
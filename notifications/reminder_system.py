@@ -1,9 +1,85 @@
 # notifications/reminder_system.py
 import logging
 import sqlite3
-from datetime import datetime, timedelta
+from datetime import datetime
 from PyQt5.QtCore import QObject, QTimer, pyqtSignal
 
+from .outbox_dispatcher import OutboxDispatcher
+from .reminder_scheduler import ReminderScheduler
+
+def build_reminder_message(db_manager, appointment, reminder_type, clinic_id=1):
+    """بناء رسالة التذكير من قالب العيادة المجمّع (أو القالب الافتراضي)"""
+    return db_manager.render_message(clinic_id, f"reminder_{reminder_type}", appointment)
+
+def claim_reminder(db_manager, appointment, reminder_type, channel='whatsapp'):
+    """حجز إرسال التذكير في سجل الإرسال - رمز الحجز أو None إن كان لمرسل آخر"""
+    return db_manager.claim_send(
+        appointment.get('id'), f"reminder_{reminder_type}", channel,
+        f"{appointment.get('appointment_date')} {appointment.get('appointment_time')}")
+
+def reminder_already_handled(db_manager, appointment, reminder_type, channel='whatsapp'):
+    """هل أُرسل التذكير أو أُضيف للصادر من مرسل آخر (لا يُعاد فحصه)"""
+    record = db_manager.get_send_record(appointment.get('id'), f"reminder_{reminder_type}", channel)
+    if record and record['status'] in ('sent', 'queued'):
+        logging.info(f"ℹ️ تذكير {reminder_type} للموعد {appointment.get('id')} أُرسل من جهاز آخر")
+        return True
+    # محجوز لمرسل آخر لم ينتهِ بعد: يبقى ضمن الفحص التالي
+    return False
+
+def send_reminder_once(db_manager, appointment, reminder_type, send, channel='whatsapp'):
+    """إرسال التذكير مرة واحدة فقط عبر كل المرسلين: حجز في سجل الإرسال ثم send()
+    
+    send() تُرجع نتيجة المزود ({'success': bool, ...}) أو قيمة منطقية.
+    """
+    token = claim_reminder(db_manager, appointment, reminder_type, channel)
+    if token is None:
+        return reminder_already_handled(db_manager, appointment, reminder_type, channel)
+    
+    try:
+        result = send()
+    except Exception as e:
+        db_manager.complete_send(token, False, error=str(e))
+        raise
+    
+    if isinstance(result, dict):
+        db_manager.complete_send(token, bool(result.get('success')),
+                                 provider_message_id=result.get('provider_message_id'),
+                                 error=result.get('message'))
+    else:
+        db_manager.complete_send(token, bool(result))
+    return result
+
+def enqueue_reminder(db_manager, appointment, reminder_type, message=None, clinic_id=1):
+    """إضافة تذكير موعد لصندوق الصادر (مرة واحدة لكل موعد ونوع ووقت)"""
+    token = claim_reminder(db_manager, appointment, reminder_type)
+    if token is None:
+        return reminder_already_handled(db_manager, appointment, reminder_type)
+    
+    # المفتاح يتضمن وقت الموعد: إعادة الجدولة تعني تذكيراً جديداً
+    idempotency_key = (f"reminder_{reminder_type}:{appointment.get('id')}:"
+                       f"{appointment.get('appointment_date')} {appointment.get('appointment_time')}")
+    message_id = db_manager.enqueue_message(
+        appointment.get('patient_phone'),
+        message or build_reminder_message(db_manager, appointment, reminder_type, clinic_id),
+        f"reminder_{reminder_type}",
+        idempotency_key=idempotency_key,
+        appointment_id=appointment.get('id'),
+        patient_id=appointment.get('patient_id'),
+        clinic_id=clinic_id,
+        priority=1 if reminder_type == '2h' else 0
+    )
+    if message_id is None:
+        db_manager.complete_send(token, False, error='تعذرت الإضافة لصندوق الصادر')
+        return False
+    
+    # إعادة الحجز بعد فشل نهائي تجد الرسالة الميتة بنفس المفتاح: تُعاد للإرسال
+    # (لا تأثير إن لم تكن ميتة)
+    db_manager.requeue_dead_letter(message_id)
+    
+    # نتيجة الإرسال يسجلها الموزع في سجل الإرسال مع علم التذكير
+    db_manager.mark_send_queued(token)
+    return True
+
 class ClinicReminderSystem(QObject):
     """نظام التذكيرات التلقائي المبسط والموثوق"""
     
@@ -28,9 +104,8 @@ class ClinicReminderSystem(QObject):
         
     def setup_timers(self):
         """إعداد المؤقتات الدورية"""
-        # فحص التذكيرات كل دقيقة
-        self.reminder_timer = QTimer()
-        self.reminder_timer.timeout.connect(self.check_reminders)
+        # التذكيرات عبر مُنبّه التذكيرات الموحد (يُنشأ عند البدء إن لم يوجد)
+        self.reminder_scheduler = None
         
         # مؤقت حالة النظام كل 30 ثانية
         self.status_timer = QTimer()
@@ -39,15 +114,27 @@ class ClinicReminderSystem(QObject):
     def start(self):
         """بدء نظام التذكيرات"""
         try:
-            self.reminder_timer.start(60000)  # كل دقيقة
             self.status_timer.start(30000)    # كل 30 ثانية
             self.is_running = True
             
+            dispatcher = OutboxDispatcher.get_global_instance()
+            if dispatcher:
+                dispatcher.message_sent.connect(self.on_outbox_message_sent)
+                dispatcher.message_dead.connect(self.on_outbox_message_dead)
+            
             self.logger.info("✅ بدء نظام التذكيرات التلقائي")
             self.system_status_changed.emit("نشط")
             
-            # فحص فوري للتذكيرات
-            self.check_reminders()
+            # المُنبّه يلحق بما فات عند بدئه ثم يستيقظ عند كل استحقاق
+            scheduler = ReminderScheduler.get_global_instance()
+            if scheduler and scheduler.is_running:
+                self.logger.info("ℹ️ التذكيرات يديرها مُنبّه التذكيرات العام")
+            else:
+                self.reminder_scheduler = ReminderScheduler(
+                    self.db_manager, dispatch=self.process_due_reminders,
+                    is_enabled=lambda reminder_type: bool(self.whatsapp_manager), parent=self)
+                ReminderScheduler.set_global_instance(self.reminder_scheduler)
+                self.reminder_scheduler.start()
             
             return True
             
@@ -57,7 +144,11 @@ class ClinicReminderSystem(QObject):
     
     def stop(self):
         """إيقاف نظام التذكيرات"""
-        self.reminder_timer.stop()
+        if self.reminder_scheduler:
+            self.reminder_scheduler.stop()
+            if ReminderScheduler.get_global_instance() is self.reminder_scheduler:
+                ReminderScheduler.set_global_instance(None)
+            self.reminder_scheduler = None
         self.status_timer.stop()
         self.is_running = False
         self.system_status_changed.emit("متوقف")
@@ -81,73 +172,31 @@ class ClinicReminderSystem(QObject):
     
     def check_24h_reminders(self):
         """فحص تذكيرات 24 ساعة"""
-        try:
-            # حساب الوقت بعد 24 ساعة
-            target_time = datetime.now() + timedelta(hours=24)
-            target_date = target_time.strftime('%Y-%m-%d')
-            target_hour = target_time.strftime('%H:%M')
-            
-            # جلب المواعيد التي تحتاج تذكير
-            appointments = self.get_appointments_for_reminder(target_date, target_hour, '24h')
-            
-            for appointment in appointments:
-                self.send_reminder(appointment, '24h')
-                
-        except Exception as e:
-            self.logger.error(f"❌ خطأ في تذكيرات 24h: {e}")
+        self.process_due_reminders('24h')
     
     def check_2h_reminders(self):
         """فحص تذكيرات ساعتين"""
-        try:
-            # حساب الوقت بعد ساعتين
-            target_time = datetime.now() + timedelta(hours=2)
-            target_date = target_time.strftime('%Y-%m-%d')
-            target_hour = target_time.strftime('%H:%M')
-            
-            # جلب المواعيد التي تحتاج تذكير
-            appointments = self.get_appointments_for_reminder(target_date, target_hour, '2h')
-            
-            for appointment in appointments:
-                self.send_reminder(appointment, '2h')
-                
-        except Exception as e:
-            self.logger.error(f"❌ خطأ في تذكيرات 2h: {e}")
+        self.process_due_reminders('2h')
     
-    def get_appointments_for_reminder(self, target_date, target_hour, reminder_type):
-        """جلب المواعيد التي تحتاج تذكير"""
+    def process_due_reminders(self, reminder_type):
+        """إرسال كل التذكيرات المستحقة منذ آخر فحص (يلحق بما فات بعد التوقف)"""
         try:
-            conn = self.db_manager.get_connection()
-            cursor = conn.cursor()
-            
-            # تحديد حقل التذكير بناءً على النوع
-            reminder_field = "reminder_24h_sent" if reminder_type == '24h' else "reminder_2h_sent"
-            
-            query = f'''
-                SELECT a.*, p.name as patient_name, p.phone as patient_phone,
-                       d.name as doctor_name, dep.name as department_name
-                FROM appointments a
-                JOIN patients p ON a.patient_id = p.id
-                JOIN doctors d ON a.doctor_id = d.id
-                JOIN departments dep ON a.department_id = dep.id
-                WHERE a.appointment_date = ? 
-                AND a.appointment_time = ?
-                AND a.status = "مجدول"
-                AND a.{reminder_field} = 0
-            '''
-            
-            cursor.execute(query, (target_date, target_hour))
-            appointments = cursor.fetchall()
+            scan_time = datetime.now()
+            appointments = self.db_manager.get_due_reminders(reminder_type, scan_time)
             
-            # تحويل إلى قاموس
-            result = []
-            for row in appointments:
-                result.append(dict(row))
+            failed_due_times = []
+            for appointment in appointments:
+                if not self.send_reminder(appointment, reminder_type):
+                    failed_due_times.append(appointment['reminder_due_at'])
             
-            return result
+            self.db_manager.advance_reminder_watermark(reminder_type, scan_time, failed_due_times)
             
         except Exception as e:
-            self.logger.error(f"❌ خطأ في جلب المواعيد: {e}")
-            return []
+            self.logger.error(f"❌ خطأ في تذكيرات {reminder_type}: {e}")
+    
+    def get_appointments_for_reminder(self, reminder_type):
+        """جلب المواعيد التي استحق تذكيرها ولم يُرسل"""
+        return self.db_manager.get_due_reminders(reminder_type)
     
     def send_reminder(self, appointment, reminder_type):
         """إرسال تذكير للموعد"""
@@ -160,19 +209,26 @@ class ClinicReminderSystem(QObject):
             # بناء رسالة التذكير
             message = self.build_reminder_message(appointment, reminder_type)
             
-            # إرسال الرسالة عبر WhatsAppManager
-            result = self.whatsapp_manager.send_message(
-                patient_phone,
-                message,
-                f"reminder_{reminder_type}",
-                appointment_id=appointment.get('id'),
-                patient_id=appointment.get('patient_id')
-            )
+            # عبر صندوق الصادر إن كان الموزع يعمل: إرسال متوازٍ مع إعادة المحاولة
+            dispatcher = OutboxDispatcher.get_global_instance()
+            if dispatcher and dispatcher.is_running:
+                return self.enqueue_reminder(appointment, reminder_type, message)
+            
+            # إرسال الرسالة عبر WhatsAppManager بعد حجزها في سجل الإرسال
+            # (علم التذكير يُحدَّث مع نتيجة السجل في نفس المعاملة)
+            result = send_reminder_once(
+                self.db_manager, appointment, reminder_type,
+                lambda: self.whatsapp_manager.send_message(
+                    patient_phone,
+                    message,
+                    f"reminder_{reminder_type}",
+                    appointment_id=appointment.get('id'),
+                    patient_id=appointment.get('patient_id')
+                ))
+            if isinstance(result, bool):
+                return result
             
             if result.get('success'):
-                # تحديث حالة التذكير في قاعدة البيانات
-                self.update_reminder_status(appointment.get('id'), reminder_type)
-                
                 # إرسال إشارة النجاح
                 self.reminder_sent.emit({
                     'patient_name': appointment.get('patient_name'),
@@ -205,41 +261,36 @@ class ClinicReminderSystem(QObject):
             self.logger.error(f"❌ {error_msg}")
             return False
     
+    def enqueue_reminder(self, appointment, reminder_type, message):
+        """إضافة التذكير لصندوق الصادر - يُحدَّث علم التذكير عند نجاح الإرسال الفعلي"""
+        queued = enqueue_reminder(self.db_manager, appointment, reminder_type, message, self.clinic_id)
+        if queued:
+            self.logger.info(f"📥 تذكير {reminder_type} لـ {appointment.get('patient_name')} في صندوق الصادر")
+        return queued
+    
+    def on_outbox_message_sent(self, message):
+        """إرسال إشارة النجاح عند خروج تذكير من صندوق الصادر"""
+        if str(message.get('message_type', '')).startswith('reminder_'):
+            self.reminder_sent.emit({
+                'patient_name': message.get('recipient'),
+                'reminder_type': message['message_type'].split('_', 1)[1],
+                'appointment_id': message.get('appointment_id'),
+                'phone': message.get('recipient')
+            })
+    
+    def on_outbox_message_dead(self, message):
+        """فشل نهائي لتذكير بعد استنفاد المحاولات"""
+        if str(message.get('message_type', '')).startswith('reminder_'):
+            self.reminder_failed.emit({
+                'patient_name': message.get('recipient'),
+                'reminder_type': message['message_type'].split('_', 1)[1],
+                'error': message.get('error') or 'فشل نهائي',
+                'phone': message.get('recipient')
+            })
+    
     def build_reminder_message(self, appointment, reminder_type):
         """بناء رسالة التذكير"""
-        patient_name = appointment.get('patient_name', 'عزيزي/عزيزتي')
-        appointment_time = appointment.get('appointment_time', '')
-        appointment_date = appointment.get('appointment_date', '')
-        doctor_name = appointment.get('doctor_name', 'الطبيب')
-        department_name = appointment.get('department_name', 'القسم')
-        
-        if reminder_type == '24h':
-            return f"""
-تذكير بالموعد 🗓️
-
-عزيزي/عزيزتي {patient_name}
-
-نذكرك بموعدك غداً:
-📅 التاريخ: {appointment_date}
-⏰ الوقت: {appointment_time}
-👨‍⚕️ الدكتور: {doctor_name}
-🏥 القسم: {department_name}
-
-نرجو التأكيد على الحضور 🌹
-            """.strip()
-        
-        else:  # 2h reminder
-            return f"""
-تذكير فوري بالموعد ⏰
-
-عزيزي/عزيزتي {patient_name}
-
-موعدك بعد ساعتين:
-🕐 الوقت: {appointment_time}
-👨‍⚕️ الدكتور: {doctor_name}
-
-نترقب زيارتكم 👨‍⚕️
-            """.strip()
+        return build_reminder_message(self.db_manager, appointment, reminder_type, self.clinic_id)
     
     def update_reminder_status(self, appointment_id, reminder_type):
         """تحديث حالة التذكير في قاعدة البيانات"""
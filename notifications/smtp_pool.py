@@ -0,0 +1,216 @@
+# notifications/smtp_pool.py
+import logging
+import smtplib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# عدد الرسائل في الجلسة الواحدة قبل تجديدها (كثير من الخوادم تقطع الجلسات الطويلة)
+SMTP_MAX_MESSAGES_PER_CONNECTION = 100
+
+# الاتصال الخامل أكثر من هذه المدة يُفحص بأمر NOOP قبل استخدامه
+SMTP_IDLE_CHECK_SECONDS = 30
+
+class PooledConnection:
+    """جلسة SMTP مفتوحة مع عدد الرسائل ووقت آخر استخدام"""
+
+    def __init__(self, smtp):
+        self.smtp = smtp
+        self.sent_count = 0
+        self.last_used = time.monotonic()
+
+class SMTPConnectionPool:
+    """مجموعة جلسات SMTP مشتركة بين الخيوط
+
+    تُرسل كل جلسة رسائل كثيرة متتالية بدل فتح اتصال وتسجيل دخول لكل رسالة.
+    الجلسة الخاملة تُفحص بـ NOOP، والجلسة المنقطعة تُستبدل تلقائياً وتُعاد
+    الرسالة عليها مرة واحدة. نتيجة كل رسالة بنفس صيغة موزع الصادر:
+    {'success': bool, 'message': str, 'retryable': bool}.
+    """
+
+    def __init__(self, settings, size=4, idle_check_seconds=SMTP_IDLE_CHECK_SECONDS,
+                 max_messages_per_connection=SMTP_MAX_MESSAGES_PER_CONNECTION,
+                 timeout=30, smtp_factory=smtplib.SMTP):
+        self.settings = dict(settings)
+        self.size = max(int(size), 1)
+        self.idle_check_seconds = idle_check_seconds
+        self.max_messages_per_connection = max_messages_per_connection
+        self.timeout = timeout
+        self.smtp_factory = smtp_factory
+
+        self._idle = []
+        self._open_count = 0
+        self._closed = False
+        self._condition = threading.Condition()
+        self.stats = {'connections_opened': 0, 'reconnects': 0, 'sent': 0, 'failed': 0}
+
+    def _count(self, key, amount=1):
+        with self._condition:
+            self.stats[key] += amount
+
+    def _connect(self):
+        """فتح جلسة جديدة وتسجيل الدخول"""
+        settings = self.settings
+        smtp = self.smtp_factory(settings['smtp_server'], settings['smtp_port'], timeout=self.timeout)
+        try:
+            if settings.get('use_tls'):
+                smtp.starttls()
+            if settings.get('username'):
+                smtp.login(settings['username'], settings.get('password', ''))
+        except Exception:
+            self._close_quietly(smtp)
+            raise
+
+        self._count('connections_opened')
+        return PooledConnection(smtp)
+
+    @staticmethod
+    def _close_quietly(smtp):
+        try:
+            smtp.quit()
+        except Exception:
+            try:
+                smtp.close()
+            except Exception:
+                pass
+
+    @staticmethod
+    def _is_alive(connection):
+        try:
+            return connection.smtp.noop()[0] == 250
+        except Exception:
+            return False
+
+    def acquire(self, timeout=None):
+        """الحصول على جلسة صالحة (من الخاملة أو جديدة ضمن الحد الأقصى)"""
+        with self._condition:
+            while True:
+                if self._closed:
+                    raise smtplib.SMTPServerDisconnected("مجموعة اتصالات SMTP مغلقة")
+                if self._idle:
+                    connection = self._idle.pop()
+                    break
+                if self._open_count < self.size:
+                    self._open_count += 1
+                    connection = None
+                    break
+                if not self._condition.wait(timeout):
+                    raise TimeoutError("انتهت مهلة انتظار اتصال SMTP")
+
+        try:
+            if connection is not None:
+                if time.monotonic() - connection.last_used < self.idle_check_seconds or self._is_alive(connection):
+                    return connection
+                # الخادم أغلق الجلسة الخاملة: نستبدلها بنفس المقعد
+                self._close_quietly(connection.smtp)
+                self._count('reconnects')
+            return self._connect()
+
+        except Exception:
+            with self._condition:
+                self._open_count -= 1
+                self._condition.notify()
+            raise
+
+    def release(self, connection, broken=False):
+        """إرجاع الجلسة للمجموعة، أو إغلاقها إن انقطعت أو استُهلكت"""
+        connection.last_used = time.monotonic()
+        expired = connection.sent_count >= self.max_messages_per_connection
+
+        with self._condition:
+            if not (broken or expired or self._closed):
+                self._idle.append(connection)
+                self._condition.notify()
+                return
+            self._open_count -= 1
+            self._condition.notify()
+
+        if broken:
+            connection.smtp.close()
+        else:
+            self._close_quietly(connection.smtp)
+
+    def send(self, message):
+        """إرسال رسالة واحدة - نتيجة الإرسال"""
+        return self.send_many([message], workers=1)[0]
+
+    def send_many(self, messages, workers=None):
+        """إرسال مجموعة رسائل موزعة على عدة جلسات متوازية - النتائج بنفس الترتيب"""
+        if not messages:
+            return []
+
+        workers = max(min(workers or self.size, self.size, len(messages)), 1)
+        results = [None] * len(messages)
+        chunks = [range(start, len(messages), workers) for start in range(workers)]
+
+        if workers == 1:
+            self._send_chunk(messages, chunks[0], results)
+        else:
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='smtp') as pool:
+                list(pool.map(lambda chunk: self._send_chunk(messages, chunk, results), chunks))
+
+        succeeded = sum(1 for result in results if result['success'])
+        self._count('sent', succeeded)
+        self._count('failed', len(results) - succeeded)
+        return results
+
+    def _send_chunk(self, messages, indexes, results):
+        """إرسال رسائل متتالية على جلسة واحدة مع إعادة الاتصال عند الانقطاع"""
+        connection = None
+
+        for position, index in enumerate(indexes):
+            for attempt in range(2):
+                try:
+                    if connection is None:
+                        connection = self.acquire(self.timeout)
+                except Exception as e:
+                    # تعذر الاتصال أو تسجيل الدخول: لا فائدة من تكرار ذلك لبقية الدفعة
+                    logging.error(f"❌ فشل الاتصال بخادم الإيميل: {e}")
+                    retryable = not isinstance(e, smtplib.SMTPAuthenticationError)
+                    for remaining in list(indexes)[position:]:
+                        results[remaining] = {'success': False, 'retryable': retryable, 'message': str(e)}
+                    return
+
+                try:
+                    connection.smtp.send_message(messages[index])
+                    connection.sent_count += 1
+                    results[index] = {'success': True}
+                    if connection.sent_count >= self.max_messages_per_connection:
+                        self.release(connection)
+                        connection = None
+                    break
+
+                except smtplib.SMTPRecipientsRefused as e:
+                    results[index] = {'success': False, 'retryable': False, 'message': f"رفض المستلم: {e}"}
+                    break
+
+                except smtplib.SMTPResponseException as e:
+                    if e.smtp_code != 421:
+                        results[index] = {'success': False, 'retryable': 400 <= e.smtp_code < 500,
+                                          'message': f"{e.smtp_code} {e.smtp_error!r}"}
+                        break
+                    # 421: الخادم يغلق الجلسة - نعاملها كانقطاع
+                    error = e
+
+                except (smtplib.SMTPServerDisconnected, OSError) as e:
+                    error = e
+
+                self.release(connection, broken=True)
+                connection = None
+                self._count('reconnects')
+                if attempt:
+                    results[index] = {'success': False, 'retryable': True, 'message': str(error)}
+
+        if connection is not None:
+            self.release(connection)
+
+    def close(self):
+        """إغلاق جميع الجلسات الخاملة (الجلسات المستخدمة تُغلق عند إرجاعها)"""
+        with self._condition:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._open_count -= len(idle)
+            self._condition.notify_all()
+
+        for connection in idle:
+            self._close_quietly(connection.smtp)
@@ -3,7 +3,7 @@
 from PyQt5.QtWidgets import (QInputDialog, QMessageBox, QMenu, QDialog)
 from PyQt5.QtCore import Qt
 import logging
-from datetime import datetime
+from datetime import datetime, timedelta
 
 class AppointmentsActions:
     """مدير إجراءات المواعد"""
@@ -248,6 +248,10 @@ class AppointmentsActions:
             # إجراءات متقدمة
             menu.addAction("📊 تغيير الحالة", self.change_status)
             menu.addAction("🗑️ إلغاء الموعد", self.main.cancel_appointment)
+            menu.addAction("🔁 نقل مواعيد الطبيب (غياب)", self.reschedule_doctor_absence)
+            menu.addSeparator()
+            menu.addAction("⏳ إضافة لقائمة الانتظار", self.add_to_waitlist)
+            menu.addAction("📨 تأكيد عرض من قائمة الانتظار", self.accept_waitlist_offer)
             
             # عرض القائمة
             menu.exec_(self.main.appointments_table.viewport().mapToGlobal(position))
@@ -407,6 +411,139 @@ class AppointmentsActions:
                 logging.error(f"❌ خطأ في فتح البريد: {e}")
                 QMessageBox.information(self.main, "بريد", "جاري فتح نافذة البريد الإلكتروني")
     
+    def reschedule_doctor_absence(self):
+        """نقل جميع مواعيد طبيب الموعد المحدد بسبب غيابه"""
+        appointment = self.main.get_selected_appointment()
+        if not appointment:
+            QMessageBox.warning(self.main, "⚠️ تحذير", "يرجى اختيار موعد للطبيب الغائب")
+            return
+        
+        days, ok = QInputDialog.getInt(
+            self.main, "🔁 غياب الطبيب",
+            f"عدد أيام الغياب ابتداءً من {appointment.get('appointment_date', '')}:", 1, 1, 30
+        )
+        if not ok:
+            return
+        
+        try:
+            start_date = datetime.strptime(appointment['appointment_date'], '%Y-%m-%d').date()
+            end_date = start_date + timedelta(days=days - 1)
+            
+            plan = self.main.db_manager.plan_absence_reschedule(appointment['doctor_id'], start_date, end_date)
+            if not plan['success']:
+                QMessageBox.critical(self.main, "❌ خطأ", f"فشل في إعداد الخطة: {plan.get('message', '')}")
+                return
+            if not plan['moves'] and not plan['unassigned']:
+                QMessageBox.information(self.main, "ℹ️ معلومة", "لا توجد مواعيد في فترة الغياب")
+                return
+            
+            # معاينة الخطة قبل التطبيق
+            lines = [f"👤 {move['patient_name']}: {move['from_date']} {move['from_time']} ← "
+                     f"{move['to_date']} {move['to_time']} ({move['to_doctor_name']})"
+                     for move in plan['moves'][:15]]
+            if len(plan['moves']) > 15:
+                lines.append(f"... و {len(plan['moves']) - 15} موعد آخر")
+            if plan['unassigned']:
+                lines.append(f"\n⚠️ {len(plan['unassigned'])} موعد بدون وقت بديل (يحتاج معالجة يدوية)")
+            
+            reply = QMessageBox.question(
+                self.main, "🔁 خطة إعادة الجدولة",
+                f"سيتم نقل {len(plan['moves'])} موعد:\n\n" + "\n".join(lines) + "\n\nهل تريد التطبيق؟",
+                QMessageBox.Yes | QMessageBox.No, QMessageBox.No
+            )
+            if reply != QMessageBox.Yes:
+                return
+            
+            result = self.main.db_manager.apply_reschedule_plan(plan)
+            if not result['success']:
+                QMessageBox.critical(self.main, "❌ خطأ", f"لم يتم تطبيق الخطة: {result['message']}")
+                return
+            
+            # حجب أيام الغياب في جدول الطبيب
+            for offset in range(days):
+                self.main.db_manager.add_schedule_exception({
+                    'doctor_id': appointment['doctor_id'],
+                    'exception_date': (start_date + timedelta(days=offset)).strftime('%Y-%m-%d'),
+                    'exception_type': 'absence',
+                    'reason': 'غياب الطبيب',
+                    'is_all_day': 1
+                })
+            
+            self.main.load_appointments()
+            self.main.data_updated.emit()
+            QMessageBox.information(self.main, "✅ نجاح", result['message'])
+            
+        except Exception as e:
+            logging.error(f"❌ خطأ في نقل مواعيد الطبيب: {e}")
+            QMessageBox.critical(self.main, "❌ خطأ", f"فشل في نقل المواعيد: {e}")
+    
+    def add_to_waitlist(self):
+        """إضافة مريض الموعد المحدد لقائمة انتظار الطبيب للحصول على وقت أقرب"""
+        appointment = self.main.get_selected_appointment()
+        if not appointment:
+            QMessageBox.warning(self.main, "⚠️ تحذير", "يرجى اختيار موعد للمريض المنتظر")
+            return
+        
+        days, ok = QInputDialog.getInt(
+            self.main, "⏳ قائمة الانتظار",
+            f"انتظار وقت متاح لدى {appointment.get('doctor_name', 'الطبيب')} خلال كم يوماً من اليوم؟", 14, 1, 90
+        )
+        if not ok:
+            return
+        
+        try:
+            today = datetime.now().date()
+            entry_id = self.main.db_manager.add_to_waitlist({
+                'patient_id': appointment['patient_id'],
+                'doctor_id': appointment['doctor_id'],
+                'service_type': appointment.get('type'),
+                'earliest_date': today,
+                'latest_date': today + timedelta(days=days),
+                'notes': f"من الموعد رقم {appointment['id']}"
+            })
+            if entry_id:
+                QMessageBox.information(self.main, "✅ نجاح",
+                                        "تمت إضافة المريض لقائمة الانتظار وسيصله عرض عند توفر وقت")
+            else:
+                QMessageBox.critical(self.main, "❌ خطأ", "فشل في الإضافة لقائمة الانتظار")
+                
+        except Exception as e:
+            logging.error(f"❌ خطأ في الإضافة لقائمة الانتظار: {e}")
+            QMessageBox.critical(self.main, "❌ خطأ", f"فشل في الإضافة لقائمة الانتظار: {e}")
+    
+    def accept_waitlist_offer(self):
+        """تأكيد عرض انتظار مرسل لطبيب الموعد المحدد بعد موافقة المريض"""
+        appointment = self.main.get_selected_appointment()
+        if not appointment:
+            QMessageBox.warning(self.main, "⚠️ تحذير", "يرجى اختيار موعد للطبيب")
+            return
+        
+        try:
+            offers = self.main.db_manager.get_sent_waitlist_offers(appointment['doctor_id'])
+            if not offers:
+                QMessageBox.information(self.main, "ℹ️ معلومة", "لا توجد عروض انتظار بانتظار الرد لهذا الطبيب")
+                return
+            
+            labels = [f"👤 {offer['patient_name']} - {offer['appointment_date']} {offer['appointment_time']}"
+                      for offer in offers]
+            label, ok = QInputDialog.getItem(self.main, "📨 عروض قائمة الانتظار",
+                                             "اختر العرض الذي وافق عليه المريض:", labels, 0, False)
+            if not ok:
+                return
+            
+            offer = offers[labels.index(label)]
+            appointment_id = self.main.db_manager.accept_waitlist_offer(offer['id'])
+            if appointment_id:
+                self.main.load_appointments()
+                self.main.data_updated.emit()
+                QMessageBox.information(self.main, "✅ نجاح", f"تم حجز الموعد رقم {appointment_id} من قائمة الانتظار")
+            else:
+                QMessageBox.critical(self.main, "❌ خطأ", "العرض منتهي أو الوقت لم يعد متاحاً")
+                
+        except Exception as e:
+            logging.error(f"❌ خطأ في تأكيد عرض الانتظار: {e}")
+            QMessageBox.critical(self.main, "❌ خطأ", f"فشل في تأكيد عرض الانتظار: {e}")
+    
     def quick_reschedule(self):
         """إعادة جدولة سريعة"""
         appointment = self.main.get_selected_appointment()
@@ -325,10 +325,7 @@ class AppointmentsDataManager:
         self.main.backup_timer.timeout.connect(self.main.backup_manager.auto_backup)
         self.main.backup_timer.start(86400000)  # 24 ساعة
         
-        # مؤقت للتحقق من التذكيرات (كل 30 دقيقة)
-        self.main.reminder_timer = QTimer()
-        self.main.reminder_timer.timeout.connect(self.main.notification_manager.check_reminders)
-        self.main.reminder_timer.start(1800000)  # 30 دقيقة
+        # التذكيرات يرسلها مُنبّه التذكيرات الموحد (notifications.reminder_scheduler)
     
     def get_today_appointments(self):
         """الحصول على مواعيد اليوم"""
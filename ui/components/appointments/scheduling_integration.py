@@ -398,15 +398,34 @@ class SchedulingIntegration(QObject):
         """إضافة استثناء للجدول"""
         try:
             if hasattr(self.db_manager, 'add_schedule_exception'):
-                return self.db_manager.add_schedule_exception(exception_data)
+                result = self.db_manager.add_schedule_exception(exception_data)
+
+                # إبلاغ الواجهة بالمواعيد المحجوزة التي تحتاج إعادة جدولة
+                if result.get('conflicts'):
+                    self.schedule_conflict_detected.emit(result)
+
+                return result
             else:
                 logging.warning("⚠️ دالة add_schedule_exception غير متاحة")
                 return False
-                
+
         except Exception as e:
             logging.error(f"❌ خطأ في إضافة الاستثناء: {e}")
             return False
 
+    def remove_schedule_exception(self, exception_id):
+        """حذف استثناء من الجدول"""
+        try:
+            if hasattr(self.db_manager, 'remove_schedule_exception'):
+                return self.db_manager.remove_schedule_exception(exception_id)
+            else:
+                logging.warning("⚠️ دالة remove_schedule_exception غير متاحة")
+                return False
+
+        except Exception as e:
+            logging.error(f"❌ خطأ في حذف الاستثناء: {e}")
+            return False
+
 # اختبار الملف
 if __name__ == "__main__":
     print("✅ تم تحميل scheduling_integration.py بنجاح")
\ No newline at end of file
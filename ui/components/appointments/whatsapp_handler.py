@@ -3,6 +3,8 @@
 from PyQt5.QtWidgets import QInputDialog, QMessageBox
 import logging
 
+from notifications.outbox_dispatcher import OutboxDispatcher
+
 class WhatsAppHandler:
     """معالج إجراءات الواتساب"""
     
@@ -207,6 +209,21 @@ class WhatsAppHandler:
                 )
                 
                 if reply == QMessageBox.Yes:
+                    # عبر صندوق الصادر إن كان الموزع يعمل (لا تجميد للواجهة ومع إعادة المحاولة)
+                    dispatcher = OutboxDispatcher.get_global_instance()
+                    if dispatcher and dispatcher.is_running:
+                        message_id = self.main.db_manager.enqueue_message(
+                            phone, message, "custom",
+                            appointment_id=appointment.get('id'),
+                            patient_id=appointment.get('patient_id'),
+                            priority=2
+                        )
+                        if message_id:
+                            QMessageBox.information(self.main, "نجاح", "📥 تمت إضافة الرسالة لقائمة الإرسال")
+                        else:
+                            QMessageBox.warning(self.main, "تحذير", "⚠️ فشل في إضافة الرسالة لقائمة الإرسال")
+                        return
+                    
                     success = self.whatsapp_manager.send_message(phone, message, "custom")
                     
                     if success:
@@ -1,24 +1,43 @@
 # -*- coding: utf-8 -*-
-import smtplib
+import time
 import logging
-from email.mime.text import MimeText
-from email.mime.multipart import MimeMultipart
+from email.mime.text import MIMEText
+from email.mime.multipart import MIMEMultipart
 from PyQt5.QtCore import QObject
 
+from notifications.smtp_pool import SMTPConnectionPool
+
+# معلومات العيادة (الاسم والعنوان للتذييل) تُقرأ مرة كل هذه المدة بدل كل رسالة
+CLINIC_INFO_CACHE_SECONDS = 300
+
 class EmailSender(QObject):
-    """مرسل الإيميلات التلقائية"""
+    """مرسل الإيميلات التلقائية
+    
+    الإرسال عبر مجموعة جلسات SMTP مشتركة (SMTPConnectionPool)، والإعدادات
+    تُقرأ مرة وتبقى محفوظة حتى يتغير settings_version في مدير الإعدادات.
+    """
     
-    def __init__(self, db_manager, settings_manager):
+    def __init__(self, db_manager, settings_manager, pool_size=4):
         super().__init__()
         self.db_manager = db_manager
         self.settings_manager = settings_manager
-        self.smtp_connection = None
+        self.pool_size = pool_size
+        self.pool = None
+        
+        self._settings = None
+        self._settings_version = None
+        self._clinic_info = None
+        self._clinic_info_loaded_at = 0
         
         logging.info("✅ تم تهيئة مرسل الإيميلات")
     
     def get_email_settings(self):
-        """الحصول على إعدادات الإيميل"""
+        """الحصول على إعدادات الإيميل (من الذاكرة ما لم تتغير)"""
         try:
+            version = getattr(self.settings_manager, 'settings_version', None)
+            if self._settings is not None and version == self._settings_version:
+                return self._settings
+            
             settings = self.settings_manager.get_system_settings()
             
             email_settings = {
@@ -30,38 +49,63 @@ class EmailSender(QObject):
                 'use_tls': settings.get('smtp_use_tls', '1') == '1'
             }
             
+            # تغيرت إعدادات الخادم: الجلسات المفتوحة لم تعد صالحة
+            if self._settings is not None and email_settings != self._settings:
+                self.close_pool()
+            
+            self._settings = email_settings
+            self._settings_version = version
+            self._clinic_info = None
             return email_settings
         except Exception as e:
             logging.error(f"❌ فشل في الحصول على إعدادات الإيميل: {e}")
             return {}
     
+    def invalidate_settings(self):
+        """إعادة قراءة الإعدادات عند الإرسال القادم"""
+        self._settings = None
+        self._clinic_info = None
+    
+    def get_pool(self):
+        """مجموعة جلسات SMTP بالإعدادات الحالية - None إن كانت الإعدادات ناقصة"""
+        settings = self.get_email_settings()
+        
+        if not all([settings.get('smtp_server'), settings.get('username'), settings.get('password')]):
+            logging.error("❌ إعدادات الإيميل غير مكتملة")
+            return None
+        
+        if self.pool is None:
+            self.pool = SMTPConnectionPool(settings, size=self.pool_size)
+        return self.pool
+    
+    def close_pool(self):
+        """إغلاق جلسات SMTP المفتوحة"""
+        if self.pool:
+            self.pool.close()
+            self.pool = None
+    
     def connect_to_smtp(self):
         """الاتصال بخادم SMTP"""
         try:
-            settings = self.get_email_settings()
-            
-            if not all([settings.get('smtp_server'), settings.get('username'), settings.get('password')]):
-                logging.error("❌ إعدادات الإيميل غير مكتملة")
+            pool = self.get_pool()
+            if not pool:
                 return False
             
-            self.smtp_connection = smtplib.SMTP(settings['smtp_server'], settings['smtp_port'])
-            
-            if settings['use_tls']:
-                self.smtp_connection.starttls()
-            
-            self.smtp_connection.login(settings['username'], settings['password'])
+            connection = pool.acquire(pool.timeout)
+            pool.release(connection)
             logging.info("✅ تم الاتصال بخادم الإيميل بنجاح")
             return True
             
         except Exception as e:
             logging.error(f"❌ فشل في الاتصال بخادم الإيميل: {e}")
-            self.smtp_connection = None
+            self.close_pool()
             return False
     
     def send_notification(self, patient, notification_type):
         """إرسال إشعار إيميل للمريض"""
         try:
-            if not self.smtp_connection and not self.connect_to_smtp():
+            pool = self.get_pool()
+            if not pool:
                 return False
             
             # إنشاء الرسالة
@@ -70,8 +114,10 @@ class EmailSender(QObject):
                 return False
             
             # إرسال الرسالة
-            settings = self.get_email_settings()
-            self.smtp_connection.send_message(message)
+            result = pool.send(message)
+            if not result['success']:
+                logging.error(f"❌ فشل في إرسال الإيميل: {result.get('message')}")
+                return False
             
             logging.info(f"✅ تم إرسال إيميل {notification_type} للمريض {patient.get('name')}")
             return True
@@ -80,27 +126,82 @@ class EmailSender(QObject):
             logging.error(f"❌ فشل في إرسال الإيميل: {e}")
             return False
     
+    def send_bulk_notifications(self, notifications, workers=None):
+        """إرسال إشعارات لعدة مرضى دفعة واحدة
+        
+        notifications: قائمة (patient, notification_type) - تُرجع نتيجة لكل عنصر بنفس الترتيب.
+        """
+        try:
+            pool = self.get_pool()
+            if not pool:
+                return [{'success': False, 'retryable': False, 'message': 'إعدادات الإيميل غير مكتملة'}] * len(notifications)
+            
+            results = [None] * len(notifications)
+            messages, positions = [], []
+            for position, (patient, notification_type) in enumerate(notifications):
+                message = self.create_email_message(patient, notification_type)
+                if message is None:
+                    results[position] = {'success': False, 'retryable': False, 'message': 'تعذر إنشاء الرسالة'}
+                else:
+                    messages.append(message)
+                    positions.append(position)
+            
+            for position, result in zip(positions, pool.send_many(messages, workers)):
+                results[position] = result
+            
+            sent = sum(1 for result in results if result['success'])
+            logging.info(f"📧 تم إرسال {sent} من {len(notifications)} إيميل")
+            return results
+            
+        except Exception as e:
+            logging.error(f"❌ فشل في الإرسال الجماعي للإيميلات: {e}")
+            return [{'success': False, 'message': str(e)}] * len(notifications)
+    
+    def send_emails(self, emails, workers=None):
+        """إرسال رسائل جاهزة [{'recipient', 'subject', 'message'}] (مزود قناة الإيميل في الصادر)"""
+        try:
+            pool = self.get_pool()
+            if not pool:
+                return [{'success': False, 'retryable': False, 'message': 'إعدادات الإيميل غير مكتملة'}] * len(emails)
+            
+            messages = []
+            for email in emails:
+                body = email['message']
+                subtype = 'html' if body.lstrip().startswith('<') else 'plain'
+                messages.append(self.build_message(email['recipient'], email.get('subject') or '', body, subtype))
+            
+            return pool.send_many(messages, workers)
+            
+        except Exception as e:
+            logging.error(f"❌ فشل في إرسال الإيميلات: {e}")
+            return [{'success': False, 'message': str(e)}] * len(emails)
+    
+    def build_message(self, recipient, subject, body, subtype='html'):
+        """بناء رسالة MIME من المرسل الحالي"""
+        settings = self.get_email_settings()
+        
+        message = MIMEMultipart()
+        message['From'] = f"{settings['from_name']} <{settings['username']}>"
+        message['To'] = recipient
+        message['Subject'] = subject
+        message.attach(MIMEText(body, subtype, 'utf-8'))
+        return message
+    
     def create_email_message(self, patient, notification_type):
         """إنشاء رسالة إيميل"""
         try:
-            settings = self.get_email_settings()
             patient_email = patient.get('email')
             
             if not patient_email:
                 logging.error(f"❌ لا يوجد بريد إلكتروني للمريض {patient.get('name')}")
                 return None
             
-            # إنشاء الرسالة
-            message = MimeMultipart()
-            message['From'] = f"{settings['from_name']} <{settings['username']}>"
-            message['To'] = patient_email
-            message['Subject'] = self.get_email_subject(notification_type, patient)
-            
-            # إضافة محتوى الرسالة
-            html_content = self.get_email_content(notification_type, patient)
-            message.attach(MimeText(html_content, 'html', 'utf-8'))
-            
-            return message
+            # إنشاء الرسالة مع محتوى الرسالة
+            return self.build_message(
+                patient_email,
+                self.get_email_subject(notification_type, patient),
+                self.get_email_content(notification_type, patient)
+            )
             
         except Exception as e:
             logging.error(f"❌ فشل في إنشاء رسالة الإيميل: {e}")
@@ -217,9 +318,16 @@ class EmailSender(QObject):
         <p>هذا إشعار مهم من العيادة.</p>
         """
     
+    def get_clinic_info(self):
+        """معلومات العيادة (محفوظة مؤقتاً)"""
+        if self._clinic_info is None or time.monotonic() - self._clinic_info_loaded_at > CLINIC_INFO_CACHE_SECONDS:
+            self._clinic_info = self.settings_manager.get_clinic_info() or {}
+            self._clinic_info_loaded_at = time.monotonic()
+        return self._clinic_info
+    
     def get_email_footer(self):
         """تذييل رسالة الإيميل"""
-        clinic_info = self.settings_manager.get_clinic_info()
+        clinic_info = self.get_clinic_info()
         
         return f"""
         <hr style="margin: 30px 0; border: none; border-top: 1px solid #ddd;">
@@ -233,7 +341,7 @@ class EmailSender(QObject):
     
     def get_clinic_name(self):
         """الحصول على اسم العيادة"""
-        clinic_info = self.settings_manager.get_clinic_info()
+        clinic_info = self.get_clinic_info()
         return clinic_info.get('name', 'العيادة')
     
     def get_patient_appointment_data(self, patient_id):
@@ -264,9 +372,8 @@ class EmailSender(QObject):
     def disconnect(self):
         """قطع الاتصال بخادم SMTP"""
         try:
-            if self.smtp_connection:
-                self.smtp_connection.quit()
-                self.smtp_connection = None
+            if self.pool:
+                self.close_pool()
                 logging.info("✅ تم قطع الاتصال بخادم الإيميل")
         except Exception as e:
             logging.error(f"❌ فشل في قطع الاتصال: {e}")
\ No newline at end of file
@@ -1,46 +1,36 @@
 # -*- coding: utf-8 -*-
 from PyQt5.QtCore import QObject
-import json
 
 class MessageTemplates(QObject):
-    """نظام قوالب الرسائل - للإضافة المستقبلية فقط"""
+    """نظام قوالب الرسائل - واجهة لمحرك القوالب المجمّعة في قاعدة البيانات"""
     
-    def __init__(self, db_path, clinic_id):
+    TEMPLATE_TYPES = ('appointment_confirmation', 'reminder_24h', 'reminder_2h')
+    LEVELS = ('clinic', 'department', 'doctor')
+    
+    def __init__(self, db_manager, clinic_id):
         super().__init__()
-        self.db_path = db_path
+        self.db_manager = db_manager
         self.clinic_id = clinic_id
         self.templates = {}
         self.load_templates()
     
     def load_templates(self):
-        """تحميل القوالب من قاعدة البيانات"""
-        # هذه مجرد هيكلة أساسية للقوالب
+        """تحميل القوالب المجمّعة للعيادة (قوالب message_templates أو الافتراضية)"""
         self.templates = {
-            'appointment_confirmation': {
-                'clinic': "تأكيد موعد - {clinic_name}\n{patient_name} موعدك بتاريخ {date} الساعة {time}",
-                'department': "تأكيد موعد - {department_name}\n{patient_name} موعدك بتاريخ {date} الساعة {time}",
-                'doctor': "تأكيد موعد - د. {doctor_name}\n{patient_name} موعدك بتاريخ {date} الساعة {time}"
-            },
-            'reminder_24h': {
-                'clinic': "تذكير موعد - {clinic_name}\n{patient_name} موعدك غداً {date} الساعة {time}",
-                'department': "تذكير موعد - {department_name}\n{patient_name} موعدك غداً {date} الساعة {time}", 
-                'doctor': "تذكير موعد - د. {doctor_name}\n{patient_name} موعدك غداً {date} الساعة {time}"
-            },
-            'reminder_2h': {
-                'clinic': "تذكير - {clinic_name}\n{patient_name} موعدك بعد ساعتين الساعة {time}",
-                'department': "تذكير - {department_name}\n{patient_name} موعدك بعد ساعتين الساعة {time}",
-                'doctor': "تذكير - د. {doctor_name}\n{patient_name} موعدك بعد ساعتين الساعة {time}"
+            template_type: {
+                level: self.db_manager.get_compiled_template(self.clinic_id, template_type, level)
+                for level in self.LEVELS
             }
+            for template_type in self.TEMPLATE_TYPES
         }
     
     def get_template(self, template_type, level='clinic'):
-        """الحصول على قالب محدد"""
-        return self.templates.get(template_type, {}).get(level, "")
+        """الحصول على نص قالب محدد"""
+        compiled = self.templates.get(template_type, {}).get(level)
+        if compiled is None:
+            compiled = self.db_manager.get_compiled_template(self.clinic_id, template_type, level)
+        return compiled.source if compiled else ""
     
     def apply_template(self, template_type, level, variables):
         """تطبيق القالب مع المتغيرات"""
-        template = self.get_template(template_type, level)
-        try:
-            return template.format(**variables)
-        except:
-            return template
\ No newline at end of file
+        return self.db_manager.render_message(self.clinic_id, template_type, variables, level)
\ No newline at end of file
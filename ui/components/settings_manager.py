@@ -16,6 +16,9 @@ class SettingsManager(QWidget):
         self.db_manager = db_manager
         self.clinic_id = clinic_id
         
+        # يزداد مع كل حفظ لتعرف المكونات (مثل مرسل الإيميل) أن نسختها المحفوظة قديمة
+        self.settings_version = 0
+        
         # إنشاء جدول الإعدادات إذا لم يكن موجوداً
         self.create_settings_table()
         
@@ -634,7 +637,8 @@ class SettingsManager(QWidget):
             
             conn.commit()
             conn.close()
-            
+            self.settings_version += 1
+        
         except Exception as e:
             logging.error(f"❌ خطأ في حفظ إعدادات النظام: {e}")
             raise
@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QTableWidget,
+                             QTableWidgetItem, QPushButton, QLineEdit, QComboBox,
+                             QMessageBox, QHeaderView, QLabel, QCheckBox)
+from PyQt5.QtCore import Qt, QTimer, pyqtSignal
+from PyQt5.QtGui import QColor
+import logging
+
+# فترة تحديث شاشة الطابور (مللي ثانية)
+QUEUE_POLL_INTERVAL = 5000
+
+class WalkInQueueManager(QWidget):
+    """طابور المراجعين اليومي للطبيب: المواعيد والمراجعون بدون موعد مع وقت الانتظار المتوقع"""
+
+    data_updated = pyqtSignal()
+
+    def __init__(self, db_manager):
+        super().__init__()
+        self.db_manager = db_manager
+        self.snapshot = None
+        self.setup_ui()
+        self.load_doctors()
+
+        # اللقطة رخيصة ما لم يتغير الطابور، فيكفي الاستعلام الدوري
+        self.poll_timer = QTimer(self)
+        self.poll_timer.timeout.connect(self.refresh_queue)
+        self.poll_timer.start(QUEUE_POLL_INTERVAL)
+
+    def setup_ui(self):
+        """إعداد واجهة الطابور"""
+        layout = QVBoxLayout(self)
+
+        header = QHBoxLayout()
+        header.addWidget(QLabel("👨‍⚕️ الطبيب:"))
+        self.doctor_combo = QComboBox()
+        self.doctor_combo.currentIndexChanged.connect(lambda: self.refresh_queue(force=True))
+        header.addWidget(self.doctor_combo)
+        header.addStretch()
+        self.summary_label = QLabel()
+        self.summary_label.setStyleSheet("font-weight: bold; color: #2c3e50;")
+        header.addWidget(self.summary_label)
+        layout.addLayout(header)
+
+        self.in_service_label = QLabel("🩺 لا يوجد مراجع عند الطبيب")
+        self.in_service_label.setStyleSheet("""
+            QLabel {
+                background-color: #e8f5e9;
+                border: 1px solid #a5d6a7;
+                border-radius: 6px;
+                padding: 10px;
+                font-size: 15px;
+                font-weight: bold;
+            }
+        """)
+        layout.addWidget(self.in_service_label)
+
+        self.table = QTableWidget()
+        self.table.setColumnCount(5)
+        self.table.setHorizontalHeaderLabels(["الدور", "المريض", "النوع", "الوقت المتوقع", "الانتظار (دقيقة)"])
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.table.setSelectionBehavior(QTableWidget.SelectRows)
+        self.table.setEditTriggers(QTableWidget.NoEditTriggers)
+        layout.addWidget(self.table)
+
+        walk_in_layout = QHBoxLayout()
+        self.name_input = QLineEdit()
+        self.name_input.setPlaceholderText("اسم المراجع")
+        self.phone_input = QLineEdit()
+        self.phone_input.setPlaceholderText("الهاتف")
+        self.urgent_check = QCheckBox("⚡ عاجل")
+        add_btn = QPushButton("➕ إضافة بدون موعد")
+        add_btn.clicked.connect(self.add_walk_in)
+        walk_in_layout.addWidget(self.name_input)
+        walk_in_layout.addWidget(self.phone_input)
+        walk_in_layout.addWidget(self.urgent_check)
+        walk_in_layout.addWidget(add_btn)
+        layout.addLayout(walk_in_layout)
+
+        actions_layout = QHBoxLayout()
+        next_btn = QPushButton("📢 نداء التالي")
+        next_btn.clicked.connect(self.call_next)
+        finish_btn = QPushButton("✅ إنهاء الحالي")
+        finish_btn.clicked.connect(self.finish_current)
+        left_btn = QPushButton("🚪 غادر")
+        left_btn.clicked.connect(self.mark_left)
+        for button in (next_btn, finish_btn, left_btn):
+            actions_layout.addWidget(button)
+        layout.addLayout(actions_layout)
+
+    def load_doctors(self):
+        """تحميل قائمة الأطباء"""
+        try:
+            self.doctor_combo.blockSignals(True)
+            self.doctor_combo.clear()
+            for doctor in self.db_manager.get_doctors():
+                self.doctor_combo.addItem(doctor['name'], doctor['id'])
+            self.doctor_combo.blockSignals(False)
+            self.refresh_queue(force=True)
+        except Exception as e:
+            logging.error(f"❌ خطأ في تحميل الأطباء للطابور: {e}")
+
+    def current_doctor_id(self):
+        return self.doctor_combo.currentData()
+
+    def refresh_queue(self, force=False):
+        """تحديث جدول الطابور من لقطة قاعدة البيانات"""
+        doctor_id = self.current_doctor_id()
+        if not doctor_id:
+            return
+
+        # نفس كائن اللقطة يعني أن الطابور لم يتغير منذ آخر تحديث
+        snapshot = self.db_manager.get_queue_snapshot(doctor_id)
+        if not force and snapshot is self.snapshot:
+            return
+        self.snapshot = snapshot
+
+        in_service = snapshot.get('in_service')
+        if in_service:
+            self.in_service_label.setText(
+                f"🩺 عند الطبيب: {in_service['label']} - {in_service['patient_name']} (منذ {in_service['started']})")
+        else:
+            self.in_service_label.setText("🩺 لا يوجد مراجع عند الطبيب")
+
+        self.summary_label.setText(
+            f"⏱️ {snapshot.get('now', '')} | 👥 ينتظر: {snapshot['waiting_count']} | "
+            f"متوسط الكشف: {round(snapshot.get('avg_service_minutes') or 0)} دقيقة")
+
+        queue = snapshot['queue']
+        self.table.setRowCount(len(queue))
+        for row, entry in enumerate(queue):
+            kind = "🚶 بدون موعد" if entry['kind'] == 'walk_in' else (
+                "📅 موعد (حاضر)" if entry['checked_in'] else "📅 موعد")
+            values = [entry['label'], entry['patient_name'], kind,
+                      entry['estimated_time'], str(entry['wait_minutes'])]
+            for column, value in enumerate(values):
+                item = QTableWidgetItem(value)
+                item.setTextAlignment(Qt.AlignCenter)
+                if column == 0:
+                    item.setData(Qt.UserRole, (entry['kind'], entry['id']))
+                if not entry['checked_in']:
+                    item.setForeground(QColor('#95a5a6'))
+                self.table.setItem(row, column, item)
+
+    def add_walk_in(self):
+        """تسجيل مراجع بدون موعد"""
+        doctor_id = self.current_doctor_id()
+        name = self.name_input.text().strip()
+        if not doctor_id or not name:
+            QMessageBox.warning(self, "تنبيه", "يرجى اختيار الطبيب وإدخال اسم المراجع")
+            return
+
+        result = self.db_manager.add_walk_in(doctor_id, name, self.phone_input.text().strip(),
+                                             priority=1 if self.urgent_check.isChecked() else 0)
+        if not result.get('success'):
+            QMessageBox.critical(self, "خطأ", f"فشل تسجيل المراجع: {result.get('message', '')}")
+            return
+
+        self.name_input.clear()
+        self.phone_input.clear()
+        self.urgent_check.setChecked(False)
+        self.refresh_queue(force=True)
+        self.data_updated.emit()
+        QMessageBox.information(
+            self, "رقم الدور",
+            f"🎫 رقم الدور: {result['ticket_number']}\n"
+            f"⏳ الانتظار المتوقع: {result['wait_minutes'] or 0} دقيقة")
+
+    def call_next(self):
+        """نداء المراجع التالي"""
+        doctor_id = self.current_doctor_id()
+        if not doctor_id:
+            return
+        entry = self.db_manager.call_next_patient(doctor_id)
+        if not entry:
+            QMessageBox.information(self, "الطابور", "لا يوجد مراجعون حاضرون في الانتظار")
+        self.refresh_queue(force=True)
+        self.data_updated.emit()
+
+    def finish_current(self):
+        """إنهاء المراجع الحالي"""
+        doctor_id = self.current_doctor_id()
+        if doctor_id and self.db_manager.finish_current_patient(doctor_id):
+            self.refresh_queue(force=True)
+            self.data_updated.emit()
+
+    def mark_left(self):
+        """خروج المراجع المحدد قبل دوره"""
+        row = self.table.currentRow()
+        item = self.table.item(row, 0) if row >= 0 else None
+        if not item:
+            return
+        kind, entry_id = item.data(Qt.UserRole)
+        if kind != 'walk_in':
+            QMessageBox.warning(self, "تنبيه", "يمكن تحديث حالة المواعيد من إدارة المواعيد")
+            return
+        if self.db_manager.mark_walk_in_left(entry_id):
+            self.refresh_queue(force=True)
+
+    def refresh_data(self):
+        """تحديث البيانات"""
+        self.load_doctors()
@@ -279,6 +279,76 @@ class AppointmentDialog(QDialog):
         
         return True
     
+    def save_recurring_series(self, appointment_data):
+        """حجز سلسلة مواعيد متكررة بعد معاينة التواريخ المتعارضة"""
+        series_data = dict(appointment_data, start_date=appointment_data['appointment_date'])
+        rule = appointment_data['recurrence']
+        
+        preview = self.db_manager.preview_recurring_series(series_data, rule)
+        if not preview['success']:
+            QMessageBox.critical(self, "خطأ", f"❌ تعذر إنشاء السلسلة: {preview.get('message', '')}")
+            return
+        
+        total = preview['ok_count'] + preview['conflict_count']
+        use_alternatives = False
+        if preview['conflict_count']:
+            conflicts = [check for check in preview['occurrences'] if not check['ok']]
+            details = "\n".join(
+                f"• {check['date']}: {check['reason']}"
+                + (f" (بديل: {check['alternative']})" if check['alternative'] else "")
+                for check in conflicts[:10]
+            )
+            reply = QMessageBox.question(
+                self, "تعارضات في السلسلة",
+                f"🔁 {preview['description']}\n"
+                f"✅ متاح: {preview['ok_count']} من {total}\n"
+                f"⚠️ يحتاج وقتاً بديلاً: {preview['conflict_count']}\n\n{details}\n\n"
+                "نعم: الحجز مع استخدام أقرب وقت بديل\n"
+                "لا: حجز الأوقات المتاحة فقط",
+                QMessageBox.Yes | QMessageBox.No | QMessageBox.Cancel
+            )
+            if reply == QMessageBox.Cancel:
+                return
+            use_alternatives = reply == QMessageBox.Yes
+        
+        result = self.db_manager.create_recurring_series(series_data, rule, use_alternatives=use_alternatives)
+        if not result['success'] or not result['booked']:
+            self.controls_status.set_status("error", "فشل في حجز السلسلة")
+            QMessageBox.critical(self, "خطأ", f"❌ فشل في حجز السلسلة: {result.get('message', '')}")
+            return
+        
+        appointment_data['id'] = result['booked'][0]['appointment_id']
+        appointment_data['appointment_time'] = result['booked'][0]['time']
+        self.appointment_saved.emit(appointment_data)
+        
+        message = f"✅ {result['message']}"
+        if result['needs_alternative']:
+            message += "\n\n⚠️ تواريخ تحتاج حجزاً يدوياً:\n" + "\n".join(
+                f"• {check['date']}: {check['reason']}" for check in result['needs_alternative'][:10])
+        QMessageBox.information(self, "سلسلة المواعيد", message)
+        self.accept()
+    
+    def check_patient_conflicts(self, appointment_data):
+        """منع حجز المريض في وقتين متداخلين مع أي طبيب"""
+        if self.db_manager.is_cancelled_status(appointment_data['status']):
+            return True
+        
+        conflicts = self.db_manager.find_patient_conflicts(
+            appointment_data['patient_id'],
+            appointment_data['appointment_date'],
+            appointment_data['appointment_time'],
+            appointment_data['type'],
+            exclude_appointment_id=self.appointment_data['id'] if self.is_edit_mode else None
+        )
+        if not conflicts:
+            return True
+        
+        details = "\n".join(f"• {conflict['appointment_time']} - {conflict['doctor_name']}" for conflict in conflicts)
+        self.controls_status.set_status("error", "تعارض في مواعيد المريض")
+        QMessageBox.warning(self, "تعارض مواعيد",
+            f"⚠️ المريض لديه موعد متداخل في نفس التاريخ:\n{details}\n\nيرجى اختيار وقت آخر.")
+        return False
+    
     def get_appointment_form_data(self):
         """الحصول على بيانات النموذج من جميع المكونات"""
         basic_data = self.basic_info_tab.get_form_data()
@@ -300,6 +370,7 @@ class AppointmentDialog(QDialog):
             'type': basic_data['type'].split(' ', 1)[-1] if basic_data['type'] else '',  # إزالة الرمز
             'status': basic_data['status'].split(' ', 1)[-1] if basic_data['status'] else '',  # إزالة الرمز
             'notes': basic_data['notes'] or None,
+            'recurrence': basic_data.get('recurrence'),
             'whatsapp_data': whatsapp_data if self.whatsapp_manager else None
         }
         
@@ -348,6 +419,13 @@ class AppointmentDialog(QDialog):
             
             appointment_data = self.get_appointment_form_data()
             
+            if appointment_data.get('recurrence') and not self.is_edit_mode:
+                self.save_recurring_series(appointment_data)
+                return
+            
+            if not self.check_patient_conflicts(appointment_data):
+                return
+            
             if self.is_edit_mode:
                 # تحديث الموعد الحالي
                 success = self.db_manager.update_appointment(self.appointment_data['id'], appointment_data)
@@ -383,6 +461,12 @@ class AppointmentDialog(QDialog):
             self.controls_status.set_status("error", f"خطأ في الحفظ: {e}")
             QMessageBox.critical(self, "خطأ", f"❌ حدث خطأ غير متوقع: {e}")
     
+    def done(self, result):
+        """إيقاف التجديد الخلفي للجدولة الذكية قبل إغلاق النافذة"""
+        if self.smart_scheduling_ui:
+            self.smart_scheduling_ui.stop_auto_renewal()
+        super().done(result)
+        
     def send_whatsapp_message(self, appointment_data):
         """إرسال رسالة واتساب"""
         try:
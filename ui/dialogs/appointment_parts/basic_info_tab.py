@@ -1,7 +1,8 @@
 # -*- coding: utf-8 -*-
 from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QFormLayout,
                              QLineEdit, QTextEdit, QComboBox, QDateEdit, 
-                             QTimeEdit, QPushButton, QLabel, QGroupBox, QFrame, QGridLayout, QCheckBox)
+                             QTimeEdit, QPushButton, QLabel, QGroupBox, QFrame, QGridLayout, QCheckBox,
+                             QSpinBox)
 from PyQt5.QtCore import Qt, QDate, QTime, pyqtSignal
 from PyQt5.QtGui import QFont
 import logging
@@ -18,6 +19,14 @@ class BasicInfoTab(QWidget):
     doctor_changed = pyqtSignal()  # ⭐ جديد
     date_changed = pyqtSignal()    # ⭐ جديد
     
+    # خيارات التكرار: (النص، قاعدة التكرار بدون العدد)
+    RECURRENCE_OPTIONS = [
+        ("أسبوعياً", {'freq': 'weekly', 'interval': 1}),
+        ("كل أسبوعين", {'freq': 'weekly', 'interval': 2}),
+        ("يومياً", {'freq': 'daily', 'interval': 1}),
+        ("شهرياً", {'freq': 'monthly', 'interval': 1}),
+    ]
+    
     def __init__(self, db_manager, parent=None):
         super().__init__(parent)
         self.db_manager = db_manager
@@ -130,7 +139,7 @@ class BasicInfoTab(QWidget):
         
         # نوع الموعد
         self.type_combo = QComboBox()
-        self.type_combo.addItems(["🩺 كشف", "📋 روتيني", "🚨 مستعجل", "🔄 متابعة", "💬 استشارة"])
+        self.type_combo.addItems(["🩺 كشف", "📋 روتيني", "🚨 مستعجل", "🔄 متابعة", "💬 استشارة", "☢️ أشعة", "🧪 تحاليل"])
         self.setup_combo_style(self.type_combo)
         
         # حالة الموعد
@@ -141,6 +150,30 @@ class BasicInfoTab(QWidget):
         ])
         self.setup_combo_style(self.status_combo)
         
+        # التكرار (سلسلة مواعيد متابعة)
+        recurrence_layout = QHBoxLayout()
+        
+        self.recurrence_check = QCheckBox("🔁 موعد متكرر")
+        
+        self.recurrence_combo = QComboBox()
+        for text, rule in self.RECURRENCE_OPTIONS:
+            self.recurrence_combo.addItem(text, rule)
+        self.setup_combo_style(self.recurrence_combo)
+        
+        self.recurrence_count = QSpinBox()
+        self.recurrence_count.setRange(2, 104)
+        self.recurrence_count.setValue(8)
+        self.recurrence_count.setSuffix(" مرة")
+        
+        self.recurrence_combo.setEnabled(False)
+        self.recurrence_count.setEnabled(False)
+        self.recurrence_check.toggled.connect(self.recurrence_combo.setEnabled)
+        self.recurrence_check.toggled.connect(self.recurrence_count.setEnabled)
+        
+        recurrence_layout.addWidget(self.recurrence_check)
+        recurrence_layout.addWidget(self.recurrence_combo)
+        recurrence_layout.addWidget(self.recurrence_count)
+        
         # الملاحظات
         self.notes_input = QTextEdit()
         self.notes_input.setMaximumHeight(80)
@@ -161,6 +194,7 @@ class BasicInfoTab(QWidget):
         appointment_layout.addRow("📅 التاريخ والوقت *:", date_time_layout)
         appointment_layout.addRow("🎯 نوع الموعد:", self.type_combo)
         appointment_layout.addRow("📊 حالة الموعد:", self.status_combo)
+        appointment_layout.addRow("🔁 التكرار:", recurrence_layout)
         appointment_layout.addRow("💭 ملاحظات:", self.notes_input)
         
         parent_layout.addWidget(appointment_group)
@@ -260,9 +294,16 @@ class BasicInfoTab(QWidget):
             'time': self.appointment_time.time().toString('hh:mm'),
             'type': self.type_combo.currentText(),
             'status': self.status_combo.currentText(),
-            'notes': self.notes_input.toPlainText()
+            'notes': self.notes_input.toPlainText(),
+            'recurrence': self.get_recurrence_rule()
         }
     
+    def get_recurrence_rule(self):
+        """قاعدة التكرار المختارة (None إن لم يكن الموعد متكرراً)"""
+        if not self.recurrence_check.isChecked():
+            return None
+        return dict(self.recurrence_combo.currentData(), count=self.recurrence_count.value())
+    
     def set_form_data(self, appointment_data):
         """تعبئة البيانات في النموذج"""
         try:
@@ -12,6 +12,7 @@ import logging
 from datetime import datetime, timedelta
 
 from ui.dialogs.widgets.smart_scheduler import SmartScheduler
+from core.schedule_renewal_worker import ScheduleRenewalWorker
 
 class SmartSchedulingUI(QWidget):
     """واجهة الجدولة الذكية المتكاملة - الإصدار الحقيقي"""
@@ -34,6 +35,7 @@ class SmartSchedulingUI(QWidget):
         self.connect_signals()
         
         # مؤقت للتجديد التلقائي
+        self.renewal_worker = None
         self.auto_renew_timer = QTimer(self)
         self.auto_renew_timer.timeout.connect(self.check_auto_renew)
         self.auto_renew_timer.start(3600000)  # كل ساعة
@@ -316,6 +318,15 @@ class SmartSchedulingUI(QWidget):
             week_text = f"أسبوع {week_start.toString('dd/MM')} - {week_end.toString('dd/MM/yyyy')}"
             self.week_selector.addItem(week_text, week_start)
             
+    # نص ولون خلية الوقت في الجدول الأسبوعي حسب الحالة
+    WEEKLY_CELL_STYLES = {
+        'available': ("🟢 متاح", "#D5F5E3"),
+        'booked': ("🔴 محجوز", "#FADBD8"),
+        'held': ("🟡 معروض", "#FCF3CF"),
+        'blocked': ("⛔ مغلق", "#E5E7E9"),
+        'break': ("☕ راحة", "#EBF5FB"),
+    }
+    
     def setup_weekly_table(self, parent_layout):
         """إعداد جدول العرض الأسبوعي"""
         self.weekly_table = QTableWidget()
@@ -719,12 +730,45 @@ class SmartSchedulingUI(QWidget):
                               f"تم اختيار الموعد:\nالتاريخ: {selected_date}\nالوقت: {time_str}")
         
     def update_weekly_display(self):
-        """تحديث العرض الأسبوعي"""
-        if not self.periodic_schedule_data:
+        """تحديث العرض الأسبوعي من شبكة الجدول العمودية"""
+        if not self.current_doctor_id:
             return
             
-        # TODO: تنفيذ تحديث الجدول الأسبوعي
-        pass
+        week_start = self.week_selector.currentData()
+        if not week_start:
+            return
+        week_start = week_start.toPyDate()
+        
+        grid = self.db_manager.get_schedule_grid(
+            self.current_doctor_id, week_start, week_start + timedelta(days=6)
+        )
+        minutes = grid['minutes']
+        status = grid['status']
+        offsets = grid['day_offsets']
+        codes = grid['status_codes']
+        
+        # صف لكل وقت مستخدم خلال الأسبوع، وعمود لكل يوم (الأحد أولاً)
+        rows = sorted(set(minutes))
+        row_index = {minute: row for row, minute in enumerate(rows)}
+        
+        self.weekly_table.setRowCount(len(rows))
+        for row, minute in enumerate(rows):
+            self.weekly_table.setItem(row, 0, QTableWidgetItem(f"{minute // 60:02d}:{minute % 60:02d}"))
+            for column in range(1, 8):
+                self.weekly_table.setItem(row, column, QTableWidgetItem(""))
+        
+        for day, ordinal in enumerate(grid['day_ordinals']):
+            column = (ordinal % 7) + 1  # (ordinal - 1) % 7 = الإثنين 0 ... الأحد 6
+            is_full = grid['day_full'][day]
+            for index in range(offsets[day], offsets[day + 1]):
+                slot_status = codes[status[index]]
+                if slot_status == 'available' and is_full:
+                    slot_status = 'blocked'
+                text, color = self.WEEKLY_CELL_STYLES.get(slot_status, ("", "#FFFFFF"))
+                item = QTableWidgetItem(text)
+                item.setTextAlignment(Qt.AlignCenter)
+                item.setBackground(QColor(color))
+                self.weekly_table.setItem(row_index[minutes[index]], column, item)
         
     def update_stats_display(self):
         """تحديث عرض الإحصائيات"""
@@ -756,14 +800,30 @@ class SmartSchedulingUI(QWidget):
         self.load_periodic_schedule()
         
     def check_auto_renew(self):
-        """التحقق من التجديد التلقائي"""
+        """التحقق من التجديد التلقائي في خيط خلفي"""
         try:
-            renewed_count = self.db_manager.check_and_renew_schedules()
-            if renewed_count > 0:
-                logging.info(f"تم التجديد التلقائي لـ {renewed_count} جدول")
+            if self.renewal_worker and self.renewal_worker.isRunning():
+                return
+            self.renewal_worker = ScheduleRenewalWorker(self.db_manager, parent=self)
+            self.renewal_worker.renewal_finished.connect(self.on_auto_renew_finished)
+            self.renewal_worker.start()
         except Exception as e:
             logging.error(f"خطأ في التجديد التلقائي: {e}")
             
+    def on_auto_renew_finished(self, metrics):
+        """تحديث العرض بعد انتهاء التجديد الخلفي"""
+        renewed_count = metrics.get('renewed', 0)
+        if renewed_count > 0:
+            logging.info(f"تم التجديد التلقائي لـ {renewed_count} جدول خلال {metrics.get('elapsed_ms', 0)} ms")
+            self.refresh_availability()
+            
+    def stop_auto_renewal(self):
+        """إيقاف مؤقت التجديد وانتظار العامل الخلفي (قبل إغلاق النافذة)"""
+        self.auto_renew_timer.stop()
+        if self.renewal_worker and self.renewal_worker.isRunning():
+            self.renewal_worker.cancel()
+            self.renewal_worker.wait()
+            
     def manage_schedules(self):
         """إدارة الجداول"""
         QMessageBox.information(self, "إدارة الجداول", 
@@ -845,8 +905,7 @@ class SmartSchedulingUI(QWidget):
         
     def on_week_changed(self, index):
         """عند تغيير الأسبوع"""
-        # TODO: تنفيذ تغيير الأسبوع
-        pass
+        self.update_weekly_display()
 
     def get_group_style(self):
         """نمط المجموعة"""
@@ -34,7 +34,7 @@ class SmartScheduler(QObject):
             # 1. جلب المواعيد الحالية من النظام الحالي
             appointments = self.db_manager.get_appointments(
                 doctor_id=doctor_id,
-                date=date
+                target_date=date
             )
             
             if appointments is None:
@@ -47,7 +47,8 @@ class SmartScheduler(QObject):
             booked_slots = self._get_booked_slots(appointments)
             
             # 4. تحليل الذكاء البسيط
-            smart_analysis = self._analyze_availability_patterns(time_slots, booked_slots, appointments)
+            smart_analysis = self._analyze_availability_patterns(time_slots, booked_slots, appointments,
+                                                                 doctor_id, date)
             
             result = {
                 'success': True,
@@ -75,11 +76,8 @@ class SmartScheduler(QObject):
     
     def _generate_time_slots(self):
         """توليد الأوقات من 8 صباحاً إلى 8 مساءً بفاصل 30 دقيقة"""
-        slots = []
-        for hour in range(8, 20):  # من 8 ص إلى 8 م
-            for minute in ['00', '30']:
-                slots.append(f"{hour:02d}:{minute}")
-        return slots
+        # من 8 ص إلى 8 م بالدقائق، والتحويل إلى 'HH:MM' للعرض فقط
+        return [f"{minute // 60:02d}:{minute % 60:02d}" for minute in range(8 * 60, 20 * 60, 30)]
     
     def _get_booked_slots(self, appointments):
         """استخراج الأوقات المشغولة من المواعيد"""
@@ -94,8 +92,8 @@ class SmartScheduler(QObject):
         
         return booked_slots
     
-    def _analyze_availability_patterns(self, time_slots, booked_slots, appointments):
-        """تحليل بسيط لأنماط التوفر"""
+    def _analyze_availability_patterns(self, time_slots, booked_slots, appointments, doctor_id=None, date=None):
+        """تحليل أنماط التوفر من إحصائيات الطلب المحسوبة مسبقاً (مع بديل بسيط عند غيابها)"""
         try:
             analysis = {
                 'best_times': [],
@@ -103,27 +101,27 @@ class SmartScheduler(QObject):
                 'recommendations': []
             }
             
-            # تحليل الأوقات المثالية (الأقل ازدحاماً)
             available_slots = [slot for slot in time_slots if slot not in booked_slots]
+            has_stats = bool(doctor_id and date and hasattr(self.db_manager, 'get_demand_stats')
+                             and any(self.db_manager.get_demand_stats(doctor_id)))
             
-            if available_slots:
+            if has_stats:
+                # الأوقات الأقل إشغالاً تاريخياً في نفس يوم الأسبوع وساعته
+                analysis['best_times'] = self.db_manager.rank_times_by_demand(doctor_id, date, available_slots)[:3]
+                analysis['busy_periods'] = [f"{hour:02d}:00-{hour:02d}:59"
+                                            for hour in self.db_manager.get_busy_hours(doctor_id, date)]
+            else:
                 # الأوقات الصباحية عادةً أقل ازدحاماً
                 morning_slots = [slot for slot in available_slots if int(slot.split(':')[0]) < 12]
-                if morning_slots:
-                    analysis['best_times'] = morning_slots[:3]  # أفضل 3 أوقات صباحية
-                else:
-                    analysis['best_times'] = available_slots[:3]
-            
-            # تحديد فترات الذروة
-            hour_counts = {}
-            for slot in booked_slots:
-                hour = slot.split(':')[0]
-                hour_counts[hour] = hour_counts.get(hour, 0) + 1
-            
-            # الفترات الأكثر ازدحاماً
-            if hour_counts:
-                busy_hours = sorted(hour_counts.items(), key=lambda x: x[1], reverse=True)[:2]
-                analysis['busy_periods'] = [f"{hour}:00-{hour}:59" for hour, count in busy_hours]
+                analysis['best_times'] = (morning_slots or available_slots)[:3]
+                
+                hour_counts = {}
+                for slot in booked_slots:
+                    hour = slot.split(':')[0]
+                    hour_counts[hour] = hour_counts.get(hour, 0) + 1
+                if hour_counts:
+                    busy_hours = sorted(hour_counts.items(), key=lambda x: x[1], reverse=True)[:2]
+                    analysis['busy_periods'] = [f"{hour}:00-{hour}:59" for hour, count in busy_hours]
             
             # توصيات ذكية بسيطة
             available_count = len(available_slots)
@@ -136,10 +134,13 @@ class SmartScheduler(QObject):
             elif available_count > total_slots * 0.7:
                 analysis['recommendations'].append("أوقات ممتازة متاحة. اليوم هادئ نسبياً.")
             
-            # اقتراح الأوقات المبكرة
-            early_slots = [slot for slot in available_slots if int(slot.split(':')[0]) <= 10]
-            if early_slots:
-                analysis['recommendations'].append(f"الأوقات المبكرة ({early_slots[0]}) عادةً ما تكون أفضل.")
+            if analysis['best_times']:
+                analysis['recommendations'].append(f"الوقت ({analysis['best_times'][0]}) عادةً ما يكون الأهدأ.")
+            
+            if has_stats and analysis['best_times']:
+                hour_stats = self.db_manager.get_hour_stats(doctor_id, date, int(analysis['best_times'][0].split(':')[0]))
+                if hour_stats and hour_stats['no_show_rate'] >= 0.25:
+                    analysis['recommendations'].append("⚠️ نسبة عدم الحضور مرتفعة في هذا الوقت - يُنصح بتأكيد الموعد.")
             
             return analysis
             
@@ -186,6 +187,10 @@ class SmartScheduler(QObject):
             availability_data = self.get_doctor_availability(doctor_id, date)
             available_count = availability_data.get('available_count', 0)
             
+            best_times = availability_data.get('smart_analysis', {}).get('best_times', [])
+            if best_times:
+                suggestions.append(f"📊 الأوقات الأهدأ عادةً: {'، '.join(best_times)}")
+            
             if available_count > 10:
                 suggestions.append("✅ اليوم ممتاز - الكثير من الأوقات المتاحة")
             elif available_count > 5:
@@ -24,10 +24,15 @@ class MainWindow(QMainWindow):
         # إدارة الإعدادات والمكونات
         self.settings_manager = None
         self.notification_system = None
+        self.outbox_dispatcher = None
+        self.email_sender = None
+        self.receipt_receiver = None
+        self.system_integrator = None
         
         # المكونات الرئيسية
         self.dashboard = None
         self.appointments_manager = None
+        self.walk_in_queue = None
         self.patients_manager = None
         self.doctors_manager = None
         self.departments_manager = None
@@ -220,6 +225,15 @@ class MainWindow(QMainWindow):
             # 2. ثانياً: تحميل WhatsApp Manager أولاً ليتم ربطه مع الإشعارات
             self.load_whatsapp_manager_early()
             
+            # 2.1 موزع الرسائل الصادرة (إرسال في الخلفية مع إعادة المحاولة)
+            self.setup_outbox_dispatcher()
+            
+            # 2.2 مستقبل إيصالات التسليم وردود المرضى (إن كان مفعلاً)
+            self.setup_receipt_receiver()
+            
+            # 2.3 مكامل النظام: تجديد الجداول وإحصائيات الطلب في الخلفية
+            self.setup_system_integrator()
+            
             # 3. ثالثاً: تحميل نظام الإشعارات
             self.setup_notification_system()
             
@@ -266,6 +280,7 @@ class MainWindow(QMainWindow):
             components = [
                 ('dashboard', '🏠 اللوحة الرئيسية', self.create_dashboard_tab),
                 ('appointments_manager', '📅 إدارة المواعيد', self.create_appointments_tab),
+                ('walk_in_queue', '🚶 طابور المراجعين', self.create_walk_in_queue_tab),
                 ('patients_manager', '👥 إدارة المرضى', self.create_patients_tab),
                 ('doctors_manager', '👨‍⚕️ إدارة الأطباء', self.create_doctors_tab),
                 ('departments_manager', '🏥 إدارة الأقسام', self.create_departments_tab),
@@ -340,6 +355,23 @@ class MainWindow(QMainWindow):
             logging.error(f"❌ خطأ عام في تحميل AppointmentsManager: {e}")
             return self.create_fallback_widget("إدارة المواعيد")
 
+    def create_walk_in_queue_tab(self):
+        """إنشاء تبويب طابور المراجعين"""
+        try:
+            for module_path in ['ui.components.walk_in_queue', 'components.walk_in_queue']:
+                try:
+                    module = __import__(module_path, fromlist=['WalkInQueueManager'])
+                    component_class = getattr(module, 'WalkInQueueManager')
+                    return component_class(self.db_manager)
+                except ImportError:
+                    continue
+            
+            return self.create_fallback_widget("طابور المراجعين")
+            
+        except Exception as e:
+            logging.error(f"❌ خطأ في تحميل WalkInQueueManager: {e}")
+            return self.create_fallback_widget("طابور المراجعين")
+
     def create_patients_tab(self):
         """إنشاء تبويب إدارة المرضى"""
         try:
@@ -472,6 +504,62 @@ class MainWindow(QMainWindow):
         except Exception as e:
             logging.error(f"❌ فشل في تحميل مدير الإعدادات: {e}")
 
+    def setup_outbox_dispatcher(self):
+        """تشغيل موزع صندوق الرسائل الصادرة وربطه بمزود الواتساب"""
+        try:
+            from notifications.outbox_dispatcher import OutboxDispatcher, whatsapp_outbox_sender, email_outbox_sender
+            
+            self.outbox_dispatcher = OutboxDispatcher(self.db_manager, workers=4)
+            if self.whatsapp_manager and hasattr(self.whatsapp_manager, 'send_message'):
+                self.outbox_dispatcher.register_sender('whatsapp', whatsapp_outbox_sender(self.whatsapp_manager))
+            
+            # الإيميل عبر جلسات SMTP مشتركة
+            if self.settings_manager is not None:
+                from ui.components.email_sender import EmailSender
+                self.email_sender = EmailSender(self.db_manager, self.settings_manager)
+                self.outbox_dispatcher.register_sender('email', email_outbox_sender(self.email_sender))
+            
+            OutboxDispatcher.set_global_instance(self.outbox_dispatcher)
+            self.outbox_dispatcher.start()
+            
+        except Exception as e:
+            logging.error(f"❌ فشل في تشغيل موزع الرسائل الصادرة: {e}")
+
+    def setup_receipt_receiver(self):
+        """تشغيل مستقبل إيصالات التسليم المحلي (webhook) حسب إعدادات النظام"""
+        try:
+            if self.settings_manager is None:
+                return
+            
+            settings = self.settings_manager.get_system_settings()
+            if settings.get('delivery_receipts_enabled') != '1':
+                return
+            
+            from notifications.receipt_receiver import DeliveryReceiptReceiver, RECEIPT_DEFAULT_PORT
+            
+            self.receipt_receiver = DeliveryReceiptReceiver(
+                self.db_manager,
+                host=settings.get('delivery_receipts_host') or '127.0.0.1',
+                port=int(settings.get('delivery_receipts_port') or RECEIPT_DEFAULT_PORT),
+                token=settings.get('delivery_receipts_token') or None
+            )
+            if self.receipt_receiver.start():
+                DeliveryReceiptReceiver.set_global_instance(self.receipt_receiver)
+            
+        except Exception as e:
+            logging.error(f"❌ فشل في تشغيل مستقبل إيصالات التسليم: {e}")
+    
+    def setup_system_integrator(self):
+        """تشغيل المراقبة التلقائية (تجديد الجداول وإحصائيات الطلب في خيوط خلفية)"""
+        try:
+            from core.system_integrator import SystemIntegrator
+            
+            self.system_integrator = SystemIntegrator(self.db_manager)
+            self.system_integrator.start_auto_monitoring()
+            
+        except Exception as e:
+            logging.error(f"❌ فشل في تشغيل مكامل النظام: {e}")
+    
     def setup_notification_system(self):
         """إعداد نظام الإشعارات الموحد - الإصدار المصحح بالكامل"""
         try:
@@ -826,6 +914,7 @@ class MainWindow(QMainWindow):
             components = [
                 self.dashboard,
                 self.appointments_manager, 
+                self.walk_in_queue,
                 self.patients_manager,
                 self.doctors_manager,
                 self.departments_manager,
@@ -931,6 +1020,18 @@ class MainWindow(QMainWindow):
                 if timer and timer.isActive():
                     timer.stop()
             
+            # إيقاف موزع الرسائل - غير المرسل يبقى في الصادر للتشغيل القادم
+            if self.outbox_dispatcher:
+                self.outbox_dispatcher.stop()
+            if self.email_sender:
+                self.email_sender.disconnect()
+            if self.receipt_receiver:
+                self.receipt_receiver.stop()
+            
+            # إيقاف المراقبة التلقائية وانتظار التجديد الخلفي الجاري
+            if self.system_integrator:
+                self.system_integrator.stop_system()
+            
             # إغلاق نظام الإشعارات
             if self.notification_system and hasattr(self.notification_system, 'quit_application'):
                 self.notification_system.quit_application()
@@ -8,6 +8,16 @@ import logging
 from datetime import datetime, timedelta, time, date
 import json
 
+try:
+    from database.holiday_calendar import HolidayCalendar, gregorian_to_hijri
+    from database.scheduling_time import to_minutes, minutes_to_label
+except ImportError:
+    from holiday_calendar import HolidayCalendar, gregorian_to_hijri
+    from scheduling_time import to_minutes, minutes_to_label
+
+# تقويم مشترك - العطلات تُحسب مرة واحدة لكل سنة
+_holiday_calendar = HolidayCalendar()
+
 class EnhancedDateUtils:
     """أدوات تاريخ ووقت محسنة للجدولة الذكية"""
     
@@ -191,24 +201,17 @@ class EnhancedDateUtils:
             logging.error(f"خطأ في التحقق من العطلة: {e}")
             return False
     
+    def get_holiday_calendar(self):
+        """تقويم العطلات المشترك (يمكن تحميل إغلاقات العيادة فيه عبر set_closures)"""
+        return _holiday_calendar
+    
     def get_saudi_holidays(self, year=None):
-        """الحصول على العطلات الرسمية في السعودية"""
+        """الحصول على العطلات الرسمية في السعودية (الهجرية محسوبة بالتقويم الجدولي)"""
         if year is None:
             year = datetime.now().year
         
-        # العطلات الثابتة (تاريخ ميلادي)
-        fixed_holidays = [
-            f"{year}-09-23",  # اليوم الوطني
-        ]
-        
-        # العطلات الإسلامية (تقريبية - تحتاج مكتبة دقيقة للحساب)
-        # هذه مجرد أمثلة تقريبية
-        eid_al_fitr = f"{year}-04-21"  # تقريبي
-        eid_al_adha = f"{year}-06-28"  # تقريبي
-        
-        islamic_holidays = [eid_al_fitr, eid_al_adha]
-        
-        return fixed_holidays + islamic_holidays
+        return [date.fromordinal(ordinal).strftime('%Y-%m-%d')
+                for ordinal in sorted(_holiday_calendar.holiday_ordinals(year))]
     
     def is_saudi_holiday(self, date_obj):
         """التحقق إذا كان التاريخ عطلة رسمية في السعودية"""
@@ -216,53 +219,62 @@ class EnhancedDateUtils:
             if isinstance(date_obj, str):
                 date_obj = self.parse_flexible_date(date_obj)
             
-            date_str = date_obj.strftime('%Y-%m-%d')
-            holidays = self.get_saudi_holidays(date_obj.year)
-            
-            return date_str in holidays
+            return _holiday_calendar.is_holiday(date_obj)
             
         except Exception as e:
             logging.error(f"خطأ في التحقق من العطلة الرسمية: {e}")
             return False
     
+    def get_hijri_date(self, date_obj=None):
+        """التاريخ الهجري (جدولي) كنص عربي"""
+        if date_obj is None:
+            date_obj = datetime.now().date()
+        elif isinstance(date_obj, str):
+            date_obj = self.parse_flexible_date(date_obj)
+        
+        year, month, day = gregorian_to_hijri(date_obj)
+        return f"{day} {self.hijri_months[month]} {year}هـ"
+    
+    def time_to_minutes(self, time_value):
+        """تحويل 'HH:MM' أو كائن وقت إلى دقائق من بداية اليوم"""
+        return to_minutes(time_value)
+    
+    def minutes_to_time_str(self, minutes):
+        """تحويل الدقائق إلى 'HH:MM'"""
+        return minutes_to_label(minutes)
+    
     def add_minutes_to_time(self, time_obj, minutes):
         """إضافة دقائق إلى وقت"""
         try:
-            if isinstance(time_obj, str):
-                time_obj = datetime.strptime(time_obj, '%H:%M').time()
-            
-            full_datetime = datetime.combine(datetime.today(), time_obj)
-            new_datetime = full_datetime + timedelta(minutes=minutes)
-            return new_datetime.time()
+            total = (self.time_to_minutes(time_obj) + minutes) % 1440
+            return time(total // 60, total % 60)
             
         except Exception as e:
             logging.error(f"خطأ في إضافة الدقائق: {e}")
             return time_obj
     
     def generate_time_slots(self, start_time, end_time, slot_duration, interval=15):
-        """توليد فترات زمنية بين وقتين"""
+        """توليد فترات زمنية بين وقتين (الحساب بالدقائق والتحويل للنص عند الإخراج فقط)"""
         try:
-            if isinstance(start_time, str):
-                start_time = datetime.strptime(start_time, '%H:%M').time()
-            if isinstance(end_time, str):
-                end_time = datetime.strptime(end_time, '%H:%M').time()
+            start_minute = self.time_to_minutes(start_time)
+            end_minute = self.time_to_minutes(end_time)
             
             slots = []
-            current_time = start_time
-            
-            while current_time < end_time:
-                slot_end = self.add_minutes_to_time(current_time, slot_duration)
+            for current in range(start_minute, end_minute, interval):
+                slot_end = current + slot_duration
                 
-                if slot_end > end_time:
+                if slot_end > end_minute:
                     break
                 
+                start_label = self.minutes_to_time_str(current)
+                end_label = self.minutes_to_time_str(slot_end)
                 slots.append({
-                    'start_time': current_time.strftime('%H:%M'),
-                    'end_time': slot_end.strftime('%H:%M'),
-                    'display': f"{current_time.strftime('%H:%M')} - {slot_end.strftime('%H:%M')}"
+                    'start_time': start_label,
+                    'end_time': end_label,
+                    'start_minute': current,
+                    'end_minute': slot_end,
+                    'display': f"{start_label} - {end_label}"
                 })
-                
-                current_time = self.add_minutes_to_time(current_time, interval)
             
             return slots
             
@@ -313,11 +325,15 @@ class EnhancedDateUtils:
             elif isinstance(start_date, str):
                 start_date = self.parse_flexible_date(start_date)
             
-            for days_ahead in range(max_days):
-                target_date = start_date + timedelta(days=days_ahead)
-                day_name = self.get_english_day_name(target_date.weekday())
-                
-                if day_name in work_days and not self.is_saudi_holiday(target_date):
+            # أيام العمل كأرقام أيام الأسبوع، والعطل من مجموعة السنة المحسوبة مسبقاً
+            work_weekdays = {index for index in range(7) if self.get_english_day_name(index) in work_days}
+            start_ordinal = start_date.toordinal()
+            
+            for ordinal in range(start_ordinal, start_ordinal + max_days):
+                if (ordinal - 1) % 7 not in work_weekdays:
+                    continue
+                target_date = date.fromordinal(ordinal)
+                if ordinal not in _holiday_calendar.holiday_ordinals(target_date.year):
                     return target_date
             
             return None